@@ -0,0 +1,85 @@
+"""Benchmark of the alert store (see stella.alertstore): memory and dashboard queries after a week of alerts.
+
+Websites flapping every few minutes for a week raise alerts, which are kept either in an unbounded list
+(as the app did before the alert store) or in the bounded store, the older ones being spilled to disk.
+
+Usage: PYTHONPATH=. python benchmarks/bench_alertstore.py [--websites 100] [--flap 10] [--capacity 10000]
+"""
+import argparse
+import datetime
+import os
+import tempfile
+import time
+import tracemalloc
+
+from stella.alert import AvailabilityAlert
+from stella.alert import AvailabilityRecovered
+from stella.alertstore import AlertStore
+
+WEEK = 7 * 24 * 3600
+
+
+def alerts(nb_websites, flap_interval, start):
+    """Yields the alerts of websites going down and back up every flap_interval seconds, in time order."""
+    for i, second in enumerate(range(0, WEEK, flap_interval)):
+        alert_class = AvailabilityRecovered if i % 2 else AvailabilityAlert
+        activation_time = datetime.datetime.fromtimestamp(start + second)
+        yield [alert_class(f'site{website}.com', 0.5, activation_time) for website in range(nb_websites)]
+
+
+def measure(build):
+    tracemalloc.start()
+    begin = time.perf_counter()
+    container = build()
+    duration = time.perf_counter() - begin
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return container, duration, memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--websites', type=int, default=100)
+    parser.add_argument('--flap', type=int, default=10, help="minutes between two alerts of a website")
+    parser.add_argument('--capacity', type=int, default=10000)
+    args = parser.parse_args()
+    start = time.time() - WEEK
+
+    def build_list():
+        alert_history = []
+        for batch in alerts(args.websites, args.flap * 60, start):
+            alert_history += batch
+        return alert_history
+
+    spill_file = os.path.join(tempfile.mkdtemp(), 'alerts')
+
+    def build_store():
+        store = AlertStore(args.capacity, spill_file)
+        for batch in alerts(args.websites, args.flap * 60, start):
+            store.add(batch)
+        return store
+
+    alert_history, list_time, list_memory = measure(build_list)
+    print(f"{len(alert_history)} alerts in a week")
+    print(f"unbounded list: {list_memory / 2 ** 20:.1f} MiB, {list_time / len(alert_history) * 1e6:.1f} us per alert")
+    store, store_time, store_memory = measure(build_store)
+    store.close()
+    print(f"store of {args.capacity} alerts: {store_memory / 2 ** 20:.1f} MiB, "
+          f"{store_time / len(alert_history) * 1e6:.1f} us per alert (including the spill), "
+          f"{os.path.getsize(spill_file) / 2 ** 20:.1f} MiB spilled")
+    os.remove(spill_file)
+
+    # Alerts of a website, as displayed on its page
+    begin = time.perf_counter()
+    for _ in range(100):
+        [alert for alert in alert_history if alert.website == 'site0.com'][-48:]
+    list_query = (time.perf_counter() - begin) / 100
+    begin = time.perf_counter()
+    for _ in range(100):
+        store.query('site0.com', limit=48)
+    store_query = (time.perf_counter() - begin) / 100
+    print(f"alerts of a website: {list_query * 1000:.2f} ms from the list, {store_query * 1000:.3f} ms from the store")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Benchmark of the rendering of the dashboard home screen in a terminal.
+
+The dashboard runs in a pseudo-terminal, and renders frames while the stats of a few websites change
+between two frames, either as before (windows created again and every cell written at each frame)
+or incrementally (see Dashboard.write). Reports the render time per frame and the number of cells
+and of bytes written to the terminal.
+
+Usage: PYTHONPATH=. python benchmarks/bench_dashboard.py [--websites 200] [--frames 100] [--updates 5]
+"""
+import argparse
+import curses
+import fcntl
+import os
+import pty
+import random
+import struct
+import termios
+
+from stella import config
+from stella.alertstore import AlertStore
+from stella.dashboard import Dashboard
+from stella.website import Website
+
+LINES = 250
+COLUMNS = 120
+
+
+def render(screen, args, full_repaint, output):
+    websites = [Website(f'http://site{i}.com', 1) for i in range(args.websites)]
+    for website in websites:
+        for second in range(config.ALERTING_TIMEFRAME):
+            website.update_stats(False, True, random.uniform(10, 100), 0, timestamp=second)
+    dashboard = Dashboard(screen, websites, AlertStore(spill_file=None))
+    dashboard.print_home_screen()
+
+    frame_times = []
+    nb_cells = 0
+    for frame in range(args.frames):
+        for website in random.sample(websites, args.updates):
+            website.update_stats(False, True, random.uniform(10, 100), 0, timestamp=config.ALERTING_TIMEFRAME + frame)
+        if full_repaint:
+            dashboard.windows = None
+        dashboard.print_home_screen()
+        frame_times.append(dashboard.frame_time)
+        nb_cells += dashboard.nb_written_cells
+    frame_times.sort()
+    os.write(output, f"{curses.LINES} {frame_times[len(frame_times) // 2]} {frame_times[-1]} {nb_cells}".encode())
+
+
+def bench(args, full_repaint):
+    """Renders the frames in a child process attached to a pseudo-terminal, and counts the bytes it outputs."""
+    read_end, write_end = os.pipe()
+    terminal, child_terminal = pty.openpty()
+    fcntl.ioctl(terminal, termios.TIOCSWINSZ, struct.pack('HHHH', LINES, COLUMNS, 0, 0))
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        os.close(terminal)
+        os.setsid()
+        for fd in (0, 1, 2):
+            os.dup2(child_terminal, fd)
+        os.environ['TERM'] = 'xterm-256color'
+        curses.wrapper(render, args, full_repaint, write_end)
+        os._exit(0)
+    os.close(write_end)
+    os.close(child_terminal)
+    nb_bytes = 0
+    while True:
+        try:
+            data = os.read(terminal, 65536)
+        except OSError:  # The child process exited
+            break
+        if not data:
+            break
+        nb_bytes += len(data)
+    os.waitpid(pid, 0)
+    lines, median, maximum, nb_cells = os.read(read_end, 1024).split()
+    os.close(read_end)
+    assert int(lines) == LINES
+    return float(median), float(maximum), int(nb_cells) / args.frames, nb_bytes / args.frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--websites', type=int, default=200)
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--updates', type=int, default=5, help="websites whose stats change between two frames")
+    args = parser.parse_args()
+
+    for name, full_repaint in (("full repaint", True), ("incremental", False)):
+        median, maximum, nb_cells, nb_bytes = bench(args, full_repaint)
+        print(f"{name:>12}: p50 {median * 1000:6.2f} ms, max {maximum * 1000:6.2f} ms per frame, "
+              f"{nb_cells:6.0f} cells, {nb_bytes:8.0f} bytes to the terminal per frame")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""Benchmark of the dashboard loop (see Dashboard.go_to_home_screen): latency of new data, and idle cost.
+
+The dashboard runs in a pseudo-terminal while a probe thread publishes new stats at random intervals,
+then stops. Reports the delay between a publication and the frame displaying it, the number of frames
+drawn per second, and the CPU used while nothing changes.
+
+Usage: PYTHONPATH=. python benchmarks/bench_dashboard_loop.py [--websites 200] [--rate 100] [--duration 3]
+"""
+import argparse
+import curses
+import fcntl
+import os
+import pty
+import random
+import struct
+import termios
+from threading import Thread
+import time
+
+from stella import config
+from stella.alertstore import AlertStore
+from stella.dashboard import Dashboard
+from stella.website import Website
+
+LINES = 60
+COLUMNS = 120
+IDLE_DURATION = 2
+
+
+def probe(websites, rate, duration, update_times, idle_start):
+    """Publishes new stats of a random website rate times per second (on average) for duration seconds."""
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        time.sleep(random.expovariate(rate))
+        random.choice(websites).update_stats(False, True, random.uniform(10, 100), 0)
+        update_times.append(time.monotonic())
+    time.sleep(0.5)
+    idle_start.append(time.process_time())
+
+
+def run(screen, args, output):
+    websites = [Website(f'http://site{i}.com', 1) for i in range(args.websites)]
+    dashboard = Dashboard(screen, websites, AlertStore(spill_file=None))
+    dashboard.refresh_interval = 10
+    frame_times = []
+    print_home_screen = dashboard.print_home_screen
+
+    def print_frame():
+        print_home_screen()
+        frame_times.append(time.monotonic())
+
+    dashboard.print_home_screen = print_frame
+    update_times = []
+    idle_start = []
+    Thread(target=probe, args=(websites, args.rate, args.duration, update_times, idle_start), daemon=True).start()
+    try:
+        dashboard.go_to_home_screen()
+    except SystemExit:
+        pass
+    idle_cpu = time.process_time() - idle_start[0]
+
+    latencies = []
+    frame = 0
+    for update_time in update_times:
+        while frame < len(frame_times) and frame_times[frame] < update_time:
+            frame += 1
+        if frame < len(frame_times):
+            latencies.append(frame_times[frame] - update_time)
+    latencies.sort()
+    nb_busy_frames = len([frame_time for frame_time in frame_times if frame_time <= update_times[-1] + 0.1])
+    os.write(output, (f"{latencies[len(latencies) // 2]} {latencies[int(len(latencies) * 0.99)]} "
+                      f"{nb_busy_frames} {len(frame_times) - nb_busy_frames} {idle_cpu}").encode())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--websites', type=int, default=200)
+    parser.add_argument('--rate', type=float, default=100, help="publications per second")
+    parser.add_argument('--duration', type=float, default=3)
+    args = parser.parse_args()
+
+    read_end, write_end = os.pipe()
+    terminal, child_terminal = pty.openpty()
+    fcntl.ioctl(terminal, termios.TIOCSWINSZ, struct.pack('HHHH', LINES, COLUMNS, 0, 0))
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        os.close(terminal)
+        os.setsid()
+        for fd in (0, 1, 2):
+            os.dup2(child_terminal, fd)
+        os.environ['TERM'] = 'xterm-256color'
+        curses.wrapper(run, args, write_end)
+        os._exit(0)
+    os.close(write_end)
+    os.close(child_terminal)
+
+    def read_terminal():
+        try:
+            while os.read(terminal, 65536):
+                pass
+        except OSError:  # The child process exited
+            pass
+
+    reader = Thread(target=read_terminal, daemon=True)
+    reader.start()
+    # Probes, then nothing changes for IDLE_DURATION, then quit
+    time.sleep(args.duration + 0.5 + IDLE_DURATION)
+    os.write(terminal, b'q')
+    os.waitpid(pid, 0)
+    median, p99, nb_busy_frames, nb_idle_frames, idle_cpu = os.read(read_end, 1024).split()
+    os.close(read_end)
+
+    print(f"publication to frame: p50 {float(median) * 1000:.1f} ms, p99 {float(p99) * 1000:.1f} ms "
+          f"(max frame rate {config.CONSOLE_MAX_FRAME_RATE}/s)")
+    print(f"{int(nb_busy_frames) / args.duration:.1f} frames per second for {args.rate:.0f} publications per second")
+    print(f"idle for {IDLE_DURATION}s: {nb_idle_frames.decode()} frames, {float(idle_cpu) * 1000:.1f} ms of CPU")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Benchmark of the DNS cache (see stella.dnscache): resolution time of the checks, and queries sent to the resolver.
+
+A stub nameserver (in its own process) answers every query after a fixed latency, with a TTL of 60s.
+The checks of the websites resolve their host either with a query at every check (as the system resolver
+would without cache), or from the DNS cache. Reports the queries sent to the nameserver,
+and the average and p99 resolution time of the checks.
+
+Usage: PYTHONPATH=. python benchmarks/bench_dnscache.py [--hosts 200] [--checks 20000] [--latency 2]
+"""
+import argparse
+from multiprocessing import Process
+from multiprocessing import Value
+import socket
+import statistics
+import time
+
+from stella.dnscache import CLASS_IN
+from stella.dnscache import DnsCache
+from stella.dnscache import HEADER
+from stella.dnscache import query_records
+from stella.dnscache import RECORD
+from stella.dnscache import TYPE_A
+
+TTL = 60
+
+
+def serve(server, latency, nb_queries):
+    """Runs the stub nameserver, answering every query with a single A record."""
+    while True:
+        query, client = server.recvfrom(512)
+        with nb_queries.get_lock():
+            nb_queries.value += 1
+        time.sleep(latency)
+        header = HEADER.unpack_from(query)
+        response = HEADER.pack(header[0], 0x8180, 1, 1, 0, 0) + query[HEADER.size:] \
+            + b'\xc0\x0c' + RECORD.pack(TYPE_A, CLASS_IN, TTL, 4) + socket.inet_aton('10.0.0.1')
+        server.sendto(response, client)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hosts', type=int, default=200)
+    parser.add_argument('--checks', type=int, default=20000)
+    parser.add_argument('--latency', type=float, default=2, help="latency of the nameserver, in ms")
+    args = parser.parse_args()
+
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(('127.0.0.1', 0))
+    nameserver = server.getsockname()
+    nb_queries = Value('i', 0)
+    process = Process(target=serve, args=(server, args.latency / 1000, nb_queries), daemon=True)
+    process.start()
+    hosts = [f'host{i}.example.com' for i in range(args.hosts)]
+
+    def uncached(hostname):
+        start = time.perf_counter()
+        query_records(hostname, nameserver)
+        return (time.perf_counter() - start) * 1000
+
+    cache = DnsCache(enabled=True, nameserver=nameserver, hosts=set())
+
+    def cached(hostname):
+        return cache.resolve(hostname)[1]
+
+    print(f"{args.checks} checks of {args.hosts} hosts, nameserver latency {args.latency} ms")
+    for name, resolve in [("uncached", uncached), ("cached", cached)]:
+        nb_queries.value = 0
+        dns_times = sorted(resolve(hosts[i % args.hosts]) for i in range(args.checks))
+        print(f"{name:8}: {nb_queries.value:6d} queries sent, resolution time avg "
+              f"{statistics.mean(dns_times):.3f} ms, p99 {dns_times[int(len(dns_times) * 0.99)]:.3f} ms")
+    process.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Benchmark of the per-phase timing of the http checks (see stella.http_pool.HTTP_PHASES): overhead and breakdown.
+
+A stub HTTP server (in its own process) answers every request after a fixed delay, with a body of a given size.
+The url is probed through the connection pool, on a kept-alive connection and on new connections,
+with and without timing the phases. Reports the process time per probe, the overhead of timing the phases,
+and the average time of each phase, in which the delay of the server shows as time to first byte.
+
+Usage: PYTHONPATH=. python benchmarks/bench_http_phases.py [--probes 2000] [--delay 1] [--body 10000]
+"""
+import argparse
+from collections import Counter
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from multiprocessing import Process
+import socket
+import time
+
+from stella.http_pool import ConnectionPool
+from stella.http_pool import HTTP_PHASES
+
+
+def serve(listener, delay, body_size):
+    """Runs the stub server, answering every request after delay with a body of body_size bytes."""
+    response = f"HTTP/1.1 200 OK\r\nContent-Length: {body_size}\r\n\r\n".encode('ascii') + b'x' * body_size
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            time.sleep(delay)
+            # In a single write, so that the body is not delayed by Nagle's algorithm
+            self.wfile.write(response)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(listener.getsockname(), Handler, bind_and_activate=False)
+    server.socket = listener
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--probes', type=int, default=2000)
+    parser.add_argument('--delay', type=float, default=1, help="delay of the server, in ms")
+    parser.add_argument('--body', type=int, default=10000, help="size of the body, in bytes")
+    args = parser.parse_args()
+
+    # socket.create_server needs Python 3.8
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(128)
+    server = Process(target=serve, args=(listener, args.delay / 1000, args.body), daemon=True)
+    server.start()
+    url = f'http://127.0.0.1:{listener.getsockname()[1]}/'
+    print(f"{args.probes} probes, server delay {args.delay} ms, body of {args.body} bytes")
+
+    for keep_alive in [True, False]:
+        process_times = {}
+        for timed in [False, True]:
+            pool = ConnectionPool()
+            phases = Counter()
+            nb_timed = Counter()
+            start = time.process_time()
+            for _ in range(args.probes):
+                timings = {} if timed else None
+                pool.get(url, keep_alive=keep_alive, timings=timings)
+                if timed:
+                    phases.update(timings)
+                    nb_timed.update(timings.keys())
+            process_times[timed] = (time.process_time() - start) / args.probes * 1e6
+            pool.clear()
+        # Average over the probes which went through the phase (a kept-alive connection is connected once)
+        breakdown = ", ".join(f"{phase} {phases[phase] / nb_timed[phase]:.3f}" for phase in HTTP_PHASES
+                              if phase in phases)
+        print(f"keep-alive={keep_alive!s:5}: {process_times[False]:6.1f} us of CPU per probe, "
+              f"{process_times[True] - process_times[False]:+5.1f} us to time the phases ({breakdown} ms)")
+    server.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Benchmark of the multiplexed ICMP sweep against a set of loopback addresses.
+
+Every address of 127.0.0.0/8 answers to ICMP echo requests on Linux, which gives a large
+local target set. Requires ICMP sockets (see config.ICMP_NATIVE); with --emulate, requests
+are sent to a local UDP responder instead, which measures the sweep loop overhead only.
+
+Usage: python benchmarks/bench_icmp_sweep.py [--hosts 20000] [--sweeps 5] [--emulate]
+"""
+import argparse
+from multiprocessing import Process
+import socket
+import time
+
+from stella import icmp
+
+
+class EmulatedIcmpSocket(socket.socket):
+    """UDP socket forwarding echo requests to a local responder which sends back echo replies."""
+
+    responder_address = None
+
+    def __init__(self):
+        super().__init__(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def bind(self, address):
+        super().bind(('127.0.0.1', 0))
+
+    def sendto(self, packet, address):
+        return super().sendto(packet, self.responder_address)
+
+
+def run_responder(responder):
+    responder.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 22)
+    while True:
+        request, address = responder.recvfrom(2048)
+        reply = bytes([icmp.ICMP_ECHO_REPLY]) + request[1:]
+        responder.sendto(reply, address)
+
+
+def loopback_hosts(nb_hosts):
+    return [f"127.{(i >> 16) & 0xFF}.{(i >> 8) & 0xFF}.{i & 0xFF}" for i in range(1, nb_hosts + 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hosts', type=int, default=20000)
+    parser.add_argument('--sweeps', type=int, default=5)
+    parser.add_argument('--emulate', action='store_true')
+    args = parser.parse_args()
+
+    if args.emulate:
+        responder = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        responder.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+        responder.bind(('127.0.0.1', 0))
+        EmulatedIcmpSocket.responder_address = responder.getsockname()
+        icmp.open_socket = EmulatedIcmpSocket
+        # The responder runs in its own process so that it does not compete with the sweep for the GIL
+        Process(target=run_responder, args=(responder,), daemon=True).start()
+    elif not icmp.native_icmp_available():
+        print("ICMP sockets are not allowed for this user: run as root, allow datagram ICMP sockets "
+              "(sysctl net.ipv4.ping_group_range) or use --emulate")
+        return
+
+    hosts = loopback_hosts(args.hosts)
+    sweeper = icmp.IcmpSweeper(timeout=1)
+    sweeper.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+
+    for sweep in range(args.sweeps):
+        start = time.perf_counter()
+        results = sweeper.sweep(hosts)
+        duration = time.perf_counter() - start
+        nb_up = sum(result[0] for result in results)
+        print(f"sweep {sweep}: {len(hosts)} hosts in {duration * 1000:.0f} ms "
+              f"({len(hosts) / duration:.0f} hosts/s), {nb_up} replies")
+    sweeper.close()
+
+
+if __name__ == '__main__':
+    main()
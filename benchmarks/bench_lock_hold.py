@@ -0,0 +1,135 @@
+"""Benchmark of the website lock contention between the probe threads and the dashboard.
+
+Probe threads update the stats of the websites while a dashboard thread renders them,
+either as before (reading the stats while holding the website lock, with curses calls in between)
+or from the snapshots published by the probe threads (see Website.get_snapshot), without the lock.
+Curses calls are simulated by a short sleep, as drawing to a slow terminal would.
+Reports how long the probe threads wait for and hold the website locks, and the cost of the publication.
+
+Usage: PYTHONPATH=. python benchmarks/bench_lock_hold.py [--websites 50] [--duration 3] [--addstr 0.0002]
+"""
+import argparse
+import random
+from threading import current_thread
+from threading import Event
+from threading import Lock
+from threading import Thread
+import time
+
+from stella import config
+from stella.website import Website
+
+
+class TimedLock(object):
+    """Lock recording how long the probe thread waited for and held it."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.acquired_at = None
+        self.waits = []
+        self.holds = []
+
+    def acquire(self):
+        start = time.perf_counter()
+        self.lock.acquire()
+        self.acquired_at = time.perf_counter()
+        if current_thread().name == 'probe':
+            self.waits.append(self.acquired_at - start)
+
+    def release(self):
+        if current_thread().name == 'probe':
+            self.holds.append(time.perf_counter() - self.acquired_at)
+        self.lock.release()
+
+
+def legacy_render(website, addstr_delay):
+    """Renders a website the way the dashboard did before the snapshots: under the lock."""
+    website.lock.acquire()
+    for timeframe in [config.ALERTING_TIMEFRAME] + config.STATS_TIMEFRAMES:
+        stats = website.ping_stats_list[timeframe]
+        (f"{stats.availability:.2f} {stats.min_response_time:.0f}/{stats.average_response_time:.0f}"
+         f"/{stats.max_response_time:.0f} {stats.percentile(99):.0f}")
+        time.sleep(addstr_delay)
+    website.lock.release()
+
+
+def snapshot_render(website, addstr_delay):
+    """Renders a website from its published snapshot, without the lock."""
+    snapshot = website.get_snapshot()
+    for timeframe in [config.ALERTING_TIMEFRAME] + config.STATS_TIMEFRAMES:
+        stats = snapshot.ping_stats[timeframe]
+        (f"{stats.availability:.2f} {stats.min_response_time:.0f}/{stats.average_response_time:.0f}"
+         f"/{stats.max_response_time:.0f} {stats.percentile(99):.0f}")
+        time.sleep(addstr_delay)
+
+
+def percentiles(values):
+    values = sorted(values)
+    return (f"p50 {values[len(values) // 2] * 1e6:8.1f} us, p99 {values[int(len(values) * 0.99)] * 1e6:8.1f} us, "
+            f"max {values[-1] * 1e6:8.1f} us")
+
+
+def bench(nb_websites, duration, addstr_delay, render):
+    websites = [Website(f'http://site{i}.com', 1) for i in range(nb_websites)]
+    for website in websites:
+        website.lock = TimedLock()
+        for second in range(config.ALERTING_TIMEFRAME):
+            website.update_stats(False, True, 20.0, 0, timestamp=second)
+        if render is snapshot_render:
+            website.get_snapshot()
+    stop = Event()
+
+    def probe():
+        timestamp = config.ALERTING_TIMEFRAME
+        while not stop.is_set():
+            timestamp += 1
+            for website in websites:
+                website.update_stats(False, random.random() < 0.99, random.uniform(10, 30), 0, timestamp)
+
+    def dashboard():
+        while not stop.is_set():
+            for website in websites:
+                render(website, addstr_delay)
+
+    threads = [Thread(target=probe, name='probe'), Thread(target=dashboard, name='dashboard')]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    waits = [wait for website in websites for wait in website.lock.waits]
+    holds = [hold for website in websites for hold in website.lock.holds]
+    print(f"{render.__name__} ({len(waits)} probe updates)")
+    print(f"  probe wait: {percentiles(waits)}")
+    print(f"  probe hold: {percentiles(holds)}")
+
+
+def bench_publication(nb_updates):
+    """Prints the cost of publishing the snapshot on every update, without contention."""
+    for published in (False, True):
+        website = Website('http://site.com', 1)
+        if published:
+            website.get_snapshot()
+        start = time.perf_counter()
+        for timestamp in range(nb_updates):
+            website.update_stats(False, True, 20.0, 0, timestamp)
+        duration = (time.perf_counter() - start) / nb_updates
+        print(f"update {'with' if published else 'without'} snapshot publication: {duration * 1e6:.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--websites', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=3)
+    parser.add_argument('--addstr', type=float, default=0.0002, help="duration of a simulated curses call (s)")
+    args = parser.parse_args()
+
+    for render in (legacy_render, snapshot_render):
+        bench(args.websites, args.duration, args.addstr, render)
+    bench_publication(100000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Benchmark of the alert notifications (see stella.notify): cost for the alert consumer, with a slow webhook.
+
+Alerts are handed to a notifier whose webhook sink answers after a delay, as the alert consumer
+(App.drain_alerts) does. Reports how long the consumer is blocked by Notifier.notify, and how many alerts
+were sent, coalesced or dropped.
+
+Usage: PYTHONPATH=. python benchmarks/bench_notify.py [--alerts 10000] [--websites 100] [--delay 0.5]
+"""
+import argparse
+import datetime
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from threading import Thread
+import time
+
+from stella.alert import AvailabilityAlert
+from stella.alert import AvailabilityRecovered
+from stella.notify import Notifier
+from stella.notify import WebhookSink
+
+
+def slow_webhook(delay):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers['Content-Length']))
+            time.sleep(delay)
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--alerts', type=int, default=10000)
+    parser.add_argument('--websites', type=int, default=100)
+    parser.add_argument('--delay', type=float, default=0.5, help="response time of the webhook (s)")
+    args = parser.parse_args()
+
+    server = slow_webhook(args.delay)
+    sink = WebhookSink(f'http://127.0.0.1:{server.server_port}/', batch_window=0.1)
+    notifier = Notifier([sink])
+    notifier.start()
+
+    now = datetime.datetime.now()
+    latencies = []
+    for i in range(0, args.alerts, args.websites):
+        # A drain of the alert queues: every website flaps
+        alert_class = AvailabilityRecovered if (i // args.websites) % 2 else AvailabilityAlert
+        alerts = [alert_class(f'site{website}.com', 0.5, now) for website in range(args.websites)]
+        start = time.perf_counter()
+        notifier.notify(alerts)
+        latencies.append(time.perf_counter() - start)
+        time.sleep(0.01)
+    notifier.close(timeout=10 * args.delay)
+    server.shutdown()
+
+    latencies.sort()
+    print(f"notify: p50 {latencies[len(latencies) // 2] * 1e6:.0f} us, max {latencies[-1] * 1e6:.0f} us "
+          f"per batch of {args.websites} alerts")
+    print(f"{args.alerts} alerts: {sink.nb_sent} sent, {sink.nb_coalesced} coalesced, {sink.nb_dropped} dropped, "
+          f"{sink.nb_failed} failed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Benchmark of the probe log (see stella.probelog): append throughput, and range queries with the time index.
+
+Logs the probes of many websites checked every second, then queries the availability of a website
+during a given duration, with the time index and with a scan of all the segments.
+
+Usage: PYTHONPATH=. python benchmarks/bench_probelog.py [--websites 1000] [--duration 3600] [--query 600]
+"""
+import argparse
+import math
+import shutil
+import tempfile
+import time
+
+from stella.probelog import ProbeLog
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--websites', type=int, default=1000)
+    parser.add_argument('--duration', type=int, default=3600)
+    parser.add_argument('--query', type=int, default=600)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    probe_log = ProbeLog(directory, retention=math.inf)
+    urls = [f'http://site{i}.com' for i in range(args.websites)]
+    start = time.time() - args.duration
+
+    append_time = flush_time = 0
+    for second in range(args.duration):
+        begin = time.perf_counter()
+        for url in urls:
+            probe_log.append(url, False, True, 42.0, 0, timestamp=start + second)
+        append_time += time.perf_counter() - begin
+        begin = time.perf_counter()
+        probe_log.flush()
+        flush_time += time.perf_counter() - begin
+    nb_records = args.duration * args.websites
+    print(f"{nb_records} records in {len(probe_log.segments)} segments")
+    print(f"append: {append_time / nb_records * 1e6:.2f} us per record (probe path)")
+    print(f"flush: {flush_time / nb_records * 1e6:.2f} us per record (writer thread, one fsync per second)")
+
+    query_start = start + args.duration / 2
+    begin = time.perf_counter()
+    bucket = probe_log.query(urls[0], query_start, query_start + args.query)
+    indexed_time = time.perf_counter() - begin
+
+    # Without the index: every segment is scanned
+    for segment in probe_log.segments:
+        segment.record_range = lambda start, end, segment=segment: (0, segment.nb_records)
+    begin = time.perf_counter()
+    scanned_bucket = probe_log.query(urls[0], query_start, query_start + args.query)
+    scan_time = time.perf_counter() - begin
+    assert scanned_bucket.count == bucket.count
+    shutil.rmtree(directory)
+
+    print(f"query of {args.query} s ({bucket.count} probes): {indexed_time * 1000:.1f} ms with the time index, "
+          f"{scan_time * 1000:.1f} ms with a full scan")
+
+
+if __name__ == '__main__':
+    main()
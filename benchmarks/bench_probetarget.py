@@ -0,0 +1,63 @@
+"""Benchmark of the shared probe targets (see stella.probetarget): probes sent for a fleet with shared hosts.
+
+The websites are paths of a smaller number of hosts, checked through icmp every second by the worker threads
+of a scheduler. Probes are fake (they only sleep for the round-trip time), and are counted by host.
+Reports the probes sent per second with and without deduplication, the checks recorded in the stats
+of the websites, and the number of probes saved.
+
+Usage: PYTHONPATH=. python benchmarks/bench_probetarget.py [--websites 2000] [--hosts 100] [--duration 3]
+"""
+import argparse
+from collections import Counter
+import random
+import time
+
+from stella.app import App
+from stella.probetarget import group_websites
+from stella.probetarget import nb_saved_probes
+from stella.scheduler import Scheduler
+from stella.website import Website
+
+CHECK_INTERVAL = 1
+ROUND_TRIP_TIME = 0.005
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--websites', type=int, default=2000)
+    parser.add_argument('--hosts', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=3)
+    args = parser.parse_args()
+
+    probes = Counter()
+
+    def ping(host):
+        probes[host] += 1
+        time.sleep(ROUND_TRIP_TIME)
+        return True, random.uniform(10, 100), 0
+
+    Website.ping = ping
+    urls = [f'http://host{random.randrange(args.hosts)}.example.com/page{i}' for i in range(args.websites)]
+
+    for deduplicate in [False, True]:
+        websites = [Website(url, CHECK_INTERVAL) for url in urls]
+        targets = group_websites(websites, use_http=False, deduplicate=deduplicate)
+        scheduler = Scheduler(targets)
+        probes.clear()
+        start = time.process_time()
+        # The websites are checked by daemon threads, which are not stopped
+        scheduler.start(App.check_target, args.workers)
+        time.sleep(args.duration)
+        scheduler.condition.acquire()
+        cpu_time = time.process_time() - start
+        nb_checks = sum(website.ping_stats_list[min(website.ping_stats_list)].nb_data_points()
+                        for website in websites)
+        print(f"deduplicate={deduplicate!s:5}: {len(targets):5d} targets, "
+              f"{sum(probes.values()) / args.duration:7.0f} probes per second, "
+              f"{nb_checks / args.duration:7.0f} checks recorded per second, "
+              f"{nb_saved_probes(websites):6d} probes saved, {cpu_time / args.duration * 100:.0f}% CPU")
+
+
+if __name__ == '__main__':
+    main()
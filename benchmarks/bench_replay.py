@@ -0,0 +1,50 @@
+"""Benchmark of the stats and alerting hot path, through a replay of synthetic probe results (see stella.replay).
+
+Each website is checked every second, fails 1% of its checks, and goes down for a minute every hour.
+
+Usage: PYTHONPATH=. python benchmarks/bench_replay.py [--websites 100] [--duration 3600] [--alerting-only] [--seed 0]
+"""
+import argparse
+import random
+
+from stella import config
+from stella.config import hour
+from stella.config import minute
+from stella.replay import Replay
+
+
+def samples(nb_websites, duration):
+    """Returns the probe results, in the format of Replay.run, generated before the replay starts."""
+    urls = [f'http://site{i}.com' for i in range(nb_websites)]
+    outages = [random.randrange(hour - minute) for _ in urls]
+    generated = []
+    for timestamp in range(duration):
+        for url, outage in zip(urls, outages):
+            is_up = not outage <= timestamp % hour < outage + minute and random.random() < 0.99
+            generated.append((float(timestamp), url, False, is_up, random.uniform(10, 100) if is_up else None,
+                              0 if is_up else 1))
+    return generated
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--websites', type=int, default=100)
+    parser.add_argument('--duration', type=int, default=3600)
+    parser.add_argument('--alerting-only', action='store_true', help="only compute the alerting timeframe")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    timeframes = [config.ALERTING_TIMEFRAME]
+    if not args.alerting_only:
+        timeframes += config.STATS_TIMEFRAMES + config.ROLLUP_TIMEFRAMES
+    replay = Replay(timeframes=timeframes)
+    replay.run(samples(args.websites, args.duration))
+
+    print(f"{replay.nb_samples} samples of {len(replay.websites)} websites ({len(timeframes)} timeframes), "
+          f"{len(replay.alerts)} alerts")
+    print(f"{replay.throughput():.0f} samples/s ({1e6 / replay.throughput():.1f} us per sample)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Benchmark of the evaluation of the alert rules (see stella.rules) after each check.
+
+Websites with 50 rules (5 metrics on 5 timeframes, with 2 thresholds each) are checked every second.
+The compiled evaluation (rules grouped by timeframe and metric, rollup timeframes only evaluated once a minute)
+is compared with evaluating every rule on its own after each check.
+
+Usage: PYTHONPATH=. python benchmarks/bench_rules.py [--websites 1000] [--rounds 120] [--target 10000]
+"""
+import argparse
+import random
+import time
+
+from stella.rules import Rule
+from stella.website import Website
+
+TIMEFRAMES = [5, 30, 120, 300, 24 * 3600]
+METRICS = {'availability': (0.8, 0.5), 'p95': (500, 1000), 'p99': (1000, 2000),
+           '5xx_ratio': (0.1, 0.5), 'average_response_time': (300, 800)}
+
+
+def naive_evaluation(website, rules):
+    """Evaluates every rule on its own, as a rule engine without compilation would."""
+    for rule in rules:
+        stats = website.http_stats_list[rule.timeframe]
+        if stats.timeframe_reached():
+            rule.compare(rule.value(stats), rule.threshold)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--websites', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=120)
+    parser.add_argument('--target', type=int, default=10000, help="number of websites to extrapolate to")
+    args = parser.parse_args()
+
+    rules = [Rule(f'{metric}-{timeframe}-{threshold}', metric, timeframe, '>' if metric != 'availability' else '<',
+                  threshold)
+             for timeframe in TIMEFRAMES for metric, thresholds in METRICS.items() for threshold in thresholds]
+    websites = [Website(f'http://site{i}.com', 1, timeframes=[], alert_rules=rules) for i in range(args.websites)]
+
+    def check_all(second):
+        for website in websites:
+            is_up = random.random() < 0.99
+            website.update_stats(True, is_up, random.lognormvariate(5, 0.5), 200 if random.random() < 0.95 else 503,
+                                 timestamp=second)
+
+    # Fill the raw timeframes first, so that every rule is evaluated
+    for second in range(max(timeframe for timeframe in TIMEFRAMES if timeframe <= 3600)):
+        check_all(second)
+
+    compiled_time = naive_time = 0
+    for second in range(args.rounds):
+        check_all(300 + second)
+        start = time.perf_counter()
+        for website in websites:
+            website.check_for_alert(True)
+        compiled_time += time.perf_counter() - start
+        start = time.perf_counter()
+        for website in websites:
+            naive_evaluation(website, rules)
+        naive_time += time.perf_counter() - start
+
+    nb_evaluations = args.websites * args.rounds
+    for name, duration in (('compiled', compiled_time), ('naive', naive_time)):
+        per_website = duration / nb_evaluations
+        print(f"{name}: {per_website * 1e6:.1f} us per website and check ({len(rules)} rules), "
+              f"{per_website * args.target:.2f} s per second for {args.target} websites checked every second")
+
+
+if __name__ == '__main__':
+    main()
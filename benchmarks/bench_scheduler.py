@@ -0,0 +1,78 @@
+"""Benchmark of the scheduler of the checks (see stella.scheduler): startup burst, lag and overload.
+
+Websites are checked by fake probes (which only sleep) from the worker threads of a scheduler:
+
+- without jitter, all the websites are checked at once on startup, as with one monitoring loop per website,
+  while with jitter the first checks are spread over the check interval,
+- with enough workers, reports the scheduling lag of the checks (delay between their deadline and their start),
+- with probes too slow for the workers, reports the checks done and dropped by each overload policy.
+
+Usage: PYTHONPATH=. python benchmarks/bench_scheduler.py [--websites 500] [--workers 64] [--duration 3]
+"""
+import argparse
+import random
+from threading import Lock
+import time
+
+from stella.scheduler import OVERLOAD_POLICIES
+from stella.scheduler import Scheduler
+
+CHECK_INTERVAL = 1
+BURST_WINDOW = 0.1
+
+
+class FakeWebsite(object):
+    def __init__(self):
+        self.check_interval = CHECK_INTERVAL
+        self.scheduling = None
+
+
+def run(args, jitter, overload_policy, probe_duration):
+    """Runs the checks for args.duration seconds, and returns the scheduler and the start times of the checks."""
+    websites = [FakeWebsite() for _ in range(args.websites)]
+    scheduler = Scheduler(websites, jitter=jitter, overload_policy=overload_policy)
+    lock = Lock()
+    start_times = []
+
+    def probe(website):
+        lock.acquire()
+        start_times.append(time.monotonic())
+        lock.release()
+        time.sleep(random.uniform(*probe_duration))
+
+    start = time.monotonic()
+    scheduler.start(probe, args.workers)
+    time.sleep(args.duration)
+    # The workers are daemon threads: the next runs do not wait for them, but no more checks are recorded
+    scheduler.condition.acquire()
+    start_times = [start_time - start for start_time in start_times]
+    return scheduler, start_times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--websites', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=3)
+    args = parser.parse_args()
+
+    for jitter in [0, 1]:
+        scheduler, start_times = run(args, jitter, 'skip', (0.005, 0.02))
+        burst = len([start_time for start_time in start_times if start_time < BURST_WINDOW])
+        lags = sorted(website.scheduling.max_lag for website in scheduler.websites if website.scheduling.nb_checks)
+        print(f"jitter {jitter}: {burst:4d} checks started in the first {BURST_WINDOW * 1000:.0f} ms, "
+              f"max lag per website p50 {lags[len(lags) // 2] * 1000:6.1f} ms, "
+              f"p99 {lags[int(len(lags) * 0.99)] * 1000:6.1f} ms")
+
+    # Capacity of the workers: about args.workers / 0.3 checks per second
+    capacity = args.workers / 0.3
+    print(f"overload: {args.websites} checks due per second, capacity {capacity:.0f} per second")
+    for overload_policy in OVERLOAD_POLICIES:
+        scheduler, start_times = run(args, 1, overload_policy, (0.25, 0.35))
+        max_lag = max(website.scheduling.max_lag for website in scheduler.websites)
+        print(f"{overload_policy:>8}: {len(start_times) / args.duration:5.0f} checks per second, "
+              f"{scheduler.nb_dropped / args.duration:5.0f} dropped per second, max lag {max_lag * 1000:6.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""Benchmark of the sharded monitoring (see stella.shard): probes per second against a local stub server.
+
+A stub HTTP server (in its own process) answers every request at once. The websites, all on the stub server,
+are probed through http by the asyncio engine, either in the benchmark process (as without sharding),
+or from worker processes streaming their stats deltas and alerts to the benchmark process.
+There are more websites than the probes can check within their check interval, so that the number
+of probes per second is the throughput of the monitoring.
+Reports the probes per second, and the stats deltas received per second and their size.
+
+Usage: PYTHONPATH=. python benchmarks/bench_shard.py [--websites 5000] [--processes 0 1 2 4] [--duration 5]
+"""
+import argparse
+import asyncio
+from collections import deque
+from multiprocessing import Pipe
+from multiprocessing import Process
+import os
+import socket
+import time
+
+from stella.engine import AsyncProbeEngine
+from stella.shard import ShardedMonitor
+from stella.shard import ShardPublisher
+from stella.website import Website
+
+CHECK_INTERVAL = 1
+WARMUP = 2
+MAX_CONCURRENT_PROBES = 256
+
+
+def serve(listener):
+    """Runs the stub server, answering every request with an empty 200 response."""
+
+    async def answer(reader, writer):
+        try:
+            await reader.readuntil(b'\r\n\r\n')
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            # The probe was stopped
+            pass
+        writer.close()
+
+    async def main():
+        server = await asyncio.start_server(answer, sock=listener, backlog=4096)
+        await server.serve_forever()
+
+    asyncio.run(main())
+
+
+def create_websites(websites_conf):
+    websites = [Website(url, interval) for url, interval in websites_conf]
+    for website in websites:
+        website.alert_queue = deque()
+    return websites
+
+
+def run_shard(shard, websites_conf, connection):
+    """Worker process probing its websites with the asyncio engine (see App.run_shard)."""
+    websites = create_websites(websites_conf)
+    publisher = ShardPublisher(websites, connection)
+    AsyncProbeEngine(websites, use_http=True, max_concurrent_probes=MAX_CONCURRENT_PROBES).start()
+    publisher.run()
+
+
+def run_in_process(websites_conf, duration, connection):
+    """Process probing all the websites with the asyncio engine, as without sharding."""
+    websites = create_websites(websites_conf)
+    AsyncProbeEngine(websites, use_http=True, max_concurrent_probes=MAX_CONCURRENT_PROBES).start()
+    connection.send(measure(websites, duration)[0])
+
+
+def nb_checks(websites):
+    return sum(website.scheduling.nb_checks for website in websites if website.scheduling is not None)
+
+
+def measure(websites, duration, monitor=None):
+    """Returns the probes per second of the websites over duration after a warmup, and the deltas received."""
+    # The worker processes first send the full snapshots of their websites
+    while monitor is not None and monitor.nb_batches < len(monitor.shards):
+        time.sleep(0.1)
+    time.sleep(WARMUP)
+    start, start_checks = time.monotonic(), nb_checks(websites)
+    start_deltas, start_bytes = (monitor.nb_deltas, monitor.nb_received_bytes) if monitor else (0, 0)
+    time.sleep(duration)
+    elapsed = time.monotonic() - start
+    if monitor is None:
+        return (nb_checks(websites) - start_checks) / elapsed, 0, 0
+    return ((nb_checks(websites) - start_checks) / elapsed, monitor.nb_deltas - start_deltas,
+            monitor.nb_received_bytes - start_bytes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--websites', type=int, default=5000)
+    parser.add_argument('--processes', type=int, nargs='+', default=[0, 1, 2, 4],
+                        help="worker processes, 0 to probe from the benchmark process")
+    parser.add_argument('--duration', type=float, default=5)
+    args = parser.parse_args()
+
+    # socket.create_server needs Python 3.8
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen()
+    port = listener.getsockname()[1]
+    server = Process(target=serve, args=(listener,), daemon=True)
+    server.start()
+    websites_conf = [(f'http://127.0.0.1:{port}/site{i}', CHECK_INTERVAL) for i in range(args.websites)]
+    print(f"{os.cpu_count()} cores, {args.websites} websites checked every {CHECK_INTERVAL}s")
+
+    for nb_processes in args.processes:
+        if nb_processes == 0:
+            # In a process of its own, which is stopped along with its probes
+            connection, process_connection = Pipe()
+            process = Process(target=run_in_process, args=(websites_conf, args.duration, process_connection))
+            process.start()
+            print(f"in process : {connection.recv():7.0f} probes per second")
+            process.join()
+            continue
+
+        mirrors = create_websites(websites_conf)
+        monitor = ShardedMonitor(mirrors, websites_conf, run_shard, nb_processes)
+        monitor.start()
+        probes_per_second, nb_deltas, nb_bytes = measure(mirrors, args.duration, monitor)
+        print(f"{nb_processes} processes: {probes_per_second:7.0f} probes per second, "
+              f"{nb_deltas / args.duration:7.0f} deltas per second ({nb_bytes / max(1, nb_deltas):.0f} bytes each)")
+        monitor.stop()
+    server.terminate()
+
+
+if __name__ == '__main__':
+    main()
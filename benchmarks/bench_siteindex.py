@@ -0,0 +1,70 @@
+"""Benchmark of the site index of the dashboard (see stella.siteindex): cost per frame of a sorted page of websites.
+
+Between two frames, the stats of some of the websites change. A page of the websites sorted by latency is
+then read either by sorting all the websites again (as the dashboard would without the index), or from the
+index, which only moves the websites published since the previous frame. Also reports the cost of the
+hostname filter, as a prefix is typed.
+The garbage collector is disabled during the measures, as the cost of its collections depends on all
+the objects of the process (mostly allocated by the updates of the stats), rather than on the frame.
+
+Usage: PYTHONPATH=. python benchmarks/bench_siteindex.py [--websites 10000] [--updates 1 10 100 1000 10000]
+"""
+import argparse
+import gc
+import random
+import time
+
+from stella import config
+from stella.siteindex import SiteIndex
+from stella.website import Website
+
+PAGE = 50
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--websites', type=int, default=10000)
+    parser.add_argument('--updates', type=int, nargs='+', default=[1, 10, 100, 1000, 10000],
+                        help="websites whose stats change between two frames")
+    parser.add_argument('--frames', type=int, default=20)
+    args = parser.parse_args()
+
+    websites = [Website(f'http://site{i}.example.com', 1) for i in range(args.websites)]
+    for website in websites:
+        website.update_stats(False, True, random.uniform(10, 100), 0, timestamp=0)
+    index = SiteIndex(websites, use_http=False)
+
+    def sort_all():
+        def latency(website):
+            return -website.get_snapshot().ping_stats[config.ALERTING_TIMEFRAME].average_response_time
+        return sorted(websites, key=latency)[:PAGE]
+
+    timestamp = 1
+    for nb_updates in args.updates:
+        sort_time = index_time = 0
+        for _ in range(args.frames):
+            for website in random.sample(websites, min(nb_updates, len(websites))):
+                website.update_stats(False, True, random.uniform(10, 100), 0, timestamp=timestamp)
+            timestamp += 1
+            gc.collect(1)
+            gc.disable()
+            start = time.perf_counter()
+            sort_all()
+            sort_time += time.perf_counter() - start
+            start = time.perf_counter()
+            index.update()
+            index.rows('latency', 0, PAGE)
+            index_time += time.perf_counter() - start
+            gc.enable()
+        print(f"{nb_updates:6d} updates per frame: sort {sort_time / args.frames * 1000:7.2f} ms, "
+              f"index {index_time / args.frames * 1000:7.2f} ms per frame")
+
+    start = time.perf_counter()
+    for prefix in ['s', 'si', 'sit', 'site', 'site1', 'site12', 'site123']:
+        index.set_filter(prefix)
+        index.rows('latency', 0, PAGE)
+    print(f"filter typed: {(time.perf_counter() - start) / 7 * 1000:.2f} ms per key")
+
+
+if __name__ == '__main__':
+    main()
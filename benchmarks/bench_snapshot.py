@@ -0,0 +1,70 @@
+"""Benchmark of the snapshot of the stats of many websites (see stella.snapshot).
+
+Every website holds the stats of a website monitored through icmp every second for the given duration:
+full buffers for the stats timeframes, and minute and hour buckets for the rollup timeframes.
+The stats of a website (and then its rollup buckets) are decoded when first used rather than on restore:
+their cost is measured separately.
+
+Usage: PYTHONPATH=. python benchmarks/bench_snapshot.py [--websites 10000] [--hours 2]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from stella.config import hour
+from stella import snapshot
+from stella.website import Website
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--websites', type=int, default=10000)
+    parser.add_argument('--hours', type=float, default=2)
+    args = parser.parse_args()
+
+    # Monitoring all the websites for hours would take too long: they all share the stats of a single one
+    template = Website('http://template.com', 1)
+    start = time.monotonic() - args.hours * hour
+    for timestamp in range(int(args.hours * hour)):
+        is_up = random.random() < 0.99
+        template.update_stats(False, is_up, random.uniform(10, 100) if is_up else None, 0 if is_up else 1,
+                              start + timestamp)
+    websites = []
+    for i in range(args.websites):
+        website = Website(f'http://site{i}.com', 1)
+        website.ping_stats_list = template.ping_stats_list
+        websites.append(website)
+
+    file_path = os.path.join(tempfile.mkdtemp(), 'stella.snapshot')
+    start = time.perf_counter()
+    snapshot.save(websites, file_path)
+    save_time = time.perf_counter() - start
+    size = os.path.getsize(file_path)
+
+    restored = [Website(f'http://site{i}.com', 1) for i in range(args.websites)]
+    start = time.perf_counter()
+    nb_restored = snapshot.restore(restored, file_path)
+    restore_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for website in restored:
+        website.ping_stats_list.restore_pending()
+    stats_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for website in restored:
+        website.ping_stats_list.rollup.restore_pending()
+    rollup_time = time.perf_counter() - start
+    os.remove(file_path)
+
+    print(f"{args.websites} websites, {size / 2 ** 20:.1f} MiB")
+    print(f"save: {save_time:.3f} s")
+    print(f"restore: {restore_time:.3f} s ({nb_restored} websites)")
+    for name, duration in (("stats", stats_time), ("rollup buckets", rollup_time)):
+        print(f"{name} decoded on first use: {duration:.3f} s in total, "
+              f"{duration / args.websites * 1e6:.0f} us per website")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Benchmark of the memory used by the stats of a website, in bytes per data point.
+
+Compares the current storage (a single buffer of typed arrays shared by all the timeframes)
+with the previous storage (one Stats per timeframe, each keeping its own deques of python objects),
+which is reproduced below for reference.
+
+Usage: python benchmarks/bench_stats_memory.py [--websites 100] [--timeframe 3600]
+"""
+import argparse
+from collections import deque
+import random
+import tracemalloc
+
+from stella.stats import PingStats
+from stella.stats import StatsWindows
+
+
+class LegacyStats(object):
+    """Data point storage of the previous Stats implementation."""
+
+    def __init__(self, max_nb_data_points):
+        self.max_nb_data_points = max_nb_data_points
+        self.ups = deque()
+        self.response_times = deque()
+        self.response_codes = deque()
+
+    def update(self, is_up, response_time, response_code):
+        if len(self.ups) == self.max_nb_data_points:
+            if self.ups.popleft():
+                self.response_times.popleft()
+            self.response_codes.popleft()
+        self.ups.append(is_up)
+        if is_up:
+            self.response_times.append(response_time)
+        self.response_codes.append(response_code)
+
+
+def samples(nb_samples):
+    for _ in range(nb_samples):
+        is_up = random.random() < 0.99
+        # Latencies computed from a clock, as real probes do: each one is a distinct float object
+        yield is_up, (random.random() * 100 if is_up else None), (0 if is_up else 1)
+
+
+def measure(build, nb_websites, nb_samples):
+    """Returns the memory allocated to hold nb_websites filled with nb_samples each, in bytes."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    websites = [build() for _ in range(nb_websites)]
+    for website in websites:
+        for is_up, response_time, response_code in samples(nb_samples):
+            website(is_up, response_time, response_code)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--websites', type=int, default=100)
+    parser.add_argument('--timeframe', type=int, default=3600)
+    args = parser.parse_args()
+
+    # The default timeframes of a website: the longest one holds args.timeframe data points
+    timeframes = [5, 30, 120, 300, args.timeframe]
+    nb_samples = args.timeframe
+    nb_data_points = args.websites * nb_samples
+
+    def build_legacy():
+        stats_list = [LegacyStats(timeframe) for timeframe in timeframes]
+
+        def update(*sample):
+            for stats in stats_list:
+                stats.update(*sample)
+        return update
+
+    def build_current():
+        return StatsWindows(1, timeframes, PingStats).update
+
+    builds = [("deques per timeframe (before)", build_legacy), ("shared typed arrays (after)", build_current)]
+    for name, build in builds:
+        memory = measure(build, args.websites, nb_samples)
+        print(f"{name}: {memory / nb_data_points:.1f} bytes per data point")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Benchmark of Stats.update for increasing window sizes.
+
+The update cost must not depend on the size of the window (from 30 seconds to 24 hours
+of data points at a 1 second check interval). Latencies are steady with many ties,
+which is the worst case when the minimum and maximum are recomputed from all the data points.
+
+Usage: python benchmarks/bench_stats_update.py [--updates 200000]
+"""
+import argparse
+import random
+import time
+
+from stella.stats import PingStats
+from stella.stats import StatsWindows
+
+second = 1
+minute = 60 * second
+hour = 60 * minute
+
+TIMEFRAMES = [30 * second, 10 * minute, 1 * hour, 6 * hour, 24 * hour]
+
+
+def bench(timeframe, nb_updates, stats=None):
+    if stats is None:
+        stats = PingStats(1, timeframe)
+    # Fill the window first, so that every measured update removes an old data point
+    samples = [(random.random() < 0.99, float(random.choice([20, 21, 22]))) for _ in range(timeframe + nb_updates)]
+    for is_up, response_time in samples[:timeframe]:
+        stats.update(is_up, response_time if is_up else None, 0 if is_up else 1)
+
+    start = time.perf_counter()
+    for is_up, response_time in samples[timeframe:]:
+        stats.update(is_up, response_time if is_up else None, 0 if is_up else 1)
+    return (time.perf_counter() - start) / nb_updates
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=200000)
+    args = parser.parse_args()
+
+    for timeframe in TIMEFRAMES:
+        print(f"window {timeframe:>6}s: {bench(timeframe, args.updates) * 1e6:.2f} us/update")
+
+    # All the timeframes at once, sharing a single buffer
+    windows = StatsWindows(1, TIMEFRAMES, PingStats)
+    print(f"{len(TIMEFRAMES)} windows sharing a buffer: "
+          f"{bench(max(TIMEFRAMES), args.updates, windows) * 1e6:.2f} us/update")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,21 +2,58 @@ import datetime
 
 
 class Alert(object):
-    def __init__(self, website, availability):
+    # Whether the alert reports a problem (rather than a recovery)
+    firing = True
+
+    def __init__(self, website, availability, activation_time=None):
         self.website = website
         self.availability = availability
-        self.activation_time = datetime.datetime.now()
+        # Name of the alert rule which raised the alert (see rules.Rule)
+        self.rule_name = 'availability'
+        # URL of the website, telling apart the websites of a same hostname (set by Website.check_for_alert)
+        self.url = None
+        self.activation_time = datetime.datetime.now() if activation_time is None else activation_time
         # self.str_activation_time = self.activation_time.strftime("%d/%m/%y %H:%M:%S")
         self.message = None
 
+    def website_key(self):
+        """Returns the url of the website of the alert, its hostname if unknown."""
+        return self.website if self.url is None else self.url
+
 
 class AvailabilityAlert(Alert):
-    def __init__(self, website, availability):
-        super().__init__(website, availability)
+    def __init__(self, website, availability, activation_time=None):
+        super().__init__(website, availability, activation_time)
         self.message = f"Website {website} is down. availability={availability:0.3f}, time={self.activation_time}"
 
 
 class AvailabilityRecovered(Alert):
-    def __init__(self, website, availability):
-        super().__init__(website, availability)
+    firing = False
+
+    def __init__(self, website, availability, activation_time=None):
+        super().__init__(website, availability, activation_time)
         self.message = f"Website {website} is back up. availability={availability:0.3f}, time={self.activation_time}"
+
+
+class RuleAlert(Alert):
+    def __init__(self, website, rule, value, activation_time=None):
+        """Alert raised when a rule (see rules.Rule) starts firing, value being the metric of the rule."""
+        super().__init__(website, None, activation_time)
+        self.rule = rule
+        self.rule_name = rule.name
+        self.value = value
+        self.message = (f"Website {website} alert {rule.name} ({rule}). value={value:0.3f}, "
+                        f"time={self.activation_time}")
+
+
+class RuleRecovered(Alert):
+    firing = False
+
+    def __init__(self, website, rule, value, activation_time=None):
+        """Alert raised when a rule (see rules.Rule) stops firing, value being the metric of the rule."""
+        super().__init__(website, None, activation_time)
+        self.rule = rule
+        self.rule_name = rule.name
+        self.value = value
+        self.message = (f"Website {website} recovered from {rule.name} ({rule}). value={value:0.3f}, "
+                        f"time={self.activation_time}")
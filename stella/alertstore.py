@@ -0,0 +1,192 @@
+"""Bounded store of the alerts of all the websites, indexed by website (url) and by time.
+
+Websites do not share the store: each one appends its alerts to its own queue (see Website.alert_queue),
+and a single consumer moves them to the store (see AlertStore.drain), so that probe threads never wait
+for each other to record an alert.
+
+The store keeps the last `capacity` alerts in a ring buffer. Older alerts are appended to a spill file,
+one per line (see SPILL_FIELDS), readable with read_spilled.
+"""
+from array import array
+from collections import deque
+import datetime
+from itertools import islice
+import math
+from threading import Lock
+
+from stella import config
+
+# Tab separated fields of a line of the spill file
+SPILL_FIELDS = ['timestamp', 'url', 'kind', 'message']
+
+
+class AlertStore(object):
+    def __init__(self, capacity=config.ALERT_STORE_CAPACITY, spill_file=config.ALERT_SPILL_FILE):
+        """Returns an empty alert store.
+
+        Parameters
+        ----------
+        capacity : int
+            number of alerts kept in memory
+        spill_file : str
+            file to which the alerts evicted from memory are appended, None to drop them
+
+        Attributes
+        ----------
+        lock : threading.Lock
+            protects the store from concurrent uses by the consumer and the readers (the dashboard)
+        alerts : list
+            ring buffer of the alerts, alert id i being at position i % capacity
+        latest_times : array('d')
+            ring buffer of the latest activation time (timestamp) of the alerts up to each alert.
+            Non-decreasing, so that the alerts since a given time are found by bisection,
+            even if alerts are not recieved in time order.
+        next_id : int
+            id of the next alert, i.e. the number of alerts recieved so far
+        site_ids : dict(str:deque)
+            ids of the alerts of each website (by url, see Alert.website_key) still in memory, oldest first.
+            Websites of a same hostname are told apart
+        nb_spilled : int
+            number of alerts evicted from memory so far
+        """
+        if capacity < 1:
+            raise ValueError(f"Capacity ({capacity}) must be positive")
+        self.lock = Lock()
+        self.capacity = capacity
+        self.alerts = [None] * capacity
+        self.latest_times = array('d', [-math.inf]) * capacity
+        self.next_id = 0
+        self.site_ids = {}
+        self.spill_file = spill_file
+        self.spill = None
+        self.nb_spilled = 0
+
+    def first_id(self):
+        """Returns the id of the oldest alert in memory."""
+        return max(0, self.next_id - self.capacity)
+
+    def drain(self, websites):
+        """Moves the alerts queued by the websites (see Website.alert_queue) to the store, and returns them.
+
+        Must only be called by a single consumer.
+        """
+        alerts = []
+        for website in websites:
+            alert_queue = website.alert_queue
+            while alert_queue:
+                alerts.append(alert_queue.popleft())
+        if alerts:
+            alerts.sort(key=lambda alert: alert.activation_time)
+            self.add(alerts)
+        return alerts
+
+    def add(self, alerts):
+        """Adds alerts to the store, evicting the oldest ones once over capacity."""
+        self.lock.acquire()
+        for alert in alerts:
+            if self.next_id >= self.capacity:
+                self.evict(self.next_id - self.capacity)
+            position = self.next_id % self.capacity
+            timestamp = alert.activation_time.timestamp()
+            if self.next_id:
+                timestamp = max(timestamp, self.latest_times[(self.next_id - 1) % self.capacity])
+            self.alerts[position] = alert
+            self.latest_times[position] = timestamp
+            key = alert.website_key()
+            site_ids = self.site_ids.get(key)
+            if site_ids is None:
+                site_ids = self.site_ids[key] = deque()
+            site_ids.append(self.next_id)
+            self.next_id += 1
+        if self.spill is not None:
+            self.spill.flush()
+        self.lock.release()
+
+    def evict(self, alert_id):
+        """Removes the oldest alert from memory, appending it to the spill file if any."""
+        position = alert_id % self.capacity
+        alert = self.alerts[position]
+        self.alerts[position] = None
+        key = alert.website_key()
+        site_ids = self.site_ids[key]
+        site_ids.popleft()
+        if not site_ids:
+            del self.site_ids[key]
+        self.nb_spilled += 1
+        if self.spill_file is not None:
+            if self.spill is None:
+                self.spill = open(self.spill_file, 'a')
+            self.spill.write(f"{alert.activation_time.timestamp()!r}\t{key}\t"
+                             f"{type(alert).__name__}\t{alert.message}\n")
+
+    def count(self, url=None):
+        """Returns the number of alerts in memory, of a website (by url) if not None."""
+        self.lock.acquire()
+        if url is None:
+            count = self.next_id - self.first_id()
+        else:
+            count = len(self.site_ids.get(url, ()))
+        self.lock.release()
+        return count
+
+    def query(self, url=None, start=-math.inf, end=math.inf, offset=0, limit=None):
+        """Returns a page of the alerts in memory, newest first.
+
+        Parameters
+        ----------
+        url : str
+            url of the website whose alerts to return, all the websites if None
+        start : float
+            timestamp from which to return the alerts
+        end : float
+            timestamp until which to return the alerts
+        offset : int
+            number of matching alerts to skip, from the newest
+        limit : int
+            maximum number of alerts to return, all if None
+        """
+        self.lock.acquire()
+        if url is not None:
+            ids = reversed(self.site_ids.get(url, ()))
+        else:
+            ids = range(self.next_id - 1, self.first_since(start) - 1, -1)
+        alerts = self.alerts
+        capacity = self.capacity
+        matching = (alerts[alert_id % capacity] for alert_id in ids)
+        if start != -math.inf or end != math.inf:
+            matching = (alert for alert in matching if start <= alert.activation_time.timestamp() <= end)
+        page = list(islice(matching, offset, None if limit is None else offset + limit))
+        self.lock.release()
+        return page
+
+    def first_since(self, start):
+        """Returns the id of the first alert in memory which may have been activated since start."""
+        low, high = self.first_id(), self.next_id
+        while low < high:
+            middle = (low + high) // 2
+            if self.latest_times[middle % self.capacity] < start:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def close(self):
+        """Closes the spill file."""
+        self.lock.acquire()
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
+        self.lock.release()
+
+
+def read_spilled(file_path, url=None, start=-math.inf, end=math.inf):
+    """Yields (activation time, url, kind, message) for each alert of a spill file, oldest first.
+
+    Alerts can be filtered by website (url) and by activation time (timestamps).
+    """
+    with open(file_path, 'r') as spill:
+        for line in spill:
+            timestamp, alert_url, kind, message = line.rstrip('\n').split('\t', 3)
+            timestamp = float(timestamp)
+            if (url is None or alert_url == url) and start <= timestamp <= end:
+                yield datetime.datetime.fromtimestamp(timestamp), alert_url, kind, message
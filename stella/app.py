@@ -1,15 +1,33 @@
+from collections import deque
 import curses
-from threading import Lock
+import os
+import signal
 from threading import Thread
 import time
 
+from stella.alertstore import AlertStore
 from stella import config
 from stella.dashboard import Dashboard
+from stella.dnscache import CACHE
+from stella.engine import AsyncProbeEngine
+from stella.helpers import Wakeup
+from stella.icmp import CODE_ERROR
+from stella.icmp import IcmpSweeper
+from stella.icmp import native_icmp_available
+from stella.notify import create_sink
+from stella.notify import Notifier
+from stella.probelog import ProbeLog
+from stella.probetarget import group_websites
+from stella.rules import read_rules
+from stella.scheduler import Scheduler
+from stella.shard import ShardedMonitor
+from stella.shard import ShardPublisher
+from stella import snapshot
 from stella.website import Website
 
 
 class App(object):
-    def __init__(self, websites_conf):
+    def __init__(self, websites_conf, shard=None):
         """Returns a website monitoring console app.
 
         The app is able to monitor websites and display a console
@@ -20,75 +38,280 @@ class App(object):
         websites_conf : list
             list of website urls to monitor along with the interval at which to monitor.
             Format is [(url, interval), ...]
+        shard : int
+            index of the shard of websites monitored, in a worker process (see App.run_shard).
+            None in the dashboard process.
 
         Attributes
         ----------
         websites : list
             list of Website objects used to monitor and compute stats for each website
-        alert_history : list
-            list of Alert objects representing the app alert history
+        alert_store : alertstore.AlertStore
+            alerts of all the websites, moved from the alert queue of each website by a single consumer thread
+        nb_restored_websites : int
+            number of websites whose stats were restored from the snapshot file (see config.SNAPSHOT_FILE)
+        probe_log : probelog.ProbeLog
+            log of all the probe results (see config.PROBE_LOG_DIR), None if disabled
+        notifier : notify.Notifier
+            sends the alerts to the sinks of config.NOTIFICATION_SINKS, None if there is none
+        sharded_monitor : shard.ShardedMonitor
+            monitors the websites from worker processes (see config.SHARDED_MONITORING), None if disabled.
+            The websites of the dashboard process are then mirrors of the websites of the worker processes.
+        snapshot_file : str
+            file to which the stats are saved, None if disabled or if they are saved by the worker processes
+        wakeup : helpers.Wakeup
+            wakes the dashboard up when new stats or alerts are to be displayed
         """
 
-        self.websites = [Website(website_conf[0], int(website_conf[1])) for website_conf in websites_conf]
-        self.alert_history = []
-        self.alert_history_lock = Lock()
+        alert_rules = []
+        if config.ALERT_RULES_FILE is not None:
+            alert_rules = read_rules(config.ALERT_RULES_FILE)
+        self.websites = [Website(website_conf[0], int(website_conf[1]), alert_rules=alert_rules)
+                         for website_conf in websites_conf]
+        self.alert_store = AlertStore()
+        for website in self.websites:
+            website.alert_queue = deque()
+        self.wakeup = Wakeup()
+
+        self.sharded_monitor = None
+        if shard is None and config.SHARDED_MONITORING:
+            self.sharded_monitor = ShardedMonitor(self.websites, websites_conf, App.run_shard)
+
+        # Worker processes save (and log) the websites of their shard, to files of their own
+        self.snapshot_file = config.SNAPSHOT_FILE
+        probe_log_dir = config.PROBE_LOG_DIR
+        if self.sharded_monitor is not None:
+            self.snapshot_file = probe_log_dir = None
+        elif shard is not None:
+            if self.snapshot_file is not None:
+                self.snapshot_file = f"{self.snapshot_file}.{shard}"
+            if probe_log_dir is not None:
+                probe_log_dir = os.path.join(probe_log_dir, f"shard{shard}")
+
+        restore_file = self.snapshot_file
+        if shard is not None and restore_file is not None and not os.path.exists(restore_file):
+            # First sharded run: the websites of the shard are restored from the snapshot of all the websites
+            restore_file = config.SNAPSHOT_FILE
+        self.nb_restored_websites = 0
+        if restore_file is not None and os.path.exists(restore_file):
+            try:
+                self.nb_restored_websites = snapshot.restore(self.websites, restore_file)
+            except snapshot.SnapshotError:
+                # Unreadable snapshot (e.g. from another version): start from scratch
+                pass
+
+        self.notifier = None
+        if config.NOTIFICATION_SINKS and shard is None:
+            self.notifier = Notifier([create_sink(*sink) for sink in config.NOTIFICATION_SINKS])
+
+        self.probe_log = None
+        if probe_log_dir is not None:
+            self.probe_log = ProbeLog(probe_log_dir)
+            for website in self.websites:
+                website.probe_log = self.probe_log
 
     def wrapped_dashboard(self, screen):
         """Dashboard wrapper used to resume terminal state in case of a program crash.
 
         Used for developement purposes
         """
-        dashboard = Dashboard(screen, self.websites, self.alert_history)
+        dashboard = Dashboard(screen, self.websites, self.alert_store, self.wakeup)
         dashboard.start()
 
     def start(self):
-        """Start the monitoring threads and the console dashboard"""
-        for website in self.websites:
-            thread = Thread(target=App.monitor_website,
-                            args=(website, self.alert_history, self.alert_history_lock),
+        """Start the monitoring threads (or engine, or worker processes) and the console dashboard"""
+        if self.sharded_monitor is not None:
+            self.sharded_monitor.start()
+        else:
+            App.start_probes(self.websites)
+        # Daemon threads (and processes) will stop when program exits
+
+        if self.notifier is not None:
+            self.notifier.start()
+        thread = Thread(target=App.drain_alerts,
+                        args=(self.alert_store, self.websites, config.ALERT_DRAIN_INTERVAL, self.notifier,
+                              self.wakeup),
+                        daemon=True)
+        thread.start()
+        if self.probe_log is not None:
+            self.probe_log.start()
+        if self.snapshot_file is not None:
+            thread = Thread(target=App.save_snapshots,
+                            args=(self.websites, self.snapshot_file, config.SNAPSHOT_INTERVAL),
                             daemon=True)
             thread.start()
-            # Daemon threads will stop when program exits
 
         # Start Dashboard
         # Dashboard is started in the main thread since POSIX signals cannot be handled in children threads
-        curses.wrapper(self.wrapped_dashboard)
+        try:
+            curses.wrapper(self.wrapped_dashboard)
+        finally:
+            # When dashboard is exited, stats and probe results are saved, then program will end and exit.
+            if self.sharded_monitor is not None:
+                self.sharded_monitor.stop()
+            if self.snapshot_file is not None:
+                snapshot.save(self.websites, self.snapshot_file)
+            if self.probe_log is not None:
+                self.probe_log.close()
+            alerts = self.alert_store.drain(self.websites)
+            self.alert_store.close()
+            if self.notifier is not None:
+                self.notifier.notify(alerts)
+                self.notifier.close()
+
+    def start_probes(websites):
+        """Starts the monitoring threads (or the asyncio probe engine, or the ICMP sweep) of the websites.
 
-        # When dashboard is exited, program will end and exit.
+        The websites sharing a probe target are probed once for all (see probetarget.group_websites).
+        """
+        if config.ICMP_SWEEP and not config.MONITOR_HTTP_RATHER_THAN_ICMP and native_icmp_available():
+            thread = Thread(target=App.sweep_websites, args=(websites,), daemon=True)
+            thread.start()
+        elif config.USE_ASYNC_ENGINE:
+            engine = AsyncProbeEngine(websites)
+            engine.start()
+        else:
+            scheduler = Scheduler(group_websites(websites, config.MONITOR_HTTP_RATHER_THAN_ICMP))
+            scheduler.start(App.check_target, on_error=App.record_error)
 
-    def monitor_website(website, alert_history, alert_history_lock=Lock()):
-        """Regularly check whether the site is up, and update stats and alert status accordingly.
+    def run_shard(shard, websites_conf, connection):
+        """Monitors a shard of the websites in a worker process, until the dashboard process stops it.
 
-        This function is an infinite loop. Run inside a thread to prevent blocking the program.
+        Started by shard.ShardedMonitor. The stats deltas and alerts of the websites are sent to the dashboard
+        process through connection (see shard.ShardPublisher), and their stats saved to a snapshot file
+        of the shard (see config.SNAPSHOT_FILE).
 
         Arguments
         ---------
-        website : website.Website
-            The website to monitor. It can be a shared object, but
-            ensure all uses of the website attributes are protected by the website.lock attribute
-        alert_history : list
-            An shared object used to save the alerts if any are detected
-        alert_history_lock : threading.Lock
-            a lock to ensure alert_history is only used by one website at a time
+        shard : int
+            index of the shard
+        websites_conf : list
+            [(url, interval), ...] of the websites of the shard
+        connection : multiprocessing.connection.Connection
+            end of the pipe to the dashboard process
+        """
+        # The dashboard process handles the interruptions from the terminal, and stops the worker processes
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        app = App(websites_conf, shard=shard)
+        publisher = ShardPublisher(app.websites, connection)
+        App.start_probes(app.websites)
+        if app.probe_log is not None:
+            app.probe_log.start()
+        if app.snapshot_file is not None:
+            thread = Thread(target=App.save_snapshots,
+                            args=(app.websites, app.snapshot_file, config.SNAPSHOT_INTERVAL),
+                            daemon=True)
+            thread.start()
+
+        try:
+            publisher.run()
+        finally:
+            if app.snapshot_file is not None:
+                snapshot.save(app.websites, app.snapshot_file)
+            if app.probe_log is not None:
+                app.probe_log.close()
+            connection.close()
+
+    def check_target(target):
+        """Checks whether the site is up, and updates stats and alert status of its websites accordingly.
+
+        Run by the worker threads of the scheduler (see scheduler.Scheduler.start), when the check is due.
+
+        Arguments
+        ---------
+        target : probetarget.ProbeTarget
+            The target to probe, whose websites can be shared objects, but
+            ensure all uses of the website attributes are protected by the website.lock attribute.
+            Alerts are appended to their alert queues (see Website.check_for_alert).
 
 
         Note
         ----
         Arguments are shared attributes. Ensure they are correctly protected by the respective thread locks.
         """
+        target.check(use_http=config.MONITOR_HTTP_RATHER_THAN_ICMP)
+
+    def record_error(target):
+        """Records a check of the target whose probe raised an exception as down (see App.check_target)."""
+        target.record_error(use_http=config.MONITOR_HTTP_RATHER_THAN_ICMP)
+
+    def save_snapshots(websites, file_path, interval):
+        """Regularly saves the stats of the websites to file_path (see snapshot.save).
+
+        This function is an infinite loop. Run inside a thread to prevent blocking the program.
+        """
         while True:
-            start = time.time()
+            time.sleep(interval)
+            snapshot.save(websites, file_path)
 
-            if config.MONITOR_HTTP_RATHER_THAN_ICMP:
-                website.ping_and_update_stats(use_http=True)
-                alert = website.check_for_alert(use_http=True)
-            else:
-                website.ping_and_update_stats(use_http=False)
-                alert = website.check_for_alert(use_http=False)
+    def drain_alerts(alert_store, websites, interval, notifier=None, wakeup=None):
+        """Regularly moves the alerts queued by the websites to the alert store (see alertstore.AlertStore.drain).
+
+        This function is an infinite loop. Run inside a thread to prevent blocking the program.
+        It is the only consumer of the alert queues. Alerts are then handed over to the notifier if any,
+        which never blocks, and the wakeup if any is set so that the dashboard displays them.
+        """
+        while True:
+            time.sleep(interval)
+            alerts = alert_store.drain(websites)
+            if notifier is not None:
+                notifier.notify(alerts)
+            if alerts and wakeup is not None:
+                wakeup.set()
 
-            if alert is not None:
-                alert_history_lock.acquire()
-                alert_history += [alert]
-                alert_history_lock.release()
+    def sweep_websites(websites, sweeper=None):
+        """Regularly sweeps all the due websites through a single ICMP socket.
 
-            time.sleep(max(0, website.check_interval - (time.time() - start)))
+        This function is an infinite loop. Run inside a thread to prevent blocking the program.
+        At each sweep, an echo request is sent to every website whose check is due, and the
+        replies are collected by a single selector loop (see icmp.IcmpSweeper).
+        The first checks are not spread over the check intervals (see scheduler.Scheduler),
+        so that the websites with the same check interval keep being probed by the same sweeps.
+        The websites on the same host are probed once for all (see probetarget.group_websites).
+
+        Arguments
+        ---------
+        websites : list(website.Website)
+            The websites to monitor
+        sweeper : icmp.IcmpSweeper
+            the sweeper to use. A new one is opened if None.
+        """
+        if not websites:
+            return
+        if sweeper is None:
+            # A sweep must not last longer than the shortest check interval
+            sweeper = IcmpSweeper(min([config.ICMP_TIMEOUT] + [website.check_interval for website in websites]))
+        targets = group_websites(websites, use_http=False)
+        scheduler = Scheduler(targets, jitter=0)
+
+        while True:
+            due = scheduler.pop_due(time.monotonic())
+
+            App.sweep(sweeper, [targets[i] for i in due])
+
+            now = time.monotonic()
+            for i in due:
+                scheduler.done(i, now)
+            time.sleep(max(0, scheduler.next_deadline() - time.monotonic()))
+
+    def sweep(sweeper, targets):
+        """Probes the targets in a single sweep, then updates the stats and alert status of their websites.
+
+        The hosts are resolved from the DNS cache first, the hosts which cannot be resolved not being probed.
+        The sweeper being IPv4 only, IPv6 addresses are pinged one after the other (see Website.ping).
+        """
+        addresses = []
+        for target in targets:
+            address, dns_time = CACHE.resolve(target.hostname)
+            target.update_dns_stats(address is not None, dns_time)
+            addresses.append(address)
+        results = iter(sweeper.sweep([address for address in addresses if address is not None and ':' not in address]))
+
+        for target, address in zip(targets, addresses):
+            if address is None:
+                is_up, response_time, response_code = False, None, CODE_ERROR
+            elif ':' in address:
+                is_up, response_time, response_code = Website.ping(address)
+            else:
+                is_up, response_time, response_code = next(results)
+            target.update(False, is_up, response_time, response_code)
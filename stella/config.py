@@ -1,6 +1,7 @@
 second = 1
 minute = 60
 hour = 60 * minute
+day = 24 * hour
 
 ################################################################
 # Suggested values, Used for README.md screenshots
@@ -10,11 +11,144 @@ MONITOR_HTTP_RATHER_THAN_ICMP = False
 
 # Stats
 CONSOLE_REFRESH_INTERVAL = 1
+# The dashboard is drawn again as soon as websites publish new stats or alerts, at most this many times per second
+CONSOLE_MAX_FRAME_RATE = 20
 STATS_TIMEFRAMES = [30 * second, 2 * minute, 5 * minute, 10 * minute]
+# Relative error bound of the response time percentiles
+PERCENTILES_RELATIVE_ACCURACY = 0.01
+
+# Long timeframes, computed from per-minute and per-hour rollups rather than from all the data points
+# (timeframes of STATS_TIMEFRAMES longer than RAW_STATS_MAX_TIMEFRAME are also computed from rollups)
+ROLLUP_TIMEFRAMES = [24 * hour, 30 * day]
+RAW_STATS_MAX_TIMEFRAME = 1 * hour
+# How long per-minute buckets are kept (per-hour buckets are kept for the longest timeframe)
+ROLLUP_MINUTE_RETENTION = 1 * hour
+ROLLUP_PERCENTILES_RELATIVE_ACCURACY = 0.05
 
 # Alerting
 DEFAULT_ALERT_THRESHOLD = 0.8
 ALERTING_TIMEFRAME = 5 * second
+# File of alert rules on other metrics (p95 response time, 5xx ratio...), see stella/rules.py. None for no rules.
+ALERT_RULES_FILE = None
+# Number of alerts kept in memory, for all the websites (older alerts are moved to ALERT_SPILL_FILE)
+ALERT_STORE_CAPACITY = 10000
+# File to which the alerts evicted from memory are appended. Set to None to drop them.
+ALERT_SPILL_FILE = "stella.alerts"
+# in seconds, how often the alerts raised by the websites are moved to the alert store
+ALERT_DRAIN_INTERVAL = 1 * second
+# Number of alerts kept in the history of each website
+WEBSITE_ALERT_HISTORY_SIZE = 100
+
+# Notifications
+# Sinks to which the alerts are sent (see stella/notify.py), as (kind, target) or (kind, target, batch window),
+# kind being "webhook" (url), "file" (path) or "command" (command line). For example:
+# NOTIFICATION_SINKS = [("webhook", "http://localhost:8080/alerts"), ("file", "alerts.jsonl", 1 * minute)]
+NOTIFICATION_SINKS = []
+# in seconds, how long alerts are collected before being sent together (unless given for the sink)
+NOTIFICATION_BATCH_WINDOW = 5 * second
+# Maximum number of alerts waiting to be sent by each sink (further alerts are dropped)
+NOTIFICATION_QUEUE_SIZE = 1000
+# Number of times a batch of alerts is sent again after a failure, before being dropped
+NOTIFICATION_MAX_RETRIES = 5
+# in seconds, delay before sending a failed batch again, doubled at each retry up to NOTIFICATION_MAX_BACKOFF
+NOTIFICATION_RETRY_BACKOFF = 1 * second
+NOTIFICATION_MAX_BACKOFF = 1 * minute
+# in seconds, after which sending a batch of alerts is considered failed
+NOTIFICATION_TIMEOUT = 10 * second
+
+# Probing
+# Run all probes as tasks of a single asyncio event loop rather than from threads (see SCHEDULER_WORKERS)
+USE_ASYNC_ENGINE = False
+# Maximum number of probes in flight at the same time with the asyncio engine
+MAX_CONCURRENT_PROBES = 256
+# in seconds, after which a probe is considered failed (asyncio engine)
+PROBE_TIMEOUT = 10 * second
+# Probe each host once per check interval for all the websites on it (icmp), rather than once per website
+DEDUPLICATE_PROBES = True
+# Probe each url once per check interval for all the websites with this url (http)
+DEDUPLICATE_HTTP_PROBES = False
+# Number of threads running the checks (unless the asyncio engine is used)
+SCHEDULER_WORKERS = 64
+# Fraction of its check interval over which the first check of each website is randomly delayed,
+# so that the websites are not all probed at once on startup
+SCHEDULER_JITTER = 1.0
+# What to do when a check is done after the next deadline of its website (see stella.scheduler):
+# "skip" the missed checks, "coalesce" them into a single check run at once,
+# or "stretch" the interval (the next check is one interval after the late one is done)
+SCHEDULER_OVERLOAD_POLICY = "skip"
+
+# Sharding
+# Probe the websites from worker processes (the websites being split across them) rather than from
+# the dashboard process, so that the probes, stats and alerts of large fleets use several cores
+SHARDED_MONITORING = False
+# Number of worker processes (one per core if None)
+MONITORING_PROCESSES = None
+# in seconds, between two batches of stats and alerts sent by a worker process to the dashboard process
+SHARD_BATCH_INTERVAL = 0.05 * second
+# in seconds, after which the worker processes are not waited for anymore on exit
+SHARD_STOP_TIMEOUT = 5 * second
+
+# DNS
+# Resolve the probed hosts from a shared cache (see stella/dnscache.py) rather than at every check,
+# and record the DNS resolution time of the checks apart from their response time
+DNS_CACHE = True
+# in seconds, bounds of the time for which resolutions are cached (the TTL of their DNS records)
+DNS_MIN_TTL = 5 * second
+DNS_MAX_TTL = 1 * hour
+# in seconds, for which resolutions are cached when the TTL of their records is unknown (e.g. names of /etc/hosts)
+DNS_DEFAULT_TTL = 5 * minute
+# in seconds, maximum time for which failed resolutions are cached
+DNS_NEGATIVE_TTL = 30 * second
+# Fraction of their TTL after which the resolutions still in use are refreshed in the background
+DNS_REFRESH_AHEAD = 0.8
+# in seconds, after which a DNS query without answer falls back to the system resolver
+# (as do the negative answers, which are only cached if the system resolver fails too)
+DNS_TIMEOUT = 2 * second
+
+# ICMP
+# Send ICMP probes from an in-process socket rather than running the ping command
+# (falls back to the ping command if ICMP sockets are not allowed)
+ICMP_NATIVE = True
+# in seconds, after which an ICMP probe without reply is considered failed
+ICMP_TIMEOUT = 2 * second
+# Probe all the due websites at once from a single ICMP socket (requires ICMP sockets, see ICMP_NATIVE)
+ICMP_SWEEP = False
+
+# HTTP connection pool
+# Reuse persistent (keep-alive) connections between http checks
+HTTP_KEEP_ALIVE = True
+# Maximum number of idle connections kept open per host
+HTTP_POOL_MAX_SIZE = 2
+# in seconds, after which an idle connection is closed
+HTTP_POOL_IDLE_TIMEOUT = 30 * second
+# Every HTTP_COLD_CHECK_INTERVAL checks, use a new connection and record its "cold" latency separately
+# (set to 0 to disable)
+HTTP_COLD_CHECK_INTERVAL = 10
+# Time the phases of the http checks (TCP connection, TLS handshake, time to first byte, body transfer),
+# displayed on the website page along with the DNS resolution time
+HTTP_PHASE_TIMINGS = True
+
+# Snapshots
+# File to which the stats are saved (periodically and on exit), and from which they are restored on startup.
+# Set to None to disable snapshots.
+SNAPSHOT_FILE = "stella.snapshot"
+# in seconds, how often the snapshot is saved
+SNAPSHOT_INTERVAL = 1 * minute
+
+# Probe log
+# Directory of the on-disk log of all the probe results (see stella/probelog.py), for example "stella.probelog".
+# None (the default) disables the log.
+PROBE_LOG_DIR = None
+# in seconds, how long probe results are kept in the log
+PROBE_LOG_RETENTION = 7 * day
+# in seconds, how often probe results are written (and synced) to disk
+PROBE_LOG_FLUSH_INTERVAL = 1 * second
+# in seconds, how often expired probe results are removed from the log
+PROBE_LOG_COMPACTION_INTERVAL = 1 * hour
+# Number of probe results per segment file (24 bytes each)
+PROBE_LOG_SEGMENT_RECORDS = 2 ** 20
+# Number of probe results per block of the time index of the segments
+PROBE_LOG_INDEX_BLOCK_RECORDS = 4096
 
 ################################################################
 
@@ -1,13 +1,24 @@
 import curses
 import curses.ascii
+from functools import partial
+import selectors
 from signal import signal, SIGINT, SIGTERM
 import sys
-
-if sys.platform != "win32":  # Uncompatible with the Windows platform
-    from signal import alarm
-    from signal import SIGALRM
+import time
 
 from stella import config
+from stella.helpers import format_duration
+from stella.helpers import Wakeup
+from stella.http_pool import HTTP_PHASES
+from stella.probetarget import nb_saved_probes
+from stella.siteindex import SiteIndex
+from stella.siteindex import SORT_ORDERS
+
+# Minimum heights of the home screen windows, when the terminal is too small to display all the websites
+MIN_LIST_HEIGHT = 4
+MIN_ALERTS_HEIGHT = 5
+# On Windows, where the console input cannot be waited on with a selector, interval (s) at which it is read
+INPUT_POLL_INTERVAL = 0.05
 
 
 class Dashboard(object):
@@ -17,9 +28,14 @@ class Dashboard(object):
     ----
     Console update is based on :
     - user input
-    - automatic reload every 10 seconds on Linux and Mac (using SIGALRM).
+    - new stats or alerts, the websites and the alert consumer waking the dashboard up through a Wakeup
+      (at most config.CONSOLE_MAX_FRAME_RATE times per second)
+    - automatic reload every config.CONSOLE_REFRESH_INTERVAL seconds otherwise.
+
+    The windows of the home screen are created once, and each frame only writes the cells whose text changed.
+    Only the websites visible in the list are rendered, in the order and with the filter of the site index.
     """
-    def __init__(self, screen, websites, alert_history):
+    def __init__(self, screen, websites, alert_store, wakeup=None):
         """Initialises a curses console.
 
         Parameters
@@ -28,8 +44,11 @@ class Dashboard(object):
             main console screen, on which to build windows, and from which to retrieve user input
         websites : list
             list of Website objects containing their Stats and Alerts
-        alert_history : list
-            list of Alert to display them
+        alert_store : alertstore.AlertStore
+            alerts to display, newest first
+        wakeup : helpers.Wakeup
+            set when new alerts are added to alert_store, and by the websites when they publish new stats.
+            A new one is created if None.
         """
         signal(SIGINT, self.exit_dashboard)
         signal(SIGTERM, self.exit_dashboard)
@@ -41,22 +60,78 @@ class Dashboard(object):
         curses.init_pair(1, curses.COLOR_BLUE, curses.COLOR_BLACK)
         self.screen.keypad(True)
         self.websites = websites
+        self.site_index = SiteIndex(websites)
+        # Index in self.websites of the selected website, and its position in the list
         self.selected_website = 0
-        self.alert_history = alert_history
+        self.selected_row = 0
+        # Position in the list of the first website displayed, and number of websites displayed
+        self.offset = 0
+        self.visible_rows = 0
+        self.sort_order = SORT_ORDERS[0]
+        # Whether the keys typed edit the hostname filter
+        self.filtering = False
+        self.alert_store = alert_store
         self.refresh_interval = config.CONSOLE_REFRESH_INTERVAL
+        self.frame_interval = 1 / config.CONSOLE_MAX_FRAME_RATE
+        self.wakeup = Wakeup() if wakeup is None else wakeup
+        # File from which curses reads the keys typed
+        self.input = sys.stdin
+        for website in websites:
+            website.wakeup = self.wakeup
         self.main_screen_timeframe = config.ALERTING_TIMEFRAME
+        # Home screen windows, their (height, width), and the (text, attributes) last written at each (y, x)
+        self.windows = None
+        self.window_sizes = {}
+        self.bordered = set()
+        self.cells = {}
+        # (website, stats snapshot, selected) last displayed on each row of the list, None for an empty row
+        self.rows = {}
+        # Render time and number of cells written of the last frame
+        self.frame_time = 0
+        self.nb_written_cells = 0
 
     def start(self):
         self.screen.clear()
         self.screen.refresh()
-        self.go_to_home_screen(None, None)
-
-    def go_to_home_screen(self, _, __):
-        """Loops through the home screen, listens for user input and periodically refreshes the interface."""
-        self._continue = True
-        while self._continue:
-            self.print_home_screen()
-            self._continue = self.listen_for_input()
+        self.go_to_home_screen()
+
+    def go_to_home_screen(self):
+        """Loops through the home screen, waiting for user input or new data, and refreshes the interface.
+
+        The loop waits on both the console input and the wakeup. A frame is drawn at once for user input,
+        and at most every frame_interval seconds for new data, so that the dashboard stays idle
+        when nothing changes.
+        """
+        selector = selectors.DefaultSelector()
+        selector.register(self.wakeup, selectors.EVENT_READ)
+        if sys.platform != "win32":
+            selector.register(self.input, selectors.EVENT_READ)
+        changed = True
+        next_frame = 0
+        while True:
+            now = time.monotonic()
+            if changed and now >= next_frame:
+                self.print_home_screen()
+                changed = False
+                next_frame = now + self.frame_interval
+            timeout = max(0, next_frame - now) if changed else self.refresh_interval
+            if sys.platform == "win32":
+                timeout = min(timeout, INPUT_POLL_INTERVAL)
+            events = selector.select(timeout)
+            if not events and not changed:
+                # Nothing happened for refresh_interval
+                changed = True
+            if any(key.fileobj is self.wakeup for key, _ in events):
+                self.wakeup.clear()
+                changed = True
+            if sys.platform == "win32" or any(key.fileobj is self.input for key, _ in events):
+                nb_keys, _continue = self.listen_for_input()
+                if not _continue:
+                    break
+                if nb_keys:
+                    changed = True
+                    next_frame = 0
+        selector.close()
         self.exit_dashboard(None, None)
 
     def exit_dashboard(self, signal_arg1, signal_arg2):
@@ -77,168 +152,377 @@ class Dashboard(object):
             window.addstr(0, max(1, (width - len(title)) // 2), title, curses.A_BOLD)
         return window
 
-    def print_home_screen(self):
-        """Prints the main dashboard screen with the list of all websites and of all alerts."""
+    def create_windows(self):
+        """Creates the windows of the home screen, sized to the terminal, with their borders and titles.
+
+        Windows are kept from one frame to the next, and only created again when the terminal is resized.
+        Websites which do not fit in the terminal are not displayed.
+        """
+        height, _ = self.screen.getmaxyx()
+        ws_nb = max(len(self.websites) + 4, len(config.STATS_TIMEFRAMES) * 7)
+        list_height = max(MIN_LIST_HEIGHT, min(ws_nb, height - 2 - MIN_ALERTS_HEIGHT))
+        alerts_height = max(MIN_ALERTS_HEIGHT, min(ws_nb + 2, height - 2 - list_height))
 
-        # Print header
         monitoring_type = "HTTP" if config.MONITOR_HTTP_RATHER_THAN_ICMP else "Ping"
-        self.window = Dashboard.newwin(
-            0, 56, 0, 0, f"Welcome to Stella : {monitoring_type} Monitoring (press h for help)",
-            False)
-        self.window.addstr(1, 1, "Select a website to display additional information:")
-        self.window.refresh()
-
-        ws_nb = max(len(self.websites) + 4, len(config.STATS_TIMEFRAMES) * 5)
-        # Initialise columns
-        self.window_hostname = Dashboard.newwin(ws_nb, 30, 2, 0, "Hostname")
-        self.window_availability = Dashboard.newwin(ws_nb, 15, 2, 29, "Availability")
-        self.window_response_time = Dashboard.newwin(ws_nb, 18, 2, 29 + 13, "Resp.Time in ms")
-        self.window_alerts = Dashboard.newwin(ws_nb + 2, 95, ws_nb + 2, 0,
-                                              f"Alerts ({config.ALERTING_TIMEFRAME}s timeframe)")
-
-        self.window_response_time.addstr(1, 1, " (min/avg/max)", curses.A_BOLD)
-
-        # Print columns
+        self.windows = {
+            'header': Dashboard.newwin(
+                2, 56, 0, 0, f"Welcome to Stella : {monitoring_type} Monitoring (press h for help)", False),
+            'hostname': Dashboard.newwin(list_height, 30, 2, 0, "Hostname"),
+            'availability': Dashboard.newwin(list_height, 15, 2, 29, "Availability"),
+            'response_time': Dashboard.newwin(list_height, 18, 2, 29 + 13, "Resp.Time in ms"),
+            'detailed': Dashboard.newwin(list_height + 2, 35, 0, 60),
+            'alerts': Dashboard.newwin(alerts_height, 95, list_height + 2, 0,
+                                       f"Alerts ({config.ALERTING_TIMEFRAME}s timeframe)"),
+        }
+        self.windows['response_time'].addstr(1, 1, " (min/avg/max)", curses.A_BOLD)
+        self.window_sizes = {
+            'header': (2, 56),
+            'hostname': (list_height, 30),
+            'availability': (list_height, 15),
+            'response_time': (list_height, 18),
+            'detailed': (list_height + 2, 35),
+            'alerts': (alerts_height, 95),
+        }
+        self.bordered = {name for name in self.windows if name != 'header'}
+        self.cells = {name: {} for name in self.windows}
+        self.rows = {}
+
+    def write(self, name, y, x, text, attributes=0):
+        """Writes text in a window of the home screen, unless the same text is already displayed there.
+
+        Parameters
+        ----------
+        name : str
+            name of the window, in self.windows
+        y : int
+            line in the window, the text is not written on the bottom border (if any) or below
+        x : int
+            column in the window, the text being cut before the right border
+        text : str
+            text to write, padded with spaces to erase a longer text previously written at the same place
+        attributes : int
+            curses attributes of the text
+        """
+        height, width = self.window_sizes[name]
+        if y >= height - (name in self.bordered):
+            return
+        text = text[:max(0, width - x - 1)]
+        cells = self.cells[name]
+        previous = cells.get((y, x))
+        if previous == (text, attributes):
+            return
+        cells[(y, x)] = (text, attributes)
+        if previous is not None and len(previous[0]) > len(text):
+            text = text.ljust(len(previous[0]))
+        self.windows[name].addstr(y, x, text, attributes)
+        self.nb_written_cells += 1
+
+    def redraw(self):
+        """Draws the whole home screen again at the next frame, after another page was displayed over it."""
+        if self.windows is not None:
+            for window in self.windows.values():
+                window.touchwin()
+
+    def print_home_screen(self):
+        """Prints the main dashboard screen with the list of all websites and of all alerts.
+
+        Only the cells whose text changed since the previous frame are written, before a single doupdate.
+        """
+        frame_start = time.perf_counter()
+        if self.windows is None:
+            try:
+                self.create_windows()
+            except curses.error:
+                # The terminal is too small for the windows: wait for it to be resized
+                self.windows = None
+                self.screen.clear()
+                self.screen.addstr(0, 0, "Please resize your terminal."[:self.screen.getmaxyx()[1] - 1])
+                self.screen.refresh()
+                return
+
+        # Render time of the previous frame, in the border of the alerts window
+        self.write('alerts', 0, self.window_sizes['alerts'][1] - 32,
+                   f" Frame: {self.frame_time * 1000:5.1f} ms, {self.nb_written_cells:5d} cells ")
+        self.nb_written_cells = 0
+
+        # Print the visible rows of the list, the other websites are not rendered
+        self.site_index.update()
         header_lines = 2
-        for i, website in enumerate(self.websites):
-            website.lock.acquire()
-            stats_list = website.http_stats_list if config.MONITOR_HTTP_RATHER_THAN_ICMP else website.ping_stats_list
-
-            if i == self.selected_website:
-                self.window_hostname.addstr(i + header_lines, 1, f"> {website.hostname}",
-                                            curses.color_pair(1) | curses.A_BOLD)
-                self.window_availability.addstr(
-                    i + header_lines, 3,
-                    f"{stats_list[config.ALERTING_TIMEFRAME].availability:.2f}",
-                    curses.color_pair(1) | curses.A_BOLD)
-                self.window_response_time.addstr(
-                    i + header_lines, 3,
-                    (f"{stats_list[config.ALERTING_TIMEFRAME].min_response_time:.0f}"
-                     f"/{stats_list[config.ALERTING_TIMEFRAME].average_response_time:.0f}"
-                     f"/{stats_list[config.ALERTING_TIMEFRAME].max_response_time:.0f}"),
-                    curses.color_pair(1) | curses.A_BOLD)
-
-            else:
-                self.window_hostname.addstr(i + header_lines, 1, f"  {website.hostname}")
-                self.window_availability.addstr(
-                    i + header_lines, 3,
-                    f"{stats_list[config.ALERTING_TIMEFRAME].availability:.2f}")
-                self.window_response_time.addstr(
-                    i + header_lines, 3,
-                    (f"{stats_list[config.ALERTING_TIMEFRAME].min_response_time:.0f}"
-                     f"/{stats_list[config.ALERTING_TIMEFRAME].average_response_time:.0f}"
-                     f"/{stats_list[config.ALERTING_TIMEFRAME].max_response_time:.0f}"))
-            website.lock.release()
+        self.visible_rows = self.window_sizes['hostname'][0] - header_lines - 1
+        nb_rows = self.site_index.count()
+        self.selected_row = max(0, min(self.selected_row, nb_rows - 1))
+        # The list scrolls to keep the selected website visible
+        self.offset = max(min(self.offset, self.selected_row), self.selected_row - self.visible_rows + 1)
+        rows = self.site_index.rows(self.sort_order, self.offset, self.visible_rows)
+        if rows:
+            self.selected_website = rows[self.selected_row - self.offset]
+
+        for i in range(self.visible_rows):
+            if i >= len(rows):
+                if self.rows.get(i) is not None:
+                    self.rows[i] = None
+                    for name in ('hostname', 'availability', 'response_time'):
+                        self.write(name, i + header_lines, 1, '')
+                continue
+            website = self.websites[rows[i]]
+            # The published snapshot is read rather than the stats, so that probe threads are never blocked
+            snapshot = website.get_snapshot()
+            stats = (snapshot.http_stats if config.MONITOR_HTTP_RATHER_THAN_ICMP
+                     else snapshot.ping_stats)[config.ALERTING_TIMEFRAME]
+            selected = i + self.offset == self.selected_row
+            # Snapshots being immutable, the row is unchanged if the same snapshot is displayed
+            if self.rows.get(i) == (website, stats, selected):
+                continue
+            self.rows[i] = (website, stats, selected)
+            attributes = curses.color_pair(1) | curses.A_BOLD if selected else 0
+            self.write('hostname', i + header_lines, 1, f"{'>' if selected else ' '} {website.hostname}", attributes)
+            self.write('availability', i + header_lines, 1, f"  {stats.availability:.2f}", attributes)
+            self.write('response_time', i + header_lines, 1,
+                       (f"  {stats.min_response_time:.0f}/{stats.average_response_time:.0f}"
+                        f"/{stats.max_response_time:.0f}"),
+                       attributes)
+
+        if rows:
+            position = f"{self.offset + 1}-{self.offset + len(rows)} of {nb_rows}"
+        else:
+            position = f"0 of {nb_rows}"
+        hostname_filter = ""
+        if self.filtering or self.site_index.prefix:
+            hostname_filter = f", /{self.site_index.prefix}{'_' if self.filtering else ''}"
+        self.write('header', 1, 1, f"Sorted by {self.sort_order}{hostname_filter}: {position}")
 
         # Print Alerts
-        self.print_alerts(self.window_alerts, self.alert_history, ws_nb + 2)
+        alerts_height = self.window_sizes['alerts'][0]
+        alerts = self.alert_store.query(limit=alerts_height - 2)
+        for i in range(alerts_height - 2):
+            self.write('alerts', i + 1, 1, alerts[i].message if i < len(alerts) else '')
 
         # Detailed information
-        self.window_detailed = Dashboard.newwin(ws_nb + 2, 35, 0, 60)
         website = self.websites[self.selected_website]
-        website.lock.acquire()
-        self.window_detailed.addstr(0, 1, f"Website : {website.hostname}", curses.A_BOLD)
+        snapshot = website.get_snapshot()
+        stats_list = snapshot.http_stats if config.MONITOR_HTTP_RATHER_THAN_ICMP else snapshot.ping_stats
+        self.write('detailed', 0, 1, f"Website : {website.hostname}", curses.A_BOLD)
         print_index = 0
         for timeframe in config.STATS_TIMEFRAMES:
-            stats_list = website.http_stats_list if config.MONITOR_HTTP_RATHER_THAN_ICMP else website.ping_stats_list
-            print_index = self.print_detailed_website_stats(self.window_detailed, print_index + 1,
+            print_index = self.print_detailed_website_stats(partial(self.write, 'detailed'), print_index + 1,
                                                             stats_list[timeframe], timeframe / 60,
                                                             False)
-        website.lock.release()
 
         # Show modifications
-        self.window_hostname.noutrefresh()
-        self.window_availability.noutrefresh()
-        self.window_response_time.noutrefresh()
-        self.window_detailed.noutrefresh()
+        for window in self.windows.values():
+            window.noutrefresh()
         curses.doupdate()
+        self.frame_time = time.perf_counter() - frame_start
 
     def listen_for_input(self):
-        """Listens for user input on the main screen, and takes action accordingly.
+        """Reads the keys typed since the last call, without waiting, and handles them (see handle_key).
+
+        Returns the number of keys read, and whether the dashboard should continue.
+        """
+        nb_keys = 0
+        while True:
+            # Pages displayed by handle_key wait for a key
+            self.screen.nodelay(True)
+            char_ord = self.screen.getch()
+            self.screen.nodelay(False)
+            if char_ord == -1:
+                return nb_keys, True
+            nb_keys += 1
+            if not self.handle_key(char_ord):
+                return nb_keys, False
+
+    def handle_key(self, char_ord):
+        """Takes action according to a key typed on the main screen.
 
         Options include :
-        - change selected website
+        - change selected website, scroll the list of websites
+        - sort the list of websites, filter it by hostname
         - print the selected website page
         - Print help window
         - Quit the dashboard.
+
+        Returns False if the dashboard should quit.
         """
         try:
-            # Listen for user input for self.refresh_interval
-            # if no signal recieved, go back to home screen (i.e. refresh)
-            if sys.platform != "win32":
-                signal(SIGALRM, self.go_to_home_screen)
-                alarm(self.refresh_interval)
-            char_ord = self.screen.getch()
-            if sys.platform != "win32":
-                alarm(0)
             char = None
             try:
                 char = chr(char_ord).upper()
             except ValueError:  # Malformed input
-                self.listen_for_input()
-            self.screen.clear()
-            self.screen.refresh()
+                return True
 
-            if char == 'Q' or char_ord == curses.ascii.ESC:
+            if (char == 'Q' or char_ord == curses.ascii.ESC) and not self.filtering:
                 return False
+            elif char_ord == curses.KEY_RESIZE:
+                # Windows are created again at the size of the terminal
+                curses.update_lines_cols()
+                self.windows = None
+                self.screen.clear()
+                self.screen.noutrefresh()
+            elif self.filtering:
+                self.edit_filter(char_ord)
             elif char == 'H':
                 self.print_help_screen()
+            elif char == 'S':
+                self.sort_order = SORT_ORDERS[(SORT_ORDERS.index(self.sort_order) + 1) % len(SORT_ORDERS)]
+                self.selected_row = 0
+            elif char == '/':
+                self.filtering = True
             elif char_ord == curses.KEY_DOWN:
-                if self.selected_website < len(self.websites) - 1:
-                    self.selected_website += 1
+                self.selected_row += 1
             elif char_ord == curses.KEY_UP:
-                if self.selected_website > 0:
-                    self.selected_website -= 1
+                self.selected_row = max(0, self.selected_row - 1)
+            elif char_ord == curses.KEY_NPAGE:
+                self.selected_row += self.visible_rows
+                self.offset += self.visible_rows
+            elif char_ord == curses.KEY_PPAGE:
+                self.selected_row = max(0, self.selected_row - self.visible_rows)
+                self.offset = max(0, self.offset - self.visible_rows)
+            elif char_ord == curses.KEY_HOME:
+                self.selected_row = 0
+            elif char_ord == curses.KEY_END:
+                self.selected_row = self.site_index.count() - 1
             elif char_ord == curses.ascii.LF or char_ord == curses.KEY_RIGHT:
                 self.print_website_page(self.websites[self.selected_website])
         except Exception as exc:
             self.print_exception(exc)
         return True
 
+    def edit_filter(self, char_ord):
+        """Edits the hostname filter with a key typed after '/', the list being filtered as the prefix is typed.
+
+        Enter keeps the filter, and ESC removes it.
+        """
+        prefix = self.site_index.prefix
+        if char_ord == curses.ascii.LF or char_ord == curses.KEY_ENTER:
+            self.filtering = False
+            return
+        elif char_ord == curses.ascii.ESC:
+            self.filtering = False
+            prefix = ''
+        elif char_ord in (curses.KEY_BACKSPACE, curses.ascii.BS, curses.ascii.DEL):
+            prefix = prefix[:-1]
+        elif curses.ascii.isprint(char_ord):
+            prefix += chr(char_ord)
+        else:
+            return
+        self.site_index.set_filter(prefix)
+        self.selected_row = 0
+        self.offset = 0
+
     def print_help_screen(self):
         """Prints a help screen"""
-        window = Dashboard.newwin(9, 45, 0, 0, "Help information:")
+        window = Dashboard.newwin(13, 45, 0, 0, "Help information:")
         window.addstr(1, 1, "H - This help screen")
         window.addstr(2, 1, "Q or ESC - Quit the program")
         window.addstr(3, 1, "Down - Move selection down")
         window.addstr(4, 1, "Up - Move selection up")
-        window.addstr(5, 1, "Right or Enter - Select website to check")
-        window.addstr(7, 1, "Press any key to continue")
+        window.addstr(5, 1, "PageDown/PageUp/Home/End - Scroll the list")
+        window.addstr(6, 1, "S - Change the sort order")
+        window.addstr(7, 1, "/ - Filter by hostname (Enter/ESC to end)")
+        window.addstr(8, 1, "Right or Enter - Select website to check")
+        window.addstr(10, 1, f"Probes saved by shared targets: {nb_saved_probes(self.websites)}")
+        window.addstr(11, 1, "Press any key to continue")
 
         # Wait for any key press to exit page
         window.getch()
         self.screen.clear()
         self.screen.refresh()
+        self.redraw()
 
     def print_website_page(self, website):
-        """Prints a screen detailing all the website information"""
-        window = Dashboard.newwin(50, 35, 0, 1)
-        website.lock.acquire()
-        window.addstr(0, 1, f"Website : {website.hostname}", curses.A_BOLD)
+        """Prints a screen detailing all the website information.
+
+        The window is sized to the lines printed, the lines which do not fit in the terminal being dropped.
+        """
+        lines = []
+
+        def write(y, x, text, attributes=0):
+            lines.append((y, x, text, attributes))
+
+        snapshot = website.get_snapshot()
+        stats_list = snapshot.http_stats if config.MONITOR_HTTP_RATHER_THAN_ICMP else snapshot.ping_stats
+        write(0, 1, f"Website : {website.hostname}", curses.A_BOLD)
         print_index = 0
         for timeframe in config.STATS_TIMEFRAMES:
-            stats_list = website.http_stats_list if config.MONITOR_HTTP_RATHER_THAN_ICMP else website.ping_stats_list
-            print_index = self.print_detailed_website_stats(window, print_index + 1,
-                                                            stats_list[timeframe], timeframe // 60)
-        website.lock.release()
+            print_index = self.print_detailed_website_stats(write, print_index + 1, stats_list[timeframe],
+                                                            timeframe // 60)
+        if config.MONITOR_HTTP_RATHER_THAN_ICMP and snapshot.http_cold_stats:
+            timeframe = max(snapshot.http_cold_stats)
+            cold_stats = snapshot.http_cold_stats[timeframe]
+            write(print_index + 1, 2, f"New connections ({timeframe // 60} min)", curses.A_BOLD)
+            write(
+                print_index + 2, 2,
+                (f"min/avg/max: {cold_stats.min_response_time:.0f}/{cold_stats.average_response_time:.0f}"
+                 f"/{cold_stats.max_response_time:.0f}"))
+            print_index += 2
+        # The DNS resolution and the phases of the http checks share their timeframes
+        timing_timeframes = [timeframe for timeframe in config.STATS_TIMEFRAMES if timeframe in snapshot.dns_stats]
+        timeframe = max(timing_timeframes) if timing_timeframes else None
+        if timeframe is not None and snapshot.dns_stats[timeframe].nb_data_points():
+            dns_stats = snapshot.dns_stats[timeframe]
+            write(print_index + 1, 2, f"DNS resolution ({timeframe // 60} min)", curses.A_BOLD)
+            write(
+                print_index + 2, 2,
+                f"avg/p99: {dns_stats.average_response_time:.1f}/{dns_stats.percentile(99):.1f} ms")
+            write(print_index + 3, 2, f"resolved: {dns_stats.availability * 100:.2f}%")
+            print_index += 3
+        phases = [phase for phase in HTTP_PHASES if phase in snapshot.http_phase_stats]
+        if config.MONITOR_HTTP_RATHER_THAN_ICMP and timeframe is not None and phases:
+            write(print_index + 1, 2, f"HTTP phases avg/p99 ({timeframe // 60} min)", curses.A_BOLD)
+            for phase in phases:
+                stats = snapshot.http_phase_stats[phase][timeframe]
+                write(print_index + 2, 2,
+                      f"{phase:7}: {stats.average_response_time:.1f}/{stats.percentile(99):.1f} ms")
+                print_index += 1
+            print_index += 1
+        for timeframe in config.ROLLUP_TIMEFRAMES:
+            stats = stats_list[timeframe]
+            write(print_index + 1, 2, f"{format_duration(timeframe)} availability: {stats.availability * 100:.2f}%",
+                  curses.A_BOLD)
+            write(
+                print_index + 2, 2,
+                f"avg/p99: {stats.average_response_time:.0f}/{stats.percentile(99):.0f} ms")
+            print_index += 2
+        if website.scheduling is not None:
+            scheduling = website.scheduling
+            write(print_index + 1, 2, "Scheduling", curses.A_BOLD)
+            write(print_index + 2, 2,
+                  f"lag avg/max: {scheduling.average_lag() * 1000:.0f}/{scheduling.max_lag * 1000:.0f} ms")
+            write(print_index + 3, 2, f"dropped checks: {scheduling.nb_dropped}")
+            print_index += 3
+            if scheduling.nb_errors:
+                write(print_index + 1, 2, f"probe errors: {scheduling.nb_errors}")
+                print_index += 1
+            if scheduling.nb_websites > 1:
+                write(print_index + 1, 2, f"probes shared by {scheduling.nb_websites} websites")
+                print_index += 1
 
+        screen_height, _ = self.screen.getmaxyx()
+        height = min(max(y for y, _, _, _ in lines) + 2, screen_height)
+        window = Dashboard.newwin(height, 35, 0, 1)
+        for y, x, text, attributes in lines:
+            if y < height - 1:
+                window.addstr(y, x, text, attributes)
+
+        alerts_height = min(50, screen_height)
         try:
-            window_alerts = Dashboard.newwin(50, 95, 0, 35,
+            window_alerts = Dashboard.newwin(alerts_height, 95, 0, 35,
                                              f"Alerts ({config.ALERTING_TIMEFRAME}s timeframe)")
-        except _curses.error as exc:
+        except curses.error as exc:
             self.print_exception(str(exc) + " Please resize your terminal.")
+            return
 
-        website.lock.acquire()
-        self.print_alerts(window_alerts, website.alert_history, 50)
-        website.lock.release()
+        self.print_alerts(window_alerts, self.alert_store.query(url=website.url, limit=alerts_height - 2),
+                          alerts_height)
 
         # Wait for any key press to exit page
         window.getch()
         self.screen.clear()
         self.screen.refresh()
+        self.redraw()
 
     def print_detailed_website_stats(self,
-                                     window,
+                                     write,
                                      print_index,
                                      stats,
                                      timeframe_in_minutes,
@@ -247,8 +531,8 @@ class Dashboard(object):
 
         Parameters
         ----------
-        window : _CursesWindow
-            The window in which to print the stats
+        write : callable
+            writes a text in the window in which to print the stats, from (y, x, text[, attributes])
         print_index : int
             Line in window at which to start printing
         stats : stats.Stats
@@ -258,26 +542,31 @@ class Dashboard(object):
         print_response_codes : bool
             whether to print the response codes
         """
-        window.addstr(print_index, 2, f"{timeframe_in_minutes} minutes stats", curses.A_BOLD)
-        window.addstr(print_index + 1, 2, "Availability: {:.0f}%".format(stats.availability * 100))
-        window.addstr(print_index + 2, 2, "Resp.Time in ms:")
-        window.addstr(
-            print_index + 3, 2,
+        write(print_index, 2, f"{timeframe_in_minutes} minutes stats", curses.A_BOLD)
+        write(print_index + 1, 2, "Availability: {:.0f}%".format(stats.availability * 100))
+        write(print_index + 2, 2, f"Checks: {stats.nb_data_points()} in {stats.covered_duration():.0f}s")
+        write(print_index + 3, 2, "Resp.Time in ms:")
+        write(
+            print_index + 4, 2,
             f"min/avg/max: {stats.min_response_time:.0f}/{stats.average_response_time:.0f}/{stats.max_response_time:.0f}"
         )
-        print_index += 4
+        write(
+            print_index + 5, 2,
+            f"p50/p95/p99: {stats.percentile(50):.0f}/{stats.percentile(95):.0f}/{stats.percentile(99):.0f}"
+        )
+        print_index += 6
         if print_response_codes:
-            window.addstr(print_index, 2, "Response Code count:")
+            write(print_index, 2, "Response Code count:")
             print_index += 1
             for key in stats.response_codes_dict:
-                window.addstr(print_index, 3, f"{key}: {stats.response_codes_dict[key]}")
+                write(print_index, 3, f"{key}: {stats.response_codes_dict[key]}")
                 print_index += 1
 
         return print_index
 
-    def print_alerts(self, window, alert_history, window_height):
+    def print_alerts(self, window, alerts, window_height):
         """Limit the alert printing to the window_height to prevent curses from crashing."""
-        for i, alert in enumerate(alert_history[:window_height - 2]):
+        for i, alert in enumerate(alerts[:window_height - 2]):
             window.addstr(i + 1, 1, f"{alert.message}")
         window.refresh()
 
@@ -288,3 +577,4 @@ class Dashboard(object):
         self.screen.getch()
         self.screen.clear()
         self.screen.refresh()
+        self.redraw()
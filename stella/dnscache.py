@@ -0,0 +1,441 @@
+"""Cache of the DNS resolutions of the probed hosts, shared by all the probes (see DnsCache).
+
+Hostnames are resolved once per TTL of their records rather than at every check, so that the resolver
+is not queried once per check of every website, and its latency is kept out of the response times:
+the resolution time of each check is recorded as a metric of its own (see Website.update_dns_stats).
+
+- resolutions are cached for the TTL of their records, within DNS_MIN_TTL and DNS_MAX_TTL,
+- the resolutions used since they were cached are resolved again in the background once DNS_REFRESH_AHEAD
+  of their TTL elapsed (see DnsCache.refresh_due), so that the checks of a host do not wait for the resolver,
+- failed resolutions are cached as well (negative caching), for the negative TTL of the zone
+  (from its SOA record, see parse_response) up to DNS_NEGATIVE_TTL.
+
+As getaddrinfo does not give the TTL of the records, A records (AAAA records for the IPv6-only hosts)
+are queried from the first nameserver of /etc/resolv.conf by a minimal stub resolver (see query_records).
+Names of /etc/hosts, single-label names (resolved with the search domains), failed queries and names
+without any address in the answer fall back to getaddrinfo (other nameservers and sources of nsswitch,
+TCP), and are cached for DNS_DEFAULT_TTL. Only names which getaddrinfo cannot resolve either are cached
+as failed resolutions.
+"""
+import asyncio
+from heapq import heappop
+from heapq import heappush
+import ipaddress
+import random
+import socket
+import struct
+from threading import Condition
+from threading import Event
+from threading import Lock
+from threading import Thread
+import time
+
+from stella import config
+
+DNS_PORT = 53
+HEADER = struct.Struct('!HHHHHH')
+QUESTION = struct.Struct('!HH')
+RECORD = struct.Struct('!HHIH')
+FLAG_RECURSION_DESIRED = 0x0100
+FLAG_TRUNCATED = 0x0200
+RCODE_NOERROR = 0
+RCODE_NXDOMAIN = 3
+TYPE_A = 1
+TYPE_CNAME = 5
+TYPE_SOA = 6
+TYPE_AAAA = 28
+CLASS_IN = 1
+
+
+class DnsError(Exception):
+    """Raised when a DNS response cannot be used (truncated, malformed, or a server failure)."""
+
+
+def read_nameserver(path='/etc/resolv.conf'):
+    """Returns the (address, port) of the first nameserver of the resolver configuration, None if none."""
+    try:
+        with open(path) as resolv_conf:
+            for line in resolv_conf:
+                fields = line.split()
+                if len(fields) >= 2 and fields[0] == 'nameserver':
+                    return fields[1], DNS_PORT
+    except OSError:
+        pass
+    return None
+
+
+def read_hosts(path='/etc/hosts'):
+    """Returns the set of the (lowercase) names of the hosts file."""
+    names = set()
+    try:
+        with open(path) as hosts:
+            for line in hosts:
+                names.update(name.lower() for name in line.partition('#')[0].split()[1:])
+    except OSError:
+        pass
+    return names
+
+
+def is_ip_address(host):
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+def encode_name(hostname):
+    labels = [label for label in hostname.encode('idna').split(b'.') if label]
+    if not labels or any(len(label) > 63 for label in labels):
+        raise DnsError(f"Invalid hostname {hostname}")
+    return b''.join(bytes([len(label)]) + label for label in labels) + b'\0'
+
+
+def skip_name(packet, offset):
+    """Returns the offset following the (possibly compressed) name at offset."""
+    while True:
+        length = packet[offset]
+        if length & 0xC0 == 0xC0:
+            return offset + 2
+        offset += length + 1
+        if length == 0:
+            return offset
+
+
+def build_query(identifier, hostname, record_type=TYPE_A):
+    """Returns a recursive query of the A (or AAAA) records of hostname."""
+    return HEADER.pack(identifier, FLAG_RECURSION_DESIRED, 1, 0, 0, 0) + encode_name(hostname) \
+        + QUESTION.pack(record_type, CLASS_IN)
+
+
+def parse_response(packet):
+    """Returns the addresses of the A (or AAAA) records of a response, and their TTL.
+
+    The TTL is the lowest of the records of the answer (CNAME records included).
+    For a negative answer (unknown name, or no record of the type), the addresses are empty and the TTL
+    is the negative TTL of the zone (see RFC 2308), None if the response has no SOA record.
+
+    Raises
+    ------
+    DnsError
+        if the response is truncated, malformed, or reports a server failure
+    """
+    try:
+        _, flags, nb_questions, nb_answers, nb_authorities, _ = HEADER.unpack_from(packet)
+        if flags & FLAG_TRUNCATED:
+            raise DnsError("Truncated response")
+        if flags & 0xF not in (RCODE_NOERROR, RCODE_NXDOMAIN):
+            raise DnsError(f"Server failure (rcode {flags & 0xF})")
+        offset = HEADER.size
+        for _ in range(nb_questions):
+            offset = skip_name(packet, offset) + QUESTION.size
+
+        addresses = []
+        ttls = []
+        for _ in range(nb_answers):
+            offset = skip_name(packet, offset)
+            record_type, record_class, ttl, length = RECORD.unpack_from(packet, offset)
+            offset += RECORD.size
+            if record_type == TYPE_A and record_class == CLASS_IN and length == 4:
+                addresses.append(socket.inet_ntoa(packet[offset:offset + 4]))
+                ttls.append(ttl)
+            elif record_type == TYPE_AAAA and record_class == CLASS_IN and length == 16:
+                addresses.append(socket.inet_ntop(socket.AF_INET6, packet[offset:offset + 16]))
+                ttls.append(ttl)
+            elif record_type == TYPE_CNAME:
+                ttls.append(ttl)
+            offset += length
+        if addresses:
+            return addresses, min(ttls)
+
+        for _ in range(nb_authorities):
+            offset = skip_name(packet, offset)
+            record_type, _, ttl, length = RECORD.unpack_from(packet, offset)
+            offset += RECORD.size
+            if record_type == TYPE_SOA:
+                # The negative TTL is the last field of the SOA record
+                minimum, = struct.unpack_from('!I', packet, offset + length - 4)
+                return [], min(ttl, minimum)
+            offset += length
+        return [], None
+    except (struct.error, IndexError):
+        raise DnsError("Malformed response")
+
+
+def query_records(hostname, nameserver, timeout=config.DNS_TIMEOUT, record_type=TYPE_A):
+    """Queries the A (or AAAA) records of hostname from nameserver (address, port), see parse_response.
+
+    Raises
+    ------
+    DnsError
+        if the response cannot be used
+    OSError
+        if the nameserver does not answer within timeout
+    """
+    identifier = random.getrandbits(16)
+    query = build_query(identifier, hostname, record_type)
+    family = socket.AF_INET6 if ':' in nameserver[0] else socket.AF_INET
+    with socket.socket(family, socket.SOCK_DGRAM) as dns_socket:
+        dns_socket.settimeout(timeout)
+        dns_socket.connect(nameserver)
+        dns_socket.send(query)
+        while True:
+            packet = dns_socket.recv(4096)
+            # Ignore the responses to other queries
+            if packet[:2] == query[:2]:
+                return parse_response(packet)
+
+
+class Resolution(object):
+    """Cached resolution of a hostname, address being None if it could not be resolved."""
+
+    __slots__ = ('address', 'expires_at', 'refresh_at', 'used')
+
+    def __init__(self, address, expires_at, refresh_at):
+        self.address = address
+        self.expires_at = expires_at
+        self.refresh_at = refresh_at
+        # Whether the resolution was read since it was cached: only those are refreshed
+        self.used = False
+
+
+class DnsCache(object):
+    """Thread-safe cache of the resolutions of hostnames, refreshed in the background before they expire.
+
+    Hits only take the lock of the cache. On a miss, a single thread queries the resolver for a given hostname,
+    the other threads resolving it waiting for its result.
+    """
+
+    def __init__(self,
+                 enabled=config.DNS_CACHE,
+                 nameserver=None,
+                 hosts=None,
+                 min_ttl=config.DNS_MIN_TTL,
+                 max_ttl=config.DNS_MAX_TTL,
+                 default_ttl=config.DNS_DEFAULT_TTL,
+                 negative_ttl=config.DNS_NEGATIVE_TTL,
+                 refresh_ahead=config.DNS_REFRESH_AHEAD,
+                 timeout=config.DNS_TIMEOUT,
+                 background_refresh=True,
+                 clock=time.monotonic):
+        """Returns an empty cache.
+
+        Parameters
+        ----------
+        enabled : bool
+            whether hostnames are resolved from the cache. If not, they are returned as is
+            (to be resolved by the system at every check), without resolution time.
+        nameserver : (str, int)
+            address and port of the nameserver to query, the first one of /etc/resolv.conf if None
+        hosts : set(str)
+            names resolved through getaddrinfo only, the names of /etc/hosts if None
+        min_ttl, max_ttl : float
+            in seconds, bounds of the time for which resolutions are cached
+        default_ttl : float
+            in seconds, for which resolutions without known TTL are cached
+        negative_ttl : float
+            in seconds, maximum time for which failed resolutions are cached
+        refresh_ahead : float
+            fraction of the TTL after which the resolutions used since they were cached are refreshed
+        timeout : float
+            in seconds, after which a query falls back to getaddrinfo
+        background_refresh : bool
+            whether a daemon thread refreshes the resolutions (see DnsCache.run), started on the first miss
+        clock : callable
+            returns the current time in seconds (time.monotonic)
+
+        Attributes
+        ----------
+        entries : dict(str: Resolution)
+            resolutions of the (lowercase) hostnames
+        refresh_heap : list
+            heap of (refresh time, hostname) of the resolutions, some of them outdated
+        nb_hits : int
+            number of resolutions read from the cache
+        nb_misses : int
+            number of resolutions which had to wait for the resolver
+        nb_refreshes : int
+            number of resolutions refreshed before they expired
+        """
+        self.lock = Lock()
+        self.condition = Condition(self.lock)
+        self.enabled = enabled
+        self.nameserver = read_nameserver() if nameserver is None else nameserver
+        self.hosts = read_hosts() if hosts is None else hosts
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.default_ttl = default_ttl
+        self.negative_ttl = negative_ttl
+        self.refresh_ahead = refresh_ahead
+        self.timeout = timeout
+        self.background_refresh = background_refresh
+        self.clock = clock
+        self.entries = {}
+        self.refresh_heap = []
+        # Events of the hostnames being resolved on a miss
+        self.pending = {}
+        self.thread = None
+        self.nb_hits = 0
+        self.nb_misses = 0
+        self.nb_refreshes = 0
+
+    def resolve(self, hostname):
+        """Returns the address of hostname and the time taken to resolve it.
+
+        Returns
+        -------
+        str : IP address of hostname, None if it could not be resolved
+        float : resolution time (in ms), None if hostname was not resolved
+            (IP address, or cache disabled: hostname is then returned as is)
+        """
+        start = time.perf_counter()
+        if not self.enabled or is_ip_address(hostname):
+            return hostname, None
+        key = hostname.lower()
+        resolution = self.lookup(key)
+        if resolution is None:
+            resolution = self.fetch(key)
+        return resolution.address, (time.perf_counter() - start) * 1000
+
+    async def async_resolve(self, hostname):
+        """Non-blocking counterpart of DnsCache.resolve: the resolver is queried from the default executor."""
+        start = time.perf_counter()
+        if not self.enabled or is_ip_address(hostname):
+            return hostname, None
+        key = hostname.lower()
+        resolution = self.lookup(key)
+        if resolution is None:
+            resolution = await asyncio.get_running_loop().run_in_executor(None, self.fetch, key)
+        return resolution.address, (time.perf_counter() - start) * 1000
+
+    def lookup(self, key):
+        """Returns the cached Resolution of the (lowercase) hostname, None if it is not cached or expired."""
+        self.lock.acquire()
+        resolution = self.entries.get(key)
+        if resolution is not None and self.clock() < resolution.expires_at:
+            resolution.used = True
+            self.nb_hits += 1
+        else:
+            resolution = None
+        self.lock.release()
+        return resolution
+
+    def fetch(self, key):
+        """Resolves the (lowercase) hostname on a miss, or waits for the thread already resolving it."""
+        self.lock.acquire()
+        self.nb_misses += 1
+        event = self.pending.get(key)
+        is_resolving = event is None
+        if is_resolving:
+            event = self.pending[key] = Event()
+        self.lock.release()
+
+        if not is_resolving:
+            event.wait()
+            self.lock.acquire()
+            resolution = self.entries[key]
+            self.lock.release()
+            return resolution
+
+        try:
+            return self.store(key, *self.query(key))
+        finally:
+            self.lock.acquire()
+            del self.pending[key]
+            self.lock.release()
+            event.set()
+
+    def query(self, hostname):
+        """Returns the addresses of hostname and their TTL (see parse_response), from the resolver.
+
+        IPv4 addresses are preferred, the AAAA records being queried for the hosts without any A record.
+        Names of the hosts file, single-label names, failed queries and negative answers are resolved
+        through getaddrinfo, without TTL. A name getaddrinfo cannot resolve either keeps the negative TTL
+        of the answer, if any.
+        """
+        negative_ttl = None
+        if self.nameserver is not None and '.' in hostname.strip('.') and hostname not in self.hosts:
+            try:
+                addresses, negative_ttl = query_records(hostname, self.nameserver, self.timeout)
+                if addresses:
+                    return addresses, negative_ttl
+                addresses, ttl = query_records(hostname, self.nameserver, self.timeout, TYPE_AAAA)
+                if addresses:
+                    return addresses, ttl
+            except (DnsError, OSError, UnicodeError):
+                pass
+        try:
+            infos = socket.getaddrinfo(hostname, None, type=socket.SOCK_STREAM)
+        except (OSError, UnicodeError):
+            return [], negative_ttl
+        return [info[4][0] for info in sorted(infos, key=lambda info: info[0] != socket.AF_INET)], None
+
+    def store(self, key, addresses, ttl):
+        """Caches the resolution of the (lowercase) hostname, and returns it.
+
+        A failed resolution does not replace a cached address which did not expire yet.
+        """
+        if addresses:
+            ttl = min(max(self.default_ttl if ttl is None else ttl, self.min_ttl), self.max_ttl)
+        else:
+            ttl = self.negative_ttl if ttl is None else min(max(ttl, self.min_ttl), self.negative_ttl)
+        now = self.clock()
+        resolution = Resolution(addresses[0] if addresses else None, now + ttl, now + ttl * self.refresh_ahead)
+
+        self.lock.acquire()
+        cached = self.entries.get(key)
+        if not addresses and cached is not None and cached.address is not None and now < cached.expires_at:
+            resolution = cached
+        else:
+            self.entries[key] = resolution
+            heappush(self.refresh_heap, (resolution.refresh_at, key))
+            if self.refresh_heap[0][1] == key:
+                self.condition.notify()
+            if self.background_refresh and self.thread is None:
+                self.thread = Thread(target=self.run, daemon=True)
+                self.thread.start()
+        self.lock.release()
+        return resolution
+
+    def refresh_due(self):
+        """Resolves again the resolutions used since they were cached whose refresh time is reached.
+
+        Returns the number of resolutions refreshed. The others expire, and are resolved again
+        on their next use.
+        """
+        due = []
+        self.lock.acquire()
+        now = self.clock()
+        while self.refresh_heap and self.refresh_heap[0][0] <= now:
+            refresh_at, key = heappop(self.refresh_heap)
+            resolution = self.entries.get(key)
+            # Resolutions cached again since then have another refresh time
+            if resolution is not None and resolution.refresh_at == refresh_at and resolution.used \
+                    and key not in self.pending:
+                due.append(key)
+        self.lock.release()
+
+        for key in due:
+            self.store(key, *self.query(key))
+        self.lock.acquire()
+        self.nb_refreshes += len(due)
+        self.lock.release()
+        return len(due)
+
+    def run(self):
+        """Refreshes the resolutions when due.
+
+        This function is a loop. Run inside a thread to prevent blocking the program.
+        """
+        self.lock.acquire()
+        while True:
+            if self.refresh_heap:
+                self.condition.wait(max(0, self.refresh_heap[0][0] - self.clock()))
+            else:
+                self.condition.wait()
+            self.lock.release()
+            self.refresh_due()
+            self.lock.acquire()
+
+
+CACHE = DnsCache()
@@ -0,0 +1,263 @@
+import asyncio
+import socket
+import ssl
+from threading import Thread
+import time
+from urllib.parse import urljoin
+from urllib.parse import urlparse
+
+from stella import config
+from stella.dnscache import CACHE
+from stella.http_pool import add_timing
+from stella import icmp
+from stella.probetarget import group_websites
+from stella.scheduler import Scheduler
+from stella.website import parse_ping_output
+from stella.website import ping_command
+
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 10
+
+
+class AsyncProbeEngine(object):
+    """Probes all the websites from a single asyncio event loop.
+
+    Replaces the worker threads of scheduler.Scheduler.start: the checks are still scheduled
+    by a scheduler.Scheduler, but each check is run by a lightweight task, and at most
+    max_concurrent_probes of them are in flight at the same time.
+
+    Note
+    ----
+    Stats and alerts are updated through Website.update_stats and Website.check_for_alert
+    (see probetarget.ProbeTarget.update),
+    so the dashboard and alerting behave exactly as with the threaded model.
+    """
+
+    def __init__(self,
+                 websites,
+                 use_http=config.MONITOR_HTTP_RATHER_THAN_ICMP,
+                 max_concurrent_probes=config.MAX_CONCURRENT_PROBES,
+                 probe_timeout=config.PROBE_TIMEOUT):
+        """Returns an asyncio probe engine.
+
+        Parameters
+        ----------
+        websites : list
+            list of Website objects to monitor. Alerts are appended to their alert queues.
+        use_http : bool
+            whether to probe websites through http rather than icmp
+        max_concurrent_probes : int
+            maximum number of probes in flight at the same time
+        probe_timeout : float
+            in seconds, after which a probe is considered failed
+        """
+        self.websites = websites
+        self.use_http = use_http
+        self.max_concurrent_probes = max_concurrent_probes
+        self.probe_timeout = probe_timeout
+        self.loop = None
+        self.targets = None
+        self.scheduler = None
+        self.tasks = set()
+        self.nb_in_flight = 0
+        self.checks_done = None
+
+    def start(self):
+        """Runs the event loop in a daemon thread, so that the dashboard can keep the main thread."""
+        thread = Thread(target=asyncio.run, args=(self.run(),), daemon=True)
+        thread.start()
+        return thread
+
+    async def run(self):
+        """Monitors all the websites until cancelled.
+
+        The due checks are started as long as less than max_concurrent_probes are in flight,
+        so that the scheduling lag of the others includes the wait for a free slot.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.targets = group_websites(self.websites, self.use_http)
+        self.scheduler = Scheduler(self.targets, clock=self.loop.time)
+        self.checks_done = asyncio.Event()
+        while True:
+            self.checks_done.clear()
+            now = self.loop.time()
+            for i in self.scheduler.pop_due(now, limit=self.max_concurrent_probes - self.nb_in_flight):
+                self.nb_in_flight += 1
+                task = self.loop.create_task(self.check(i))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+
+            next_deadline = self.scheduler.next_deadline()
+            if self.nb_in_flight >= self.max_concurrent_probes or next_deadline is None:
+                await self.checks_done.wait()
+                continue
+            try:
+                await asyncio.wait_for(self.checks_done.wait(), max(0, next_deadline - now))
+            except asyncio.TimeoutError:
+                pass
+
+    async def check(self, i):
+        """Checks the probe target of index i, then schedules its next check.
+
+        A probe raising an exception (e.g. on an unexpected ping output) is recorded as down.
+        """
+        target = self.targets[i]
+        try:
+            await self.probe_and_update(target)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            target.scheduling.nb_errors += 1
+            target.record_error(self.use_http)
+        finally:
+            self.nb_in_flight -= 1
+            self.scheduler.done(i, self.loop.time())
+            self.checks_done.set()
+
+    async def probe_and_update(self, target):
+        """Probes the target (see probetarget.ProbeTarget) once, then updates its websites and checks for alerts."""
+        is_up, response_time, response_code = await self.probe(target)
+        target.update(self.use_http, is_up, response_time, response_code)
+
+    async def probe(self, target):
+        """Probes the target through http or icmp, failing after probe_timeout seconds.
+
+        The host is first resolved from the DNS cache (see dnscache.py), its resolution time being recorded
+        in the websites of the target, and the probe is not sent if it cannot be resolved.
+        The time of the phases of the http probes is recorded as well (see config.HTTP_PHASE_TIMINGS).
+        """
+        address, dns_time = await CACHE.async_resolve(target.url_hostname if self.use_http else target.hostname)
+        target.update_dns_stats(address is not None, dns_time)
+        if address is None:
+            return (False, None, None) if self.use_http else (False, None, icmp.CODE_ERROR)
+        try:
+            if self.use_http:
+                timings = {} if config.HTTP_PHASE_TIMINGS else None
+                try:
+                    return await asyncio.wait_for(async_http_ping(target.url, timings), self.probe_timeout)
+                finally:
+                    if timings:
+                        target.update_http_phase_stats(timings)
+            else:
+                return await asyncio.wait_for(async_ping(address), self.probe_timeout)
+        except asyncio.TimeoutError:
+            return (False, None, None) if self.use_http else (False, None, 1)
+
+
+async def async_ping(host):
+    """Non-blocking counterpart of Website.ping.
+
+    Returns
+    -------
+    int : success status
+    float : round-trip time (in ms)
+    int : ICMP response code
+    """
+    if config.ICMP_NATIVE and icmp.native_icmp_available() and ':' not in host:
+        return await icmp.async_ping(host)
+
+    process = await asyncio.create_subprocess_exec(*ping_command(host),
+                                                   stdout=asyncio.subprocess.PIPE,
+                                                   stderr=asyncio.subprocess.PIPE)
+    try:
+        stdout, _ = await process.communicate()
+    except asyncio.CancelledError:
+        process.kill()
+        raise
+    return parse_ping_output(process.returncode, stdout)
+
+
+async def async_http_ping(url, timings=None):
+    """Non-blocking counterpart of Website.http_ping.
+
+    As with urlopen, redirections are followed, and error codes (>= 400) are reported as failures.
+    The response time is measured up to the end of the body.
+    If timings is not None, the time of each phase of the requests is added to it (see http_pool.HTTP_PHASES).
+
+    Returns
+    -------
+    int : success status
+    float : response time (in ms)
+    int : HTTP response code
+    """
+    try:
+        start = time.perf_counter_ns()
+        for _ in range(MAX_REDIRECTS + 1):
+            response_code, headers = await http_get(url, timings)
+            if response_code in REDIRECT_CODES and 'location' in headers:
+                url = urljoin(url, headers['location'])
+                continue
+            break
+        response_time = (time.perf_counter_ns() - start) / 1e6
+        if response_code >= 400:
+            return False, None, None
+        return True, response_time, response_code
+
+    except Exception:
+        return False, None, None
+
+
+async def http_get(url, timings=None):
+    """Sends a GET request to url and returns the response code and headers (as a lowercase dict).
+
+    The connection is opened to the address of the host in the DNS cache. The body is read,
+    unless the response is a redirection. If timings is not None, the time of each phase is added to it.
+    """
+    parsed_url = urlparse(url)
+    use_tls = parsed_url.scheme == 'https'
+    port = parsed_url.port or (443 if use_tls else 80)
+    path = parsed_url.path or '/'
+    if parsed_url.query:
+        path += '?' + parsed_url.query
+
+    address, _ = await CACHE.async_resolve(parsed_url.hostname)
+    if address is None:
+        raise OSError(f"Could not resolve {parsed_url.hostname}")
+    # Connect beforehand (rather than with open_connection) to time the connection and the TLS handshake
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter_ns()
+    connection_socket = socket.socket(socket.AF_INET6 if ':' in address else socket.AF_INET, socket.SOCK_STREAM)
+    connection_socket.setblocking(False)
+    try:
+        await loop.sock_connect(connection_socket, (address, port))
+        connected_at = time.perf_counter_ns()
+        reader, writer = await asyncio.open_connection(sock=connection_socket,
+                                                       ssl=ssl.create_default_context() if use_tls else None,
+                                                       server_hostname=parsed_url.hostname if use_tls else None)
+    except BaseException:
+        connection_socket.close()
+        raise
+    if timings is not None:
+        add_timing(timings, 'connect', connected_at - start)
+        if use_tls:
+            add_timing(timings, 'tls', time.perf_counter_ns() - connected_at)
+
+    try:
+        start = time.perf_counter_ns()
+        writer.write((f"GET {path} HTTP/1.1\r\n"
+                      f"Host: {parsed_url.netloc}\r\n"
+                      "User-Agent: Stella\r\n"
+                      "Connection: close\r\n\r\n").encode('ascii'))
+        await writer.drain()
+
+        status_line = await reader.readline()
+        response_code = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        headers_at = time.perf_counter_ns()
+
+        if response_code not in REDIRECT_CODES:
+            # The server closes the connection after the body
+            await reader.read()
+        if timings is not None:
+            add_timing(timings, 'ttfb', headers_at - start)
+            if response_code not in REDIRECT_CODES:
+                add_timing(timings, 'body', time.perf_counter_ns() - headers_at)
+        return response_code, headers
+    finally:
+        writer.close()
@@ -1,4 +1,64 @@
+import re
+import socket
+
+DURATION_UNITS = {'d': 86400, 'h': 3600, 'min': 60, 's': 1}
+
+
 def read_websites(file_path):
     """Returns a list of [url, check_interval] for each website."""
     with open(file_path, 'r') as file_handle:
         return [site_url.strip('\n').split(' ') for site_url in file_handle.readlines()]
+
+
+def format_duration(seconds):
+    """Returns a short human readable duration, for example 30s, 10min, 24h or 30d."""
+    for unit, unit_seconds in (('d', 86400), ('h', 3600), ('min', 60)):
+        if seconds >= unit_seconds and seconds % unit_seconds == 0:
+            return f"{seconds // unit_seconds}{unit}"
+    return f"{seconds}s"
+
+
+def parse_duration(text):
+    """Returns the number of seconds of a duration in seconds or with a unit, for example 30, 30s, 10min, 24h or 30d."""
+    match = re.fullmatch(r'(\d+)(s|min|h|d)?', text)
+    if match is None:
+        raise ValueError(f"Invalid duration {text!r}")
+    return int(match.group(1)) * DURATION_UNITS[match.group(2) or 's']
+
+
+class Wakeup(object):
+    def __init__(self):
+        """Returns a channel through which threads wake up a loop waiting on its file descriptor (see selectors).
+
+        A socket pair is used rather than a pipe, so that the loop can wait on it on every platform.
+        """
+        self.reader, self.writer = socket.socketpair()
+        self.reader.setblocking(False)
+        self.writer.setblocking(False)
+        self.is_set = False
+
+    def fileno(self):
+        return self.reader.fileno()
+
+    def set(self):
+        """Wakes the loop up. Can be called from any thread, a byte being written only once until cleared."""
+        if not self.is_set:
+            self.is_set = True
+            try:
+                self.writer.send(b'\0')
+            except OSError:  # Full or closed: the loop is woken up anyway
+                pass
+
+    def clear(self):
+        """Called by the loop once woken up, before reading the changes."""
+        try:
+            while self.reader.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        # Cleared after reading the socket, so that a thread setting it from now on writes again
+        self.is_set = False
+
+    def close(self):
+        self.reader.close()
+        self.writer.close()
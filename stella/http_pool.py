@@ -0,0 +1,352 @@
+from collections import deque
+from http.client import BadStatusLine
+from http.client import HTTPConnection
+from http.client import HTTPException
+from http.client import HTTPSConnection
+import socket
+import ssl
+from threading import local
+from threading import Lock
+import time
+from urllib.error import HTTPError
+from urllib.parse import urljoin
+from urllib.parse import urlparse
+from urllib.request import build_opener
+from urllib.request import getproxies
+from urllib.request import proxy_bypass
+from urllib.request import ProxyHandler
+
+from stella import config
+from stella.dnscache import CACHE
+
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 10
+# Phases of the http checks timed when asked (see ConnectionPool.get), the DNS resolution being timed apart
+HTTP_PHASES = ('connect', 'tls', 'ttfb', 'body')
+# Errors of a request sent on a keep-alive connection closed by the server in the meantime, up to the status line
+# (RemoteDisconnected being both a ConnectionResetError and a BadStatusLine). Timeouts are not among them.
+STALE_CONNECTION_ERRORS = (ConnectionResetError, BrokenPipeError, BadStatusLine)
+
+
+def add_timing(timings, phase, duration_ns):
+    """Adds a duration (in ns) to the time of a phase (in ms) in timings, summed over the redirections."""
+    timings[phase] = timings.get(phase, 0) + duration_ns / 1e6
+
+
+class HttpProbeError(Exception):
+    """Raised when a probed url answers with an error code (as urlopen would)."""
+
+
+class PooledHTTPConnection(HTTPConnection):
+    """HTTP connection opened to the address of its host in the DNS cache of its pool (see ConnectionPool)."""
+
+    def __init__(self, pool, host, port=None):
+        super().__init__(host, port, timeout=pool.timeout)
+        self.pool = pool
+
+    def connect(self):
+        self.sock = self.pool.create_connection((self.host, self.port), self.timeout, self.source_address)
+
+
+class PooledHTTPSConnection(HTTPSConnection):
+    """HTTPS connection opened to the address of its host in the DNS cache of its pool (see ConnectionPool).
+
+    The hostname is kept as TLS server name, against which the certificate is checked.
+    """
+
+    def __init__(self, pool, host, port=None):
+        super().__init__(host, port, timeout=pool.timeout, context=pool.ssl_context)
+        self.pool = pool
+
+    def connect(self):
+        connection_socket = self.pool.create_connection((self.host, self.port), self.timeout, self.source_address)
+        self.sock = self.pool.ssl_context.wrap_socket(connection_socket, server_hostname=self.host)
+
+
+class ConnectionPool(object):
+    """Per-host pool of persistent (keep-alive) HTTP connections.
+
+    Connections are kept open between checks so that a probe does not pay for
+    a new DNS lookup, TCP connection and TLS handshake every time.
+    New connections are opened to the address of the host in the DNS cache (see dnscache.py),
+    the Host header and the TLS server name still being the hostname.
+
+    The phases of a check can be timed (see ConnectionPool.get): the TCP connection and TLS handshake
+    of the new connections, the time to first byte (from the request to the response headers),
+    and the transfer of the body.
+
+    The urls to be requested through a proxy (HTTP_PROXY, HTTPS_PROXY and NO_PROXY environment variables,
+    see urllib.request.getproxies) are requested with urllib instead, on a new connection, without timings.
+
+    Note
+    ----
+    The pool is thread-safe: a connection is used by a single thread at a time,
+    it is removed from the pool while in use and given back afterwards.
+    """
+
+    def __init__(self,
+                 max_size_per_host=config.HTTP_POOL_MAX_SIZE,
+                 idle_timeout=config.HTTP_POOL_IDLE_TIMEOUT,
+                 timeout=config.PROBE_TIMEOUT,
+                 resolver=CACHE,
+                 proxies=None):
+        """Returns an empty connection pool.
+
+        Parameters
+        ----------
+        max_size_per_host : int
+            maximum number of idle connections kept open for each host
+        idle_timeout : float
+            in seconds, after which an idle connection is closed
+        timeout : float
+            in seconds, socket timeout of the connections
+        resolver : dnscache.DnsCache
+            cache from which the hosts are resolved when connecting
+        proxies : dict(str: str)
+            proxy url of each scheme, those of the environment if None (see urllib.request.getproxies)
+
+        Attributes
+        ----------
+        idle_connections : dict((str, str, int): deque((HTTPConnection, float)))
+            idle connections along with the time they were last used, for each (scheme, host, port).
+            The most recently used connections are at the right of the queues.
+        idle_order : deque((float, (str, str, int), HTTPConnection))
+            connections in the order they were given back to the pool, with their time and key,
+            from which the connections idle for too long are evicted (see ConnectionPool.evict_idle)
+        ssl_context : ssl.SSLContext
+            context of the TLS connections
+        proxy_opener : urllib.request.OpenerDirector
+            opener of the urls requested through a proxy (see ConnectionPool.get_through_proxy)
+        stale_time : threading.local
+            time (ns) spent by the thread on stale connections during its last request (see ConnectionPool.get)
+        """
+        self.lock = Lock()
+        self.max_size_per_host = max_size_per_host
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.resolver = resolver
+        self.proxies = getproxies() if proxies is None else proxies
+        self.proxy_opener = build_opener(ProxyHandler(self.proxies))
+        self.idle_connections = {}
+        self.idle_order = deque()
+        self.ssl_context = ssl.create_default_context()
+        # Time at which the last connection of each thread was established, before its TLS handshake
+        self.connected_at = local()
+        self.stale_time = local()
+
+    def acquire(self, key, fresh_connection=False):
+        """Returns an idle connection for the given (scheme, host, port), or a new one.
+
+        Returns
+        -------
+        HTTPConnection : the connection to use
+        bool : whether the connection is new (i.e. not connected yet)
+        """
+        connection = None
+
+        self.lock.acquire()
+        expired = self.evict_idle(time.monotonic())
+        idle = self.idle_connections.get(key)
+        if idle and not fresh_connection:
+            connection = idle.pop()[0]
+        self.lock.release()
+
+        for expired_connection in expired:
+            expired_connection.close()
+        if connection is not None:
+            return connection, False
+
+        scheme, host, port = key
+        if scheme == 'https':
+            return PooledHTTPSConnection(self, host, port), True
+        return PooledHTTPConnection(self, host, port), True
+
+    def create_connection(self, address, timeout, source_address=None):
+        """Opens a socket to the (host, port) address, the host being resolved from the DNS cache."""
+        host, port = address
+        resolved, _ = self.resolver.resolve(host)
+        if resolved is None:
+            raise socket.gaierror(f"Could not resolve {host}")
+        connection_socket = socket.create_connection((resolved, port), timeout, source_address)
+        # As HTTPConnection.connect: the requests are sent in a single packet, without waiting for an ACK
+        connection_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connected_at.ns = time.perf_counter_ns()
+        return connection_socket
+
+    def release(self, key, connection):
+        """Gives a connection back to the pool, closing it if the pool is full."""
+        now = time.monotonic()
+        self.lock.acquire()
+        expired = self.evict_idle(now)
+        idle = self.idle_connections.setdefault(key, deque())
+        if len(idle) < self.max_size_per_host:
+            idle.append((connection, now))
+            self.idle_order.append((now, key, connection))
+            connection = None
+        self.lock.release()
+
+        for expired_connection in expired:
+            expired_connection.close()
+        if connection is not None:
+            connection.close()
+
+    def evict_idle(self, now):
+        """Removes the connections of all the hosts idle for more than idle_timeout, and returns them to be closed.
+
+        Called with the lock held, on every acquire and release. The connections are visited in the order
+        they were given back, so that only the expired ones are visited.
+        """
+        expired = []
+        while self.idle_order and now - self.idle_order[0][0] > self.idle_timeout:
+            released_at, key, connection = self.idle_order.popleft()
+            idle = self.idle_connections.get(key)
+            # Unless it was reused since, the connection is the oldest of its host (on the left)
+            if idle and idle[0][0] is connection and idle[0][1] == released_at:
+                idle.popleft()
+                expired.append(connection)
+                if not idle:
+                    del self.idle_connections[key]
+        return expired
+
+    def clear(self):
+        """Closes all the idle connections."""
+        self.lock.acquire()
+        idle_connections = self.idle_connections
+        self.idle_connections = {}
+        self.idle_order = deque()
+        self.lock.release()
+
+        for idle in idle_connections.values():
+            for connection, _ in idle:
+                connection.close()
+
+    def get(self, url, fresh_connection=False, keep_alive=True, timings=None):
+        """Sends a GET request to url, following redirections, and returns the response code.
+
+        Parameters
+        ----------
+        url : str
+            url to request
+        fresh_connection : bool
+            whether to bypass the idle connections and open a new one (to measure "cold" latency)
+        keep_alive : bool
+            whether to keep the connections open for the next requests, rather than open a new one per request
+        timings : dict
+            if not None, the time (in ms, see HTTP_PHASES) of each phase of the requests is added to it.
+            The phases which were not done (such as the connection, on a reused connection) are not added.
+            The time spent on stale connections before their retry is not timed, but kept in stale_time.ns,
+            to be taken out of the response time.
+
+        Raises
+        ------
+        HttpProbeError
+            if the url answers with an error code (>= 400)
+        """
+        self.stale_time.ns = 0
+        if self.proxies and self.uses_proxy(urlparse(url)):
+            return self.get_through_proxy(url)
+        for _ in range(MAX_REDIRECTS + 1):
+            response = self.request(url, fresh_connection or not keep_alive, keep_alive, timings)
+            if response.status in REDIRECT_CODES and response.getheader('Location'):
+                url = urljoin(url, response.getheader('Location'))
+                continue
+            break
+
+        if response.status >= 400:
+            raise HttpProbeError(f"{url} answered with code {response.status}")
+        return response.status
+
+    def uses_proxy(self, parsed_url):
+        """Returns whether the url must be requested through a proxy (see ConnectionPool.proxies)."""
+        return parsed_url.scheme in self.proxies and not proxy_bypass(parsed_url.netloc)
+
+    def get_through_proxy(self, url):
+        """Sends a GET request to url through its proxy with urllib, following redirections, and returns the
+        response code.
+
+        Raises
+        ------
+        HttpProbeError
+            if the url answers with an error code (>= 400)
+        """
+        try:
+            with self.proxy_opener.open(url, timeout=self.timeout) as response:
+                response.read()
+                return response.status
+        except HTTPError as error:
+            error.close()
+            raise HttpProbeError(f"{url} answered with code {error.code}")
+
+    def request(self, url, fresh_connection=False, keep_alive=True, timings=None):
+        """Sends a GET request to url on a pooled connection, and returns the (fully read) response.
+
+        A reused connection may have been closed by the server in the meantime: in which case the request
+        is sent again on a new connection, if the connection failed before the status line of the response
+        (see STALE_CONNECTION_ERRORS). Other errors, such as timeouts, are raised.
+        """
+        parsed_url = urlparse(url)
+        key = (parsed_url.scheme, parsed_url.hostname, parsed_url.port)
+        path = parsed_url.path or '/'
+        if parsed_url.query:
+            path += '?' + parsed_url.query
+
+        connection, is_new = self.acquire(key, fresh_connection)
+        start = time.perf_counter_ns()
+        try:
+            response = self.send(connection, parsed_url, path, timings)
+        except STALE_CONNECTION_ERRORS:
+            connection.close()
+            if is_new:
+                raise
+            # Stale keep-alive connection: reconnect once
+            self.stale_time.ns += time.perf_counter_ns() - start
+            connection, is_new = self.acquire(key, fresh_connection=True)
+            try:
+                response = self.send(connection, parsed_url, path, timings)
+            except (HTTPException, OSError):
+                connection.close()
+                raise
+        except (HTTPException, OSError):
+            connection.close()
+            raise
+
+        try:
+            self.read_body(response, timings)
+        except (HTTPException, OSError):
+            connection.close()
+            raise
+
+        if response.will_close or not keep_alive:
+            connection.close()
+        else:
+            self.release(key, connection)
+        return response
+
+    def send(self, connection, parsed_url, path, timings=None):
+        """Sends the request on the connection, and returns the response once its headers are read."""
+        if timings is not None and connection.sock is None:
+            # Connect beforehand (rather than on the request) to time the connection and the TLS handshake
+            start = time.perf_counter_ns()
+            connection.connect()
+            end = time.perf_counter_ns()
+            connected_at = self.connected_at.ns
+            add_timing(timings, 'connect', connected_at - start)
+            if isinstance(connection, HTTPSConnection):
+                add_timing(timings, 'tls', end - connected_at)
+
+        start = time.perf_counter_ns()
+        connection.request('GET', path, headers={'Host': parsed_url.netloc, 'User-Agent': 'Stella'})
+        response = connection.getresponse()
+        if timings is not None:
+            add_timing(timings, 'ttfb', time.perf_counter_ns() - start)
+        return response
+
+    def read_body(self, response, timings=None):
+        """Reads the body of the response, which must be consumed before its connection can be reused."""
+        start = time.perf_counter_ns()
+        response.read()
+        if timings is not None:
+            add_timing(timings, 'body', time.perf_counter_ns() - start)
+
+
+POOL = ConnectionPool()
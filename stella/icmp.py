@@ -0,0 +1,363 @@
+import asyncio
+from collections import deque
+from itertools import count
+import os
+import selectors
+import socket
+import struct
+import time
+
+from stella import config
+
+ICMP_ECHO_REPLY = 0
+ICMP_DESTINATION_UNREACHABLE = 3
+ICMP_ECHO_REQUEST = 8
+ICMP_TIME_EXCEEDED = 11
+
+# Response codes mimic the exit status of the ping command
+CODE_REPLY = 0
+CODE_NO_REPLY = 1
+CODE_ERROR = 2
+
+ICMP_HEADER = struct.Struct('!BBHHH')
+PAYLOAD = b'stella-icmp-probe'
+MAX_SEQUENCE = 0xFFFF
+# Maximum number of hosts of a sweep batch, so that the sequence numbers of two consecutive batches never overlap
+SWEEP_BATCH = (MAX_SEQUENCE + 1) // 2
+# Number of requests sent in a row before reading the replies, so that the socket recieve buffer does not overflow
+SEND_BURST = 128
+
+_identifiers = count(os.getpid() & 0xFFFF)
+_socket_type = None
+_native_icmp_available = None
+
+
+def checksum(data):
+    """Returns the internet checksum (RFC 1071) of data."""
+    if len(data) % 2:
+        data += b'\0'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def build_echo_request(identifier, sequence, payload=PAYLOAD):
+    """Returns an ICMP ECHO_REQUEST packet."""
+    header = ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, 0, identifier, sequence)
+    return ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, checksum(header + payload), identifier, sequence) + payload
+
+
+def parse_reply(packet, has_ip_header):
+    """Parses a packet recieved on an ICMP socket.
+
+    Parameters
+    ----------
+    packet : bytes
+        the recieved packet
+    has_ip_header : bool
+        whether the packet starts with its IP header (raw sockets) or not (datagram sockets)
+
+    Returns
+    -------
+    (int, int, int) or None : the ICMP type, identifier and sequence of the echo request
+        the packet answers to. For error messages (destination unreachable, time exceeded),
+        the identifier and sequence are those of the original echo request.
+        None if the packet is not related to an echo request.
+    """
+    if has_ip_header:
+        packet = packet[(packet[0] & 0x0F) * 4:]
+    if len(packet) < ICMP_HEADER.size:
+        return None
+    icmp_type, _, _, identifier, sequence = ICMP_HEADER.unpack_from(packet)
+
+    if icmp_type == ICMP_ECHO_REPLY:
+        return icmp_type, identifier, sequence
+
+    if icmp_type in (ICMP_DESTINATION_UNREACHABLE, ICMP_TIME_EXCEEDED):
+        # The message embeds the IP header and the first bytes of the original echo request
+        original = packet[ICMP_HEADER.size:]
+        if len(original) < 20:
+            return None
+        original = original[(original[0] & 0x0F) * 4:]
+        if len(original) < ICMP_HEADER.size or original[0] != ICMP_ECHO_REQUEST:
+            return None
+        _, _, _, identifier, sequence = ICMP_HEADER.unpack_from(original)
+        return icmp_type, identifier, sequence
+
+    return None
+
+
+def open_socket():
+    """Returns a non-privileged datagram ICMP socket if the kernel allows it, a raw ICMP socket otherwise.
+
+    Raises
+    ------
+    PermissionError
+        if neither kind of socket is allowed for this user
+    """
+    global _socket_type
+    socket_types = [_socket_type] if _socket_type is not None else [socket.SOCK_DGRAM, socket.SOCK_RAW]
+    for socket_type in socket_types:
+        try:
+            icmp_socket = socket.socket(socket.AF_INET, socket_type, socket.IPPROTO_ICMP)
+        except (PermissionError, OSError):
+            continue
+        _socket_type = socket_type
+        return icmp_socket
+    raise PermissionError("ICMP sockets are not allowed for this user")
+
+
+def native_icmp_available():
+    """Returns whether ICMP probes can be sent without the ping command (checked once)."""
+    global _native_icmp_available
+    if _native_icmp_available is None:
+        try:
+            open_socket().close()
+            _native_icmp_available = True
+        except PermissionError:
+            _native_icmp_available = False
+    return _native_icmp_available
+
+
+class EchoRequest(object):
+    """An echo request sent through an ICMP socket, waiting to be matched with its reply."""
+
+    def __init__(self, icmp_socket, address):
+        self.socket = icmp_socket
+        self.address = address
+        self.is_raw = icmp_socket.type == socket.SOCK_RAW
+        if self.is_raw:
+            self.identifier = next(_identifiers) & 0xFFFF
+        else:
+            # The kernel replaces the identifier of datagram ICMP sockets by the socket "port"
+            icmp_socket.bind(('', 0))
+            self.identifier = icmp_socket.getsockname()[1]
+        self.sequence = 1
+        self.sent_at = None
+
+    def send(self):
+        self.sent_at = time.perf_counter()
+        self.socket.sendto(build_echo_request(self.identifier, self.sequence), (self.address, 0))
+
+    def match(self, packet):
+        """Returns the probe result if the packet answers this request, None otherwise."""
+        reply = parse_reply(packet, self.is_raw)
+        if reply is None:
+            return None
+        icmp_type, identifier, sequence = reply
+        if (identifier, sequence) != (self.identifier, self.sequence):
+            return None
+        if icmp_type == ICMP_ECHO_REPLY:
+            return True, (time.perf_counter() - self.sent_at) * 1000, CODE_REPLY
+        return False, None, CODE_NO_REPLY
+
+
+def ping(host, timeout=config.ICMP_TIMEOUT):
+    """Sends an ICMP ECHO_REQUEST from an in-process socket and waits for the reply.
+
+    Returns
+    -------
+    int : success status
+    float : round-trip time (in ms)
+    int : response code (0 on reply, 1 without reply, 2 on error, as the ping command)
+    """
+    try:
+        address = socket.gethostbyname(host)
+    except OSError:
+        return False, None, CODE_ERROR
+
+    icmp_socket = open_socket()
+    try:
+        request = EchoRequest(icmp_socket, address)
+        request.send()
+        deadline = request.sent_at + timeout
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return False, None, CODE_NO_REPLY
+            icmp_socket.settimeout(remaining)
+            try:
+                packet = icmp_socket.recv(2048)
+            except socket.timeout:
+                return False, None, CODE_NO_REPLY
+            result = request.match(packet)
+            if result is not None:
+                return result
+    except OSError:
+        return False, None, CODE_ERROR
+    finally:
+        icmp_socket.close()
+
+
+async def async_ping(host, timeout=config.ICMP_TIMEOUT):
+    """Non-blocking counterpart of icmp.ping, for the asyncio probe engine."""
+    loop = asyncio.get_running_loop()
+    try:
+        address = (await loop.getaddrinfo(host, None, family=socket.AF_INET))[0][4][0]
+    except OSError:
+        return False, None, CODE_ERROR
+
+    icmp_socket = open_socket()
+    icmp_socket.setblocking(False)
+    try:
+        request = EchoRequest(icmp_socket, address)
+        request.send()
+
+        async def wait_for_reply():
+            while True:
+                result = request.match(await loop.sock_recv(icmp_socket, 2048))
+                if result is not None:
+                    return result
+
+        return await asyncio.wait_for(wait_for_reply(), timeout)
+    except asyncio.TimeoutError:
+        return False, None, CODE_NO_REPLY
+    except OSError:
+        return False, None, CODE_ERROR
+    finally:
+        icmp_socket.close()
+
+
+class IcmpSweeper(object):
+    """Probes many hosts at once from a single ICMP socket.
+
+    All the echo requests of a sweep are sent from the same socket, and a single
+    selector loop collects the replies (matched by sequence number) until the timeout.
+    Sequence numbers run on from one sweep to the next, so that the late replies to a previous sweep
+    are told apart from the replies to the current one, and dropped.
+    Sending and recieving are interleaved, so that replies are timed as soon as they arrive
+    even while requests are still being sent.
+    """
+
+    def __init__(self, timeout=config.ICMP_TIMEOUT):
+        """Opens the sweeper socket.
+
+        Raises
+        ------
+        PermissionError
+            if ICMP sockets are not allowed for this user
+        """
+        self.timeout = timeout
+        self.socket = open_socket()
+        self.socket.setblocking(False)
+        self.is_raw = self.socket.type == socket.SOCK_RAW
+        if self.is_raw:
+            self.identifier = next(_identifiers) & 0xFFFF
+        else:
+            # The kernel replaces the identifier of datagram ICMP sockets by the socket "port"
+            self.socket.bind(('', 0))
+            self.identifier = self.socket.getsockname()[1]
+        self.selector = selectors.DefaultSelector()
+        # Sequence numbers of the requests of the current batch, from first_sequence on (see sweep_batch)
+        self.first_sequence = 0
+        self.next_sequence = 0
+
+    def close(self):
+        self.selector.close()
+        self.socket.close()
+
+    def sweep(self, hosts):
+        """Sends an echo request to each host and waits for the replies.
+
+        Parameters
+        ----------
+        hosts : list(str)
+            IPv4 addresses to probe. Duplicates are probed several times.
+            Hostnames are accepted, but resolved one after the other with the blocking socket.gethostbyname:
+            callers should pass addresses (App.sweep resolves them from the DNS cache, see dnscache.py).
+
+        Returns
+        -------
+        list((bool, float, int)) : the (is_up, response_time, response_code) of each host, in order
+        """
+        results = [None] * len(hosts)
+        # Sequence numbers identify the requests: sweep by batches of at most SWEEP_BATCH hosts
+        for batch_start in range(0, len(hosts), SWEEP_BATCH):
+            batch = hosts[batch_start:batch_start + SWEEP_BATCH]
+            results[batch_start:batch_start + len(batch)] = self.sweep_batch(batch)
+        return results
+
+    def sweep_batch(self, hosts):
+        self.first_sequence = self.next_sequence
+        self.next_sequence = (self.first_sequence + len(hosts)) & MAX_SEQUENCE
+        results = [None] * len(hosts)
+        to_send = []
+        for index, host in enumerate(hosts):
+            try:
+                to_send.append((index, socket.gethostbyname(host)))
+            except OSError:
+                results[index] = (False, None, CODE_ERROR)
+        to_send.reverse()
+
+        sent_at = {}
+        # (send time, index) of the requests in the order they were sent, including the answered ones
+        sent_order = deque()
+        perf_counter = time.perf_counter
+        self.selector.register(self.socket, selectors.EVENT_READ | selectors.EVENT_WRITE)
+        try:
+            while to_send or sent_at:
+                # Each request times out on its own, timeout seconds after it was sent
+                now = perf_counter()
+                while sent_order and now - sent_order[0][0] >= self.timeout:
+                    _, index = sent_order.popleft()
+                    if sent_at.pop(index, None) is not None:
+                        results[index] = (False, None, CODE_NO_REPLY)
+                if not sent_at and not to_send:
+                    break
+                timeout = sent_order[0][0] + self.timeout - now if sent_order else None
+                for _, events in self.selector.select(timeout):
+                    if events & selectors.EVENT_READ:
+                        self.recieve_replies(sent_at, results)
+                    if events & selectors.EVENT_WRITE and to_send:
+                        self.send_requests(to_send, sent_at, sent_order, results)
+                        if not to_send:
+                            self.selector.modify(self.socket, selectors.EVENT_READ)
+        finally:
+            self.selector.unregister(self.socket)
+        return results
+
+    def send_requests(self, to_send, sent_at, sent_order, results):
+        """Sends up to SEND_BURST pending requests, or as many as the socket buffer allows.
+
+        Their send times are recorded in sent_at, by index, and appended to sent_order.
+        """
+        perf_counter = time.perf_counter
+        for _ in range(min(SEND_BURST, len(to_send))):
+            index, address = to_send[-1]
+            # The sequence number is the index of the host in the batch, following those of the previous batches
+            packet = build_echo_request(self.identifier, (self.first_sequence + index) & MAX_SEQUENCE)
+            try:
+                sent_at[index] = perf_counter()
+                self.socket.sendto(packet, (address, 0))
+            except BlockingIOError:
+                del sent_at[index]
+                return
+            except OSError:
+                del sent_at[index]
+                results[index] = (False, None, CODE_ERROR)
+            else:
+                sent_order.append((sent_at[index], index))
+            to_send.pop()
+
+    def recieve_replies(self, sent_at, results):
+        """Reads all the available replies and records those answering a pending request of the current batch."""
+        perf_counter = time.perf_counter
+        while True:
+            try:
+                packet = self.socket.recv(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            reply = parse_reply(packet, self.is_raw)
+            if reply is None:
+                continue
+            icmp_type, identifier, sequence = reply
+            # Replies to the previous batches fall out of the indexes of the current one
+            index = (sequence - self.first_sequence) & MAX_SEQUENCE
+            if identifier != self.identifier or index not in sent_at:
+                continue
+            start = sent_at.pop(index)
+            if icmp_type == ICMP_ECHO_REPLY:
+                results[index] = (True, (perf_counter() - start) * 1000, CODE_REPLY)
+            else:
+                results[index] = (False, None, CODE_NO_REPLY)
@@ -0,0 +1,280 @@
+"""Notifications of the alerts to external sinks: webhooks, local files and commands.
+
+Alerts are handed to the Notifier by the consumer of the alert queues (see App.drain_alerts),
+never by the probes. Each sink has its own bounded queue and its own worker task, on the event loop
+of the notifier thread, so that a slow or dead sink only delays its own notifications:
+
+- alerts are sent in batches, collected during the batching window of the sink,
+- in a batch, the alerts of a rule of a website are coalesced into the last one. It is dropped if the rule
+  is back to the state last notified (an alert which recovered within the window is not notified),
+- failed batches are retried with an exponential backoff, then dropped,
+- alerts are dropped when the queue of the sink is full.
+
+Dropped and coalesced alerts are counted in the attributes of each sink.
+"""
+import asyncio
+from functools import partial
+import json
+import shlex
+from threading import Thread
+from urllib.request import Request
+from urllib.request import urlopen
+
+from stella import config
+
+
+def alert_to_dict(alert):
+    """Returns the JSON serializable representation of an alert sent to the sinks."""
+    return {
+        'website': alert.website,
+        'url': alert.url,
+        'rule': alert.rule_name,
+        'firing': alert.firing,
+        'time': alert.activation_time.isoformat(),
+        'message': alert.message,
+    }
+
+
+def alert_key(alert):
+    """Returns the key of the notified state of an alert: (url of its website, or hostname if unknown, rule name)."""
+    return alert.website_key(), alert.rule_name
+
+
+class Sink(object):
+    def __init__(self,
+                 batch_window=config.NOTIFICATION_BATCH_WINDOW,
+                 queue_size=config.NOTIFICATION_QUEUE_SIZE,
+                 max_retries=config.NOTIFICATION_MAX_RETRIES,
+                 retry_backoff=config.NOTIFICATION_RETRY_BACKOFF,
+                 max_backoff=config.NOTIFICATION_MAX_BACKOFF,
+                 timeout=config.NOTIFICATION_TIMEOUT):
+        """Returns a notification sink. Child classes implement send.
+
+        Parameters
+        ----------
+        batch_window : float
+            in seconds, how long alerts are collected before being sent together
+        queue_size : int
+            maximum number of alerts waiting to be sent, newer alerts being dropped
+        max_retries : int
+            number of times a failed batch is sent again before being dropped
+        retry_backoff : float
+            in seconds, delay before the first retry, doubled at each retry
+        max_backoff : float
+            in seconds, maximum delay between two retries
+        timeout : float
+            in seconds, after which sending a batch is considered failed
+
+        Attributes
+        ----------
+        queue : asyncio.Queue
+            alerts waiting to be sent, created when the notifier starts
+        notified : dict
+            firing state last notified for each (website url, rule name), see alert_key
+        nb_sent : int
+            number of alerts sent
+        nb_coalesced : int
+            number of alerts not sent as they were superseded by a later alert of the same batch
+        nb_dropped : int
+            number of alerts dropped as the queue was full
+        nb_failed : int
+            number of alerts dropped as their batch still failed after all the retries
+        nb_retries : int
+            number of batches sent again after a failure
+        """
+        self.batch_window = batch_window
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.queue = None
+        self.notified = {}
+        self.nb_sent = 0
+        self.nb_coalesced = 0
+        self.nb_dropped = 0
+        self.nb_failed = 0
+        self.nb_retries = 0
+
+    async def send(self, alerts):
+        """Sends a batch of alerts, raising an exception on failure."""
+        raise NotImplementedError
+
+    def coalesce(self, alerts):
+        """Returns the alerts of a batch to send: the last alert of each rule of each website, if its state changed.
+
+        Websites are told apart by url, so that the websites of a same hostname are notified separately.
+        """
+        last_alerts = {}
+        for alert in alerts:
+            key = alert_key(alert)
+            last_alerts.pop(key, None)
+            last_alerts[key] = alert
+        batch = [alert for key, alert in last_alerts.items() if self.notified.get(key, False) != alert.firing]
+        self.nb_coalesced += len(alerts) - len(batch)
+        return batch
+
+    async def run(self):
+        """Sends the alerts of the queue until cancelled."""
+        loop = asyncio.get_running_loop()
+        while True:
+            alerts = [await self.queue.get()]
+            deadline = loop.time() + self.batch_window
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    alerts.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            await self.deliver(self.coalesce(alerts))
+            for _ in alerts:
+                self.queue.task_done()
+
+    async def deliver(self, batch):
+        """Sends a batch, retrying with an exponential backoff on failure."""
+        if not batch:
+            return
+        backoff = self.retry_backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                await asyncio.wait_for(self.send(batch), self.timeout)
+            except Exception:
+                if attempt == self.max_retries:
+                    self.nb_failed += len(batch)
+                    return
+                self.nb_retries += 1
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+            else:
+                break
+        self.nb_sent += len(batch)
+        for alert in batch:
+            self.notified[alert_key(alert)] = alert.firing
+
+
+class WebhookSink(Sink):
+    def __init__(self, url, **kwargs):
+        """Returns a sink posting each batch as JSON ({"alerts": [...]}, see alert_to_dict) to url."""
+        super().__init__(**kwargs)
+        self.url = url
+
+    async def send(self, alerts):
+        body = json.dumps({'alerts': [alert_to_dict(alert) for alert in alerts]}).encode()
+        request = Request(self.url, data=body, headers={'Content-Type': 'application/json'}, method='POST')
+        # urlopen raises an exception for error statuses
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(None, partial(urlopen, request, timeout=self.timeout))
+        response.close()
+
+
+class FileSink(Sink):
+    def __init__(self, file_path, **kwargs):
+        """Returns a sink appending each alert as a line of JSON (see alert_to_dict) to a file."""
+        super().__init__(**kwargs)
+        self.file_path = file_path
+
+    async def send(self, alerts):
+        lines = ''.join(json.dumps(alert_to_dict(alert)) + '\n' for alert in alerts)
+        await asyncio.get_running_loop().run_in_executor(None, self.write, lines)
+
+    def write(self, lines):
+        with open(self.file_path, 'a') as file_handle:
+            file_handle.write(lines)
+
+
+class CommandSink(Sink):
+    def __init__(self, command, **kwargs):
+        """Returns a sink running a command for each batch, with the alerts as lines of JSON on its standard input.
+
+        A command exiting with a non-zero status is considered failed.
+        """
+        super().__init__(**kwargs)
+        self.command = command
+
+    async def send(self, alerts):
+        lines = ''.join(json.dumps(alert_to_dict(alert)) + '\n' for alert in alerts)
+        process = await asyncio.create_subprocess_exec(*shlex.split(self.command),
+                                                       stdin=asyncio.subprocess.PIPE,
+                                                       stdout=asyncio.subprocess.DEVNULL,
+                                                       stderr=asyncio.subprocess.DEVNULL)
+        try:
+            await process.communicate(lines.encode())
+        except asyncio.CancelledError:
+            process.kill()
+            raise
+        if process.returncode != 0:
+            raise RuntimeError(f"{self.command} exited with status {process.returncode}")
+
+
+SINK_CLASSES = {'webhook': WebhookSink, 'file': FileSink, 'command': CommandSink}
+
+
+def create_sink(kind, target, batch_window=config.NOTIFICATION_BATCH_WINDOW):
+    """Returns the sink of a config.NOTIFICATION_SINKS entry: webhook (url), file (path) or command."""
+    if kind not in SINK_CLASSES:
+        raise ValueError(f"Unknown notification sink {kind}")
+    return SINK_CLASSES[kind](target, batch_window=batch_window)
+
+
+class Notifier(object):
+    def __init__(self, sinks):
+        """Returns a notifier sending the alerts to sinks, each one from its own worker task.
+
+        Parameters
+        ----------
+        sinks : list(Sink)
+            sinks to which every alert is sent
+        """
+        self.sinks = sinks
+        self.loop = None
+        self.thread = None
+        self.tasks = []
+
+    def start(self):
+        """Runs the event loop of the sinks in a daemon thread, and returns once it is ready."""
+        self.loop = asyncio.new_event_loop()
+        for sink in self.sinks:
+            sink.queue = asyncio.Queue(sink.queue_size)
+            self.tasks.append(self.loop.create_task(sink.run()))
+        self.thread = Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def notify(self, alerts):
+        """Hands alerts over to the sinks, without waiting. Can be called from any thread."""
+        if alerts:
+            self.loop.call_soon_threadsafe(self.enqueue, alerts)
+
+    def enqueue(self, alerts):
+        for sink in self.sinks:
+            for alert in alerts:
+                try:
+                    sink.queue.put_nowait(alert)
+                except asyncio.QueueFull:
+                    sink.nb_dropped += 1
+
+    def flush(self, timeout):
+        """Waits up to timeout seconds for the sinks to send the alerts handed over so far."""
+        async def join():
+            await asyncio.gather(*(sink.queue.join() for sink in self.sinks))
+
+        try:
+            asyncio.run_coroutine_threadsafe(asyncio.wait_for(join(), timeout), self.loop).result()
+        except asyncio.TimeoutError:
+            pass
+
+    def close(self, timeout=config.NOTIFICATION_TIMEOUT):
+        """Sends the pending alerts (waiting up to timeout seconds), then stops the sinks."""
+        self.flush(timeout)
+
+        async def cancel():
+            for task in self.tasks:
+                task.cancel()
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(cancel(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
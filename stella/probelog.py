@@ -0,0 +1,429 @@
+"""Append-only log of all the probe results, kept on disk for the retention period.
+
+Layout
+------
+The log is a directory holding:
+
+    sites : the urls of the logged websites, one per line. A website is identified by its line number.
+    <number>.seg : segments of fixed-size records (see RECORD), appended in time order.
+                   Only the last segment is written to, a new one is started once it is full.
+    <number>.idx : time index of a full segment: the minimum and maximum timestamps of each block
+                   of index_block_records records. Rebuilt from the segment if missing.
+
+Records are appended in batches by a background thread (see ProbeLog.run), which calls fsync
+once per batch, so that probes never wait for the disk.
+"""
+from array import array
+from bisect import bisect_left
+from bisect import bisect_right
+from itertools import accumulate
+import math
+import mmap
+import os
+import struct
+from threading import Event
+from threading import Lock
+from threading import Thread
+import time
+
+from stella import config
+from stella.rollup import Bucket
+from stella.stats import NO_RESPONSE_CODE
+
+# timestamp (wall clock), site id, response time (NaN if none), response code (NO_RESPONSE_CODE if none),
+# is up, protocol
+RECORD = struct.Struct('<dIdHBB')
+PROTOCOL_ICMP = 0
+PROTOCOL_HTTP = 1
+
+SITES_FILE = 'sites'
+SEGMENT_SUFFIX = '.seg'
+INDEX_SUFFIX = '.idx'
+
+
+class Segment(object):
+    """A segment file of the log, along with its time index."""
+
+    def __init__(self, directory, number, index_block_records):
+        """Returns the segment of the given number, loading its records count and time index if it exists.
+
+        Parameters
+        ----------
+        directory : str
+            directory of the log
+        number : int
+            number of the segment, segments are ordered by number
+        index_block_records : int
+            number of records per block of the time index
+
+        Attributes
+        ----------
+        nb_records : int
+            number of records written to the segment
+        block_mins : array('d')
+            minimum timestamp of each block of records
+        block_maxs : array('d')
+            maximum timestamp of each block of records
+        running_bounds : tuple
+            (running maximum of block_maxs, running minimum from the end of block_mins), see record_range.
+            Cached until records are indexed, None until then
+        """
+        self.path = os.path.join(directory, f'{number:010d}{SEGMENT_SUFFIX}')
+        self.index_path = os.path.join(directory, f'{number:010d}{INDEX_SUFFIX}')
+        self.number = number
+        self.index_block_records = index_block_records
+        self.nb_records = 0
+        self.block_mins = array('d')
+        self.block_maxs = array('d')
+        self.running_bounds = None
+        if os.path.exists(self.path):
+            self.load()
+
+    def load(self):
+        """Loads the time index of the segment, rebuilding it if it does not cover all the records.
+
+        A partially written record (e.g. after a crash) is truncated.
+        """
+        size = os.path.getsize(self.path)
+        if size % RECORD.size:
+            with open(self.path, 'r+b') as segment_file:
+                segment_file.truncate(size - size % RECORD.size)
+        nb_records = size // RECORD.size
+
+        if os.path.exists(self.index_path):
+            index = array('d')
+            with open(self.index_path, 'rb') as index_file:
+                index.frombytes(index_file.read())
+            if len(index) == 2 * math.ceil(nb_records / self.index_block_records):
+                self.block_mins, self.block_maxs = index[0::2], index[1::2]
+                self.running_bounds = None
+                self.nb_records = nb_records
+                return
+
+        with open(self.path, 'rb') as segment_file:
+            data = segment_file.read(nb_records * RECORD.size)
+        self.add_timestamps([timestamp for timestamp, *_ in RECORD.iter_unpack(data)])
+
+    def add_timestamps(self, timestamps):
+        """Indexes the records appended to the segment, given their timestamps."""
+        self.running_bounds = None
+        for timestamp in timestamps:
+            if self.nb_records % self.index_block_records == 0:
+                self.block_mins.append(timestamp)
+                self.block_maxs.append(timestamp)
+            elif timestamp < self.block_mins[-1]:
+                self.block_mins[-1] = timestamp
+            elif timestamp > self.block_maxs[-1]:
+                self.block_maxs[-1] = timestamp
+            self.nb_records += 1
+
+    def write_index(self):
+        index = array('d', [0]) * (2 * len(self.block_mins))
+        index[0::2], index[1::2] = self.block_mins, self.block_maxs
+        with open(self.index_path, 'wb') as index_file:
+            index_file.write(index.tobytes())
+
+    def first_timestamp(self):
+        return min(self.block_mins) if self.block_mins else math.inf
+
+    def last_timestamp(self):
+        return max(self.block_maxs) if self.block_maxs else -math.inf
+
+    def record_range(self, start, end):
+        """Returns the indices (first, last + 1) of the records which may be between start and end.
+
+        Records are nearly sorted by time (probes finishing at the same time may be appended out of order),
+        so blocks are selected with the running maximum of their maximums, and the running minimum
+        (from the end) of their minimums, which are both sorted. They are computed once per change of the index
+        (once for a full segment, once per flush for the last one), the queries being then done
+        in O(log(number of blocks)).
+        """
+        if self.running_bounds is None:
+            self.running_bounds = (list(accumulate(self.block_maxs, max)),
+                                   list(accumulate(reversed(self.block_mins), min))[::-1])
+        running_maxs, running_mins = self.running_bounds
+        first_block = bisect_left(running_maxs, start)
+        last_block = bisect_right(running_mins, end)
+        if first_block >= last_block:
+            return 0, 0
+        return first_block * self.index_block_records, min(self.nb_records, last_block * self.index_block_records)
+
+    def read(self, first, last):
+        """Returns the raw records of the segment from index first to index last (excluded)."""
+        with open(self.path, 'rb') as segment_file:
+            with mmap.mmap(segment_file.fileno(), last * RECORD.size, access=mmap.ACCESS_READ) as mapping:
+                return mapping[first * RECORD.size:last * RECORD.size]
+
+    def remove(self):
+        for path in (self.path, self.index_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class ProbeLog(object):
+    """Append-only, segmented log of the probe results of all the websites."""
+
+    def __init__(self,
+                 directory,
+                 segment_records=config.PROBE_LOG_SEGMENT_RECORDS,
+                 retention=config.PROBE_LOG_RETENTION,
+                 flush_interval=config.PROBE_LOG_FLUSH_INTERVAL,
+                 compaction_interval=config.PROBE_LOG_COMPACTION_INTERVAL,
+                 index_block_records=config.PROBE_LOG_INDEX_BLOCK_RECORDS):
+        """Opens (or creates) the probe log stored in directory.
+
+        Parameters
+        ----------
+        directory : str
+            directory of the log
+        segment_records : int
+            number of records after which a new segment is started
+        retention : float
+            in seconds, how long records are kept (see ProbeLog.compact)
+        flush_interval : float
+            in seconds, how often the appended records are written to disk by the background thread
+        compaction_interval : float
+            in seconds, how often the background thread removes the expired records
+        index_block_records : int
+            number of records per block of the time index of the segments
+
+        Attributes
+        ----------
+        lock : threading.Lock
+            protects the pending records and the site ids, which are shared with the probing threads
+        segments_lock : threading.Lock
+            protects the segments, which are shared between the writer and the queries
+        pending : list
+            (record, timestamp) appended since the last flush
+        site_ids : dict(str:int)
+            ids of the logged websites
+        """
+        self.directory = directory
+        self.segment_records = segment_records
+        self.retention = retention
+        self.flush_interval = flush_interval
+        self.compaction_interval = compaction_interval
+        self.index_block_records = index_block_records
+
+        self.lock = Lock()
+        self.segments_lock = Lock()
+        self.pending = []
+        self.pending_sites = []
+        self.stop_event = Event()
+        self.thread = None
+
+        os.makedirs(directory, exist_ok=True)
+        self.site_ids = {}
+        sites_path = os.path.join(directory, SITES_FILE)
+        if os.path.exists(sites_path):
+            with open(sites_path, encoding='utf-8') as sites_file:
+                for url in sites_file.read().splitlines():
+                    self.site_ids[url] = len(self.site_ids)
+
+        numbers = sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(directory)
+                         if name.endswith(SEGMENT_SUFFIX))
+        self.segments = [Segment(directory, number, index_block_records) for number in numbers]
+        if not self.segments:
+            self.segments.append(Segment(directory, 0, index_block_records))
+        self.compact()
+
+    def append(self, url, use_http, is_up, response_time, response_code, timestamp=None):
+        """Adds a probe result to the log. Records are written to disk by the next flush.
+
+        timestamp is the wall clock time (see time.time) of the probe, now if None.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        self.lock.acquire()
+        site_id = self.site_ids.get(url)
+        if site_id is None:
+            site_id = self.site_ids[url] = len(self.site_ids)
+            self.pending_sites.append(url)
+        self.pending.append((RECORD.pack(timestamp,
+                                         site_id,
+                                         math.nan if response_time is None else response_time,
+                                         NO_RESPONSE_CODE if response_code is None else response_code,
+                                         is_up,
+                                         PROTOCOL_HTTP if use_http else PROTOCOL_ICMP),
+                             timestamp))
+        self.lock.release()
+
+    def start(self):
+        """Runs the writer in a daemon thread."""
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def run(self):
+        """Regularly writes the pending records to disk, and compacts the log, until closed."""
+        last_compaction = time.time()
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
+            if time.time() - last_compaction >= self.compaction_interval:
+                self.compact()
+                last_compaction = time.time()
+
+    def close(self):
+        """Stops the writer and writes the pending records to disk."""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
+
+    def flush(self):
+        """Writes the pending records to the log, starting new segments as needed, then syncs them to disk."""
+        self.lock.acquire()
+        pending, self.pending = self.pending, []
+        pending_sites, self.pending_sites = self.pending_sites, []
+        self.lock.release()
+
+        if pending_sites:
+            # Site ids must be on disk before the records referencing them
+            with open(os.path.join(self.directory, SITES_FILE), 'a', encoding='utf-8') as sites_file:
+                sites_file.write(''.join(url + '\n' for url in pending_sites))
+                sites_file.flush()
+                os.fsync(sites_file.fileno())
+
+        self.segments_lock.acquire()
+        try:
+            while pending:
+                segment = self.segments[-1]
+                if segment.nb_records >= self.segment_records:
+                    segment.write_index()
+                    segment = Segment(self.directory, segment.number + 1, self.index_block_records)
+                    self.segments.append(segment)
+                batch, pending = (pending[:self.segment_records - segment.nb_records],
+                                  pending[self.segment_records - segment.nb_records:])
+                with open(segment.path, 'ab') as segment_file:
+                    segment_file.write(b''.join(record for record, _ in batch))
+                    segment_file.flush()
+                    os.fsync(segment_file.fileno())
+                segment.add_timestamps(timestamp for _, timestamp in batch)
+        finally:
+            self.segments_lock.release()
+
+    def compact(self, now=None):
+        """Removes the records older than the retention period.
+
+        Full segments whose records all expired are deleted, and full segments holding expired records
+        are rewritten without them. The segment being written to is left as is until it is full.
+        """
+        cutoff = (time.time() if now is None else now) - self.retention
+        self.segments_lock.acquire()
+        try:
+            kept_segments = []
+            for segment in self.segments[:-1]:
+                if segment.last_timestamp() < cutoff:
+                    segment.remove()
+                    continue
+                if segment.first_timestamp() < cutoff:
+                    records = [record for record in RECORD.iter_unpack(segment.read(0, segment.nb_records))
+                               if record[0] >= cutoff]
+                    with open(segment.path + '.tmp', 'wb') as segment_file:
+                        segment_file.write(b''.join(RECORD.pack(*record) for record in records))
+                        segment_file.flush()
+                        os.fsync(segment_file.fileno())
+                    os.replace(segment.path + '.tmp', segment.path)
+                    segment.nb_records = 0
+                    segment.block_mins, segment.block_maxs = array('d'), array('d')
+                    segment.add_timestamps(record[0] for record in records)
+                    segment.write_index()
+                kept_segments.append(segment)
+            self.segments = kept_segments + self.segments[-1:]
+        finally:
+            self.segments_lock.release()
+
+    def records(self, url, start, end, use_http=None):
+        """Returns the probe results of a website between start and end (wall clock times, included).
+
+        Only the records written to disk are returned (see ProbeLog.flush).
+
+        Parameters
+        ----------
+        url : str
+            url of the website
+        start : float
+        end : float
+        use_http : bool
+            whether to return http (True) or icmp (False) probes only. Both if None.
+
+        Returns
+        -------
+        list of (float, bool, float, int) : the timestamp, success status, response time and response code of
+            each probe, ordered as they were logged. Missing response times and codes are None.
+        """
+        site_id = self.site_ids.get(url)
+        if site_id is None:
+            return []
+
+        results = []
+        # Segments must not be rewritten by compact while they are read
+        self.segments_lock.acquire()
+        try:
+            for segment in self.segments:
+                if segment.first_timestamp() > end or segment.last_timestamp() < start:
+                    continue
+                first, last = segment.record_range(start, end)
+                if first == last:
+                    continue
+                for timestamp, record_site_id, response_time, response_code, is_up, protocol \
+                        in RECORD.iter_unpack(segment.read(first, last)):
+                    if record_site_id != site_id or not start <= timestamp <= end:
+                        continue
+                    if use_http is not None and protocol != (PROTOCOL_HTTP if use_http else PROTOCOL_ICMP):
+                        continue
+                    results.append((timestamp,
+                                    bool(is_up),
+                                    None if math.isnan(response_time) else response_time,
+                                    None if response_code == NO_RESPONSE_CODE else response_code))
+        finally:
+            self.segments_lock.release()
+        return results
+
+    def scan(self, start=-math.inf, end=math.inf):
+        """Yields the probe results of all the websites between start and end, ordered as they were logged.
+
+        Segments are read one at a time.
+
+        Yields
+        ------
+        (float, str, bool, bool, float, int) : the timestamp, url, protocol (True for http), success status,
+            response time and response code of each probe. Missing response times and codes are None.
+        """
+        urls = sorted(self.site_ids, key=self.site_ids.get)
+        self.segments_lock.acquire()
+        segments = list(self.segments)
+        self.segments_lock.release()
+
+        for segment in segments:
+            # Segments must not be rewritten by compact while they are read
+            self.segments_lock.acquire()
+            try:
+                if segment not in self.segments or segment.first_timestamp() > end or segment.last_timestamp() < start:
+                    continue
+                first, last = segment.record_range(start, end)
+                data = segment.read(first, last) if first < last else b''
+            finally:
+                self.segments_lock.release()
+
+            for timestamp, site_id, response_time, response_code, is_up, protocol in RECORD.iter_unpack(data):
+                if start <= timestamp <= end:
+                    yield (timestamp,
+                           urls[site_id],
+                           protocol == PROTOCOL_HTTP,
+                           bool(is_up),
+                           None if math.isnan(response_time) else response_time,
+                           None if response_code == NO_RESPONSE_CODE else response_code)
+
+    def query(self, url, start, end, use_http=None, relative_accuracy=config.PERCENTILES_RELATIVE_ACCURACY):
+        """Returns the aggregates of the probes of a website between start and end (see ProbeLog.records).
+
+        Returns
+        -------
+        rollup.Bucket : number of probes, successes, sum, min and max of the response times,
+            response codes and response times histogram (for percentiles)
+        """
+        bucket = Bucket(start, relative_accuracy)
+        for timestamp, is_up, response_time, response_code in self.records(url, start, end, use_http):
+            bucket.add(timestamp, is_up, response_time, response_code)
+        return bucket
@@ -0,0 +1,158 @@
+"""Targets of the probes, shared by the websites which would otherwise probe the same thing.
+
+Several websites often share a host (for example, several paths of the same website): in ICMP mode,
+they would all send the same echo request at each check. Websites are grouped into probe targets
+(see group_websites): a target is probed once per check interval, and the result is recorded in the stats
+of each of its websites, which also share its scheduling counters (see scheduler.SchedulingStats).
+
+- with icmp, websites are grouped by hostname (see config.DEDUPLICATE_PROBES),
+- with http, websites are grouped by url, if config.DEDUPLICATE_HTTP_PROBES.
+
+Only websites with the same check interval are grouped, as their stats assume one check per interval.
+
+Before each check, the host of the target is resolved from the shared DNS cache (see dnscache.py),
+and the resolution time is recorded apart from the response time, as are the phases of the http checks
+(see config.HTTP_PHASE_TIMINGS).
+"""
+from urllib.parse import urlparse
+
+from stella import config
+from stella.dnscache import CACHE
+from stella import icmp
+from stella.website import Website
+
+
+def probe_key(website, use_http, deduplicate=config.DEDUPLICATE_PROBES,
+              deduplicate_http=config.DEDUPLICATE_HTTP_PROBES):
+    """Returns the key of the probe target of a website, None if its probes are not shared."""
+    if use_http:
+        return (website.url, website.check_interval) if deduplicate_http else None
+    return (website.hostname.lower(), website.check_interval) if deduplicate else None
+
+
+def group_websites(websites, use_http, deduplicate=config.DEDUPLICATE_PROBES,
+                   deduplicate_http=config.DEDUPLICATE_HTTP_PROBES):
+    """Returns the list of the ProbeTarget of the websites, in the order of their first website."""
+    targets = []
+    targets_by_key = {}
+    for website in websites:
+        key = probe_key(website, use_http, deduplicate, deduplicate_http)
+        if key is None:
+            targets.append(ProbeTarget([website]))
+        elif key in targets_by_key:
+            targets_by_key[key].websites.append(website)
+        else:
+            targets_by_key[key] = ProbeTarget([website])
+            targets.append(targets_by_key[key])
+    return targets
+
+
+def nb_saved_probes(websites):
+    """Returns the number of probes saved so far by the probe targets of the websites, as scheduled.
+
+    Each website accounts for its share of the probes saved by its target, so that the result is the same
+    whether the websites share their scheduling counters or hold copies of them (see shard.py).
+    """
+    nb_saved = 0
+    for website in websites:
+        scheduling = website.scheduling
+        if scheduling is not None:
+            nb_saved += scheduling.nb_checks * (scheduling.nb_websites - 1) / scheduling.nb_websites
+    return round(nb_saved)
+
+
+class ProbeTarget(object):
+    def __init__(self, websites):
+        """Returns the target of the probes of websites, which must share their check interval.
+
+        Parameters
+        ----------
+        websites : list(website.Website)
+            websites in which the results of the probes are recorded, the first one being probed
+
+        Attributes
+        ----------
+        check_interval : int
+            check interval of the websites, at which the target is probed
+        url_hostname : str
+            hostname of the url, resolved for the http checks (hostname may include a port)
+        """
+        self.websites = websites
+        self.hostname = websites[0].hostname
+        self.url = websites[0].url
+        self.url_hostname = urlparse(self.url).hostname or self.hostname
+        self.check_interval = websites[0].check_interval
+        self._scheduling = None
+
+    @property
+    def scheduling(self):
+        return self._scheduling
+
+    @scheduling.setter
+    def scheduling(self, scheduling):
+        # Set by the scheduler of the target (see scheduler.Scheduler), shared by its websites
+        scheduling.nb_websites = len(self.websites)
+        self._scheduling = scheduling
+        for website in self.websites:
+            website.scheduling = scheduling
+
+    def check(self, use_http):
+        """Probes the target once through icmp (or http), and records the result in all its websites.
+
+        The probe is not sent if the host cannot be resolved.
+        """
+        address, dns_time = CACHE.resolve(self.url_hostname if use_http else self.hostname)
+        self.update_dns_stats(address is not None, dns_time)
+        if use_http:
+            cold_check = self.next_http_check()
+            if address is None:
+                is_up, response_time, response_code = False, None, None
+            else:
+                # The connections of the pool are opened to the address cached in the meantime
+                timings = {} if config.HTTP_PHASE_TIMINGS else None
+                is_up, response_time, response_code = Website.http_ping(self.url, fresh_connection=cold_check,
+                                                                        timings=timings)
+                if timings:
+                    self.update_http_phase_stats(timings)
+        else:
+            cold_check = False
+            if address is None:
+                is_up, response_time, response_code = False, None, icmp.CODE_ERROR
+            else:
+                is_up, response_time, response_code = Website.ping(address)
+        self.update(use_http, is_up, response_time, response_code, cold_check)
+
+    def next_http_check(self):
+        """Counts a new http check of the websites, and returns whether it must be done on a new connection."""
+        for website in self.websites:
+            website.nb_http_checks += 1
+        return self.websites[0].is_cold_check()
+
+    def update_dns_stats(self, is_resolved, dns_time):
+        """Records the resolution time of the host of a check in all the websites, if it was resolved."""
+        if dns_time is None:
+            return
+        for website in self.websites:
+            website.update_dns_stats(is_resolved, dns_time)
+
+    def update_http_phase_stats(self, timings):
+        """Records the {phase: time (in ms)} of an http check in all the websites."""
+        for website in self.websites:
+            website.update_http_phase_stats(timings)
+
+    def record_error(self, use_http):
+        """Records a check whose probe raised an exception (e.g. on an unexpected ping output) as down."""
+        self.update(use_http, False, None, None if use_http else icmp.CODE_ERROR)
+
+    def update(self, use_http, is_up, response_time, response_code, cold_check=False, timestamp=None):
+        """Updates the stats of all the websites with the result of a probe of the target, and checks for alerts.
+
+        See Website.update_stats, cold_check telling whether the http check was done on a new connection:
+        such checks are only recorded in the cold stats, so that the http stats only hold warm response times.
+        """
+        for website in self.websites:
+            if cold_check:
+                website.update_cold_stats(is_up, response_time, response_code)
+            else:
+                website.update_stats(use_http, is_up, response_time, response_code, timestamp)
+                website.check_for_alert(use_http=use_http)
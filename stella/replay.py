@@ -0,0 +1,177 @@
+"""Replays recorded probe results through the stats and alerting of the websites, as fast as possible.
+
+Probe results are read from a probe log directory (see stella.probelog) or from a CSV file with the columns
+timestamp, url, protocol (icmp or http), is_up (0 or 1), response_time and response_code
+(empty if missing). They are fed to Website.update_stats and Website.check_for_alert on a virtual clock:
+the timestamp of each probe result. Used to tune the alerting configuration on past data,
+as a regression harness for the alerting, and as a benchmark of the stats and alerting hot path.
+
+Usage: python -m stella.replay <probe log directory or CSV file> [--threshold 0.8] [--timeframe 5]
+           [--rules alert rules file] [--check-interval 1] [--websites websites.conf]
+           [--start timestamp] [--end timestamp]
+"""
+import argparse
+import csv
+import datetime
+import math
+import os
+import time
+
+from stella import config
+from stella.helpers import read_websites
+from stella.probelog import ProbeLog
+from stella.rules import read_rules
+from stella.website import Website
+
+CSV_COLUMNS = ['timestamp', 'url', 'protocol', 'is_up', 'response_time', 'response_code']
+
+
+class Replay(object):
+    def __init__(self,
+                 check_intervals={},
+                 default_check_interval=1,
+                 timeframes=[config.ALERTING_TIMEFRAME] + config.STATS_TIMEFRAMES + config.ROLLUP_TIMEFRAMES,
+                 alert_threshold=config.DEFAULT_ALERT_THRESHOLD,
+                 alerting_timeframe=config.ALERTING_TIMEFRAME,
+                 alert_rules=[]):
+        """Returns a replay of probe results, whose websites are created as their first probe result is read.
+
+        Parameters
+        ----------
+        check_intervals : dict(str:int)
+            check interval of each website
+        default_check_interval : int
+            check interval of the websites missing from check_intervals
+        timeframes : list(int)
+            timeframes of the stats of the websites
+        alert_threshold : float
+            availability threshold for triggering alerts
+        alerting_timeframe : int
+            timeframe on which to evaluate website availability
+        alert_rules : list(rules.Rule)
+            alert rules on other metrics (see rules.read_rules)
+
+        Attributes
+        ----------
+        websites : dict(str:Website)
+            replayed websites, by url
+        alerts : list
+            Alert objects raised so far, activated at the time of the probe result which raised them
+        nb_samples : int
+            number of probe results replayed so far
+        duration : float
+            in seconds, time spent replaying the probe results (including reading them)
+        """
+        self.check_intervals = check_intervals
+        self.default_check_interval = default_check_interval
+        self.timeframes = sorted(set(timeframes + [alerting_timeframe]))
+        self.alert_threshold = alert_threshold
+        self.alerting_timeframe = alerting_timeframe
+        self.alert_rules = alert_rules
+        self.websites = {}
+        self.alerts = []
+        self.nb_samples = 0
+        self.duration = 0
+
+    def website(self, url):
+        """Returns the website of url, created on first use."""
+        website = self.websites.get(url)
+        if website is None:
+            website = self.websites[url] = Website(url,
+                                                   self.check_intervals.get(url, self.default_check_interval),
+                                                   self.timeframes,
+                                                   self.alert_threshold,
+                                                   self.alerting_timeframe,
+                                                   self.alert_rules)
+        return website
+
+    def run(self, samples):
+        """Replays the probe results, and returns the alerts they raised.
+
+        Parameters
+        ----------
+        samples : iterable
+            (timestamp, url, use_http, is_up, response_time, response_code) for each probe result,
+            ordered by timestamp. Timestamps are wall clock times (see time.time).
+        """
+        alerts = []
+        nb_samples = 0
+        start = time.perf_counter()
+        for timestamp, url, use_http, is_up, response_time, response_code in samples:
+            website = self.website(url)
+            website.update_stats(use_http, is_up, response_time, response_code, timestamp)
+            alerts += website.check_for_alert(use_http, alert_time=datetime.datetime.fromtimestamp(timestamp))
+            nb_samples += 1
+        self.duration += time.perf_counter() - start
+        self.nb_samples += nb_samples
+        self.alerts += alerts
+        return alerts
+
+    def throughput(self):
+        """Returns the number of probe results replayed per second."""
+        return self.nb_samples / self.duration if self.duration else math.inf
+
+
+def read_csv(file_path):
+    """Yields the probe results of a CSV file (see CSV_COLUMNS), in the format of Replay.run."""
+    with open(file_path, newline='') as csv_file:
+        for row in csv.reader(csv_file):
+            if not row or row == CSV_COLUMNS:
+                continue
+            timestamp, url, protocol, is_up, response_time, response_code = row
+            yield (float(timestamp),
+                   url,
+                   protocol == 'http',
+                   is_up.lower() in ('1', 'true'),
+                   float(response_time) if response_time else None,
+                   int(response_code) if response_code else None)
+
+
+def write_csv(samples, file_path):
+    """Writes probe results, in the format of Replay.run, to a CSV file readable by read_csv."""
+    with open(file_path, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(CSV_COLUMNS)
+        for timestamp, url, use_http, is_up, response_time, response_code in samples:
+            writer.writerow([repr(timestamp), url, 'http' if use_http else 'icmp', int(is_up),
+                             '' if response_time is None else repr(response_time),
+                             '' if response_code is None else response_code])
+
+
+def read_samples(path, start=-math.inf, end=math.inf):
+    """Yields the probe results of a probe log directory or of a CSV file, between start and end."""
+    if os.path.isdir(path):
+        # Recorded probe results must not expire while they are replayed
+        yield from ProbeLog(path, retention=math.inf).scan(start, end)
+    else:
+        for sample in read_csv(path):
+            if start <= sample[0] <= end:
+                yield sample
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help="probe log directory or CSV file")
+    parser.add_argument('--threshold', type=float, default=config.DEFAULT_ALERT_THRESHOLD)
+    parser.add_argument('--timeframe', type=int, default=config.ALERTING_TIMEFRAME)
+    parser.add_argument('--rules', default=config.ALERT_RULES_FILE, help="alert rules file (see stella.rules)")
+    parser.add_argument('--check-interval', type=int, default=1, help="check interval of the unlisted websites")
+    parser.add_argument('--websites', help="websites file giving the check interval of each website")
+    parser.add_argument('--start', type=float, default=-math.inf)
+    parser.add_argument('--end', type=float, default=math.inf)
+    args = parser.parse_args()
+
+    check_intervals = {}
+    if args.websites:
+        check_intervals = {url: int(check_interval) for url, check_interval in read_websites(args.websites)}
+    alert_rules = read_rules(args.rules) if args.rules else []
+    replay = Replay(check_intervals, args.check_interval,
+                    alert_threshold=args.threshold, alerting_timeframe=args.timeframe, alert_rules=alert_rules)
+    for alert in replay.run(read_samples(args.path, args.start, args.end)):
+        print(alert.message)
+    print(f"{replay.nb_samples} samples of {len(replay.websites)} websites, {len(replay.alerts)} alerts, "
+          f"replayed in {replay.duration:.2f} s ({replay.throughput():.0f} samples/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+from collections import deque
+import math
+
+from stella import config
+from stella.config import hour
+from stella.config import minute
+from stella.sketch import LogHistogram
+
+
+class Bucket(object):
+    """Aggregates of the data points recieved during a period of time (a minute, an hour...)."""
+
+    __slots__ = ('start', 'first_timestamp', 'last_timestamp', 'count', 'successes', 'sum_response_times',
+                 'min_response_time', 'max_response_time', 'response_codes_dict', 'response_times_histogram')
+
+    def __init__(self, start, relative_accuracy):
+        """Returns an empty bucket.
+
+        Parameters
+        ----------
+        start : float
+            monotonic time at which the period of the bucket starts
+        relative_accuracy : float
+            relative accuracy of the response time percentiles
+        """
+        self.start = start
+        self.first_timestamp = None
+        self.last_timestamp = None
+        self.count = 0
+        self.successes = 0
+        self.sum_response_times = 0
+        self.min_response_time = float('inf')
+        self.max_response_time = -float('inf')
+        self.response_codes_dict = {}
+        self.response_times_histogram = LogHistogram(relative_accuracy)
+
+    def add(self, timestamp, is_up, response_time, response_code):
+        if self.first_timestamp is None:
+            self.first_timestamp = timestamp
+        self.last_timestamp = timestamp
+        self.count += 1
+        if is_up:
+            self.successes += 1
+            self.sum_response_times += response_time
+            self.min_response_time = min(self.min_response_time, response_time)
+            self.max_response_time = max(self.max_response_time, response_time)
+            self.response_times_histogram.add(response_time)
+        if response_code is not None:
+            self.response_codes_dict[response_code] = self.response_codes_dict.get(response_code, 0) + 1
+
+    def merge(self, other):
+        """Folds the aggregates of another bucket (of a shorter period) into this bucket."""
+        if other.count == 0:
+            return
+        if self.first_timestamp is None:
+            self.first_timestamp = other.first_timestamp
+        self.last_timestamp = other.last_timestamp
+        self.count += other.count
+        self.successes += other.successes
+        self.sum_response_times += other.sum_response_times
+        self.min_response_time = min(self.min_response_time, other.min_response_time)
+        self.max_response_time = max(self.max_response_time, other.max_response_time)
+        for response_code, count in other.response_codes_dict.items():
+            self.response_codes_dict[response_code] = self.response_codes_dict.get(response_code, 0) + count
+        self.response_times_histogram.merge(other.response_times_histogram)
+
+
+class RollupTier(object):
+    """Buckets of a given width, kept for a given retention."""
+
+    def __init__(self, width, retention):
+        self.width = width
+        self.retention = retention
+        self.buckets = deque(maxlen=max(1, math.ceil(retention / width)))
+
+    def add_bucket(self, bucket):
+        """Adds a closed bucket, dropping the oldest one if the retention is exceeded."""
+        self.buckets.append(bucket)
+
+    def buckets_since(self, since):
+        """Returns the buckets starting at or after since, from the most recent to the oldest.
+
+        Runs in O(number of returned buckets).
+        """
+        selected = []
+        for bucket in reversed(self.buckets):
+            if bucket.start < since:
+                break
+            selected.append(bucket)
+        return selected
+
+
+class Rollup(object):
+    """Data points of a website folded into per-minute buckets, then into per-hour buckets.
+
+    Long timeframes (a day, a month) are answered from the buckets with bounded memory,
+    rather than from all their data points: a 30 days timeframe at a 1 second check interval
+    is answered from 720 hour buckets rather than 2.6 million data points.
+
+    Note
+    ----
+    Timeframes are aligned on bucket boundaries: a timeframe covers the buckets which
+    started within the timeframe, the oldest data points of the timeframe may thus be left out
+    (up to a bucket width).
+    """
+
+    def __init__(self,
+                 retention,
+                 minute_retention=config.ROLLUP_MINUTE_RETENTION,
+                 relative_accuracy=config.ROLLUP_PERCENTILES_RELATIVE_ACCURACY):
+        """Returns an empty rollup.
+
+        Parameters
+        ----------
+        retention : int
+            in seconds, how long hour buckets are kept (i.e. the longest timeframe)
+        minute_retention : int
+            in seconds, how long minute buckets are kept.
+            Timeframes up to minute_retention are answered from minute buckets.
+        relative_accuracy : float
+            relative accuracy of the response time percentiles
+
+        Attributes
+        ----------
+        current_minute : Bucket
+            bucket of the current minute, folded into the minute and hour tiers once the minute is over
+        current_hour : Bucket
+            bucket of the current hour, added to the hour tier once the hour is over
+        generation : int
+            number of data points added so far, used to know when computed stats are outdated
+        nb_closed_minutes : int
+            number of minute buckets closed so far
+        epoch : float
+            monotonic time from which the timestamps of the buckets are counted (see stats.SampleBuffer)
+        pending_restore : callable
+            restores the buckets from a snapshot when they are first needed (see snapshot.restore), if not None
+        """
+        self.relative_accuracy = relative_accuracy
+        self.minutes = RollupTier(minute, minute_retention)
+        self.hours = RollupTier(hour, retention)
+        self.current_minute = None
+        self.current_hour = None
+        self.last_timestamp = None
+        self.generation = 0
+        self.nb_closed_minutes = 0
+        self.epoch = 0.0
+        self.pending_restore = None
+
+    def restore_pending(self):
+        """Restores the buckets from the snapshot they were saved to, if not done yet."""
+        if self.pending_restore is not None:
+            pending_restore, self.pending_restore = self.pending_restore, None
+            pending_restore(self)
+
+    def add(self, timestamp, is_up, response_time, response_code):
+        """Adds a data point to the bucket of the current minute, closing the previous buckets if needed."""
+        self.restore_pending()
+        timestamp -= self.epoch
+        minute_start = timestamp - timestamp % minute
+        if self.current_minute is None or minute_start != self.current_minute.start:
+            self.close_minute()
+            self.current_minute = Bucket(minute_start, self.relative_accuracy)
+        self.current_minute.add(timestamp, is_up, response_time, response_code)
+        self.last_timestamp = timestamp
+        self.generation += 1
+
+    def close_minute(self):
+        """Folds the current minute bucket into the minute tier and the current hour bucket."""
+        if self.current_minute is None:
+            return
+        self.minutes.add_bucket(self.current_minute)
+
+        hour_start = self.current_minute.start - self.current_minute.start % hour
+        if self.current_hour is None or hour_start != self.current_hour.start:
+            if self.current_hour is not None:
+                self.hours.add_bucket(self.current_hour)
+            self.current_hour = Bucket(hour_start, self.relative_accuracy)
+        self.current_hour.merge(self.current_minute)
+        self.current_minute = None
+        self.nb_closed_minutes += 1
+
+    def buckets(self, timeframe):
+        """Returns the buckets covering the last timeframe, from the finest tier able to answer it."""
+        self.restore_pending()
+        if self.last_timestamp is None:
+            return []
+        since = self.last_timestamp - timeframe
+        open_buckets = [self.current_minute] if self.current_minute is not None else []
+        if timeframe <= self.minutes.retention:
+            return open_buckets + self.minutes.buckets_since(since)
+
+        if self.current_hour is not None:
+            open_buckets.append(self.current_hour)
+        hour_buckets = self.hours.buckets_since(since)
+        return [bucket for bucket in open_buckets if bucket.start >= since] + hour_buckets
+
+
+class RollupStats(object):
+    """Stats of a long timeframe, computed from the buckets of a Rollup.
+
+    Exposes the same stats as stats.Stats, computed in O(number of buckets) when read,
+    and cached until new data points are added to the rollup.
+    """
+
+    __slots__ = ('rollup', 'timeframe', 'check_interval', 'generation', 'total')
+
+    def __init__(self, rollup, timeframe, check_interval):
+        """Returns the stats of the last timeframe of a rollup.
+
+        Parameters
+        ----------
+        rollup : Rollup
+            the rollup to compute the stats from
+        timeframe : int
+            in seconds, the duration upon which the stats are computed
+        check_interval : int
+            in seconds, the frequency at which the rollup is updated
+
+        Attributes
+        ----------
+        total : Bucket
+            aggregates of all the buckets of the timeframe, computed when read
+        """
+        self.rollup = rollup
+        self.timeframe = timeframe
+        self.check_interval = check_interval
+        self.generation = None
+        self.total = None
+
+    def compute(self):
+        """Returns the aggregates of the timeframe, computed again if data points were added since."""
+        if self.generation != self.rollup.generation:
+            self.generation = self.rollup.generation
+            self.total = Bucket(None, self.rollup.relative_accuracy)
+            for bucket in reversed(self.rollup.buckets(self.timeframe)):
+                self.total.merge(bucket)
+        return self.total
+
+    @property
+    def availability(self):
+        total = self.compute()
+        return total.successes / total.count if total.count else 0
+
+    @property
+    def min_response_time(self):
+        return self.compute().min_response_time
+
+    @property
+    def max_response_time(self):
+        return self.compute().max_response_time
+
+    @property
+    def average_response_time(self):
+        total = self.compute()
+        return total.sum_response_times / total.successes if total.successes else float('inf')
+
+    @property
+    def response_codes_dict(self):
+        return self.compute().response_codes_dict
+
+    def percentile(self, percent):
+        """Returns the given percentile (between 0 and 100) of the response times, NaN if there is none."""
+        return self.compute().response_times_histogram.quantile(percent / 100)
+
+    def nb_data_points(self):
+        return self.compute().count
+
+    def covered_duration(self):
+        """Returns the duration (in seconds) covered by the buckets of the timeframe."""
+        total = self.compute()
+        if total.count == 0:
+            return 0
+        return total.last_timestamp - total.first_timestamp + self.check_interval
+
+    def timeframe_reached(self):
+        return self.covered_duration() >= self.timeframe
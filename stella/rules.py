@@ -0,0 +1,253 @@
+"""Alert rules: conditions on a metric of the stats of a timeframe, evaluated after each check.
+
+A rules file (see config.ALERT_RULES_FILE) has one rule per line, blank lines and lines starting with # being ignored:
+
+    <name> <metric> <timeframe> <comparator> <threshold> [<websites>]
+
+metric
+    availability, min_response_time, average_response_time, max_response_time,
+    p<N> (Nth percentile of the response times, for example p95)
+    or <N>xx_ratio (ratio of the checks with a response code of class N, for example 5xx_ratio)
+timeframe
+    in seconds, or with a unit (for example 30s, 5min or 24h, see helpers.parse_duration)
+comparator
+    <, <=, >, >=, == or !=. The alert fires once `metric comparator threshold` holds, and recovers once it does not.
+websites
+    shell-style pattern matched against the url and the hostname of the websites (all the websites if missing)
+
+For example:
+
+    slow p95 5min > 500 *.wikipedia.org
+    errors 5xx_ratio 2min > 0.1
+"""
+from fnmatch import fnmatchcase
+from functools import partial
+from operator import attrgetter
+from operator import eq
+from operator import ge
+from operator import gt
+from operator import le
+from operator import lt
+from operator import methodcaller
+from operator import ne
+import re
+
+from stella.alert import AvailabilityAlert
+from stella.alert import AvailabilityRecovered
+from stella.alert import RuleAlert
+from stella.alert import RuleRecovered
+from stella.helpers import format_duration
+from stella.helpers import parse_duration
+from stella.rollup import RollupStats
+
+COMPARATORS = {'<': lt, '<=': le, '>': gt, '>=': ge, '==': eq, '!=': ne}
+METRICS = {
+    'availability': attrgetter('availability'),
+    'min_response_time': attrgetter('min_response_time'),
+    'average_response_time': attrgetter('average_response_time'),
+    'max_response_time': attrgetter('max_response_time'),
+}
+
+
+class RuleError(ValueError):
+    """Raised when a rule is invalid."""
+
+
+def response_code_class_ratio(code_class, stats):
+    """Returns the ratio of the data points of stats whose response code is of the given class (e.g. 5 for 5xx)."""
+    nb_data_points = stats.nb_data_points()
+    if not nb_data_points:
+        return 0
+    return sum(count for code, count in stats.response_codes_dict.items()
+               if code is not None and code // 100 == code_class) / nb_data_points
+
+
+def metric_function(metric):
+    """Returns the function computing metric from the stats of a timeframe."""
+    if metric in METRICS:
+        return METRICS[metric]
+    match = re.fullmatch(r'p(\d+(?:\.\d+)?)', metric)
+    if match and float(match.group(1)) <= 100:
+        return methodcaller('percentile', float(match.group(1)))
+    match = re.fullmatch(r'([1-5])xx_ratio', metric)
+    if match:
+        return partial(response_code_class_ratio, int(match.group(1)))
+    raise RuleError(f"Unknown metric {metric}")
+
+
+class Rule(object):
+    def __init__(self, name, metric, timeframe, comparator, threshold, websites='*'):
+        """Returns an alert rule, firing when the metric of a timeframe compares to the threshold.
+
+        Parameters
+        ----------
+        name : str
+            name of the rule, displayed in the alerts
+        metric : str
+            metric of the stats (see the module documentation)
+        timeframe : int
+            timeframe (in seconds) of the stats from which the metric is computed
+        comparator : str
+            one of COMPARATORS
+        threshold : float
+        websites : str
+            shell-style pattern selecting the websites to which the rule applies, by url or hostname
+
+        Attributes
+        ----------
+        value : callable
+            computes the metric from the stats of the timeframe
+        compare : callable
+            compares the metric to the threshold
+        """
+        if comparator not in COMPARATORS:
+            raise RuleError(f"Unknown comparator {comparator}")
+        if timeframe <= 0:
+            raise RuleError(f"Timeframe ({timeframe}) must be positive")
+        self.name = name
+        self.metric = metric
+        self.timeframe = timeframe
+        self.comparator = comparator
+        self.threshold = threshold
+        self.websites = websites
+        self.value = metric_function(metric)
+        self.compare = COMPARATORS[comparator]
+
+    def __str__(self):
+        return f"{self.metric} {self.comparator} {self.threshold:g} over {format_duration(self.timeframe)}"
+
+    def matches(self, url, hostname):
+        """Returns whether the rule applies to the website of the given url and hostname."""
+        return fnmatchcase(url, self.websites) or fnmatchcase(hostname, self.websites)
+
+    def alert(self, hostname, value, alert_time=None):
+        """Returns the alert raised when the rule starts firing."""
+        return RuleAlert(hostname, self, value, alert_time)
+
+    def recovery(self, hostname, value, alert_time=None):
+        """Returns the alert raised when the rule stops firing."""
+        return RuleRecovered(hostname, self, value, alert_time)
+
+
+class AvailabilityRule(Rule):
+    """Rule of every website: availability below the alert threshold of the website over its alerting timeframe."""
+
+    def __init__(self, alert_threshold, alerting_timeframe):
+        super().__init__('availability', 'availability', alerting_timeframe, '<', alert_threshold)
+
+    def alert(self, hostname, value, alert_time=None):
+        return AvailabilityAlert(hostname, value, alert_time)
+
+    def recovery(self, hostname, value, alert_time=None):
+        return AvailabilityRecovered(hostname, value, alert_time)
+
+
+class RuleEvaluator(object):
+    def __init__(self, rules):
+        """Returns the rules of a website, compiled to be evaluated after each check.
+
+        Rules are grouped by timeframe, then by metric, so that each metric is computed once
+        for all the rules using it. Only the timeframes whose stats changed since the last evaluation
+        are evaluated again: all the raw timeframes after each check, and the rollup timeframes
+        (see rollup.RollupStats) once a minute, when a minute bucket is closed.
+
+        Parameters
+        ----------
+        rules : list(Rule)
+            rules of the website
+
+        Attributes
+        ----------
+        firing : list(bool)
+            whether each rule is currently firing
+        groups : list
+            (timeframe, [(metric function, [(rule index, compare, threshold)])]) for each timeframe of the rules
+        generations : dict
+            (index of the next data point, number of closed minute buckets) of each StatsWindows when last evaluated
+        """
+        self.rules = rules
+        self.firing = [False] * len(rules)
+        groups = {}
+        for i, rule in enumerate(rules):
+            metrics = groups.setdefault(rule.timeframe, {})
+            metrics.setdefault(rule.metric, (rule.value, []))[1].append((i, rule.compare, rule.threshold))
+        self.groups = [(timeframe, list(metrics.values())) for timeframe, metrics in sorted(groups.items())]
+        self.generations = {}
+
+    def timeframes(self):
+        """Returns the timeframes whose stats the rules need."""
+        return [timeframe for timeframe, _ in self.groups]
+
+    def evaluate(self, hostname, stats_windows, alert_time=None):
+        """Returns the alerts raised by the rules starting or stopping to fire.
+
+        Parameters
+        ----------
+        hostname : str
+            hostname of the website, displayed in the alerts
+        stats_windows : stats.StatsWindows
+            stats of the website, which must include the timeframes of the rules
+        alert_time : datetime.datetime
+            activation time of the alerts, now if None
+        """
+        stats_windows.restore_pending()
+        raw_generation = stats_windows.buffer.next_index
+        rollup_generation = None if stats_windows.rollup is None else stats_windows.rollup.nb_closed_minutes
+        last_raw_generation, last_rollup_generation = self.generations.get(stats_windows, (None, None))
+        if raw_generation == last_raw_generation and rollup_generation == last_rollup_generation:
+            return []
+        self.generations[stats_windows] = (raw_generation, rollup_generation)
+
+        alerts = []
+        all_stats = stats_windows.stats
+        firing = self.firing
+        for timeframe, metrics in self.groups:
+            stats = all_stats[timeframe]
+            if isinstance(stats, RollupStats):
+                if rollup_generation == last_rollup_generation:
+                    continue
+            elif raw_generation == last_raw_generation:
+                continue
+            # Ensure enough datapoints are available
+            if not stats.timeframe_reached():
+                continue
+            for value_of, conditions in metrics:
+                value = value_of(stats)
+                for i, compare, threshold in conditions:
+                    if compare(value, threshold) != firing[i]:
+                        firing[i] = not firing[i]
+                        rule = self.rules[i]
+                        if firing[i]:
+                            alerts.append(rule.alert(hostname, value, alert_time))
+                        else:
+                            alerts.append(rule.recovery(hostname, value, alert_time))
+        return alerts
+
+
+def parse_rule(line):
+    """Returns the Rule of a line of a rules file (see the module documentation)."""
+    fields = line.split()
+    if len(fields) not in (5, 6):
+        raise RuleError(f"Expected <name> <metric> <timeframe> <comparator> <threshold> [<websites>], got {line!r}")
+    name, metric, timeframe, comparator, threshold = fields[:5]
+    try:
+        timeframe = parse_duration(timeframe)
+        threshold = float(threshold)
+    except ValueError as exc:
+        raise RuleError(str(exc)) from exc
+    return Rule(name, metric, timeframe, comparator, threshold, *fields[5:])
+
+
+def read_rules(file_path):
+    """Returns the rules of a rules file."""
+    rules = []
+    with open(file_path, 'r') as file_handle:
+        for line_number, line in enumerate(file_handle, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                rules.append(parse_rule(line))
+            except RuleError as exc:
+                raise RuleError(f"{file_path}:{line_number}: {exc}") from exc
+    return rules
@@ -0,0 +1,236 @@
+"""Central scheduler of the checks of the websites, keyed by deadline.
+
+The deadlines of the checks of each website are on a grid of its check interval. The next deadline of every
+website is kept in a heap, from which the probe loops (worker threads, the asyncio engine or the ICMP sweep)
+take the due websites. A website has at most one check in flight: its next deadline is pushed back
+once its check is done.
+
+The first deadlines are spread over the check intervals (see config.SCHEDULER_JITTER), so that the websites
+are not all probed at once on startup. A check which is done after the next deadline of its website
+(because it was slow) is an overload, which is handled according to the overload policy
+(see config.SCHEDULER_OVERLOAD_POLICY):
+
+- skip: the missed deadlines are dropped, the next check being at the next deadline of the grid,
+- coalesce: the missed deadlines are merged into a single check, run at once,
+- stretch: the missed deadlines are dropped, and the grid is moved one check interval after the late check.
+
+A check which starts after the next deadline of its website (for lack of workers) is an overload as well:
+it is the check of the last missed deadline, the previous ones being dropped (with the stretch policy,
+the grid is moved to its start).
+
+Either way, a website is never checked more than once per check interval, which the stats assume
+(see stats.StatsWindows), and the checks dropped are counted rather than silently lost.
+"""
+import heapq
+import logging
+import random
+from threading import Condition
+from threading import Thread
+import time
+
+from stella import config
+
+OVERLOAD_POLICIES = ['skip', 'coalesce', 'stretch']
+
+logger = logging.getLogger(__name__)
+# The terminal belongs to the dashboard: errors are only written out if the application configures logging
+logger.addHandler(logging.NullHandler())
+
+
+class SchedulingStats(object):
+    def __init__(self):
+        """Returns the scheduling counters of the checks of a website.
+
+        Attributes
+        ----------
+        nb_checks : int
+            number of checks started
+        total_lag : float
+            in seconds, sum of the delays between the deadlines of the checks and their start
+        max_lag : float
+            in seconds, maximum delay between the deadline of a check and its start
+        nb_overloads : int
+            number of checks started or done after the next deadline, to which the overload policy was applied
+        nb_dropped : int
+            number of deadlines at which no check was started, because of overloads
+        nb_errors : int
+            number of checks whose probe raised an exception
+        nb_websites : int
+            number of websites sharing the checks (see probetarget.ProbeTarget)
+        """
+        self.nb_checks = 0
+        self.total_lag = 0
+        self.max_lag = 0
+        self.nb_overloads = 0
+        self.nb_dropped = 0
+        self.nb_errors = 0
+        self.nb_websites = 1
+
+    def average_lag(self):
+        """Returns the average delay (in seconds) between the deadlines of the checks and their start."""
+        return self.total_lag / self.nb_checks if self.nb_checks else 0
+
+
+class Scheduler(object):
+    def __init__(self,
+                 websites,
+                 jitter=config.SCHEDULER_JITTER,
+                 overload_policy=config.SCHEDULER_OVERLOAD_POLICY,
+                 clock=time.monotonic):
+        """Returns a scheduler of the checks of the websites.
+
+        Parameters
+        ----------
+        websites : list(website.Website or probetarget.ProbeTarget)
+            websites (or probe targets) to check. Their scheduling counters are set to new SchedulingStats.
+        jitter : float
+            fraction of its check interval over which the first check of each website is randomly delayed
+        overload_policy : str
+            one of OVERLOAD_POLICIES
+        clock : callable
+            returns the current time, in seconds
+
+        Attributes
+        ----------
+        heap : list
+            (deadline, website index) of the websites whose check is not in flight
+        deadlines : list
+            deadline of the last (or next) check of each website
+        condition : threading.Condition
+            protects the scheduler when used by several threads (see Scheduler.start)
+        nb_dropped : int
+            number of deadlines of all the websites at which no check was started, because of overloads
+        nb_unrecorded_errors : int
+            number of probe errors which on_error failed to record (see Scheduler.work)
+        """
+        if overload_policy not in OVERLOAD_POLICIES:
+            raise ValueError(f"Unknown overload policy {overload_policy!r}, expected one of {OVERLOAD_POLICIES}")
+        self.websites = websites
+        self.overload_policy = overload_policy
+        self.clock = clock
+        self.condition = Condition()
+        self.nb_dropped = 0
+        self.nb_unrecorded_errors = 0
+
+        now = clock()
+        self.deadlines = [now + random.uniform(0, jitter * website.check_interval) for website in websites]
+        self.heap = [(deadline, i) for i, deadline in enumerate(self.deadlines)]
+        heapq.heapify(self.heap)
+        for website in websites:
+            website.scheduling = SchedulingStats()
+
+    def next_deadline(self):
+        """Returns the earliest deadline of the websites whose check is not in flight, None if there is none."""
+        return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, now, limit=None):
+        """Returns the indices of the websites whose check is due at now, at most limit of them if not None.
+
+        Their checks are then in flight until done (see Scheduler.done), and their lags are recorded.
+        """
+        due = []
+        while self.heap and self.heap[0][0] <= now and (limit is None or len(due) < limit):
+            deadline, i = heapq.heappop(self.heap)
+            website = self.websites[i]
+            interval = website.check_interval
+            if now - deadline >= interval:
+                nb_missed = int((now - deadline) // interval)
+                deadline = now if self.overload_policy == 'stretch' else deadline + nb_missed * interval
+                self.drop(website, nb_missed)
+                self.deadlines[i] = deadline
+            scheduling = website.scheduling
+            lag = now - deadline
+            scheduling.nb_checks += 1
+            scheduling.total_lag += lag
+            scheduling.max_lag = max(scheduling.max_lag, lag)
+            due.append(i)
+        return due
+
+    def done(self, i, now):
+        """Schedules the next check of the website of index i, whose check was done at now.
+
+        If the next deadline of the grid is already past, the overload policy is applied.
+        """
+        website = self.websites[i]
+        interval = website.check_interval
+        deadline = self.deadlines[i] + interval
+        if deadline <= now:
+            nb_missed = int((now - deadline) // interval) + 1
+            if self.overload_policy == 'skip':
+                deadline += nb_missed * interval
+                nb_dropped = nb_missed
+            elif self.overload_policy == 'coalesce':
+                # The check of the last missed deadline is run at once
+                deadline += (nb_missed - 1) * interval
+                nb_dropped = nb_missed - 1
+            else:
+                deadline = now + interval
+                nb_dropped = nb_missed
+            self.drop(website, nb_dropped)
+        self.deadlines[i] = deadline
+        heapq.heappush(self.heap, (deadline, i))
+
+    def drop(self, website, nb_dropped):
+        """Counts an overload of the website, at which nb_dropped of its deadlines were missed."""
+        website.scheduling.nb_overloads += 1
+        website.scheduling.nb_dropped += nb_dropped
+        self.nb_dropped += nb_dropped
+
+    def start(self, probe, nb_workers=config.SCHEDULER_WORKERS, on_error=None):
+        """Runs the checks in daemon worker threads, until the program exits.
+
+        Parameters
+        ----------
+        probe : callable
+            checks a website, from (website)
+        nb_workers : int
+            maximum number of checks in flight at the same time
+        on_error : callable
+            records the failure of a check whose probe raised an exception, from (website), if not None
+
+        Returns
+        -------
+        list(threading.Thread) : the worker threads
+        """
+        threads = [Thread(target=self.work, args=(probe, on_error), daemon=True)
+                   for _ in range(min(nb_workers, len(self.websites)))]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def work(self, probe, on_error=None):
+        """Runs the due checks, one at a time, and waits for the next deadline in between.
+
+        A probe raising an exception does not stop the worker: the error is counted (see SchedulingStats)
+        and handed to on_error if not None.
+        This function is an infinite loop. Run inside a thread to prevent blocking the program.
+        """
+        while True:
+            self.condition.acquire()
+            now = self.clock()
+            due = self.pop_due(now, limit=1)
+            if not due:
+                next_deadline = self.next_deadline()
+                self.condition.wait(None if next_deadline is None else next_deadline - now)
+                self.condition.release()
+                continue
+            self.condition.release()
+
+            website = self.websites[due[0]]
+            try:
+                probe(website)
+            except Exception:
+                website.scheduling.nb_errors += 1
+                if on_error is not None:
+                    try:
+                        on_error(website)
+                    except Exception:
+                        # Neither must stop the worker, whose thread would not be replaced
+                        self.nb_unrecorded_errors += 1
+                        logger.exception("Could not record the failed check of %s", website)
+            finally:
+                self.condition.acquire()
+                self.done(due[0], self.clock())
+                # The next check may be due before the deadline an idle worker is waiting for
+                self.condition.notify()
+                self.condition.release()
@@ -0,0 +1,255 @@
+"""Sharded monitoring: the websites are split across worker processes, which probe them.
+
+Each worker process owns the Website objects of its shard: it probes them, updates their stats and evaluates
+their alerts, so that these do not share the GIL of the dashboard process. Every SHARD_BATCH_INTERVAL,
+a worker sends a batch to the dashboard process through a pipe (see ShardPublisher.batch), made of:
+
+- the stats deltas of the websites whose snapshot was published since the last batch: only the snapshots
+  (see stats.StatsSnapshot) of the timeframes which changed since the last ones sent (DNS and http phase
+  stats included),
+  along with the alert state and the scheduling counters of the website,
+- the alerts raised since the last batch.
+
+The dashboard process keeps a mirror Website for each website, whose snapshot is rebuilt from the deltas
+(see ShardedMonitor.apply): the dashboard, the alert store and the notifier use the mirrors as if
+the websites were probed in the dashboard process.
+"""
+from collections import deque
+from multiprocessing import Pipe
+from multiprocessing import Process
+from multiprocessing.connection import wait
+import os
+import pickle
+from threading import Thread
+
+from stella import config
+from stella.probetarget import group_websites
+from stella.website import WebsiteSnapshot
+
+
+def changed_stats(stats, previous):
+    """Returns the {timeframe: StatsSnapshot} of stats which are not in previous (the last ones sent)."""
+    if previous is None:
+        return stats
+    if stats is previous:
+        return {}
+    return {timeframe: snapshot for timeframe, snapshot in stats.items() if previous.get(timeframe) is not snapshot}
+
+
+class ShardPublisher(object):
+    def __init__(self, websites, connection, batch_interval=config.SHARD_BATCH_INTERVAL):
+        """Returns the publisher of the stats deltas and alerts of the websites of a worker process.
+
+        Parameters
+        ----------
+        websites : list(website.Website)
+            websites of the shard, whose alert queues are drained by the publisher
+        connection : multiprocessing.connection.Connection
+            end of the pipe to the dashboard process
+        batch_interval : float
+            in seconds, between two batches
+
+        Attributes
+        ----------
+        publish_queue : deque
+            websites whose snapshot was published since the last batch
+        sent : list
+            last WebsiteSnapshot sent of each website, None if none was
+        """
+        self.websites = websites
+        self.connection = connection
+        self.batch_interval = batch_interval
+        self.indices = {website: i for i, website in enumerate(websites)}
+        self.publish_queue = deque()
+        for website in websites:
+            website.publish_queue = self.publish_queue
+        self.sent = [None] * len(websites)
+
+    def delta(self, i):
+        """Returns the stats delta of the website of index i since the last one sent.
+
+        Returns
+        -------
+        tuple : (website index, availability issue, ping stats, http stats, http cold stats, dns stats,
+            http phase stats, scheduling), the stats being dicts of {timeframe: StatsSnapshot}
+            (a dict of them per phase for the http phase stats), of the timeframes which changed
+        """
+        website = self.websites[i]
+        snapshot = website.get_snapshot()
+        previous = self.sent[i]
+        self.sent[i] = snapshot
+        if previous is None:
+            return (i, snapshot.availability_issue, snapshot.ping_stats, snapshot.http_stats,
+                    snapshot.http_cold_stats, snapshot.dns_stats, snapshot.http_phase_stats, website.scheduling)
+        return (i, snapshot.availability_issue,
+                changed_stats(snapshot.ping_stats, previous.ping_stats),
+                changed_stats(snapshot.http_stats, previous.http_stats),
+                changed_stats(snapshot.http_cold_stats, previous.http_cold_stats),
+                changed_stats(snapshot.dns_stats, previous.dns_stats),
+                {phase: changed_stats(stats, previous.http_phase_stats.get(phase))
+                 for phase, stats in snapshot.http_phase_stats.items()
+                 if stats is not previous.http_phase_stats.get(phase)},
+                website.scheduling)
+
+    def batch(self):
+        """Returns the stats deltas and the (website index, alert) raised since the last batch."""
+        changed = set()
+        # Websites published while the batch is built are left to the next one
+        for _ in range(len(self.publish_queue)):
+            website = self.publish_queue.popleft()
+            website.publish_pending = False
+            changed.add(self.indices[website])
+
+        alerts = []
+        for i, website in enumerate(self.websites):
+            alert_queue = website.alert_queue
+            if alert_queue:
+                # The alert state of the website changed along with its alerts
+                changed.add(i)
+                while alert_queue:
+                    alerts.append((i, alert_queue.popleft()))
+        return [self.delta(i) for i in sorted(changed)], alerts
+
+    def run(self):
+        """Sends a batch every batch_interval, until the dashboard process asks to stop.
+
+        The first batch holds the full snapshots of all the websites, and the last one the alerts raised
+        until the stop.
+        """
+        self.connection.send(([self.delta(i) for i in range(len(self.websites))], []))
+        while not self.connection.poll(self.batch_interval):
+            deltas, alerts = self.batch()
+            if deltas or alerts:
+                self.connection.send((deltas, alerts))
+        self.connection.send(self.batch())
+
+
+class ShardedMonitor(object):
+    def __init__(self, websites, websites_conf, target, nb_processes=config.MONITORING_PROCESSES,
+                 use_http=config.MONITOR_HTTP_RATHER_THAN_ICMP):
+        """Returns the monitor of the websites by worker processes, whose results are applied to mirror websites.
+
+        Parameters
+        ----------
+        websites : list(website.Website)
+            mirrors of the websites, in the dashboard process. Their stats are never updated:
+            their snapshots are rebuilt from the stats deltas, and the alerts appended to their alert queues.
+        websites_conf : list
+            [(url, interval), ...] of the websites, in the order of websites
+        target : callable
+            runs a worker process, from (shard index, websites conf of the shard, connection) (see App.run_shard)
+        nb_processes : int
+            number of worker processes, one per core if None
+        use_http : bool
+            whether the websites are probed through http rather than icmp
+
+        Attributes
+        ----------
+        shards : list
+            for each shard, the sorted indices of its websites. The websites sharing a probe target
+            (see probetarget.group_websites) are in the same shard, so that they are probed once.
+        connections : list(multiprocessing.connection.Connection)
+            pipes to the worker processes
+        nb_batches : int
+            number of batches received
+        nb_deltas : int
+            number of stats deltas received
+        nb_received_bytes : int
+            size of the batches received
+        """
+        nb_processes = nb_processes or os.cpu_count() or 1
+        nb_processes = max(1, min(nb_processes, len(websites)))
+        self.websites = websites
+        self.websites_conf = websites_conf
+        self.target = target
+        self.shards = [[] for _ in range(nb_processes)]
+        indices = {website: i for i, website in enumerate(websites)}
+        # Largest targets first, each one to the shard with the fewest websites
+        probe_targets = sorted(group_websites(websites, use_http), key=lambda probe_target: -len(probe_target.websites))
+        for probe_target in probe_targets:
+            min(self.shards, key=len).extend(indices[website] for website in probe_target.websites)
+        for shard in self.shards:
+            shard.sort()
+        self.processes = []
+        self.connections = []
+        self.thread = None
+        self.nb_batches = 0
+        self.nb_deltas = 0
+        self.nb_received_bytes = 0
+
+    def start(self):
+        """Starts the worker processes, and the thread applying their batches to the mirror websites."""
+        for shard, indices in enumerate(self.shards):
+            connection, worker_connection = Pipe()
+            process = Process(target=self.target,
+                              args=(shard, [self.websites_conf[i] for i in indices], worker_connection),
+                              daemon=True)
+            process.start()
+            worker_connection.close()
+            self.processes.append(process)
+            self.connections.append(connection)
+        self.thread = Thread(target=self.receive, daemon=True)
+        self.thread.start()
+
+    def receive(self):
+        """Applies the batches of the worker processes as they arrive, until they all exit.
+
+        This function is a loop. Run inside a thread to prevent blocking the program.
+        """
+        shards = {connection: shard for shard, connection in enumerate(self.connections)}
+        while shards:
+            for connection in wait(list(shards)):
+                try:
+                    data = connection.recv_bytes()
+                except (EOFError, OSError):
+                    del shards[connection]
+                    continue
+                deltas, alerts = pickle.loads(data)
+                self.nb_batches += 1
+                self.nb_deltas += len(deltas)
+                self.nb_received_bytes += len(data)
+                self.apply(shards[connection], deltas, alerts)
+
+    def apply(self, shard, deltas, alerts):
+        """Applies the stats deltas and alerts of a batch of a shard to the mirror websites."""
+        indices = self.shards[shard]
+        for alert_index, alert in alerts:
+            website = self.websites[indices[alert_index]]
+            website.lock.acquire()
+            website.alert_history.append(alert)
+            if website.alert_queue is not None:
+                website.alert_queue.append(alert)
+            website.lock.release()
+
+        for i, availability_issue, ping_stats, http_stats, http_cold_stats, dns_stats, http_phase_stats, \
+                scheduling in deltas:
+            website = self.websites[indices[i]]
+            snapshot = website.snapshot
+            if snapshot is not None:
+                ping_stats = {**snapshot.ping_stats, **ping_stats}
+                http_stats = {**snapshot.http_stats, **http_stats}
+                http_cold_stats = {**snapshot.http_cold_stats, **http_cold_stats}
+                dns_stats = {**snapshot.dns_stats, **dns_stats}
+                http_phase_stats = {**snapshot.http_phase_stats,
+                                    **{phase: {**snapshot.http_phase_stats.get(phase, {}), **stats}
+                                       for phase, stats in http_phase_stats.items()}}
+            website.lock.acquire()
+            website.availability_issue = availability_issue
+            website.snapshot = WebsiteSnapshot(availability_issue, ping_stats, http_stats, http_cold_stats, dns_stats,
+                                               http_phase_stats)
+            website.scheduling = scheduling
+            website.lock.release()
+            website.publish()
+
+    def stop(self, timeout=config.SHARD_STOP_TIMEOUT):
+        """Asks the worker processes to stop, and waits for them and for their last batches to be applied."""
+        for connection in self.connections:
+            try:
+                connection.send(None)
+            except OSError:
+                # The worker process already exited
+                pass
+        for process in self.processes:
+            process.join(timeout)
+        if self.thread is not None:
+            self.thread.join(timeout)
@@ -0,0 +1,184 @@
+"""Index of the websites listed by the dashboard: sort orders and hostname filter.
+
+The dashboard only renders the rows visible on the screen, which it reads from the index:
+
+- the availability and latency orders are sorted lists of (key, website index). They are not sorted again
+  at each frame: only the websites whose snapshot was published since the previous frame
+  (see Website.publish_queue) are moved, by bisection (or the orders are sorted again, when next read,
+  if many websites were),
+- the hostname order never changes, and is the prefix index of the hostname filter: the hostnames starting
+  with a prefix are a contiguous range of it, found by bisection.
+"""
+from bisect import bisect_left
+from bisect import insort
+from collections import deque
+import heapq
+from itertools import islice
+
+from stella import config
+
+SORT_ORDERS = ['config', 'hostname', 'availability', 'latency']
+# Orders whose keys are computed from the stats, in the order of SiteIndex.keys
+KEY_ORDERS = ['availability', 'latency']
+# When at least 1 website out of SCAN_RATIO matches the filter, the rows of a page are found by scanning
+# the order from the top, rather than by selecting the matching websites
+SCAN_RATIO = 8
+# When more than 1 website out of REBUILD_RATIO was published since the last update, the orders are sorted again
+# rather than updated website by website
+REBUILD_RATIO = 16
+
+
+class SiteIndex(object):
+    def __init__(self, websites, use_http=config.MONITOR_HTTP_RATHER_THAN_ICMP, timeframe=config.ALERTING_TIMEFRAME):
+        """Returns the index of websites, which then publish their snapshots to its queue.
+
+        Parameters
+        ----------
+        websites : list(website.Website)
+            websites, listed in this order by the config order
+        use_http : bool
+            whether the availability and latency orders use the http stats rather than the icmp stats
+        timeframe : int
+            timeframe of the stats used by the availability and latency orders
+
+        Attributes
+        ----------
+        publish_queue : deque
+            websites whose snapshot was published since the last update
+        hostnames : list
+            sorted (hostname, website index)
+        keys : list
+            for each order of KEY_ORDERS, the list of the keys of the websites, as last updated
+        orders : dict
+            {order: sorted list of (key, website index)}, for the orders of KEY_ORDERS
+        unsorted : set
+            orders of KEY_ORDERS to sort again before being read
+        prefix : str
+            filter of the hostnames, all the websites being listed if empty
+        matches : tuple
+            (start, end) range of hostnames starting with prefix
+        """
+        self.websites = websites
+        self.use_http = use_http
+        self.timeframe = timeframe
+        self.indices = {website: i for i, website in enumerate(websites)}
+        # The queue is set before reading the snapshots, so that no publication is missed
+        self.publish_queue = deque()
+        for website in websites:
+            website.publish_queue = self.publish_queue
+        self.hostnames = sorted((website.hostname.lower(), i) for i, website in enumerate(websites))
+        self.keys = None
+        self.orders = {}
+        self.unsorted = set()
+        self.sort()
+        self.prefix = ''
+        self.matches = (0, len(websites))
+        self.matching = None
+
+    def stats(self, website):
+        """Returns the published stats of a website from which its keys are computed."""
+        snapshot = website.get_snapshot()
+        return (snapshot.http_stats if self.use_http else snapshot.ping_stats)[self.timeframe]
+
+    def sort(self):
+        """Reads the keys of all the websites again, the orders of KEY_ORDERS being sorted when next read.
+
+        Websites are sorted by increasing availability and decreasing average response time, so that
+        the websites with issues are listed first (then in the config order).
+        """
+        all_stats = [self.stats(website) for website in self.websites]
+        self.keys = [[stats.availability for stats in all_stats],
+                     [-stats.average_response_time for stats in all_stats]]
+        self.unsorted = set(KEY_ORDERS)
+
+    def sorted_keys(self, order):
+        """Returns the sorted list of (key, website index) of an order of KEY_ORDERS."""
+        if order in self.unsorted:
+            keys = self.keys[KEY_ORDERS.index(order)]
+            indices = sorted(range(len(keys)), key=keys.__getitem__)
+            self.orders[order] = list(zip([keys[i] for i in indices], indices))
+            self.unsorted.discard(order)
+        return self.orders[order]
+
+    def update(self):
+        """Moves the websites whose snapshot was published since the last update to their new place in the orders.
+
+        Returns the number of websites updated.
+        """
+        # Websites published during the update are left to the next one
+        nb_updated = len(self.publish_queue)
+        if nb_updated * REBUILD_RATIO > len(self.websites):
+            # publish_pending is cleared before reading the snapshots, so that a later publication is queued again
+            for _ in range(nb_updated):
+                self.publish_queue.popleft().publish_pending = False
+            self.sort()
+            return nb_updated
+
+        availabilities, latencies = self.keys
+        for _ in range(nb_updated):
+            website = self.publish_queue.popleft()
+            website.publish_pending = False
+            i = self.indices[website]
+            stats = self.stats(website)
+            for order, keys, key in (('availability', availabilities, stats.availability),
+                                     ('latency', latencies, -stats.average_response_time)):
+                if key != keys[i]:
+                    if order not in self.unsorted:
+                        sorted_keys = self.orders[order]
+                        del sorted_keys[bisect_left(sorted_keys, (keys[i], i))]
+                        insort(sorted_keys, (key, i))
+                    keys[i] = key
+        return nb_updated
+
+    def set_filter(self, prefix):
+        """Only lists the websites whose hostname starts with prefix (case insensitive), all of them if empty."""
+        prefix = prefix.lower()
+        start, end = 0, len(self.hostnames)
+        if prefix.startswith(self.prefix):
+            # The prefix was extended: its range is within the previous one
+            start, end = self.matches
+        self.matches = (bisect_left(self.hostnames, (prefix,), start, end),
+                        bisect_left(self.hostnames, (prefix + '\U0010ffff',), start, end))
+        self.prefix = prefix
+        self.matching = None
+
+    def count(self):
+        """Returns the number of websites listed."""
+        start, end = self.matches
+        return end - start
+
+    def matching_websites(self):
+        """Returns the set of the indices of the websites matching the filter."""
+        if self.matching is None:
+            start, end = self.matches
+            self.matching = {i for _, i in self.hostnames[start:end]}
+        return self.matching
+
+    def rows(self, order, offset, limit):
+        """Returns the indices of the websites listed from position offset in an order (see SORT_ORDERS).
+
+        Parameters
+        ----------
+        order : str
+            one of SORT_ORDERS
+        offset : int
+            position of the first website returned
+        limit : int
+            maximum number of websites returned
+        """
+        start, end = self.matches
+        if order == 'hostname':
+            return [i for _, i in self.hostnames[start + offset:min(end, start + offset + limit)]]
+        if not self.prefix:
+            if order == 'config':
+                return list(range(offset, min(len(self.websites), offset + limit)))
+            return [i for _, i in self.sorted_keys(order)[offset:offset + limit]]
+
+        matching = self.matching_websites()
+        if len(matching) * SCAN_RATIO >= len(self.websites):
+            ordered = range(len(self.websites)) if order == 'config' else (i for _, i in self.sorted_keys(order))
+            return list(islice((i for i in ordered if i in matching), offset, offset + limit))
+        if order == 'config':
+            return heapq.nsmallest(offset + limit, matching)[offset:]
+        keys = self.keys[KEY_ORDERS.index(order)]
+        return heapq.nsmallest(offset + limit, matching, key=lambda i: (keys[i], i))[offset:]
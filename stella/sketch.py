@@ -0,0 +1,158 @@
+from array import array
+import math
+
+from stella import config
+
+# Values lower than MIN_VALUE are counted in a dedicated bucket, for which the quantile is 0
+MIN_VALUE = 1e-6
+# Keys fit in a signed short, so that they can be stored in array('h')
+ZERO_KEY = -2 ** 15
+MAX_KEY = 2 ** 15 - 1
+
+
+class LogHistogram(object):
+    """Mergeable streaming quantile sketch over logarithmic buckets.
+
+    Bucket i counts the values in ]gamma^(i-1), gamma^i], with gamma = (1 + alpha) / (1 - alpha)
+    and alpha the relative accuracy. Values can be added and removed in constant time,
+    which makes it suitable for sliding windows.
+
+    Error bound
+    -----------
+    For any quantile q, the returned value v' and the exact quantile v
+    (the value of rank floor(q * (count - 1)) in the sorted values) verify |v' - v| <= alpha * v.
+
+    Reading a quantile scans the buckets, whose number does not depend on the number of values:
+    for response times between 1 us and 100 s, there are at most about 900 buckets with alpha = 1%.
+    """
+
+    __slots__ = ('relative_accuracy', 'gamma', 'log_gamma', 'counts', 'offset', 'zero_count', 'count')
+
+    def __init__(self, relative_accuracy=config.PERCENTILES_RELATIVE_ACCURACY):
+        """Returns an empty histogram.
+
+        Parameters
+        ----------
+        relative_accuracy : float
+            the relative error bound (alpha) of the quantiles, between 0 and 1
+
+        Attributes
+        ----------
+        counts : array('I')
+            counts of the buckets from offset to offset + len(counts) - 1
+        offset : int
+            key of the first bucket in counts
+        zero_count : int
+            number of values lower than MIN_VALUE
+        count : int
+            total number of values
+        """
+        if not 0 < relative_accuracy < 1:
+            raise ValueError(f"Relative accuracy ({relative_accuracy}) must be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.counts = array('I')
+        self.offset = 0
+        self.zero_count = 0
+        self.count = 0
+
+    def key(self, value):
+        """Returns the key of the bucket of value."""
+        if value < MIN_VALUE:
+            return ZERO_KEY
+        key = math.ceil(math.log(value) / self.log_gamma)
+        if -MAX_KEY <= key <= MAX_KEY:
+            return key
+        return MAX_KEY if key > 0 else -MAX_KEY
+
+    def value(self, key):
+        """Returns the value representing the bucket of key, at most alpha away from any value of the bucket."""
+        if key == ZERO_KEY:
+            return 0.0
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, value, count=1):
+        self.add_key(self.key(value), count)
+
+    def remove(self, value, count=1):
+        self.add_key(self.key(value), -count)
+
+    def add_key(self, key, count=1):
+        """Adds count values (or removes them if count is negative) to the bucket of key."""
+        self.count += count
+        index = key - self.offset
+        if 0 <= index < len(self.counts):
+            self.counts[index] += count
+            return
+        if key == ZERO_KEY:
+            self.zero_count += count
+            return
+
+        if not self.counts:
+            self.offset = key
+            self.counts.append(0)
+        elif key < self.offset:
+            self.counts[0:0] = array('I', [0]) * (self.offset - key)
+            self.offset = key
+        elif key >= self.offset + len(self.counts):
+            self.counts.extend(array('I', [0]) * (key - self.offset - len(self.counts) + 1))
+        self.counts[key - self.offset] += count
+
+    def quantile(self, q):
+        """Returns the q-quantile (0 <= q <= 1) of the values, NaN if there is no value."""
+        if self.count == 0:
+            return math.nan
+        rank = math.floor(q * (self.count - 1))
+        if rank < self.zero_count:
+            return 0.0
+        rank -= self.zero_count
+        nb_values = self.count - self.zero_count
+        if rank >= nb_values // 2:
+            # High quantiles (p95, p99) are found faster from the highest bucket
+            rank = nb_values - 1 - rank
+            index = self.offset + len(self.counts)
+            for count in reversed(self.counts):
+                index -= 1
+                if rank < count:
+                    return self.value(index)
+                rank -= count
+            return self.value(self.offset)
+        for index, count in enumerate(self.counts):
+            if rank < count:
+                return self.value(index + self.offset)
+            rank -= count
+        return self.value(self.offset + len(self.counts) - 1)
+
+    def copy(self):
+        """Returns an independent copy of the histogram."""
+        histogram = LogHistogram.__new__(LogHistogram)
+        histogram.relative_accuracy = self.relative_accuracy
+        histogram.gamma = self.gamma
+        histogram.log_gamma = self.log_gamma
+        histogram.counts = self.counts[:]
+        histogram.offset = self.offset
+        histogram.zero_count = self.zero_count
+        histogram.count = self.count
+        return histogram
+
+    def __getstate__(self):
+        # Compact pickled form, as the snapshots of the stats are sent between processes (see shard.py)
+        return (self.relative_accuracy, self.counts.tobytes(), self.offset, self.zero_count, self.count)
+
+    def __setstate__(self, state):
+        self.relative_accuracy, counts, self.offset, self.zero_count, self.count = state
+        self.gamma = (1 + self.relative_accuracy) / (1 - self.relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.counts = array('I')
+        self.counts.frombytes(counts)
+
+    def merge(self, other):
+        """Adds the values of another histogram with the same relative accuracy."""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge histograms of different relative accuracies")
+        self.zero_count += other.zero_count
+        self.count += other.zero_count
+        for index, count in enumerate(other.counts):
+            if count:
+                self.add_key(index + other.offset, count)
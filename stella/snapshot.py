@@ -0,0 +1,404 @@
+"""Snapshots of the stats of the websites, used to restore them after a restart.
+
+File format
+-----------
+Headers are little-endian, and arrays are dumped as is (see array.tobytes), in the byte order of the header.
+
+    header : magic, version, byte order of the arrays, wall clock and monotonic times of the snapshot,
+             number of records, followed by the CRC32 of the header
+    records : one per website, made of its length and CRC32 followed by the website state
+              (url, check interval, names of the firing alert rules, then its ping, http and cold http stats)
+
+A stats record holds the layout of the StatsWindows it was saved from (timeframes, capacity,
+relative accuracies): it is only restored into a StatsWindows of the same layout.
+The records of the websites which are no longer monitored, and the corrupted records, are skipped.
+
+Timestamps are monotonic times, which are meaningless after a restart: they are rebased by
+shifting the epoch of the buffers and rollups (see stats.SampleBuffer), so that the time elapsed
+between the snapshot and the restore is accounted for without rewriting any timestamp.
+"""
+from array import array
+from collections import deque
+from functools import partial
+import math
+import mmap
+import os
+import struct
+import sys
+from threading import Lock
+import time
+import zlib
+
+from stella.rollup import Bucket
+
+MAGIC = b'STLA'
+VERSION = 2
+BYTE_ORDER = b'l' if sys.byteorder == 'little' else b'b'
+
+HEADER = struct.Struct('<4sHcxddI')
+CHECKSUM = struct.Struct('<I')
+RECORD = struct.Struct('<II')
+WEBSITE = struct.Struct('<dQ')
+SIZE = struct.Struct('<I')
+# Number of values packed per timeframe, rollup and bucket (see encode_stats_windows and encode_rollup)
+WINDOW_INTEGERS = 10
+ROLLUP_INTEGERS = 5
+ROLLUP_FLOATS = 2
+BUCKET_INTEGERS = 7
+BUCKET_FLOATS = 6
+
+# Periodic and on-exit saves share the temporary file
+SAVE_LOCK = Lock()
+
+
+class SnapshotError(ValueError):
+    """Raised when a snapshot file cannot be read (unknown format or version, corrupted header)."""
+
+
+def save(websites, file_path):
+    """Saves the stats and alert state of the websites to file_path.
+
+    The snapshot is written to a temporary file first, then moved to file_path,
+    so that an interrupted save never leaves a corrupted snapshot behind.
+    Each website is locked while it is saved (see Website.lock).
+    """
+    chunks = []
+    for website in websites:
+        website.lock.acquire()
+        try:
+            payload = encode_website(website)
+        finally:
+            website.lock.release()
+        chunks.append(RECORD.pack(len(payload), zlib.crc32(payload)))
+        chunks.append(payload)
+
+    header = HEADER.pack(MAGIC, VERSION, BYTE_ORDER, time.time(), time.monotonic(), len(websites))
+    temporary_path = file_path + '.tmp'
+    SAVE_LOCK.acquire()
+    try:
+        with open(temporary_path, 'wb') as snapshot_file:
+            snapshot_file.write(header)
+            snapshot_file.write(CHECKSUM.pack(zlib.crc32(header)))
+            snapshot_file.write(b''.join(chunks))
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(temporary_path, file_path)
+    finally:
+        SAVE_LOCK.release()
+
+
+def restore(websites, file_path):
+    """Restores the stats and alert state of the websites from the snapshot saved to file_path.
+
+    Websites are matched by url and check interval. The file is mapped in memory, and only the alert
+    state is restored right away: the stats of a website are decoded from the mapping when first used
+    (see stats.StatsWindows.restore_pending), so that restoring does not depend on the number of data points.
+
+    Returns
+    -------
+    int : the number of restored websites
+
+    Raises
+    ------
+    SnapshotError
+        if the file is not a snapshot of this version
+    """
+    with open(file_path, 'rb') as snapshot_file:
+        if os.fstat(snapshot_file.fileno()).st_size < HEADER.size + CHECKSUM.size:
+            raise SnapshotError(f"{file_path} is too short to be a snapshot")
+        view = memoryview(mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ))
+
+    magic, version, byte_order, saved_time, saved_monotonic, nb_records = HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise SnapshotError(f"{file_path} is not a snapshot")
+    if CHECKSUM.unpack_from(view, HEADER.size)[0] != zlib.crc32(view[:HEADER.size]):
+        raise SnapshotError(f"{file_path} has a corrupted header")
+    if version != VERSION or byte_order != BYTE_ORDER:
+        raise SnapshotError(f"{file_path} is a snapshot of another version ({version}) or platform")
+
+    # Monotonic times of the snapshot are shifted so that the time elapsed since the snapshot is preserved
+    elapsed = max(0, time.time() - saved_time)
+    shift = time.monotonic() - saved_monotonic - elapsed
+
+    websites_by_key = {}
+    for website in websites:
+        websites_by_key.setdefault((website.url, website.check_interval), []).append(website)
+
+    nb_restored = 0
+    offset = HEADER.size + CHECKSUM.size
+    for _ in range(nb_records):
+        if offset + RECORD.size > len(view):
+            break
+        length, checksum = RECORD.unpack_from(view, offset)
+        offset += RECORD.size
+        payload = view[offset:offset + length]
+        offset += length
+        if len(payload) != length or zlib.crc32(payload) != checksum:
+            continue
+
+        reader = Reader(payload)
+        key = (reader.string(), WEBSITE.unpack_from(payload, reader.offset)[0])
+        if not websites_by_key.get(key):
+            continue
+        website = websites_by_key[key].pop(0)
+        website.lock.acquire()
+        try:
+            decode_website(reader, website, shift)
+        finally:
+            website.lock.release()
+        nb_restored += 1
+    return nb_restored
+
+
+def encode_website(website):
+    """Returns the state of a website as bytes."""
+    writer = Writer()
+    writer.string(website.url)
+    writer.pack(WEBSITE, website.check_interval, website.nb_http_checks)
+    # Rules are saved by name, so that their state is kept when the rules file is edited
+    alert_evaluator = website.alert_evaluator
+    firing_rules = [rule.name for rule, firing in zip(alert_evaluator.rules, alert_evaluator.firing) if firing]
+    writer.pack(SIZE, len(firing_rules))
+    for name in firing_rules:
+        writer.string(name)
+    for stats_windows in (website.ping_stats_list, website.http_stats_list, website.http_cold_stats_list):
+        writer.bytes(encode_stats_windows(stats_windows))
+    return writer.getvalue()
+
+
+def decode_website(reader, website, shift):
+    """Restores the state of a website saved by encode_website, shifting its timestamps by shift."""
+    _, website.nb_http_checks = reader.unpack(WEBSITE)
+    nb_firing_rules, = reader.unpack(SIZE)
+    firing_rules = {reader.string() for _ in range(nb_firing_rules)}
+    alert_evaluator = website.alert_evaluator
+    for i, rule in enumerate(alert_evaluator.rules):
+        alert_evaluator.firing[i] = rule.name in firing_rules
+    for stats_windows in (website.ping_stats_list, website.http_stats_list, website.http_cold_stats_list):
+        data = reader.bytes()
+        if data:
+            stats_windows.pending_restore = partial(decode_stats_windows, data, shift)
+
+
+def layout(stats_windows):
+    """Returns what a snapshot of stats_windows must match to be restored into it."""
+    values = [stats_windows.buffer.capacity, stats_windows.buffer.bucketing.relative_accuracy]
+    for timeframe, stats in stats_windows.items():
+        values += [timeframe, stats.check_interval]
+    rollup = stats_windows.rollup
+    if rollup is not None:
+        values += [rollup.hours.retention, rollup.minutes.retention, rollup.relative_accuracy]
+    return array('d', values)
+
+
+def encode_stats_windows(stats_windows):
+    """Returns the state of stats_windows as bytes, empty if no data point was recieved.
+
+    The state of all the timeframes is packed into a few arrays, so that it is restored
+    with a few copies rather than field by field:
+    the integers and floats of each timeframe (WINDOW_INTEGERS and WINDOW_FLOATS values per timeframe),
+    then their min and max candidates, response codes and histogram counts, one after the other.
+    """
+    stats_windows.restore_pending()
+    buffer = stats_windows.buffer
+    if buffer.next_index == 0:
+        # e.g. http stats when monitoring through icmp
+        return b''
+
+    integers = array('q', [buffer.next_index])
+    floats = array('d', [buffer.epoch])
+    candidates = array('q')
+    response_codes = array('q')
+    histogram_counts = array('I')
+    for stats in stats_windows.stats_values:
+        histogram = stats.response_times_histogram
+        integers.extend((stats.first_index, stats.next_index, stats.successes_in_timeframe,
+                         histogram.offset, histogram.zero_count, histogram.count,
+                         len(stats.max_candidates), len(stats.min_candidates),
+                         len(stats.response_codes_dict), len(histogram.counts)))
+        floats.append(stats.sum_response_times)
+        candidates.extend(stats.max_candidates)
+        candidates.extend(stats.min_candidates)
+        response_codes.extend(stats.response_codes_dict.keys())
+        response_codes.extend(stats.response_codes_dict.values())
+        histogram_counts.extend(histogram.counts)
+
+    writer = Writer()
+    for values in (layout(stats_windows), integers, floats, candidates, response_codes, histogram_counts,
+                   buffer.timestamps, buffer.ups, buffer.response_times, buffer.response_codes,
+                   buffer.response_time_keys):
+        writer.array(values)
+    if stats_windows.rollup is not None:
+        encode_rollup(writer, stats_windows.rollup)
+    return writer.getvalue()
+
+
+def decode_stats_windows(data, shift, stats_windows):
+    """Restores stats_windows from data saved by encode_stats_windows, unless it does not have the same layout."""
+    reader = Reader(data)
+    if reader.array('d') != layout(stats_windows):
+        return
+
+    integers, floats, candidates, response_codes, histogram_counts = [reader.array(typecode) for typecode in 'qdqqI']
+    buffer = stats_windows.buffer
+    buffer.next_index = integers[0]
+    buffer.epoch = floats[0] + shift
+    buffer.timestamps, buffer.ups, buffer.response_times, buffer.response_codes, buffer.response_time_keys = \
+        [reader.array(typecode) for typecode in 'dbdHh']
+
+    candidates_index = codes_index = counts_index = 0
+    for i, stats in enumerate(stats_windows.stats_values):
+        histogram = stats.response_times_histogram
+        (stats.first_index, stats.next_index, stats.successes_in_timeframe,
+         histogram.offset, histogram.zero_count, histogram.count,
+         nb_max_candidates, nb_min_candidates, nb_response_codes, nb_histogram_counts) = \
+            integers[1 + i * WINDOW_INTEGERS:1 + (i + 1) * WINDOW_INTEGERS]
+        stats.sum_response_times = floats[1 + i]
+
+        stats.max_candidates = deque(candidates[candidates_index:candidates_index + nb_max_candidates])
+        candidates_index += nb_max_candidates
+        stats.min_candidates = deque(candidates[candidates_index:candidates_index + nb_min_candidates])
+        candidates_index += nb_min_candidates
+        stats.response_codes_dict = dict(zip(
+            response_codes[codes_index:codes_index + nb_response_codes],
+            response_codes[codes_index + nb_response_codes:codes_index + 2 * nb_response_codes]))
+        codes_index += 2 * nb_response_codes
+        histogram.counts = histogram_counts[counts_index:counts_index + nb_histogram_counts]
+        counts_index += nb_histogram_counts
+        stats.update_averages()
+
+    rollup = stats_windows.rollup
+    if rollup is not None:
+        decode_rollup(reader, rollup, shift)
+
+
+def encode_rollup(writer, rollup):
+    """Writes the buckets of a rollup, packed as the timeframes of encode_stats_windows.
+
+    The integers and floats of the rollup come first, then BUCKET_INTEGERS and BUCKET_FLOATS values per bucket
+    (minute buckets, hour buckets, then the current minute and hour buckets if any).
+    """
+    rollup.restore_pending()
+    buckets = list(rollup.minutes.buckets) + list(rollup.hours.buckets)
+    buckets += [bucket for bucket in (rollup.current_minute, rollup.current_hour) if bucket is not None]
+    integers = array('q', [rollup.generation, len(rollup.minutes.buckets), len(rollup.hours.buckets),
+                           rollup.current_minute is not None, rollup.current_hour is not None])
+    floats = array('d', [math.nan if rollup.last_timestamp is None else rollup.last_timestamp, rollup.epoch])
+    response_codes = array('q')
+    histogram_counts = array('I')
+    for bucket in buckets:
+        histogram = bucket.response_times_histogram
+        integers.extend((bucket.count, bucket.successes, histogram.offset, histogram.zero_count, histogram.count,
+                         len(bucket.response_codes_dict), len(histogram.counts)))
+        floats.extend((bucket.start,
+                       math.nan if bucket.first_timestamp is None else bucket.first_timestamp,
+                       math.nan if bucket.last_timestamp is None else bucket.last_timestamp,
+                       bucket.sum_response_times, bucket.min_response_time, bucket.max_response_time))
+        response_codes.extend(bucket.response_codes_dict.keys())
+        response_codes.extend(bucket.response_codes_dict.values())
+        histogram_counts.extend(histogram.counts)
+    for values in (integers, floats, response_codes, histogram_counts):
+        writer.array(values)
+
+
+def decode_rollup(reader, rollup, shift):
+    """Restores a rollup saved by encode_rollup.
+
+    The arrays are copied right away, but the buckets are only built when the rollup is first used
+    (see rollup.Rollup.restore_pending), as they are many more objects than the rest of the stats.
+    """
+    integers, floats, response_codes, histogram_counts = [reader.array(typecode) for typecode in 'qdqI']
+    rollup.generation = integers[0]
+    rollup.last_timestamp = None if math.isnan(floats[0]) else floats[0]
+    rollup.epoch = floats[1] + shift
+    rollup.pending_restore = partial(build_buckets, integers, floats, response_codes, histogram_counts)
+
+
+def build_buckets(integers, floats, response_codes, histogram_counts, rollup):
+    """Builds the buckets of a rollup from the arrays of decode_rollup."""
+    _, nb_minutes, nb_hours, has_current_minute, has_current_hour = integers[:ROLLUP_INTEGERS]
+    buckets = []
+    codes_index = counts_index = 0
+    for i in range(nb_minutes + nb_hours + has_current_minute + has_current_hour):
+        (count, successes, offset, zero_count, histogram_count, nb_response_codes, nb_histogram_counts) = \
+            integers[ROLLUP_INTEGERS + i * BUCKET_INTEGERS:ROLLUP_INTEGERS + (i + 1) * BUCKET_INTEGERS]
+        (start, first_timestamp, last_timestamp, sum_response_times, min_response_time, max_response_time) = \
+            floats[ROLLUP_FLOATS + i * BUCKET_FLOATS:ROLLUP_FLOATS + (i + 1) * BUCKET_FLOATS]
+
+        bucket = Bucket(start, rollup.relative_accuracy)
+        bucket.first_timestamp = None if math.isnan(first_timestamp) else first_timestamp
+        bucket.last_timestamp = None if math.isnan(last_timestamp) else last_timestamp
+        bucket.count = count
+        bucket.successes = successes
+        bucket.sum_response_times = sum_response_times
+        bucket.min_response_time = min_response_time
+        bucket.max_response_time = max_response_time
+        bucket.response_codes_dict = dict(zip(
+            response_codes[codes_index:codes_index + nb_response_codes],
+            response_codes[codes_index + nb_response_codes:codes_index + 2 * nb_response_codes]))
+        codes_index += 2 * nb_response_codes
+        histogram = bucket.response_times_histogram
+        histogram.offset, histogram.zero_count, histogram.count = offset, zero_count, histogram_count
+        histogram.counts = histogram_counts[counts_index:counts_index + nb_histogram_counts]
+        counts_index += nb_histogram_counts
+        buckets.append(bucket)
+
+    rollup.minutes.buckets.extend(buckets[:nb_minutes])
+    rollup.hours.buckets.extend(buckets[nb_minutes:nb_minutes + nb_hours])
+    current_buckets = buckets[nb_minutes + nb_hours:]
+    if has_current_minute:
+        rollup.current_minute = current_buckets.pop(0)
+    if has_current_hour:
+        rollup.current_hour = current_buckets.pop(0)
+
+
+class Writer(object):
+    """Accumulates the chunks of a record."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def pack(self, packer, *values):
+        self.chunks.append(packer.pack(*values))
+
+    def bytes(self, data):
+        self.chunks.append(SIZE.pack(len(data)))
+        self.chunks.append(data)
+
+    def string(self, text):
+        self.bytes(text.encode('utf-8'))
+
+    def array(self, values):
+        self.bytes(values.tobytes())
+
+    def getvalue(self):
+        return b''.join(self.chunks)
+
+
+class Reader(object):
+    """Reads the chunks of a record written by Writer, from any bytes-like object (e.g. a memoryview of a mmap)."""
+
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def unpack(self, packer):
+        values = packer.unpack_from(self.data, self.offset)
+        self.offset += packer.size
+        return values
+
+    def bytes(self):
+        size, = self.unpack(SIZE)
+        data = self.data[self.offset:self.offset + size]
+        if len(data) != size:
+            raise SnapshotError("Truncated record")
+        self.offset += size
+        return data
+
+    def string(self):
+        return str(self.bytes(), 'utf-8')
+
+    def array(self, typecode):
+        values = array(typecode)
+        values.frombytes(self.bytes())
+        return values
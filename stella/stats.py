@@ -1,4 +1,121 @@
+from array import array
 from collections import deque
+import math
+import time
+
+from stella import config
+from stella.rollup import Rollup
+from stella.rollup import RollupStats
+from stella.sketch import LogHistogram
+
+# Stored in place of a missing response code
+NO_RESPONSE_CODE = 0xFFFF
+
+
+class SampleBuffer(object):
+    """Ring buffer storing the data points of a website, shared by the Stats of all its timeframes.
+
+    Each data point is stored once, whatever the number of timeframes:
+    the Stats of each timeframe only keep cursors into the buffer along with their aggregates.
+    Data points are identified by their index, which counts all the data points recieved.
+
+    Data points are stored in fixed-size typed arrays (21 bytes per data point)
+    rather than in containers of python objects.
+    """
+
+    __slots__ = ('capacity', 'next_index', 'timestamps', 'ups', 'response_times', 'response_codes',
+                 'response_time_keys', 'bucketing', 'epoch')
+
+    def __init__(self, capacity, relative_accuracy=config.PERCENTILES_RELATIVE_ACCURACY):
+        """Returns an empty buffer.
+
+        Parameters
+        ----------
+        capacity : int
+            maximum number of data points kept, i.e. the number of data points of the longest timeframe
+        relative_accuracy : float
+            relative accuracy of the response time percentiles of the Stats using the buffer
+
+        Attributes
+        ----------
+        next_index : int
+            index of the next data point to be recieved
+        timestamps : array('d')
+            monotonic time (see time.monotonic) at which the data points were recieved, minus epoch
+        ups : array('b')
+            result of the availability checks (0 or 1)
+        response_times : array('d')
+            response times, NaN if no response time was recieved with the check
+        response_codes : array('H')
+            response codes, NO_RESPONSE_CODE if no response code was recieved with the check
+        response_time_keys : array('h')
+            keys of the response times in the response time histograms,
+            computed once for all the timeframes
+        bucketing : LogHistogram
+            empty histogram giving the parameters of the response time histograms
+        epoch : float
+            monotonic time from which the timestamps are counted.
+            Lets the timestamps be rebased in constant time when restored after a restart (see snapshot.restore).
+        """
+        self.capacity = capacity
+        self.next_index = 0
+        self.timestamps = array('d', [0]) * capacity
+        self.ups = array('b', [0]) * capacity
+        self.response_times = array('d', [math.nan]) * capacity
+        self.response_codes = array('H', [NO_RESPONSE_CODE]) * capacity
+        self.response_time_keys = array('h', [0]) * capacity
+        self.bucketing = LogHistogram(relative_accuracy)
+        self.epoch = 0.0
+
+    def append(self, timestamp, is_up, response_time, response_code):
+        """Adds a data point, overwriting the data point recieved capacity updates ago.
+
+        Parameters
+        ----------
+        timestamp : float
+            monotonic time at which the data point was recieved
+        is_up : bool
+            whether the site is up
+        response_time : float or None
+            the response time, if any
+        response_code : int or None
+            the response code, if any. Must be between 0 and 65534.
+
+        Returns
+        -------
+        int : the index of the new data point
+        """
+        if response_code is not None and not 0 <= response_code < NO_RESPONSE_CODE:
+            raise ValueError(f"Response code {response_code} out of range [0, {NO_RESPONSE_CODE})")
+        index = self.next_index
+        position = index % self.capacity
+        self.timestamps[position] = timestamp - self.epoch
+        self.ups[position] = is_up
+        self.response_times[position] = math.nan if response_time is None else response_time
+        self.response_codes[position] = NO_RESPONSE_CODE if response_code is None else response_code
+        if response_time is not None:
+            self.response_time_keys[position] = self.bucketing.key(response_time)
+        self.next_index += 1
+        return index
+
+    def first_index(self):
+        """Returns the index of the oldest data point still in the buffer."""
+        return max(0, self.next_index - self.capacity)
+
+    def data_points(self, first_index, next_index):
+        """Returns the (is_up, response_time, response_code) data points between the two indices.
+
+        Missing response times and response codes are returned as None.
+        """
+        data_points = []
+        for index in range(first_index, next_index):
+            position = index % self.capacity
+            response_time = self.response_times[position]
+            response_code = self.response_codes[position]
+            data_points.append((bool(self.ups[position]),
+                                None if math.isnan(response_time) else response_time,
+                                None if response_code == NO_RESPONSE_CODE else response_code))
+        return data_points
 
 
 class Stats(object):
@@ -7,7 +124,12 @@ class Stats(object):
     We suggest to use child classes based on Stats rather than the class directly.
     """
 
-    def __init__(self, check_interval, compute_timeframe):
+    __slots__ = ('timeframe', 'check_interval', 'max_nb_data_points', 'buffer', 'first_index', 'next_index',
+                 'successes_in_timeframe', 'sum_response_times', 'availability',
+                 'max_response_time', 'min_response_time', 'average_response_time',
+                 'response_codes_dict', 'max_candidates', 'min_candidates', 'response_times_histogram')
+
+    def __init__(self, check_interval, compute_timeframe, buffer=None):
         """Returns an instance of Stats.
 
         Parameters
@@ -16,25 +138,25 @@ class Stats(object):
             in seconds, the frequency at which the stats are updated
         compute_timeframe : int
             in seconds, the duration upon which the stats are computed
+        buffer : SampleBuffer
+            buffer storing the data points, which can be shared with the Stats of longer timeframes
+            (see StatsWindows). A buffer of max_nb_data_points is created if None.
 
         Attributes
         ----------
         max_nb_data_points : int
-            number of data points to be recieved in the given computed timeframe
+            number of data points to be recieved in the given computed timeframe.
+            Data points are removed once older than the timeframe, or when there are already
+            max_nb_data_points data points (if checks are done more often than check_interval).
+        first_index : int
+            index in the buffer of the oldest data point of the timeframe
+        next_index : int
+            index in the buffer of the next data point of the timeframe
         successes_in_timeframe : int
             number of successful availability checks recieved in the last timeframe.
             used to compute the availability.
         sum_response_times : float
             sum of the response times recieved in the last timeframe.
-        ups : deque(int)
-            Queue with the result of the availability checks (0 or 1) recieved in the last timeframe.
-            Used to determine if there is a response time and response code associated with the check.
-        response_times : deque(float)
-            Queue with the response time recieved in the last timeframe.
-            If no response time is provided during the update, no element is added.
-        response_codes : deque(int)
-            Queue with the response code recieved in the last timeframe
-            If no response code is provided during the update, no element is added.
         availability : float
             portion of successful availability checks.
             Used to access the mean value of ups in constant time.
@@ -42,11 +164,20 @@ class Stats(object):
             Used to access the maximum value of responses in response_times in constant time.
         min_response_time : float
             Used to access the minimum value of responses in response_times in constant time.
+        max_candidates : deque(int)
+            Monotonic queue of the indices of the response times which may become the maximum response time
+            once the older response times are removed. Response times are strictly decreasing.
+        min_candidates : deque(int)
+            Monotonic queue of the indices of the response times which may become the minimum response time
+            once the older response times are removed. Response times are strictly increasing.
         average_response_time :
             Used to access the mean value of responses in response_times in constant time.
         response_codes_dict : dict(int:int)
             Map of the amount of each response code recieved in the last timeframe.
             Used to access the response codes in constant time.
+        response_times_histogram : sketch.LogHistogram
+            Histogram of the response times recieved in the last timeframe.
+            Used to access the response time percentiles (see Stats.percentile).
         """
 
         if not (float(compute_timeframe) / check_interval).is_integer():
@@ -54,27 +185,64 @@ class Stats(object):
                 f"Check interval ({check_interval}) must be a divider of {compute_timeframe}")
         else:
             self.max_nb_data_points = compute_timeframe // check_interval
+        self.timeframe = compute_timeframe
+        self.check_interval = check_interval
+
+        if buffer is None:
+            buffer = SampleBuffer(self.max_nb_data_points)
+        elif buffer.capacity < self.max_nb_data_points:
+            raise ValueError(f"Buffer too small ({buffer.capacity}) for {self.max_nb_data_points} data points")
+        self.buffer = buffer
+        self.first_index = buffer.next_index
+        self.next_index = buffer.next_index
 
         self.successes_in_timeframe = 0
         self.sum_response_times = 0
 
-        self.ups = deque()
-        self.response_times = deque()
-        self.response_codes = deque()
-
         self.availability = 0
         self.max_response_time = -float('inf')
         self.min_response_time = float('inf')
         self.average_response_time = float('inf')
         self.response_codes_dict = {}
 
-    def update(self, is_up, response_time, response_code, always_a_response_code):
+        self.max_candidates = deque()
+        self.min_candidates = deque()
+        self.response_times_histogram = LogHistogram(buffer.bucketing.relative_accuracy)
+
+    @property
+    def ups(self):
+        """List with the result of the availability checks (0 or 1) recieved in the last timeframe.
+
+        Built from the buffer on each access: used for inspection only.
+        """
+        return [is_up for is_up, _, _ in self.buffer.data_points(self.first_index, self.next_index)]
+
+    @property
+    def response_times(self):
+        """List with the response times recieved in the last timeframe.
+
+        Built from the buffer on each access: used for inspection only.
+        """
+        return [response_time for _, response_time, _ in self.buffer.data_points(self.first_index, self.next_index)
+                if response_time is not None]
+
+    @property
+    def response_codes(self):
+        """List with the response codes recieved in the last timeframe.
+
+        Built from the buffer on each access: used for inspection only.
+        """
+        return [response_code for _, _, response_code in self.buffer.data_points(self.first_index, self.next_index)
+                if response_code is not None]
+
+    def update(self, is_up, response_time, response_code, always_a_response_code, timestamp=None):
         """Updates the stats object with data from a new check.
 
         Adds the success status, response time and response time to memory,
         removes old values (those older than the compute timeframe), and
-        updates the stats in constant time most of the time
-        (apart when max or min is removed. [...])
+        updates the stats in amortized constant time.
+        The maximum and minimum response times are tracked with monotonic queues,
+        so that they never need to be recomputed from all the response times.
 
         Parameters
         ----------
@@ -88,51 +256,89 @@ class Stats(object):
             a response_code, even if the website is down).
         always_a_response_code : bool
             see response_code
+        timestamp : float
+            monotonic time at which the check was done (see time.monotonic). Now if None.
+
+        Note
+        ----
+        When the buffer is shared, use StatsWindows.update to add the data point to all the timeframes at once.
         """
+        if timestamp is None:
+            timestamp = time.monotonic()
+        self.remove_expired(timestamp)
+        self.remove_oldest()
+        self.buffer.append(timestamp,
+                           is_up,
+                           response_time if is_up else None,
+                           response_code if is_up or always_a_response_code else None)
+        self.add_newest()
 
-        # Remove old availability status
-        if len(self.ups) == self.max_nb_data_points:
-            was_up_timeframe_ago = self.ups.popleft()
-        else:
-            was_up_timeframe_ago = 0
+    def remove_expired(self, now):
+        """Removes the data points older than the timeframe.
 
-        # Add new availability status
-        self.ups.append(is_up)
-        self.successes_in_timeframe += is_up - was_up_timeframe_ago
+        Data points are ordered by time, so that this is done in amortized constant time.
+        """
+        timestamps = self.buffer.timestamps
+        capacity = self.buffer.capacity
+        expiry = now - self.timeframe - self.buffer.epoch
+        while self.first_index < self.next_index and timestamps[self.first_index % capacity] <= expiry:
+            self.remove_first()
+
+    def remove_oldest(self):
+        """Removes the oldest data point of the timeframe if the timeframe is full.
+
+        Must be called before a new data point is appended to the buffer,
+        as the oldest data point of the longest timeframe is overwritten by the new one.
+        """
+        if self.next_index - self.first_index >= self.max_nb_data_points:
+            self.remove_first()
 
-        if was_up_timeframe_ago:
+    def remove_first(self):
+        """Removes the oldest data point of the timeframe, and updates the stats."""
+        index = self.first_index
+        position = index % self.buffer.capacity
+        self.first_index += 1
+
+        if self.buffer.ups[position]:
             # Remove old response time
-            old_response_time = self.response_times.popleft()
-            self.sum_response_times -= old_response_time
+            self.successes_in_timeframe -= 1
+            self.sum_response_times -= self.buffer.response_times[position]
             # Update response time stats
-            if old_response_time == self.max_response_time:
-                if len(self.response_times) == 0:
-                    self.max_response_time = -float('inf')
-                else:
-                    self.max_response_time = max(self.response_times)
-            if old_response_time == self.min_response_time:
-                if len(self.response_times) == 0:
-                    self.min_response_time = float('inf')
-                else:
-                    self.min_response_time = min(self.response_times)
-
-        if was_up_timeframe_ago or (always_a_response_code and len(self.response_codes) == self.max_nb_data_points):
-            # Remove old response code
-            old_response_code = self.response_codes.popleft()
+            if self.max_candidates[0] == index:
+                self.max_candidates.popleft()
+            if self.min_candidates[0] == index:
+                self.min_candidates.popleft()
+            self.response_times_histogram.add_key(self.buffer.response_time_keys[position], -1)
+
+        old_response_code = self.buffer.response_codes[position]
+        if old_response_code != NO_RESPONSE_CODE:
             # Update response code stats
             self.response_codes_dict[old_response_code] -= 1
 
-        if is_up:
-            # Add new response time
+    def add_newest(self):
+        """Adds the data point last appended to the buffer to the timeframe, and updates the stats."""
+        index = self.next_index
+        position = index % self.buffer.capacity
+        self.next_index += 1
+
+        if self.buffer.ups[position]:
+            response_time = self.buffer.response_times[position]
+            self.successes_in_timeframe += 1
             self.sum_response_times += response_time
-            self.response_times.append(response_time)
             # Update response time stats
-            self.max_response_time = max(self.max_response_time, response_time)
-            self.min_response_time = min(self.min_response_time, response_time)
+            # Older response times which are not greater (resp. lower) can never become the maximum (resp. minimum)
+            response_times = self.buffer.response_times
+            capacity = self.buffer.capacity
+            while self.max_candidates and response_times[self.max_candidates[-1] % capacity] <= response_time:
+                self.max_candidates.pop()
+            self.max_candidates.append(index)
+            while self.min_candidates and response_times[self.min_candidates[-1] % capacity] >= response_time:
+                self.min_candidates.pop()
+            self.min_candidates.append(index)
+            self.response_times_histogram.add_key(self.buffer.response_time_keys[position])
 
-        if is_up or always_a_response_code:
-            # Add new response code
-            self.response_codes.append(response_code)
+        response_code = self.buffer.response_codes[position]
+        if response_code != NO_RESPONSE_CODE:
             # Update response code stats
             if response_code in self.response_codes_dict:
                 self.response_codes_dict[response_code] += 1
@@ -140,20 +346,55 @@ class Stats(object):
                 self.response_codes_dict[response_code] = 1
 
         # Update remaining stats
-        self.availability = self.successes_in_timeframe / self.nb_data_points()
+        self.update_averages()
+
+    def update_averages(self):
+        """Updates the stats which are not maintained incrementally by add_newest and remove_first."""
+        capacity = self.buffer.capacity
+        if self.max_candidates:
+            self.max_response_time = self.buffer.response_times[self.max_candidates[0] % capacity]
+            self.min_response_time = self.buffer.response_times[self.min_candidates[0] % capacity]
+        else:
+            self.max_response_time = -float('inf')
+            self.min_response_time = float('inf')
+        nb_data_points = self.nb_data_points()
+        self.availability = self.successes_in_timeframe / nb_data_points if nb_data_points else 0
         if self.successes_in_timeframe > 0:
             self.average_response_time = self.sum_response_times / self.successes_in_timeframe
+        else:
+            self.average_response_time = float('inf')
+
+    def percentile(self, percent):
+        """Returns the given percentile (between 0 and 100) of the response times recieved in the last timeframe.
+
+        The relative error is bounded by the relative accuracy of the buffer (see sketch.LogHistogram).
+        Returns NaN if no response time was recieved.
+        """
+        return self.response_times_histogram.quantile(percent / 100)
 
     def nb_data_points(self):
         """Returns the number of data points recieved yet.
 
         Slowly increases up to self.max_nb_data_points.
         """
-        return len(self.ups)
+        return self.next_index - self.first_index
+
+    def covered_duration(self):
+        """Returns the duration (in seconds) actually covered by the data points of the timeframe.
+
+        Each data point accounts for one check_interval. The duration differs from the timeframe
+        when checks are late or missing (the timeframe then holds fewer data points).
+        """
+        if self.next_index == self.first_index:
+            return 0
+        timestamps = self.buffer.timestamps
+        capacity = self.buffer.capacity
+        return (timestamps[(self.next_index - 1) % capacity] - timestamps[self.first_index % capacity]
+                + self.check_interval)
 
     def timeframe_reached(self):
-        """Return whether we have already reached the max number of data points."""
-        return self.nb_data_points() == self.max_nb_data_points
+        """Return whether we have already reached the max number of data points, or covered the whole timeframe."""
+        return self.nb_data_points() == self.max_nb_data_points or self.covered_duration() >= self.timeframe
 
 
 class HttpStats(Stats):
@@ -161,10 +402,16 @@ class HttpStats(Stats):
 
     Ensures both response times and response codes are provided if the website is online
     """
-    def update(self, is_up, response_time=None, response_code=None):
-        if is_up and (response_time is None or response_time is None):
+    __slots__ = ()
+    always_a_response_code = False
+
+    def check(is_up, response_time, response_code):
+        if is_up and (response_time is None or response_code is None):
             raise ValueError("Site is available but no additional information given")
-        super().update(is_up, response_time, response_code, always_a_response_code=False)
+
+    def update(self, is_up, response_time=None, response_code=None, timestamp=None):
+        HttpStats.check(is_up, response_time, response_code)
+        super().update(is_up, response_time, response_code, always_a_response_code=False, timestamp=timestamp)
 
 
 class PingStats(Stats):
@@ -173,9 +420,212 @@ class PingStats(Stats):
     Ensures a response code is provided, and
     ensures a response time is provided if the website is online.
     """
-    def update(self, is_up, response_time=None, response_code=None):
+    __slots__ = ()
+    always_a_response_code = True
+
+    def check(is_up, response_time, response_code):
         if response_code is None:
             raise ValueError("Ping should return a response code")
         if is_up and response_time is None:
             raise ValueError("Successful ping should return a response time")
-        super().update(is_up, response_time, response_code, always_a_response_code=True)
+
+    def update(self, is_up, response_time=None, response_code=None, timestamp=None):
+        PingStats.check(is_up, response_time, response_code)
+        super().update(is_up, response_time, response_code, always_a_response_code=True, timestamp=timestamp)
+
+
+class TimingStats(Stats):
+    """Use to store the durations of a step of the checks (such as the DNS resolution).
+
+    A data point is up when the step succeeded, in which case its duration is the response time.
+    There is never a response code.
+    """
+    __slots__ = ()
+    always_a_response_code = False
+
+    def check(is_up, response_time, response_code):
+        if is_up and response_time is None:
+            raise ValueError("Successful step should have a duration")
+        if response_code is not None:
+            raise ValueError("Steps do not have response codes")
+
+    def update(self, is_up, response_time=None, response_code=None, timestamp=None):
+        TimingStats.check(is_up, response_time, response_code)
+        super().update(is_up, response_time, response_code, always_a_response_code=False, timestamp=timestamp)
+
+
+class StatsSnapshot(object):
+    """Immutable copy of the stats of a timeframe, read without locking the website.
+
+    Exposes the same stats as Stats (and RollupStats), as they were when the snapshot was taken.
+    """
+
+    __slots__ = ('timeframe', 'availability', 'min_response_time', 'max_response_time', 'average_response_time',
+                 'response_codes_dict', 'response_times_histogram', 'data_points', 'duration', 'reached')
+
+    def __init__(self, stats):
+        """Returns a copy of the stats of a timeframe.
+
+        Parameters
+        ----------
+        stats : Stats or rollup.RollupStats
+            stats to copy, which must not be updated during the copy
+        """
+        self.timeframe = stats.timeframe
+        self.availability = stats.availability
+        self.min_response_time = stats.min_response_time
+        self.max_response_time = stats.max_response_time
+        self.average_response_time = stats.average_response_time
+        self.response_codes_dict = dict(stats.response_codes_dict)
+        if isinstance(stats, Stats):
+            self.response_times_histogram = stats.response_times_histogram.copy()
+        else:
+            self.response_times_histogram = stats.compute().response_times_histogram.copy()
+        self.data_points = stats.nb_data_points()
+        self.duration = stats.covered_duration()
+        self.reached = stats.timeframe_reached()
+
+    def __getstate__(self):
+        # Compact pickled form, as snapshots are sent between processes (see shard.py)
+        return tuple(getattr(self, name) for name in StatsSnapshot.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(StatsSnapshot.__slots__, state):
+            setattr(self, name, value)
+
+    def percentile(self, percent):
+        """Returns the given percentile (between 0 and 100) of the response times, NaN if there is none."""
+        return self.response_times_histogram.quantile(percent / 100)
+
+    def nb_data_points(self):
+        return self.data_points
+
+    def covered_duration(self):
+        return self.duration
+
+    def timeframe_reached(self):
+        return self.reached
+
+
+class StatsWindows(object):
+    """Stats of several timeframes sharing a single buffer of data points.
+
+    Behaves as a read-only dict of {timeframe: Stats}. Data points are stored once,
+    in a buffer sized for the longest timeframe, and each timeframe keeps its aggregates
+    along with cursors into that buffer: memory grows with the number of data points only,
+    and not with the number of data points times the number of timeframes.
+
+    Timeframes longer than config.RAW_STATS_MAX_TIMEFRAME are computed from a rollup
+    of the data points instead (see rollup.RollupStats), so that their memory is bounded.
+    """
+
+    __slots__ = ('stats_class', 'buffer', 'rollup', 'stats', 'stats_values', 'pending_restore',
+                 'snapshot_rollup_minutes')
+
+    def __init__(self, check_interval, timeframes, stats_class, raw_stats_max_timeframe=config.RAW_STATS_MAX_TIMEFRAME):
+        """Returns the stats of the given timeframes.
+
+        Parameters
+        ----------
+        check_interval : int
+            in seconds, the frequency at which the stats are updated
+        timeframes : list(int)
+            in seconds, the durations upon which the stats are computed
+        stats_class : type
+            HttpStats, PingStats or TimingStats
+        raw_stats_max_timeframe : int
+            in seconds, the longest timeframe computed from the data points rather than from a rollup
+
+        Attributes
+        ----------
+        pending_restore : callable
+            restores the stats from a snapshot when they are first needed (see snapshot.restore), if not None
+        """
+        self.stats_class = stats_class
+        raw_timeframes = [timeframe for timeframe in timeframes if timeframe <= raw_stats_max_timeframe]
+        rollup_timeframes = [timeframe for timeframe in timeframes if timeframe > raw_stats_max_timeframe]
+
+        capacity = max([timeframe // check_interval for timeframe in raw_timeframes] + [1])
+        self.buffer = SampleBuffer(capacity)
+        self.stats = {timeframe: stats_class(check_interval, timeframe, self.buffer) for timeframe in raw_timeframes}
+        self.stats_values = list(self.stats.values())
+
+        self.rollup = None
+        if rollup_timeframes:
+            self.rollup = Rollup(max(rollup_timeframes))
+            for timeframe in rollup_timeframes:
+                self.stats[timeframe] = RollupStats(self.rollup, timeframe, check_interval)
+        self.pending_restore = None
+        self.snapshot_rollup_minutes = None
+
+    def restore_pending(self):
+        """Restores the stats from the snapshot they were saved to, if not done yet."""
+        if self.pending_restore is not None:
+            pending_restore, self.pending_restore = self.pending_restore, None
+            pending_restore(self)
+
+    def update(self, is_up, response_time=None, response_code=None, timestamp=None):
+        """Updates the stats of all the timeframes with data from a new check.
+
+        timestamp is the monotonic time at which the check was done (see time.monotonic), now if None.
+        """
+        self.stats_class.check(is_up, response_time, response_code)
+        self.restore_pending()
+        if timestamp is None:
+            timestamp = time.monotonic()
+        if not is_up:
+            response_time = None
+        if not is_up and not self.stats_class.always_a_response_code:
+            response_code = None
+
+        for stats in self.stats_values:
+            stats.remove_expired(timestamp)
+            stats.remove_oldest()
+        self.buffer.append(timestamp, is_up, response_time, response_code)
+        for stats in self.stats_values:
+            stats.add_newest()
+
+        if self.rollup is not None:
+            self.rollup.add(timestamp, is_up, response_time, response_code)
+
+    def snapshot(self, previous=None):
+        """Returns an immutable copy of the stats of all the timeframes, as a dict of {timeframe: StatsSnapshot}.
+
+        The stats of the rollup timeframes are computed from all their buckets: they are only copied
+        again once a minute bucket is closed, and taken from previous (the last snapshot) otherwise.
+        """
+        self.restore_pending()
+        snapshot = {}
+        for timeframe, stats in self.stats.items():
+            if previous is not None and isinstance(stats, RollupStats) \
+                    and self.rollup.nb_closed_minutes == self.snapshot_rollup_minutes:
+                snapshot[timeframe] = previous[timeframe]
+            else:
+                snapshot[timeframe] = StatsSnapshot(stats)
+        if self.rollup is not None:
+            self.snapshot_rollup_minutes = self.rollup.nb_closed_minutes
+        return snapshot
+
+    def __getitem__(self, timeframe):
+        self.restore_pending()
+        return self.stats[timeframe]
+
+    def __contains__(self, timeframe):
+        return timeframe in self.stats
+
+    def __iter__(self):
+        return iter(self.stats)
+
+    def __len__(self):
+        return len(self.stats)
+
+    def keys(self):
+        return self.stats.keys()
+
+    def values(self):
+        self.restore_pending()
+        return self.stats.values()
+
+    def items(self):
+        self.restore_pending()
+        return self.stats.items()
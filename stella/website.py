@@ -1,25 +1,38 @@
+from collections import deque
+from collections import namedtuple
 import platform
 import re
 import subprocess
 from threading import Lock
 import time
 from urllib.parse import urlparse
-from urllib.request import urlopen
 
-from stella.alert import AvailabilityAlert
-from stella.alert import AvailabilityRecovered
 from stella import config
+from stella.http_pool import POOL
+from stella import icmp
+from stella.rules import AvailabilityRule
+from stella.rules import RuleEvaluator
 from stella.stats import HttpStats
 from stella.stats import PingStats
+from stella.stats import StatsWindows
+from stella.stats import TimingStats
+
+WebsiteSnapshot = namedtuple('WebsiteSnapshot', ['availability_issue', 'ping_stats', 'http_stats', 'http_cold_stats',
+                                                 'dns_stats', 'http_phase_stats'])
+WebsiteSnapshot.__doc__ = """Immutable copy of the state of a website, read by the dashboard without locking it.
+
+The stats are dicts of {timeframe: stats.StatsSnapshot}, and http_phase_stats a dict of such stats per phase.
+"""
 
 
 class Website(object):
     def __init__(self,
                  website_url,
                  check_interval,
-                 timeframes=[config.ALERTING_TIMEFRAME] + config.STATS_TIMEFRAMES,
+                 timeframes=[config.ALERTING_TIMEFRAME] + config.STATS_TIMEFRAMES + config.ROLLUP_TIMEFRAMES,
                  alert_threshold=config.DEFAULT_ALERT_THRESHOLD,
-                 alerting_timeframe=config.ALERTING_TIMEFRAME):
+                 alerting_timeframe=config.ALERTING_TIMEFRAME,
+                 alert_rules=[]):
         """Returns a website object containing it's stats for the configured timeframes.
 
         Parameters
@@ -35,14 +48,45 @@ class Website(object):
             availability threshold for triggerign alerts
         alerting_timeframe : int
             timeframe on which to evaluate website availability
+        alert_rules : list(rules.Rule)
+            alert rules on other metrics, only the ones matching the website being kept.
+            The stats of their timeframes are computed along with the given timeframes.
         Attributes
         ----------
         availability_issue : bool
             indicates if an availability alert is currently fired
-        ping_stats_list : list of (int: PingStats)
+        alert_evaluator : rules.RuleEvaluator
+            rules of the website, the first one being the availability rule
+        alert_history : deque
+            last alerts of the website (see config.WEBSITE_ALERT_HISTORY_SIZE)
+        alert_queue : deque
+            queue to which the alerts of the website are appended, if not None,
+            to be moved to the alert store of the app (see alertstore.AlertStore.drain)
+        ping_stats_list : StatsWindows of (int: PingStats)
             website icmp stats for each of the timeframes
-        http_stats_list : list of (int: HttpStats)
+        http_stats_list : StatsWindows of (int: HttpStats)
             website http stats for each of the timeframes
+        http_cold_stats_list : StatsWindows of (int: HttpStats)
+            website http stats for each of the timeframes, only for the checks done on a new connection
+            (see config.HTTP_COLD_CHECK_INTERVAL). Used to monitor the connection and handshake costs
+            which are hidden by keep-alive connections.
+        dns_stats_list : StatsWindows of (int: TimingStats)
+            DNS resolution time of the checks for each of the timeframes (but the rollup ones),
+            a check being down if the hostname could not be resolved (see dnscache.DnsCache).
+            Not saved in snapshots.
+        http_phase_stats_lists : dict(str: StatsWindows of (int: TimingStats))
+            time of each phase of the http checks (see http_pool.HTTP_PHASES) for the same timeframes
+            as dns_stats_list, created on the first check timing the phase. Not saved in snapshots.
+        nb_http_checks : int
+            number of http checks done so far
+        probe_log : probelog.ProbeLog
+            log to which every probe result is appended, if not None
+        snapshot : WebsiteSnapshot
+            copy of the state of the website, published again on every update, None until first read
+            (see Website.get_snapshot)
+        scheduling : scheduler.SchedulingStats
+            scheduling lag and dropped checks of the website, None if its checks are not scheduled
+            by a scheduler.Scheduler
         """
         self.lock = Lock()
 
@@ -53,31 +97,107 @@ class Website(object):
         self.alert_threshold = alert_threshold
         self.alerting_timeframe = alerting_timeframe
 
-        self.availability_issue = False
-        self.alert_history = []
+        self.alert_evaluator = RuleEvaluator(
+            [AvailabilityRule(alert_threshold, alerting_timeframe)]
+            + [rule for rule in alert_rules if rule.matches(self.url, self.hostname)])
+        self.alert_history = deque(maxlen=config.WEBSITE_ALERT_HISTORY_SIZE)
+        self.alert_queue = None
 
-        self.ping_stats_list = {timeframe: PingStats(check_interval, timeframe) for timeframe in timeframes}
-        self.http_stats_list = {timeframe: HttpStats(check_interval, timeframe) for timeframe in timeframes}
+        stats_timeframes = sorted(set(timeframes) | set(self.alert_evaluator.timeframes()))
+        self.ping_stats_list = StatsWindows(check_interval, stats_timeframes, PingStats)
+        self.http_stats_list = StatsWindows(check_interval, stats_timeframes, HttpStats)
+        cold_check_interval = check_interval * config.HTTP_COLD_CHECK_INTERVAL
+        self.http_cold_stats_list = StatsWindows(
+            cold_check_interval,
+            [timeframe for timeframe in timeframes if cold_check_interval and timeframe % cold_check_interval == 0],
+            HttpStats)
+        # Timeframes of the stats of the DNS resolution and of the phases of the http checks
+        self.timing_timeframes = [timeframe for timeframe in stats_timeframes
+                                  if timeframe <= config.RAW_STATS_MAX_TIMEFRAME]
+        self.dns_stats_list = StatsWindows(check_interval, self.timing_timeframes, TimingStats)
+        self.http_phase_stats_lists = {}
+        self.nb_http_checks = 0
+        self.probe_log = None
+        self.snapshot = None
+        # Queue (shared by the websites) to which the website is added when it publishes new stats,
+        # once until its consumer (see siteindex.SiteIndex) clears publish_pending
+        self.publish_queue = None
+        self.publish_pending = False
+        # Set (see helpers.Wakeup) when the website is added to its publish queue
+        self.wakeup = None
+        self.scheduling = None
 
     def ping_and_update_stats(self, use_http):
-        """Updates the website icmp (or http) ping stats with a new ping (or http) request."""
+        """Updates the website icmp (or http) ping stats with a new ping (or http) request.
+
+        The http checks done on a new connection are only recorded in the cold stats (see Website.is_cold_check).
+        """
         if use_http:
-            is_up, response_time, response_code = Website.http_ping(self.url)
-            stats_list = self.http_stats_list
+            self.nb_http_checks += 1
+            cold_check = self.is_cold_check()
+            is_up, response_time, response_code = Website.http_ping(self.url, fresh_connection=cold_check)
+            if cold_check:
+                self.update_cold_stats(is_up, response_time, response_code)
+                return
         else:
             is_up, response_time, response_code = Website.ping(self.hostname)
-            stats_list = self.ping_stats_list
+        self.update_stats(use_http, is_up, response_time, response_code)
+
+    def is_cold_check(self):
+        """Returns whether the current http check must be done on a new connection.
+
+        Without keep-alive, every check is done on a new connection and is already recorded
+        in http_stats_list, so no check is singled out.
+        """
+        if not config.HTTP_KEEP_ALIVE or not config.HTTP_COLD_CHECK_INTERVAL:
+            return False
+        return self.nb_http_checks % config.HTTP_COLD_CHECK_INTERVAL == 0
+
+    def update_cold_stats(self, is_up, response_time, response_code):
+        """Updates the stats of the http checks done on a new connection."""
+        self.lock.acquire()
+        self.http_cold_stats_list.update(is_up, response_time, response_code)
+        if self.snapshot is not None:
+            self.snapshot = self.snapshot._replace(
+                http_cold_stats=self.http_cold_stats_list.snapshot(self.snapshot.http_cold_stats))
+        self.lock.release()
 
+    def update_dns_stats(self, is_resolved, dns_time, timestamp=None):
+        """Updates the stats of the DNS resolution time of the checks (in ms, see dnscache.DnsCache.resolve).
+
+        Recorded before the stats of the probe, whose update publishes the snapshot.
+        """
+        self.lock.acquire()
+        self.dns_stats_list.update(is_resolved, dns_time if is_resolved else None, timestamp=timestamp)
+        if self.snapshot is not None:
+            self.snapshot = self.snapshot._replace(dns_stats=self.dns_stats_list.snapshot(self.snapshot.dns_stats))
+        self.lock.release()
+
+    def update_http_phase_stats(self, timings, timestamp=None):
+        """Updates the stats of the phases of the http checks with the {phase: time (in ms)} of a check.
+
+        Recorded before the stats of the probe, whose update publishes the snapshot.
+        """
         self.lock.acquire()
-        for timeframe in stats_list:
-            stats_list[timeframe].update(is_up, response_time, response_code)
+        for phase, duration in timings.items():
+            stats_list = self.http_phase_stats_lists.get(phase)
+            if stats_list is None:
+                stats_list = self.http_phase_stats_lists[phase] = StatsWindows(
+                    self.check_interval, self.timing_timeframes, TimingStats)
+            stats_list.update(True, duration, timestamp=timestamp)
+        if self.snapshot is not None:
+            previous = self.snapshot.http_phase_stats
+            self.snapshot = self.snapshot._replace(http_phase_stats={
+                **previous,
+                **{phase: self.http_phase_stats_lists[phase].snapshot(previous.get(phase)) for phase in timings}})
         self.lock.release()
 
-    def check_for_alert(self, use_http):
-        """Checks if an alert should be raised based on a Stat list.
+    def update_stats(self, use_http, is_up, response_time, response_code, timestamp=None):
+        """Updates the website icmp (or http) stats with the result of a probe done elsewhere.
 
-        Check is based on a defined threshold and timeframe
-        for the icmp or http ping availability stat metric.
+        Used by probe engines which do not rely on Website.ping and Website.http_ping
+        (for example the asyncio engine).
+        timestamp is the monotonic time at which the probe was done (see time.monotonic), now if None.
         """
         if use_http:
             stats_list = self.http_stats_list
@@ -85,28 +205,83 @@ class Website(object):
             stats_list = self.ping_stats_list
 
         self.lock.acquire()
-        availability = stats_list[self.alerting_timeframe].availability
-        # Ensure enough datapoints are available
-        if stats_list[self.alerting_timeframe].timeframe_reached():
-
-            # Firing Alert
-            if self.availability_issue and availability >= self.alert_threshold:
-                self.availability_issue = False
-                alert = AvailabilityRecovered(self.hostname, availability)
-                self.alert_history += [alert]
-
-            # Recovering
-            elif availability < self.alert_threshold and not self.availability_issue:
-                self.availability_issue = True
-                alert = AvailabilityAlert(self.hostname, availability)
-                self.alert_history += [alert]
-
+        stats_list.update(is_up, response_time, response_code, timestamp)
+        if self.snapshot is not None:
+            # Only the stats of the probed protocol changed
+            if use_http:
+                self.snapshot = self.snapshot._replace(http_stats=stats_list.snapshot(self.snapshot.http_stats))
             else:
-                alert = None
+                self.snapshot = self.snapshot._replace(ping_stats=stats_list.snapshot(self.snapshot.ping_stats))
+        self.lock.release()
+        self.publish()
+
+        if self.probe_log is not None:
+            # The log outlives the process: probes are logged with their wall clock time
+            self.probe_log.append(self.url, use_http, is_up, response_time, response_code,
+                                  None if timestamp is None else time.time() - (time.monotonic() - timestamp))
+
+    def publish(self):
+        """Adds the website to its publish queue if any, once until its consumer clears publish_pending."""
+        if self.publish_queue is not None and not self.publish_pending:
+            self.publish_pending = True
+            self.publish_queue.append(self)
+            if self.wakeup is not None:
+                self.wakeup.set()
+
+    @property
+    def availability_issue(self):
+        return self.alert_evaluator.firing[0]
+
+    @availability_issue.setter
+    def availability_issue(self, availability_issue):
+        self.alert_evaluator.firing[0] = availability_issue
+
+    def check_for_alert(self, use_http, alert_time=None):
+        """Checks if alerts should be raised based on a Stat list, and returns them (empty list if none).
+
+        Checks are based on the alert rules of the website (see rules.RuleEvaluator): the availability rule,
+        on a defined threshold and timeframe, then the rules of alert_rules,
+        for the icmp or http ping stats.
+        alert_time is the activation time (datetime) of the alerts if any, now if None.
+        Alerts are added to the alert history of the website, and to its alert queue if any.
+        """
+        if use_http:
+            stats_list = self.http_stats_list
         else:
-            alert = None
+            stats_list = self.ping_stats_list
+
+        self.lock.acquire()
+        alerts = self.alert_evaluator.evaluate(self.hostname, stats_list, alert_time)
+        if alerts:
+            for alert in alerts:
+                alert.url = self.url
+            self.alert_history += alerts
+            if self.alert_queue is not None:
+                self.alert_queue += alerts
+            if self.snapshot is not None:
+                self.snapshot = self.snapshot._replace(availability_issue=self.availability_issue)
         self.lock.release()
-        return alert
+        return alerts
+
+    def get_snapshot(self):
+        """Returns a copy of the stats of the website (see WebsiteSnapshot), which is never modified.
+
+        Once read, the snapshot is published again under the lock by every update, so that readers
+        (such as the dashboard) only read the published snapshot and never hold the lock of the website
+        while probe threads update it. Until first read, updates do not pay for the publication.
+        """
+        snapshot = self.snapshot
+        if snapshot is None:
+            self.lock.acquire()
+            snapshot = self.snapshot = WebsiteSnapshot(self.availability_issue,
+                                                       self.ping_stats_list.snapshot(),
+                                                       self.http_stats_list.snapshot(),
+                                                       self.http_cold_stats_list.snapshot(),
+                                                       self.dns_stats_list.snapshot(),
+                                                       {phase: stats_list.snapshot() for phase, stats_list
+                                                        in self.http_phase_stats_lists.items()})
+            self.lock.release()
+        return snapshot
 
     def ping(host):
         """sends an ICMP ECHO_REQUEST packet to the given host and returns relevant information.
@@ -116,35 +291,75 @@ class Website(object):
         int : success status
         float : round-trip time (in ms)
         int : ICMP response code
-        """
 
-        param = '-n' if platform.system() == "Windows" else '-c'
-        command = ['ping', param, '1', host]
-        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        Note
+        ----
+        The packet is sent from an in-process ICMP socket when allowed (see config.ICMP_NATIVE),
+        otherwise the ping command is used. As the in-process sockets are IPv4 only, IPv6 addresses
+        (of the IPv6-only hosts, see dnscache.DnsCache.query) are always pinged with the ping command.
+        """
+        if config.ICMP_NATIVE and icmp.native_icmp_available() and ':' not in host:
+            return icmp.ping(host)
 
-        response_time = None
-        if result.returncode == 0:
-            re_search = re.findall("time=[0-9]*.[0-9]* *ms", str(result.stdout))
-            if len(re_search) != 1:
-                raise RuntimeError("Could not extract time from ping command")
-            str_time = re_search[0].strip("time=").strip("ms").strip(" ")
-            response_time = float(str_time)
-        return (result.returncode == 0, response_time, result.returncode)
+        result = subprocess.run(ping_command(host), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return parse_ping_output(result.returncode, result.stdout)
 
-    def http_ping(url):
+    def http_ping(url, fresh_connection=False, timings=None):
         """Probes the given url and returns relevant information.
 
+        The request is sent from the shared connection pool, whose new connections are opened to the address
+        of the host in the DNS cache. Unless config.HTTP_KEEP_ALIVE is disabled, the connection is kept open
+        for the next checks. The time lost on a stale connection before the request was sent again
+        is not part of the response time (see http_pool.ConnectionPool.get).
+
+        Parameters
+        ----------
+        url : str
+            url to probe
+        fresh_connection : bool
+            whether to open a new connection rather than reuse a pooled one
+        timings : dict
+            if not None, the time of each phase of the check is added to it (see http_pool.HTTP_PHASES)
+
         Returns
         -------
         int : success status
-        float : response time (in ms)
+        float : response time (in ms), up to the end of the body
         int : HTTP response code
         """
         try:
-            start = time.time()
-            response = urlopen(url)
-            response_time = time.time() - start
-            return True, response_time * 1000, response.getcode()
+            start = time.perf_counter_ns()
+            response_code = POOL.get(url, fresh_connection, keep_alive=config.HTTP_KEEP_ALIVE, timings=timings)
+            return True, (time.perf_counter_ns() - start - POOL.stale_time.ns) / 1e6, response_code
 
         except Exception:
             return False, None, None
+
+
+def ping_command(host):
+    """Returns the command line sending a single ICMP ECHO_REQUEST to host."""
+    param = '-n' if platform.system() == "Windows" else '-c'
+    return ['ping', param, '1', host]
+
+
+def parse_ping_output(returncode, stdout):
+    """Extracts the round-trip time from the output of the ping command.
+
+    Returns
+    -------
+    int : success status
+    float : round-trip time (in ms)
+    int : ICMP response code
+    """
+    response_time = None
+    if returncode == 0:
+        re_search = re.findall("time=[0-9]*.[0-9]* *ms", str(stdout))
+        if len(re_search) != 1:
+            raise RuntimeError("Could not extract time from ping command")
+        str_time = re_search[0].strip("time=").strip("ms").strip(" ")
+        response_time = float(str_time)
+    if returncode < 0:
+        # ping was killed by a signal (e.g. -9): report it as any other error, response codes being stored
+        # in an unsigned array (see stats.SampleBuffer)
+        returncode = 2
+    return (returncode == 0, response_time, returncode)
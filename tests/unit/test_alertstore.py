@@ -0,0 +1,80 @@
+from collections import deque
+import datetime
+
+from stella.alert import AvailabilityAlert
+from stella.alert import AvailabilityRecovered
+from stella.alertstore import AlertStore
+from stella.alertstore import read_spilled
+from stella.website import Website
+
+START = 1.7e9
+
+
+def alert(website, second, recovered=False):
+    alert_class = AvailabilityRecovered if recovered else AvailabilityAlert
+    return alert_class(website, 0.5, datetime.datetime.fromtimestamp(START + second))
+
+
+def test_queries_by_website_and_time():
+    store = AlertStore(capacity=10, spill_file=None)
+    store.add([alert('a.com', second) if second % 3 else alert('b.com', second) for second in range(8)])
+
+    assert store.count() == 8 and store.count('b.com') == 3
+    assert [a.activation_time.timestamp() - START for a in store.query()] == list(range(7, -1, -1))
+    assert [a.activation_time.timestamp() - START for a in store.query(offset=2, limit=3)] == [5, 4, 3]
+    assert [a.activation_time.timestamp() - START for a in store.query('b.com')] == [6, 3, 0]
+    assert [a.activation_time.timestamp() - START for a in store.query(start=START + 2, end=START + 4)] == [4, 3, 2]
+    assert [a.activation_time.timestamp() - START for a in store.query('a.com', start=START + 5)] == [7, 5]
+    assert store.query('unknown.com') == []
+
+
+def test_capacity_and_spill(tmp_path):
+    spill_file = str(tmp_path / 'alerts')
+    store = AlertStore(capacity=4, spill_file=spill_file)
+    store.add([alert('a.com', second, recovered=second % 2) for second in range(6)])
+    store.add([alert('b.com', 6)])
+    store.close()
+
+    # The 3 oldest alerts are evicted to the spill file
+    assert store.count() == 4 and store.nb_spilled == 3
+    assert [a.activation_time.timestamp() - START for a in store.query()] == [6, 5, 4, 3]
+    assert [a.activation_time.timestamp() - START for a in store.query('a.com')] == [5, 4, 3]
+    spilled = list(read_spilled(spill_file))
+    assert [(time.timestamp() - START, website, kind) for time, website, kind, _ in spilled] == \
+        [(0, 'a.com', 'AvailabilityAlert'), (1, 'a.com', 'AvailabilityRecovered'), (2, 'a.com', 'AvailabilityAlert')]
+    assert len(list(read_spilled(spill_file, start=START + 1))) == 2
+
+
+def test_drain_website_queues():
+    websites = [Website(f'http://site{i}.com', 1, timeframes=[5], alerting_timeframe=5) for i in range(3)]
+    for website in websites:
+        website.alert_queue = deque()
+    for second in range(5):
+        for website in websites[1:]:
+            website.update_stats(False, False, None, 1, timestamp=second)
+            website.check_for_alert(False)
+
+    store = AlertStore(spill_file=None)
+    assert len(store.drain(websites)) == 2
+    assert all(not website.alert_queue for website in websites)
+    assert [alert.website for alert in store.query()] == ['site2.com', 'site1.com']
+    assert store.drain(websites) == []
+
+
+def test_websites_of_a_same_hostname(tmp_path):
+    websites = [Website(f'http://a.com/{path}', 1, timeframes=[5], alerting_timeframe=5) for path in ('x', 'y')]
+    websites[0].alert_queue = deque()
+    websites[1].alert_queue = deque()
+    for second in range(5):
+        websites[0].update_stats(False, False, None, 1, timestamp=second)
+        websites[0].check_for_alert(False)
+
+    spill_file = str(tmp_path / 'alerts')
+    store = AlertStore(capacity=1, spill_file=spill_file)
+    store.drain(websites)
+    assert store.count('http://a.com/x') == 1 and store.count('http://a.com/y') == 0
+    assert store.query(url='http://a.com/y') == [] and store.count('a.com') == 0
+    store.add([alert('b.com', 6)])
+    store.close()
+    assert [url for _, url, _, _ in read_spilled(spill_file, url='http://a.com/x')] == ['http://a.com/x']
+    assert list(read_spilled(spill_file, url='http://a.com/y')) == []
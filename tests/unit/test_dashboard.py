@@ -0,0 +1,186 @@
+import os
+import select
+from threading import Thread
+import time
+
+import mock
+import pytest
+
+from stella import config
+from stella.alertstore import AlertStore
+from stella.dashboard import Dashboard
+from stella.website import Website
+
+
+class CursesError(Exception):
+    pass
+
+
+class FakeWindow(object):
+    """Curses window recording the text written at each (y, x), failing as curses outside of the window."""
+
+    def __init__(self, height=60, width=120):
+        self.height = height
+        self.width = width
+        self.texts = {}
+        self.nb_addstr = 0
+
+    def addstr(self, y, x, text, attributes=0):
+        if not (0 <= y < self.height and 0 <= x and x + len(text) <= self.width):
+            raise CursesError(f"addstr() returned ERR at ({y}, {x}) in a window of {self.height}x{self.width}")
+        self.texts[(y, x)] = text
+        self.nb_addstr += 1
+
+    def getmaxyx(self):
+        return (self.height, self.width)
+
+    def __getattr__(self, name):
+        # border, noutrefresh, touchwin...
+        return lambda *args: None
+
+
+@pytest.fixture
+def fake_curses():
+    windows = []
+
+    def newwin(height, width, start_y=0, start_x=0):
+        windows.append(FakeWindow(height, width))
+        return windows[-1]
+
+    with mock.patch('stella.dashboard.curses') as curses, mock.patch('stella.dashboard.signal'):
+        curses.error = CursesError
+        curses.A_BOLD = 1
+        curses.color_pair.return_value = 2
+        curses.newwin.side_effect = newwin
+        curses.windows = windows
+        yield curses
+
+
+def test_only_changed_cells_are_written(fake_curses):
+    websites = [Website(f'http://site{i}.com', 1) for i in range(3)]
+    for website in websites:
+        website.update_stats(False, True, 20.0, 0, timestamp=0)
+    dashboard = Dashboard(FakeWindow(), websites, AlertStore(spill_file=None))
+
+    dashboard.print_home_screen()
+    assert dashboard.nb_written_cells > 0
+    assert fake_curses.newwin.call_count == 6
+    dashboard.print_home_screen()
+    assert dashboard.nb_written_cells == 0
+
+    # Only the response time of the 3rd website changes: 1 cell for the list, the detail pane shows the 1st website
+    websites[2].update_stats(False, True, 40.0, 0, timestamp=1)
+    dashboard.print_home_screen()
+    assert dashboard.nb_written_cells == 1
+    assert fake_curses.windows[3].texts[(4, 1)] == '  20/30/40'
+
+    # The selection moves: 2 rows are written again, with the detail pane
+    dashboard.selected_row = 1
+    dashboard.print_home_screen()
+    assert fake_curses.windows[1].texts[(2, 1)] == '  site0.com'
+    assert fake_curses.windows[1].texts[(3, 1)] == '> site1.com'
+    assert fake_curses.windows[4].texts[(0, 1)] == 'Website : site1.com'
+    assert fake_curses.newwin.call_count == 6
+
+
+def test_list_scrolls_sorts_and_filters(fake_curses):
+    websites = [Website(f'http://site{i}.com', 1) for i in range(100)]
+    for i, website in enumerate(websites):
+        website.update_stats(False, True, float(i), 0, timestamp=0)
+    dashboard = Dashboard(FakeWindow(height=40), websites, AlertStore(spill_file=None))
+    dashboard.print_home_screen()
+
+    # 2 lines of header, 5 for the alerts: the list has 33 lines, 2 of titles and 1 of border
+    assert dashboard.window_sizes['hostname'] == (33, 30)
+    assert dashboard.window_sizes['alerts'] == (5, 95)
+    hostnames = fake_curses.windows[1].texts
+    assert max(y for y, x in hostnames) == 31
+    assert fake_curses.windows[0].texts[(1, 1)] == 'Sorted by config: 1-30 of 100'
+
+    # The list scrolls to the selected website
+    dashboard.selected_row = 40
+    dashboard.print_home_screen()
+    assert (hostnames[(2, 1)], hostnames[(31, 1)]) == ('  site11.com', '> site40.com')
+
+    # The slowest website first
+    dashboard.sort_order = 'latency'
+    dashboard.selected_row = 0
+    websites[50].update_stats(False, True, 1000.0, 0, timestamp=1)
+    dashboard.print_home_screen()
+    assert (hostnames[(2, 1)], hostnames[(3, 1)]) == ('> site50.com', '  site99.com')
+
+    dashboard.site_index.set_filter('site5')
+    dashboard.print_home_screen()
+    assert fake_curses.windows[0].texts[(1, 1)] == 'Sorted by latency, /site5: 1-11 of 11'
+    assert [hostnames[(y, 1)].rstrip() for y in (2, 3, 4, 12, 13)] == \
+        ['> site50.com', '  site59.com', '  site58.com', '  site5.com', '']
+
+
+@mock.patch.object(config, 'MONITOR_HTTP_RATHER_THAN_ICMP', True)
+def test_website_page_fits_in_the_terminal(fake_curses):
+    website = Website('http://site0.com', 1)
+    for i in range(10):
+        website.update_dns_stats(True, 1.0, timestamp=i)
+        website.update_http_phase_stats({'connect': 1.0, 'ttfb': 15.0, 'body': 4.0}, timestamp=i)
+        website.update_cold_stats(True, 20.0, 200)
+        # A response code per check, each one printed on its own line
+        website.update_stats(True, True, 20.0, 200 + i, timestamp=i)
+    for screen_height in [40, 200]:
+        dashboard = Dashboard(FakeWindow(height=screen_height), [website], AlertStore(spill_file=None))
+        dashboard.print_website_page(website)
+        window = fake_curses.windows[-2]
+        assert window.height == min(max(y for y, x in window.texts) + 2, screen_height)
+        assert window.texts[(0, 1)] == 'Website : site0.com'
+    # The HTTP phases are displayed on a tall terminal
+    assert 'ttfb   : 15.0/15.0 ms' in window.texts.values()
+
+
+class KeyboardScreen(FakeWindow):
+    """Screen returning the keys written to a pipe, which the dashboard waits on."""
+
+    def __init__(self):
+        super().__init__()
+        self.input, self.keyboard = os.pipe()
+
+    def getch(self):
+        readable, _, _ = select.select([self.input], [], [], 0)
+        return ord(os.read(self.input, 1)) if readable else -1
+
+    def type(self, key):
+        os.write(self.keyboard, key.encode())
+
+
+def test_frames_are_drawn_on_new_data_and_input(fake_curses):
+    websites = [Website(f'http://site{i}.com', 1) for i in range(3)]
+    screen = KeyboardScreen()
+    dashboard = Dashboard(screen, websites, AlertStore(spill_file=None))
+    dashboard.input = screen.input
+    dashboard.refresh_interval = 10
+    frame_times = []
+    print_home_screen = dashboard.print_home_screen
+
+    def print_frame():
+        print_home_screen()
+        frame_times.append(time.monotonic())
+
+    dashboard.print_home_screen = print_frame
+
+    def probe_then_quit():
+        time.sleep(0.2)
+        # 2 probes within a frame interval: 1 frame
+        websites[0].update_stats(False, True, 20.0, 0)
+        websites[1].update_stats(False, True, 20.0, 0)
+        update_times.append(time.monotonic())
+        time.sleep(0.2)
+        screen.type('q')
+
+    update_times = []
+    thread = Thread(target=probe_then_quit)
+    thread.start()
+    with pytest.raises(SystemExit):
+        dashboard.go_to_home_screen()
+    thread.join()
+
+    # Nothing is drawn while nothing changes
+    assert len(frame_times) == 2
+    assert frame_times[1] - update_times[0] < 0.1
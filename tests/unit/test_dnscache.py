@@ -0,0 +1,215 @@
+import socket
+import struct
+from threading import Event
+from threading import Thread
+import time
+
+import mock
+import pytest
+
+from stella import config
+from stella.dnscache import CLASS_IN
+from stella.dnscache import DnsCache
+from stella.dnscache import encode_name
+from stella.dnscache import HEADER
+from stella.dnscache import query_records
+from stella.dnscache import RECORD
+from stella.dnscache import TYPE_A
+from stella.dnscache import TYPE_AAAA
+from stella.dnscache import TYPE_CNAME
+from stella.dnscache import TYPE_SOA
+
+# Pointer to the name of the question
+NAME = b'\xc0\x0c'
+
+
+def record(record_type, ttl, data):
+    return NAME + RECORD.pack(record_type, CLASS_IN, ttl, len(data)) + data
+
+
+def answer(query, answers=(), authorities=(), rcode=0):
+    identifier, = struct.unpack_from('!H', query)
+    return HEADER.pack(identifier, 0x8180 | rcode, 1, len(answers), len(authorities), 0) + query[HEADER.size:] \
+        + b''.join(answers) + b''.join(authorities)
+
+
+@pytest.fixture
+def nameserver():
+    """Stub nameserver: example.com is an alias of two A records, ipv6.example.com has an AAAA record only,
+    other names are unknown."""
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(('127.0.0.1', 0))
+
+    def serve():
+        while True:
+            try:
+                query, client = server.recvfrom(512)
+            except OSError:
+                return
+            soa = encode_name('ns.example.com') + encode_name('admin.example.com') \
+                + struct.pack('!IIIII', 1, 3600, 600, 86400, 15)
+            ipv6_name = encode_name('ipv6.example.com')
+            if query[HEADER.size:].startswith(ipv6_name):
+                record_type, = struct.unpack_from('!H', query, HEADER.size + len(ipv6_name))
+                if record_type == TYPE_AAAA:
+                    response = answer(query, [record(TYPE_AAAA, 60, socket.inet_pton(socket.AF_INET6, '2001:db8::1'))])
+                else:
+                    response = answer(query, authorities=[record(TYPE_SOA, 900, soa)])
+            elif query[HEADER.size:].startswith(encode_name('example.com')):
+                response = answer(query, [record(TYPE_CNAME, 300, encode_name('cdn.example.net')),
+                                          record(TYPE_A, 60, socket.inet_aton('10.0.0.1')),
+                                          record(TYPE_A, 60, socket.inet_aton('10.0.0.2'))])
+            else:
+                response = answer(query, authorities=[record(TYPE_SOA, 900, soa)], rcode=3)
+            server.sendto(response, client)
+
+    Thread(target=serve, daemon=True).start()
+    yield server.getsockname()
+    server.close()
+
+
+def test_records_are_queried_with_their_ttl(nameserver):
+    assert query_records('example.com', nameserver, timeout=1) == (['10.0.0.1', '10.0.0.2'], 60)
+    # The negative TTL of the zone is the minimum of its SOA record
+    assert query_records('unknown.example.com', nameserver, timeout=1) == ([], 15)
+    assert query_records('ipv6.example.com', nameserver, timeout=1, record_type=TYPE_AAAA) == (['2001:db8::1'], 60)
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_cache(results, **kwargs):
+    """Returns a cache whose resolutions are taken from results, {hostname: (addresses, ttl)}."""
+    cache = DnsCache(enabled=True, nameserver=('127.0.0.1', 53), hosts=set(), min_ttl=5, max_ttl=3600,
+                     default_ttl=300, negative_ttl=30, refresh_ahead=0.8, background_refresh=False,
+                     clock=FakeClock(), **kwargs)
+    cache.queries = []
+
+    def query(hostname):
+        cache.queries.append(hostname)
+        return results[hostname]
+
+    cache.query = query
+    return cache
+
+
+def test_resolutions_are_cached_for_their_ttl(nameserver):
+    cache = DnsCache(enabled=True, nameserver=nameserver, hosts=set(), background_refresh=False, clock=FakeClock())
+    address, dns_time = cache.resolve('Example.com')
+    assert address == '10.0.0.1' and dns_time > 0
+    cache.clock.now += 59
+    assert cache.resolve('example.com')[0] == '10.0.0.1'
+    assert (cache.nb_misses, cache.nb_hits) == (1, 1)
+    cache.clock.now += 1
+    cache.resolve('example.com')
+    assert cache.nb_misses == 2
+
+    with mock.patch('socket.getaddrinfo', side_effect=socket.gaierror):
+        assert cache.resolve('unknown.example.com')[0] is None
+        cache.clock.now += 14
+        assert cache.resolve('unknown.example.com')[0] is None
+    assert cache.nb_misses == 3
+
+
+def test_ttls_are_bounded():
+    cache = make_cache({'short.com': (['10.0.0.1'], 0), 'hosts.com': (['10.0.0.2'], None),
+                        'unknown.com': ([], 86400), 'failing.com': ([], None)})
+    for hostname in ['short.com', 'hosts.com', 'unknown.com', 'failing.com']:
+        cache.resolve(hostname)
+    assert {hostname: resolution.expires_at - 1000 for hostname, resolution in cache.entries.items()} == \
+        {'short.com': 5, 'hosts.com': 300, 'unknown.com': 30, 'failing.com': 30}
+
+
+def test_addresses_are_not_resolved():
+    cache = make_cache({})
+    assert cache.resolve('127.0.0.1') == ('127.0.0.1', None)
+    assert cache.resolve('::1') == ('::1', None)
+    cache.enabled = False
+    assert cache.resolve('example.com') == ('example.com', None)
+    assert cache.queries == []
+
+
+def test_used_resolutions_are_refreshed_before_they_expire():
+    results = {'used.com': (['10.0.0.1'], 100), 'unused.com': (['10.0.0.2'], 100)}
+    cache = make_cache(results)
+    cache.resolve('used.com')
+    cache.resolve('unused.com')
+    cache.clock.now += 50
+    cache.resolve('used.com')
+    assert cache.refresh_due() == 0
+    cache.clock.now += 30
+
+    results['used.com'] = (['10.0.0.3'], 100)
+    assert cache.refresh_due() == 1
+    assert cache.queries == ['used.com', 'unused.com', 'used.com']
+    # Refreshed before expiring: the next checks do not wait for the resolver
+    cache.clock.now += 90
+    assert cache.resolve('used.com')[0] == '10.0.0.3'
+    assert cache.resolve('unused.com')[0] == '10.0.0.2'
+    assert cache.queries == ['used.com', 'unused.com', 'used.com', 'unused.com']
+
+
+def test_failed_refresh_keeps_the_cached_address():
+    results = {'flaky.com': (['10.0.0.1'], 100)}
+    cache = make_cache(results)
+    cache.resolve('flaky.com')
+    cache.clock.now += 80
+    cache.resolve('flaky.com')
+    results['flaky.com'] = ([], None)
+    assert cache.refresh_due() == 1
+    assert cache.resolve('flaky.com')[0] == '10.0.0.1'
+    cache.clock.now += 20
+    assert cache.resolve('flaky.com')[0] is None
+
+
+def test_concurrent_misses_query_once():
+    cache = make_cache({})
+    released = Event()
+
+    def slow_query(hostname):
+        released.wait(5)
+        cache.queries.append(hostname)
+        return ['10.0.0.1'], 100
+
+    cache.query = slow_query
+    addresses = []
+    threads = [Thread(target=lambda: addresses.append(cache.resolve('example.com')[0])) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    while len(cache.pending) < 1 or cache.nb_misses < 8:
+        time.sleep(0.001)
+    released.set()
+    for thread in threads:
+        thread.join()
+    assert addresses == ['10.0.0.1'] * 8
+    assert cache.queries == ['example.com']
+
+
+def test_ipv6_only_hosts_are_resolved(nameserver):
+    cache = DnsCache(enabled=True, nameserver=nameserver, hosts=set(), background_refresh=False, clock=FakeClock())
+    assert cache.resolve('ipv6.example.com')[0] == '2001:db8::1'
+    assert cache.entries['ipv6.example.com'].expires_at == 1060
+
+    # Through getaddrinfo (for the names of the hosts file), IPv4 addresses are preferred
+    cache = DnsCache(enabled=True, nameserver=nameserver, hosts={'dual.example.com', 'ipv6.example.com'},
+                     background_refresh=False, clock=FakeClock())
+    ipv6 = (socket.AF_INET6, socket.SOCK_STREAM, 6, '', ('2001:db8::1', 0, 0, 0))
+    ipv4 = (socket.AF_INET, socket.SOCK_STREAM, 6, '', ('10.0.0.1', 0))
+    with mock.patch('socket.getaddrinfo', side_effect=[[ipv6, ipv4], [ipv6]]):
+        assert cache.resolve('dual.example.com')[0] == '10.0.0.1'
+        assert cache.resolve('ipv6.example.com')[0] == '2001:db8::1'
+
+
+def test_negative_answers_fall_back_to_getaddrinfo(nameserver):
+    # Names unknown to the first nameserver may be known to the other sources of the system resolver
+    cache = DnsCache(enabled=True, nameserver=nameserver, hosts=set(), background_refresh=False, clock=FakeClock())
+    ipv4 = (socket.AF_INET, socket.SOCK_STREAM, 6, '', ('10.0.0.3', 0))
+    with mock.patch('socket.getaddrinfo', return_value=[ipv4]) as getaddrinfo:
+        assert cache.resolve('unknown.example.com')[0] == '10.0.0.3'
+    getaddrinfo.assert_called_once_with('unknown.example.com', None, type=socket.SOCK_STREAM)
+    assert cache.entries['unknown.example.com'].expires_at == 1000 + config.DNS_DEFAULT_TTL
@@ -0,0 +1,134 @@
+import asyncio
+from collections import deque
+
+import mock
+
+from stella.engine import AsyncProbeEngine
+from stella.engine import async_http_ping
+from stella.probetarget import ProbeTarget
+from stella.website import Website
+
+
+class SlowProbeEngine(AsyncProbeEngine):
+    """Engine whose probes take a short delay, recording the concurrency reached. Probes of the first website raise."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def probe(self, target):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.1)
+            if target.websites[0] is self.websites[0]:
+                raise RuntimeError("unexpected ping output")
+        finally:
+            self.in_flight -= 1
+        return (True, 10, 0)
+
+
+async def run_for(engine, duration):
+    try:
+        await asyncio.wait_for(engine.run(), duration)
+    except asyncio.TimeoutError:
+        pass
+
+
+def test_engine_runs_the_due_checks_within_the_concurrency_limit():
+    websites = [Website(f"http://fakehost{i}.url", 1) for i in range(10)]
+    engine = SlowProbeEngine(websites, use_http=False, max_concurrent_probes=3)
+    # Without jitter, the first checks of all the websites are due at once: 4 rounds of 3 checks of 0.1s
+    with mock.patch('stella.scheduler.random.uniform', return_value=0):
+        asyncio.run(run_for(engine, 0.6))
+
+    assert engine.max_in_flight == 3
+    assert engine.nb_in_flight == 0
+    for website in websites:
+        assert website.scheduling.nb_checks == 1
+        for stats in website.ping_stats_list.values():
+            assert stats.nb_data_points() == 1
+            # The check whose probe raised is recorded as down
+            assert stats.availability == (0 if website is websites[0] else 1)
+    assert websites[0].scheduling.nb_errors == 1
+
+
+def test_engine_fires_alerts():
+    website = Website("http://fakehost.url", 1)
+    website.alert_queue = deque()
+    engine = AsyncProbeEngine([website], use_http=True)
+
+    async def always_down(website):
+        return (False, None, None)
+
+    engine.probe = always_down
+
+    async def probe_timeframe():
+        for i in range(website.alerting_timeframe):
+            await engine.probe_and_update(ProbeTarget([website]))
+
+    asyncio.run(probe_timeframe())
+
+    assert len(website.alert_queue) == 1, website.alert_queue
+    assert website.availability_issue
+
+
+def run_with_http_server(responses, coroutine_factory):
+    """Runs coroutine_factory(url) against a local http server answering with the given raw responses."""
+
+    async def handle(reader, writer):
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b'\r\n', b''):
+            pass
+        path = request_line.split()[1].decode()
+        writer.write(responses[path])
+        await writer.drain()
+        writer.close()
+
+    async def run():
+        server = await asyncio.start_server(handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            return await coroutine_factory(f"http://127.0.0.1:{port}")
+
+    return asyncio.run(run())
+
+
+def test_async_http_ping():
+    responses = {
+        '/': b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n",
+        '/moved': b"HTTP/1.1 301 Moved Permanently\r\nLocation: /\r\n\r\n",
+        '/missing': b"HTTP/1.1 404 Not Found\r\n\r\n",
+    }
+
+    async def ping_all(base_url):
+        return [await async_http_ping(base_url + path) for path in ('/', '/moved', '/missing')]
+
+    up, redirected, missing = run_with_http_server(responses, ping_all)
+
+    assert up[0] and up[2] == 200 and up[1] >= 0
+    assert redirected[0] and redirected[2] == 200
+    assert missing == (False, None, None)
+
+
+def test_async_http_ping_unreachable():
+    assert asyncio.run(async_http_ping("http://127.0.0.1:1/")) == (False, None, None)
+
+
+def test_async_http_ping_times_its_phases():
+    responses = {
+        '/': b"HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\nhello",
+        '/moved': b"HTTP/1.1 301 Moved Permanently\r\nLocation: /\r\n\r\n",
+    }
+    timings = {}
+
+    async def ping(base_url):
+        return await async_http_ping(base_url + '/moved', timings)
+
+    is_up, response_time, _ = run_with_http_server(responses, ping)
+
+    assert is_up
+    assert set(timings) == {'connect', 'ttfb', 'body'}
+    # Both requests are timed, up to the end of the body
+    assert sum(timings.values()) <= response_time
@@ -0,0 +1,169 @@
+from collections import deque
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import socket
+from threading import Thread
+import time
+from urllib.parse import urlparse
+
+import pytest
+
+from stella.dnscache import DnsCache
+from stella.http_pool import ConnectionPool
+from stella.http_pool import HttpProbeError
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    connections = set()
+    hosts = set()
+    paths = []
+
+    def do_GET(self):
+        KeepAliveHandler.connections.add(self.client_address)
+        KeepAliveHandler.hosts.add(self.headers['Host'])
+        KeepAliveHandler.paths.append(self.path)
+        if self.path.endswith('/missing'):
+            self.send_response(404)
+            body = b''
+        elif self.path == '/slow':
+            time.sleep(0.5)
+            self.send_response(200)
+            body = b''
+        elif self.path == '/moved':
+            self.send_response(302)
+            self.send_header('Location', '/')
+            body = b''
+        else:
+            self.send_response(200)
+            body = b'hello'
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        if self.path == '/drop':
+            # Close the connection without telling the client, as a server whose keep-alive timeout elapsed
+            self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    KeepAliveHandler.connections = set()
+    KeepAliveHandler.hosts = set()
+    KeepAliveHandler.paths = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+    Thread(target=server.serve_forever, args=(0.01,), daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_connection_is_reused(server_url):
+    pool = ConnectionPool()
+    for i in range(5):
+        assert pool.get(server_url + '/') == 200
+    assert len(KeepAliveHandler.connections) == 1
+
+
+def test_fresh_connection(server_url):
+    pool = ConnectionPool()
+    pool.get(server_url + '/')
+    pool.get(server_url + '/', fresh_connection=True)
+    assert len(KeepAliveHandler.connections) == 2
+
+
+def test_redirect_and_error_codes(server_url):
+    pool = ConnectionPool()
+    assert pool.get(server_url + '/moved') == 200
+    with pytest.raises(HttpProbeError):
+        pool.get(server_url + '/missing')
+
+
+def test_reconnect_on_stale_connection(server_url):
+    pool = ConnectionPool()
+    pool.get(server_url + '/drop')
+    time.sleep(0.05)
+    assert pool.get(server_url + '/') == 200
+    assert len(KeepAliveHandler.connections) == 2
+    # The failed attempt is kept out of the response time
+    assert pool.stale_time.ns > 0
+    pool.get(server_url + '/')
+    assert pool.stale_time.ns == 0
+
+
+def test_timeouts_are_not_retried(server_url):
+    pool = ConnectionPool(timeout=0.1)
+    pool.get(server_url + '/')
+    with pytest.raises(socket.timeout):
+        pool.get(server_url + '/slow')
+    assert len(KeepAliveHandler.connections) == 1
+    assert pool.idle_connections[('http', '127.0.0.1', urlparse(server_url).port)] == deque()
+
+
+def test_idle_eviction_and_bounded_size(server_url):
+    pool = ConnectionPool(max_size_per_host=1, idle_timeout=0)
+    pool.get(server_url + '/')
+    pool.get(server_url + '/')
+    assert len(KeepAliveHandler.connections) == 2
+    assert all(len(idle) <= 1 for idle in pool.idle_connections.values())
+
+
+def test_idle_connections_of_all_hosts_are_evicted(server_url):
+    resolver = DnsCache(enabled=True, nameserver=None, hosts=set(), background_refresh=False)
+    resolver.query = lambda hostname: (['127.0.0.1'], 60)
+    pool = ConnectionPool(idle_timeout=0.05, resolver=resolver)
+    pool.get(server_url.replace('127.0.0.1', 'a.test') + '/')
+    connection, _ = pool.idle_connections[('http', 'a.test', urlparse(server_url).port)][0]
+    time.sleep(0.1)
+    # The connection to a.test expired while idle: it is closed when another host is requested
+    pool.get(server_url.replace('127.0.0.1', 'b.test') + '/')
+    assert list(pool.idle_connections) == [('http', 'b.test', urlparse(server_url).port)]
+    assert connection.sock is None
+
+
+def test_hosts_are_resolved_from_the_cache(server_url):
+    resolver = DnsCache(enabled=True, nameserver=None, hosts=set(), background_refresh=False)
+    resolver.query = lambda hostname: (['127.0.0.1'], 60)
+    pool = ConnectionPool(resolver=resolver)
+    url = server_url.replace('127.0.0.1', 'stub.test')
+    assert pool.get(url + '/') == 200
+    assert pool.get(url + '/', fresh_connection=True) == 200
+    assert KeepAliveHandler.hosts == {url[len('http://'):]}
+    assert (resolver.nb_misses, resolver.nb_hits) == (1, 1)
+
+
+def test_phases_are_timed(server_url):
+    pool = ConnectionPool()
+    timings = {}
+    pool.get(server_url + '/', timings=timings)
+    assert set(timings) == {'connect', 'ttfb', 'body'}
+    # A reused connection is neither connected nor timed as such
+    timings = {}
+    pool.get(server_url + '/', timings=timings)
+    assert set(timings) == {'ttfb', 'body'}
+    assert len(KeepAliveHandler.connections) == 1
+
+    pool.get(server_url + '/', keep_alive=False)
+    pool.get(server_url + '/', keep_alive=False)
+    assert len(KeepAliveHandler.connections) == 3
+
+
+def test_proxies_are_honored(server_url, monkeypatch):
+    monkeypatch.setenv('no_proxy', 'direct.test')
+    resolver = DnsCache(enabled=True, nameserver=None, hosts=set(), background_refresh=False)
+    resolver.query = lambda hostname: (['127.0.0.1'], 60)
+    pool = ConnectionPool(resolver=resolver, proxies={'http': server_url})
+    # The proxy (the test server) receives the absolute url of the request
+    assert pool.get('http://proxied.test/') == 200
+    assert KeepAliveHandler.paths == ['http://proxied.test/']
+    with pytest.raises(HttpProbeError):
+        pool.get('http://proxied.test/missing')
+    assert not pool.idle_connections
+
+    # Hosts of NO_PROXY are requested directly, from the pool
+    port = urlparse(server_url).port
+    assert pool.get(f'http://direct.test:{port}/') == 200
+    assert KeepAliveHandler.paths[-1] == '/'
+    assert list(pool.idle_connections) == [('http', 'direct.test', port)]
@@ -0,0 +1,192 @@
+import socket
+import struct
+from threading import Thread
+from threading import Timer
+import time
+
+import pytest
+
+from stella import icmp
+
+
+def ip_header(protocol=socket.IPPROTO_ICMP):
+    """Returns a minimal IPv4 header (20 bytes, no options)."""
+    return struct.pack('!BBHHHBBH4s4s', 0x45, 0, 0, 0, 0, 64, protocol, 0,
+                       socket.inet_aton('127.0.0.1'), socket.inet_aton('127.0.0.1'))
+
+
+def echo_reply(request):
+    """Turns an echo request into the matching echo reply."""
+    reply = bytes([icmp.ICMP_ECHO_REPLY]) + request[1:2] + b'\0\0' + request[4:]
+    checksum = icmp.checksum(reply)
+    return reply[:2] + struct.pack('!H', checksum) + reply[4:]
+
+
+class FakeIcmpSocket(object):
+    """Socket answering every echo request with the given reply factory."""
+
+    def __init__(self, socket_type, reply_factory):
+        self.type = socket_type
+        self.reply_factory = reply_factory
+        self.replies = []
+
+    def bind(self, address):
+        pass
+
+    def getsockname(self):
+        return ('0.0.0.0', 4242)
+
+    def sendto(self, packet, address):
+        self.replies += self.reply_factory(packet)
+
+    def settimeout(self, timeout):
+        pass
+
+    def recv(self, size):
+        if not self.replies:
+            raise socket.timeout()
+        return self.replies.pop(0)
+
+    def close(self):
+        pass
+
+
+def test_checksum():
+    packet = icmp.build_echo_request(0x1234, 1)
+    # The checksum of a packet including its checksum is 0
+    assert icmp.checksum(packet) == 0
+
+
+def test_parse_echo_reply():
+    reply = echo_reply(icmp.build_echo_request(0x1234, 7))
+    assert icmp.parse_reply(reply, has_ip_header=False) == (icmp.ICMP_ECHO_REPLY, 0x1234, 7)
+    assert icmp.parse_reply(ip_header() + reply, has_ip_header=True) == (icmp.ICMP_ECHO_REPLY, 0x1234, 7)
+    # Our own echo requests are seen by raw sockets too
+    assert icmp.parse_reply(ip_header() + icmp.build_echo_request(0x1234, 7), has_ip_header=True) is None
+
+
+def test_parse_destination_unreachable():
+    request = icmp.build_echo_request(0x1234, 7)
+    unreachable = struct.pack('!BBHHH', icmp.ICMP_DESTINATION_UNREACHABLE, 1, 0, 0, 0) + ip_header() + request[:8]
+    assert icmp.parse_reply(unreachable, has_ip_header=False) == (icmp.ICMP_DESTINATION_UNREACHABLE, 0x1234, 7)
+
+
+@pytest.mark.parametrize("socket_type", [socket.SOCK_DGRAM, socket.SOCK_RAW])
+def test_ping_matches_reply(monkeypatch, socket_type):
+    has_ip_header = socket_type == socket.SOCK_RAW
+
+    def replies(request):
+        prefix = ip_header() if has_ip_header else b''
+        if socket_type == socket.SOCK_DGRAM:
+            # The kernel rewrites the identifier of datagram sockets
+            request = request[:4] + struct.pack('!H', 4242) + request[6:]
+        other = request[:4] + struct.pack('!H', 1) + request[6:]
+        return [prefix + echo_reply(other), prefix + echo_reply(request)]
+
+    monkeypatch.setattr(icmp, 'open_socket', lambda: FakeIcmpSocket(socket_type, replies))
+    is_up, response_time, response_code = icmp.ping('127.0.0.1')
+    assert is_up
+    assert response_time >= 0
+    assert response_code == icmp.CODE_REPLY
+
+
+def test_ping_timeout(monkeypatch):
+    monkeypatch.setattr(icmp, 'open_socket', lambda: FakeIcmpSocket(socket.SOCK_DGRAM, lambda request: []))
+    assert icmp.ping('127.0.0.1', timeout=0.01) == (False, None, icmp.CODE_NO_REPLY)
+
+
+def test_ping_unknown_host():
+    assert icmp.ping('unexistant.site.invalid') == (False, None, icmp.CODE_ERROR)
+
+
+class LoopbackIcmpSocket(socket.socket):
+    """UDP socket standing for a datagram ICMP socket.
+
+    Echo requests are forwarded to a responder socket, prefixed with their destination address.
+    """
+
+    responder_address = None
+
+    def __init__(self):
+        super().__init__(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def bind(self, address):
+        super().bind(('127.0.0.1', 0))
+
+    def sendto(self, packet, address):
+        return super().sendto(socket.inet_aton(address[0]) + packet, self.responder_address)
+
+
+def run_responder(responder, down_addresses, nb_requests, late_addresses=(), delay=0):
+    for _ in range(nb_requests):
+        data, address = responder.recvfrom(2048)
+        destination, request = socket.inet_ntoa(data[:4]), data[4:]
+        if destination in late_addresses:
+            Timer(delay, responder.sendto, (echo_reply(request), address)).start()
+        elif destination not in down_addresses:
+            responder.sendto(echo_reply(request), address)
+
+
+def test_sweep(monkeypatch):
+    responder = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    responder.bind(('127.0.0.1', 0))
+    LoopbackIcmpSocket.responder_address = responder.getsockname()
+    monkeypatch.setattr(icmp, 'open_socket', LoopbackIcmpSocket)
+
+    hosts = [f'127.0.0.{i}' for i in range(1, 101)]
+    down_addresses = {'127.0.0.7', '127.0.0.50'}
+    Thread(target=run_responder, args=(responder, down_addresses, len(hosts)), daemon=True).start()
+
+    sweeper = icmp.IcmpSweeper(timeout=0.2)
+    results = sweeper.sweep(hosts + ['unexistant.site.invalid'])
+    sweeper.close()
+    responder.close()
+
+    for host, (is_up, response_time, response_code) in zip(hosts, results):
+        if host in down_addresses:
+            assert (is_up, response_time, response_code) == (False, None, icmp.CODE_NO_REPLY)
+        else:
+            assert is_up and response_time >= 0 and response_code == icmp.CODE_REPLY
+    assert results[-1] == (False, None, icmp.CODE_ERROR)
+
+
+class SlowLoopbackIcmpSocket(LoopbackIcmpSocket):
+    def sendto(self, packet, address):
+        time.sleep(0.02)
+        return super().sendto(packet, address)
+
+
+def test_sweep_times_out_each_request(monkeypatch):
+    responder = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    responder.bind(('127.0.0.1', 0))
+    LoopbackIcmpSocket.responder_address = responder.getsockname()
+    monkeypatch.setattr(icmp, 'open_socket', SlowLoopbackIcmpSocket)
+    monkeypatch.setattr(icmp, 'SEND_BURST', 1)
+
+    # The requests are sent over 0.4s, the reply of the first host comes 0.2s after its request
+    hosts = [f'127.0.0.{i}' for i in range(1, 21)]
+    Thread(target=run_responder, args=(responder, set(), len(hosts), {'127.0.0.1'}, 0.2), daemon=True).start()
+
+    sweeper = icmp.IcmpSweeper(timeout=0.1)
+    results = sweeper.sweep(hosts)
+    sweeper.close()
+    responder.close()
+
+    assert results[0] == (False, None, icmp.CODE_NO_REPLY)
+    assert all(is_up and response_time < 100 for is_up, response_time, _ in results[1:])
+
+
+def test_late_replies_to_a_previous_sweep_are_dropped(monkeypatch):
+    responder = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    responder.bind(('127.0.0.1', 0))
+    LoopbackIcmpSocket.responder_address = responder.getsockname()
+    monkeypatch.setattr(icmp, 'open_socket', LoopbackIcmpSocket)
+    Thread(target=run_responder, args=(responder, {'127.0.0.2'}, 2, {'127.0.0.1'}, 0.2), daemon=True).start()
+
+    # The reply to the first sweep comes during the second one, in which the host is down
+    sweeper = icmp.IcmpSweeper(timeout=0.1)
+    assert sweeper.sweep(['127.0.0.1']) == [(False, None, icmp.CODE_NO_REPLY)]
+    sweeper.timeout = 0.3
+    assert sweeper.sweep(['127.0.0.2']) == [(False, None, icmp.CODE_NO_REPLY)]
+    sweeper.close()
+    responder.close()
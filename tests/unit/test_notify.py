@@ -0,0 +1,146 @@
+import asyncio
+import datetime
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import json
+from threading import Thread
+
+import pytest
+
+from stella.alert import AvailabilityAlert
+from stella.alert import AvailabilityRecovered
+from stella.notify import CommandSink
+from stella.notify import FileSink
+from stella.notify import Notifier
+from stella.notify import Sink
+from stella.notify import WebhookSink
+
+START = datetime.datetime(2024, 1, 1)
+
+
+def down(website, second=0):
+    return AvailabilityAlert(website, 0.5, START + datetime.timedelta(seconds=second))
+
+
+def up(website, second=0):
+    return AvailabilityRecovered(website, 0.9, START + datetime.timedelta(seconds=second))
+
+
+@pytest.fixture
+def webhook():
+    """Local HTTP stub recording the posted batches, failing the first `failures` requests with a 500."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers['Content-Length']))
+            if server.failures > 0:
+                server.failures -= 1
+                self.send_response(500)
+            else:
+                server.batches.append(json.loads(body)['alerts'])
+                self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.batches = []
+    server.failures = 0
+    server.url = f'http://127.0.0.1:{server.server_port}/alerts'
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_webhook_batches_and_coalesces(webhook):
+    sink = WebhookSink(webhook.url, batch_window=0.2, timeout=5)
+    notifier = Notifier([sink])
+    notifier.start()
+
+    # a.com flaps within the batching window: it is back up, as last notified, so nothing is sent for it
+    notifier.notify([down('a.com', 0), down('b.com', 1)])
+    notifier.notify([up('a.com', 2)])
+    notifier.flush(5)
+    notifier.notify([up('b.com', 3), up('b.com', 4)])
+    notifier.close(5)
+
+    assert [[(alert['website'], alert['firing']) for alert in batch] for batch in webhook.batches] == \
+        [[('b.com', True)], [('b.com', False)]]
+    assert webhook.batches[0][0]['rule'] == 'availability'
+    assert webhook.batches[0][0]['time'] == '2024-01-01T00:00:01'
+    assert (sink.nb_sent, sink.nb_coalesced, sink.nb_dropped, sink.nb_failed) == (2, 3, 0, 0)
+
+
+def test_webhook_retries_with_backoff(webhook):
+    webhook.failures = 2
+    sink = WebhookSink(webhook.url, batch_window=0, retry_backoff=0.01, max_retries=3, timeout=5)
+    notifier = Notifier([sink])
+    notifier.start()
+    notifier.notify([down('a.com')])
+    notifier.close(5)
+
+    assert len(webhook.batches) == 1
+    assert (sink.nb_sent, sink.nb_retries, sink.nb_failed) == (1, 2, 0)
+
+
+class DeadSink(Sink):
+    """Sink whose sends never complete."""
+
+    async def send(self, alerts):
+        await asyncio.sleep(3600)
+
+
+def test_dead_sink_drops_alerts_without_delaying_others(tmp_path):
+    dead = DeadSink(batch_window=0, queue_size=2, max_retries=0, timeout=0.5)
+    file_sink = FileSink(str(tmp_path / 'alerts.jsonl'), batch_window=0)
+    notifier = Notifier([dead, file_sink])
+    notifier.start()
+    notifier.notify([down(f'site{i}.com') for i in range(5)])
+    notifier.flush(5)
+
+    # The dead sink queues the first 2 alerts and drops the others, then its batches time out
+    assert dead.nb_dropped == 3
+    assert dead.nb_failed == 2
+    lines = (tmp_path / 'alerts.jsonl').read_text().splitlines()
+    assert [json.loads(line)['website'] for line in lines] == [f'site{i}.com' for i in range(5)]
+    notifier.close(5)
+
+
+def test_failing_command():
+    sink = CommandSink('false', batch_window=0, max_retries=1, retry_backoff=0.01)
+    notifier = Notifier([sink])
+    notifier.start()
+    notifier.notify([down('a.com')])
+    notifier.close(5)
+    assert (sink.nb_sent, sink.nb_retries, sink.nb_failed) == (0, 1, 1)
+
+
+def test_file_sink_appends_json_lines(tmp_path):
+    file_path = tmp_path / 'alerts.jsonl'
+    file_path.write_text('{"previous": "line"}\n')
+    sink = FileSink(str(file_path), batch_window=0.2)
+    notifier = Notifier([sink])
+    notifier.start()
+    notifier.notify([down('a.com', 0), down('b.com', 1), up('b.com', 2)])
+    notifier.close(5)
+
+    lines = [json.loads(line) for line in file_path.read_text().splitlines()]
+    assert lines[0] == {'previous': 'line'}
+    assert lines[1:] == [{'website': 'a.com', 'url': None, 'rule': 'availability', 'firing': True,
+                          'time': '2024-01-01T00:00:00', 'message': down('a.com', 0).message}]
+    assert (sink.nb_sent, sink.nb_coalesced, sink.nb_failed) == (1, 2, 0)
+
+
+def test_websites_of_a_same_host_are_notified_separately():
+    def alert(make_alert, url, second):
+        alert = make_alert('a.com', second)
+        alert.url = url
+        return alert
+
+    sink = Sink()
+    sink.notified[('http://a.com/api', 'availability')] = True
+    batch = sink.coalesce([alert(down, 'http://a.com/', 0), alert(up, 'http://a.com/api', 1),
+                           alert(down, 'http://a.com/api', 2)])
+    # The api is still down, as last notified, while the home page went down
+    assert [(alert.url, alert.firing) for alert in batch] == [('http://a.com/', True)]
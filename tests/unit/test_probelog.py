@@ -0,0 +1,102 @@
+import os
+
+from stella.probelog import ProbeLog
+from stella.probelog import RECORD
+from stella.website import Website
+
+
+def fill(probe_log, url, start, nb_probes):
+    for i in range(nb_probes):
+        is_up = i % 4 != 0
+        probe_log.append(url, False, is_up, 10.0 + i if is_up else None, 0 if is_up else 1, timestamp=start + i)
+
+
+def test_query_between_timestamps(tmp_path):
+    probe_log = ProbeLog(str(tmp_path), segment_records=50, index_block_records=8)
+    fill(probe_log, 'http://a.com', 1000, 100)
+    fill(probe_log, 'http://b.com', 1000, 100)
+    probe_log.flush()
+    # Records of both websites are interleaved by time in real use
+    assert len(probe_log.segments) == 4
+
+    records = probe_log.records('http://a.com', 1010, 1029)
+    assert [timestamp for timestamp, *_ in records] == list(range(1010, 1030))
+    assert records[2] == (1012, False, None, 1)
+    assert records[3] == (1013, True, 23.0, 0)
+
+    bucket = probe_log.query('http://a.com', 1010, 1029)
+    assert bucket.count == 20
+    assert bucket.successes == 15
+    assert bucket.min_response_time == 20.0 and bucket.max_response_time == 39.0
+    assert bucket.response_codes_dict == {0: 15, 1: 5}
+
+    assert probe_log.records('http://a.com', 1010, 1029, use_http=True) == []
+    assert probe_log.records('http://unknown.com', 0, 2000) == []
+    assert probe_log.records('http://a.com', 2000, 3000) == []
+
+
+def test_reopen(tmp_path):
+    # Records are timestamped long ago: they must not expire when the log is opened again
+    probe_log = ProbeLog(str(tmp_path), segment_records=50, retention=float('inf'), index_block_records=8)
+    fill(probe_log, 'http://a.com', 1000, 70)
+    probe_log.close()
+
+    # A partially written record is dropped, and the index of the last segment is rebuilt
+    last_segment = probe_log.segments[-1].path
+    with open(last_segment, 'ab') as segment_file:
+        segment_file.write(b'\0' * (RECORD.size // 2))
+
+    probe_log = ProbeLog(str(tmp_path), segment_records=50, retention=float('inf'), index_block_records=8)
+    assert os.path.getsize(last_segment) == 20 * RECORD.size
+    fill(probe_log, 'http://b.com', 1070, 10)
+    fill(probe_log, 'http://a.com', 1080, 10)
+    probe_log.close()
+
+    assert len(probe_log.records('http://a.com', 0, 2000)) == 80
+    assert len(probe_log.records('http://b.com', 0, 2000)) == 10
+
+
+def test_compaction(tmp_path):
+    probe_log = ProbeLog(str(tmp_path), segment_records=50, retention=100, index_block_records=8)
+    fill(probe_log, 'http://a.com', 1000, 200)
+    probe_log.flush()
+    assert len(probe_log.segments) == 4
+
+    # Records before 1075 expire: the first segment is deleted, the second one is rewritten
+    probe_log.compact(now=1175)
+    assert len(probe_log.segments) == 3
+    assert probe_log.segments[0].nb_records == 25
+    assert [timestamp for timestamp, *_ in probe_log.records('http://a.com', 0, 2000)] == list(range(1075, 1200))
+
+    reopened = ProbeLog(str(tmp_path), segment_records=50, retention=float('inf'), index_block_records=8)
+    assert reopened.segments[0].nb_records == 25
+
+
+def test_website_logs_probes(tmp_path):
+    probe_log = ProbeLog(str(tmp_path))
+    website = Website('http://a.com', 1)
+    website.probe_log = probe_log
+    website.update_stats(False, True, 12.0, 0)
+    website.update_stats(True, False, None, None)
+    probe_log.flush()
+
+    assert [record[1:] for record in probe_log.records('http://a.com', 0, float('inf'))] == \
+        [(True, 12.0, 0), (False, None, None)]
+    assert len(probe_log.records('http://a.com', 0, float('inf'), use_http=True)) == 1
+
+
+def test_running_bounds_are_cached_until_records_are_indexed(tmp_path):
+    probe_log = ProbeLog(str(tmp_path), segment_records=1000, index_block_records=8)
+    fill(probe_log, 'http://a.com', 1000, 40)
+    probe_log.flush()
+    segment = probe_log.segments[-1]
+    assert segment.record_range(1010, 1019) == (8, 24)
+    running_bounds = segment.running_bounds
+    segment.record_range(1020, 1029)
+    assert segment.running_bounds is running_bounds
+
+    # Records appended out of order widen the range of their block
+    probe_log.append('http://a.com', False, True, 10.0, 0, timestamp=1012)
+    probe_log.flush()
+    assert segment.running_bounds is None
+    assert segment.record_range(1012, 1012) == (8, 41)
@@ -0,0 +1,91 @@
+import mock
+
+from stella.dnscache import CACHE
+from stella.probetarget import group_websites
+from stella.probetarget import nb_saved_probes
+from stella.scheduler import Scheduler
+from stella.shard import ShardedMonitor
+from stella.website import Website
+
+URLS = ['http://en.wikipedia.org/wiki/A', 'http://en.wikipedia.org/wiki/B', 'http://EN.wikipedia.org/wiki/A',
+        'http://github.com', 'http://en.wikipedia.org/wiki/A']
+
+
+def make_websites(urls, check_interval=1):
+    return [Website(url, check_interval, timeframes=[10], alerting_timeframe=10) for url in urls]
+
+
+def test_websites_are_grouped_by_host_or_url():
+    websites = make_websites(URLS) + make_websites(['http://github.com'], check_interval=2)
+    targets = group_websites(websites, use_http=False)
+    # Websites with another check interval are not grouped
+    assert [[websites.index(website) for website in target.websites] for target in targets] == \
+        [[0, 1, 2, 4], [3], [5]]
+
+    assert len(group_websites(websites, use_http=True)) == 6
+    targets = group_websites(websites, use_http=True, deduplicate_http=True)
+    assert [[websites.index(website) for website in target.websites] for target in targets] == \
+        [[0, 4], [1], [2], [3], [5]]
+    assert len(group_websites(websites, use_http=False, deduplicate=False)) == 6
+
+
+def test_results_are_fanned_out():
+    websites = make_websites(URLS)
+    targets = group_websites(websites, use_http=False)
+    scheduler = Scheduler(targets, jitter=0)
+    assert scheduler.pop_due(scheduler.next_deadline()) == [0, 1]
+
+    with mock.patch.object(Website, 'ping', return_value=(True, 20.0, 0)) as ping, \
+            mock.patch.object(CACHE, 'resolve', return_value=('10.0.0.1', 2.0)):
+        for target in targets:
+            target.check(use_http=False)
+    assert ping.call_args_list == [mock.call('10.0.0.1')] * 2
+    for website in websites:
+        assert website.ping_stats_list[10].nb_data_points() == 1
+        assert website.ping_stats_list[10].average_response_time == 20
+        assert website.dns_stats_list[10].average_response_time == 2
+    assert websites[0].scheduling is websites[1].scheduling
+    assert websites[0].scheduling.nb_websites == 4
+    assert nb_saved_probes(websites) == 3
+
+    def http_ping(url, fresh_connection=False, timings=None):
+        timings.update(connect=1.0, ttfb=5.0, body=1.0)
+        return True, 7.0, 200
+
+    with mock.patch.object(Website, 'http_ping', side_effect=http_ping), \
+            mock.patch.object(CACHE, 'resolve', return_value=('10.0.0.1', 2.0)):
+        targets[0].check(use_http=True)
+    for website in targets[0].websites:
+        assert sorted(website.http_phase_stats_lists) == ['body', 'connect', 'ttfb']
+        assert website.http_phase_stats_lists['ttfb'][10].average_response_time == 5
+
+    # Hosts which cannot be resolved are not probed
+    with mock.patch.object(Website, 'http_ping') as http_ping, \
+            mock.patch.object(CACHE, 'resolve', return_value=(None, 1.0)):
+        for _ in range(10):
+            targets[0].check(use_http=True)
+    assert http_ping.call_count == 0
+    assert websites[0].dns_stats_list[10].availability == 0
+    assert websites[1].availability_issue and websites[2].alert_history
+
+    # A probe which raised an exception is recorded as down
+    targets[1].record_error(use_http=False)
+    assert targets[1].websites[0].ping_stats_list[10].availability == 0.5
+
+
+def test_shards_keep_targets_together():
+    websites = make_websites(URLS + ['http://site1.com', 'http://site2.com'])
+    monitor = ShardedMonitor(websites, [(website.url, 1) for website in websites], target=None, nb_processes=2,
+                             use_http=False)
+    assert monitor.shards == [[0, 1, 2, 4], [3, 5, 6]]
+
+
+def test_cold_checks_are_only_recorded_in_the_cold_stats():
+    websites = make_websites(URLS[:2])
+    target = group_websites(websites, use_http=False)[0]
+    target.update(True, True, 50.0, 200, cold_check=True)
+    target.update(True, True, 5.0, 200)
+    for website in websites:
+        assert website.http_cold_stats_list[10].max_response_time == 50
+        assert website.http_stats_list[10].nb_data_points() == 1
+        assert website.http_stats_list[10].max_response_time == 5
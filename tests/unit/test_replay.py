@@ -0,0 +1,55 @@
+import datetime
+
+from stella.alert import AvailabilityAlert
+from stella.alert import AvailabilityRecovered
+from stella.probelog import ProbeLog
+from stella.replay import read_samples
+from stella.replay import Replay
+from stella.replay import write_csv
+
+START = 1.7e9
+
+
+def outage_samples():
+    """A website checked every second, down from the 20th to the 40th second, and another one always up."""
+    samples = []
+    for second in range(60):
+        is_up = not 20 <= second < 40
+        samples.append((START + second, 'http://down.com', False, is_up, 10.0 if is_up else None, 0 if is_up else 1))
+        samples.append((START + second, 'http://up.com', False, True, 20.0, 0))
+    return samples
+
+
+def timeline(alerts):
+    return [(type(alert), alert.website, alert.activation_time) for alert in alerts]
+
+
+def test_replay_alert_timeline():
+    replay = Replay(timeframes=[5], alert_threshold=0.8, alerting_timeframe=5)
+    alerts = replay.run(outage_samples())
+
+    # Alerts are activated at the time of the probe results, not when they are replayed:
+    # availability drops to 3/5 at the 21st second, and is back to 4/5 at the 43rd second
+    assert timeline(alerts) == [
+        (AvailabilityAlert, 'down.com', datetime.datetime.fromtimestamp(START + 21)),
+        (AvailabilityRecovered, 'down.com', datetime.datetime.fromtimestamp(START + 43)),
+    ]
+    assert replay.nb_samples == 120
+    assert replay.throughput() > 0
+
+
+def test_replay_from_csv_and_probe_log(tmp_path):
+    samples = outage_samples()
+    write_csv(samples, str(tmp_path / 'samples.csv'))
+    probe_log = ProbeLog(str(tmp_path / 'probelog'), retention=float('inf'))
+    for timestamp, url, use_http, is_up, response_time, response_code in samples:
+        probe_log.append(url, use_http, is_up, response_time, response_code, timestamp)
+    probe_log.close()
+
+    assert list(read_samples(str(tmp_path / 'samples.csv'))) == samples
+    assert list(read_samples(str(tmp_path / 'probelog'))) == samples
+    assert list(read_samples(str(tmp_path / 'probelog'), start=START + 10, end=START + 19)) == samples[20:40]
+
+    expected = timeline(Replay(timeframes=[5]).run(samples))
+    for path in ('samples.csv', 'probelog'):
+        assert timeline(Replay(timeframes=[5]).run(read_samples(str(tmp_path / path)))) == expected
@@ -0,0 +1,56 @@
+import random
+
+from stella.config import day
+from stella.config import hour
+from stella.config import minute
+from stella.rollup import Rollup
+from stella.rollup import RollupStats
+from stella.stats import PingStats
+from stella.stats import StatsWindows
+
+
+def test_rollup_matches_exact_stats_on_bucket_boundaries():
+    rollup = Rollup(6 * hour)
+    stats = {timeframe: RollupStats(rollup, timeframe, 1) for timeframe in (30 * minute, 6 * hour)}
+    samples = []
+    # Start right after a bucket boundary, so that the timeframes hold whole buckets
+    for timestamp in range(1, 6 * hour + 1):
+        is_up = random.random() < 0.9
+        sample = (is_up, random.uniform(10, 100) if is_up else None, 0 if is_up else 1)
+        samples.append((timestamp, sample))
+        rollup.add(timestamp, *sample)
+
+    for timeframe, rollup_stats in stats.items():
+        last_timestamp = samples[-1][0]
+        expected = [sample for timestamp, sample in samples
+                    if timestamp - timestamp % (minute if timeframe <= hour else hour) >= last_timestamp - timeframe]
+        ups = [sample for sample in expected if sample[0]]
+        response_times = [sample[1] for sample in ups]
+
+        assert rollup_stats.nb_data_points() == len(expected)
+        assert rollup_stats.availability == len(ups) / len(expected)
+        assert rollup_stats.min_response_time == min(response_times)
+        assert rollup_stats.max_response_time == max(response_times)
+        assert abs(rollup_stats.average_response_time - sum(response_times) / len(response_times)) < 1e-6
+        assert rollup_stats.response_codes_dict == {0: len(ups), 1: len(expected) - len(ups)}
+        assert rollup_stats.timeframe_reached()
+
+
+def test_rollup_memory_is_bounded():
+    rollup = Rollup(2 * day)
+    for timestamp in range(0, 5 * day, 10):
+        rollup.add(timestamp, True, 10, 0)
+    assert len(rollup.minutes.buckets) == 60
+    assert len(rollup.hours.buckets) == 48
+    assert RollupStats(rollup, 2 * day, 10).nb_data_points() <= 2 * day // 10
+
+
+def test_stats_windows_with_rollups():
+    windows = StatsWindows(1, [5, 10, day], PingStats, raw_stats_max_timeframe=hour)
+    assert windows.buffer.capacity == 10
+    for timestamp in range(100):
+        windows.update(True, 10, 0, timestamp=timestamp)
+    assert windows[day].nb_data_points() == 100
+    assert windows[day].availability == 1
+    assert not windows[day].timeframe_reached()
+    assert windows[10].nb_data_points() == 10
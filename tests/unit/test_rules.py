@@ -0,0 +1,67 @@
+import pytest
+
+from stella.alert import AvailabilityAlert
+from stella.alert import RuleAlert
+from stella.alert import RuleRecovered
+from stella.helpers import parse_duration
+from stella.rules import read_rules
+from stella.rules import Rule
+from stella.rules import RuleError
+from stella.website import Website
+
+
+def test_read_rules(tmp_path):
+    rules_file = tmp_path / 'alert_rules.conf'
+    rules_file.write_text("# name metric timeframe comparator threshold [websites]\n"
+                          "\n"
+                          "slow p95 2min > 500 *.wikipedia.org\n"
+                          "errors 5xx_ratio 30 >= 0.1\n")
+    slow, errors = read_rules(str(rules_file))
+
+    assert (slow.name, slow.metric, slow.timeframe, slow.comparator, slow.threshold) == ('slow', 'p95', 120, '>', 500)
+    assert slow.matches('https://fr.wikipedia.org/', 'fr.wikipedia.org')
+    assert not slow.matches('http://github.com/', 'github.com')
+    assert errors.timeframe == 30 and errors.matches('http://github.com/', 'github.com')
+
+    rules_file.write_text("slow p95 2min > 500\nbroken latency 2min > 500\n")
+    with pytest.raises(RuleError, match=':2: Unknown metric'):
+        read_rules(str(rules_file))
+    with pytest.raises(RuleError):
+        Rule('slow', 'p95', 120, '=>', 500)
+    assert parse_duration('24h') == 86400
+    with pytest.raises(ValueError):
+        parse_duration('5 minutes')
+
+
+def test_rules_fire_and_recover():
+    rules = [Rule('slow', 'p50', 5, '>', 100), Rule('errors', '5xx_ratio', 5, '>', 0.5),
+             Rule('other', 'max_response_time', 5, '>', 0, 'http://other.com/*')]
+    website = Website('http://a.com/', 1, timeframes=[5], alert_rules=rules)
+    assert [rule.name for rule in website.alert_evaluator.rules] == ['availability', 'slow', 'errors']
+
+    def check(second, response_time, response_code):
+        website.update_stats(True, True, response_time, response_code, timestamp=second)
+        return website.check_for_alert(True)
+
+    # Not enough data points yet
+    assert [check(second, 200.0, 503) for second in range(4)] == [[]] * 4
+    alerts = check(4, 200.0, 503)
+    assert [(type(alert), alert.rule.name) for alert in alerts] == [(RuleAlert, 'slow'), (RuleAlert, 'errors')]
+    assert alerts[0].value == pytest.approx(200, rel=0.01)
+    assert not website.availability_issue
+
+    # Evaluating again without a new data point does nothing
+    assert website.check_for_alert(True) == []
+
+    alerts = [alert for second in range(5, 10) for alert in check(second, 50.0, 200)]
+    assert [(type(alert), alert.rule.name) for alert in alerts] == [(RuleRecovered, 'slow'), (RuleRecovered, 'errors')]
+    assert list(website.alert_history)[-2:] == alerts
+
+
+def test_availability_rule_raises_availability_alerts():
+    website = Website('http://a.com/', 1, timeframes=[5], alert_threshold=0.8, alerting_timeframe=5)
+    for second in range(5):
+        website.update_stats(False, False, None, 1, timestamp=second)
+        alerts = website.check_for_alert(False)
+    assert [type(alert) for alert in alerts] == [AvailabilityAlert]
+    assert website.availability_issue
@@ -0,0 +1,146 @@
+from threading import Lock
+import time
+
+import pytest
+
+from stella.scheduler import Scheduler
+
+
+class FakeWebsite(object):
+    """Website whose checks are scheduled, without stats."""
+
+    def __init__(self, check_interval):
+        self.check_interval = check_interval
+        self.scheduling = None
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_first_checks_are_spread_over_the_interval():
+    websites = [FakeWebsite(10) for _ in range(1000)]
+    scheduler = Scheduler(websites, jitter=1.0, clock=FakeClock())
+    assert all(100 <= deadline <= 110 for deadline in scheduler.deadlines)
+    # No more than a fifth of the websites in any second of the interval
+    for second in range(100, 110):
+        assert len([deadline for deadline in scheduler.deadlines if second <= deadline < second + 1]) < 200
+
+    scheduler = Scheduler(websites, jitter=0, clock=FakeClock())
+    assert len(scheduler.pop_due(100)) == 1000
+
+
+def scheduler_for_one_website(overload_policy):
+    clock = FakeClock()
+    website = FakeWebsite(10)
+    return Scheduler([website], jitter=0, overload_policy=overload_policy, clock=clock), website
+
+
+def test_checks_on_time_keep_the_grid():
+    scheduler, website = scheduler_for_one_website('skip')
+    assert scheduler.pop_due(100.5) == [0]
+    assert scheduler.pop_due(100.5) == []
+    scheduler.done(0, 103)
+    assert scheduler.next_deadline() == 110
+    assert scheduler.pop_due(111) == [0]
+    scheduler.done(0, 112)
+    assert scheduler.next_deadline() == 120
+    assert website.scheduling.nb_checks == 2
+    assert website.scheduling.max_lag == 1
+    assert website.scheduling.average_lag() == 0.75
+    assert website.scheduling.nb_dropped == 0
+
+
+@pytest.mark.parametrize('overload_policy, next_deadline, nb_dropped', [
+    ('skip', 130, 2),
+    ('coalesce', 120, 1),
+    ('stretch', 135, 2),
+])
+def test_overload_policies(overload_policy, next_deadline, nb_dropped):
+    scheduler, website = scheduler_for_one_website(overload_policy)
+    scheduler.pop_due(100)
+    # The check lasts 2.5 intervals: the deadlines 110 and 120 are missed
+    scheduler.done(0, 125)
+    assert scheduler.next_deadline() == next_deadline
+    assert website.scheduling.nb_overloads == 1
+    assert website.scheduling.nb_dropped == scheduler.nb_dropped == nb_dropped
+
+
+@pytest.mark.parametrize('overload_policy, deadline', [('skip', 120), ('stretch', 125)])
+def test_late_start_is_the_check_of_the_last_missed_deadline(overload_policy, deadline):
+    scheduler, website = scheduler_for_one_website(overload_policy)
+    # No worker was free for 2.5 intervals
+    assert scheduler.pop_due(125) == [0]
+    assert scheduler.deadlines[0] == deadline
+    assert website.scheduling.max_lag == 125 - deadline
+    assert website.scheduling.nb_dropped == 2
+
+
+def test_unknown_overload_policy():
+    with pytest.raises(ValueError):
+        Scheduler([], overload_policy='retry')
+
+
+def test_workers_never_overlap_the_checks_of_a_website():
+    websites = [FakeWebsite(0.05) for _ in range(4)]
+    scheduler = Scheduler(websites, jitter=1.0, overload_policy='skip')
+    lock = Lock()
+    in_flight = set()
+    overlaps = []
+
+    def slow_probe(website):
+        lock.acquire()
+        overlaps.append(website in in_flight)
+        in_flight.add(website)
+        lock.release()
+        # Longer than the check interval
+        time.sleep(0.08)
+        lock.acquire()
+        in_flight.discard(website)
+        lock.release()
+
+    scheduler.start(slow_probe, nb_workers=8)
+    time.sleep(0.5)
+    assert overlaps and not any(overlaps)
+    for website in websites:
+        # At most one check every 2 intervals, the missed deadlines being counted
+        assert 2 <= website.scheduling.nb_checks <= 6
+        assert website.scheduling.nb_dropped >= website.scheduling.nb_checks - 2
+
+
+def test_failing_probes_do_not_stop_the_workers():
+    websites = [FakeWebsite(0.02) for _ in range(2)]
+    scheduler = Scheduler(websites, jitter=0)
+    errors = []
+
+    def failing_probe(website):
+        if website is websites[0]:
+            raise RuntimeError("unexpected ping output")
+
+    threads = scheduler.start(failing_probe, nb_workers=1, on_error=errors.append)
+    time.sleep(0.2)
+    assert threads[0].is_alive()
+    assert websites[0].scheduling.nb_errors >= 3 and websites[1].scheduling.nb_errors == 0
+    assert websites[1].scheduling.nb_checks >= 3
+    assert errors and all(website is websites[0] for website in errors)
+
+
+def test_failing_error_callbacks_do_not_stop_the_workers():
+    websites = [FakeWebsite(0.02)]
+    scheduler = Scheduler(websites, jitter=0)
+
+    def failing_probe(website):
+        raise RuntimeError("unexpected ping output")
+
+    def failing_on_error(website):
+        raise ValueError("could not record the check")
+
+    threads = scheduler.start(failing_probe, nb_workers=1, on_error=failing_on_error)
+    time.sleep(0.2)
+    assert threads[0].is_alive()
+    assert websites[0].scheduling.nb_errors >= 3
+    assert scheduler.nb_unrecorded_errors >= 3
@@ -0,0 +1,94 @@
+from collections import deque
+import pickle
+import time
+
+from stella.shard import ShardedMonitor
+from stella.shard import ShardPublisher
+from stella.website import Website
+
+TIMEFRAMES = [10, 20]
+
+
+def make_websites(websites_conf):
+    websites = [Website(url, interval, timeframes=TIMEFRAMES, alerting_timeframe=10)
+                for url, interval in websites_conf]
+    for website in websites:
+        website.alert_queue = deque()
+    return websites
+
+
+def test_deltas_rebuild_the_snapshots_of_the_mirrors():
+    websites_conf = [(f'http://site{i}.com', 1) for i in range(4)]
+    websites = make_websites(websites_conf)
+    mirrors = make_websites(websites_conf)
+    monitor = ShardedMonitor(mirrors, websites_conf, target=None, nb_processes=2)
+    assert monitor.shards == [[0, 2], [1, 3]]
+    publisher = ShardPublisher([websites[1], websites[3]], connection=None)
+
+    def send(deltas, alerts):
+        # As sent through the pipe
+        monitor.apply(1, *pickle.loads(pickle.dumps((deltas, alerts))))
+
+    send([publisher.delta(i) for i in range(2)], [])
+    assert publisher.batch() == ([], [])
+
+    websites[3].update_stats(False, True, 20.0, 0, timestamp=0)
+    websites[3].update_stats(False, True, 40.0, 0, timestamp=1)
+    deltas, alerts = publisher.batch()
+    # Only the icmp stats of the website changed
+    assert [delta[0] for delta in deltas] == [1] and not alerts
+    assert set(deltas[0][2]) == set(TIMEFRAMES) and deltas[0][3] == {}
+    send(deltas, alerts)
+    assert mirrors[3].get_snapshot().ping_stats[10].average_response_time == 30
+    assert mirrors[3].get_snapshot().http_stats[10].nb_data_points() == 0
+
+    websites[3].update_http_phase_stats({'connect': 2.0, 'ttfb': 10.0}, timestamp=2)
+    websites[3].update_http_phase_stats({'ttfb': 20.0}, timestamp=3)
+    # The snapshot is published by the update of the stats of the check
+    websites[3].update_stats(True, True, 30.0, 200, timestamp=3)
+    deltas, _ = publisher.batch()
+    send(deltas, [])
+    websites[3].update_http_phase_stats({'ttfb': 30.0}, timestamp=4)
+    websites[3].update_stats(True, True, 40.0, 200, timestamp=4)
+    deltas, _ = publisher.batch()
+    # Only the phases timed since the last batch are sent
+    assert list(deltas[0][6]) == ['ttfb']
+    send(deltas, [])
+    http_phase_stats = mirrors[3].get_snapshot().http_phase_stats
+    assert http_phase_stats['connect'][10].average_response_time == 2
+    assert http_phase_stats['ttfb'][10].average_response_time == 20
+
+    for timestamp in range(2, 12):
+        websites[1].update_stats(False, False, None, 1, timestamp=timestamp)
+        websites[1].check_for_alert(use_http=False)
+    send(*publisher.batch())
+    assert mirrors[1].get_snapshot().availability_issue
+    assert [alert.website for alert in mirrors[1].alert_queue] == ['site1.com']
+    assert mirrors[1].get_snapshot().ping_stats[10].availability == 0
+
+
+def run_fake_shard(shard, websites_conf, connection):
+    """Worker process whose websites are probed once, with a response time of 10 * shard."""
+    websites = make_websites(websites_conf)
+    publisher = ShardPublisher(websites, connection, batch_interval=0.01)
+    for website in websites:
+        website.update_stats(False, True, 10.0 * shard, 0)
+    publisher.run()
+
+
+def test_worker_processes_stream_to_the_mirrors():
+    websites_conf = [(f'http://site{i}.com', 1) for i in range(5)]
+    mirrors = make_websites(websites_conf)
+    publish_queue = deque()
+    for mirror in mirrors:
+        mirror.publish_queue = publish_queue
+    monitor = ShardedMonitor(mirrors, websites_conf, run_fake_shard, nb_processes=2)
+    monitor.start()
+    deadline = time.monotonic() + 10
+    while len(publish_queue) < 5 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    monitor.stop()
+
+    assert len(publish_queue) == 5
+    assert [mirror.get_snapshot().ping_stats[10].average_response_time for mirror in mirrors] == [0, 10, 0, 10, 0]
+    assert not any(process.is_alive() for process in monitor.processes)
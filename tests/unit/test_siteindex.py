@@ -0,0 +1,55 @@
+import random
+
+from stella.siteindex import SiteIndex
+from stella.website import Website
+
+
+def make_websites(hostnames):
+    websites = [Website(f'http://{hostname}', 1, timeframes=[10], alerting_timeframe=10) for hostname in hostnames]
+    for website in websites:
+        website.update_stats(False, True, 10.0, 0, timestamp=0)
+    return websites
+
+
+def test_orders_are_updated_from_publications():
+    websites = make_websites(['c.com', 'a.com', 'b.com'])
+    index = SiteIndex(websites, use_http=False, timeframe=10)
+    assert index.rows('hostname', 0, 10) == [1, 2, 0]
+    assert index.rows('config', 1, 10) == [1, 2]
+
+    websites[1].update_stats(False, False, None, 1, timestamp=1)
+    websites[2].update_stats(False, True, 50.0, 0, timestamp=1)
+    websites[2].update_stats(False, True, 50.0, 0, timestamp=2)
+    # b.com is queued once, until the index is updated
+    assert len(index.publish_queue) == 2
+    assert index.update() == 2
+    assert index.rows('availability', 0, 10) == [1, 0, 2]
+    assert index.rows('latency', 0, 10) == [2, 0, 1]
+    assert index.update() == 0
+
+
+def test_filter_by_prefix():
+    hostnames = [f'site{i}.com' for i in range(200)] + ['www.other.com', 'Site.org']
+    websites = make_websites(hostnames)
+    for i, website in enumerate(websites):
+        website.update_stats(False, True, random.uniform(1, 100), 0, timestamp=1)
+    index = SiteIndex(websites, use_http=False, timeframe=10)
+    index.update()
+
+    def expected(prefix, order):
+        matching = [i for i, hostname in enumerate(hostnames) if hostname.lower().startswith(prefix)]
+        if order == 'latency':
+            matching.sort(key=lambda i: (index.keys[1][i], i))
+        return matching
+
+    # A sparse filter (selection of the matching websites), then a dense one (scan of the order)
+    for prefix in ['site1', 'site19', 'site1', 'site', 's', '']:
+        index.set_filter(prefix)
+        for order in ['config', 'latency']:
+            assert index.rows(order, 0, 1000) == expected(prefix, order)
+            assert index.rows(order, 3, 5) == expected(prefix, order)[3:8]
+        assert index.count() == len(expected(prefix, 'config'))
+    index.set_filter('SITE.')
+    assert [hostnames[i] for i in index.rows('hostname', 0, 10)] == ['Site.org']
+    index.set_filter('z')
+    assert index.rows('latency', 0, 10) == [] and index.count() == 0
@@ -0,0 +1,73 @@
+import math
+import random
+
+import pytest
+
+from stella.sketch import LogHistogram
+from stella.stats import PingStats
+
+RELATIVE_ACCURACY = 0.01
+QUANTILES = [0, 0.01, 0.25, 0.5, 0.9, 0.95, 0.99, 1]
+
+
+def exact_quantile(values, q):
+    return sorted(values)[math.floor(q * (len(values) - 1))]
+
+
+def assert_within_bound(histogram, values):
+    for q in QUANTILES:
+        exact = exact_quantile(values, q)
+        assert abs(histogram.quantile(q) - exact) <= RELATIVE_ACCURACY * exact * (1 + 1e-9), (q, exact)
+
+
+def test_quantiles_error_bound():
+    histogram = LogHistogram(RELATIVE_ACCURACY)
+    values = [random.lognormvariate(3, 1.5) for _ in range(5000)]
+    for value in values:
+        histogram.add(value)
+    assert_within_bound(histogram, values)
+
+
+def test_sliding_window_error_bound():
+    histogram = LogHistogram(RELATIVE_ACCURACY)
+    window = []
+    for i in range(3000):
+        value = random.choice([0, random.uniform(1, 50), random.uniform(500, 5000)])
+        window.append(value)
+        histogram.add(value)
+        if len(window) > 200:
+            histogram.remove(window.pop(0))
+        if i % 100 == 0:
+            assert_within_bound(histogram, window)
+
+
+def test_merge():
+    values = [random.expovariate(0.01) for _ in range(2000)]
+    first, second = LogHistogram(RELATIVE_ACCURACY), LogHistogram(RELATIVE_ACCURACY)
+    for value in values[:1000]:
+        first.add(value)
+    for value in values[1000:]:
+        second.add(value)
+    first.merge(second)
+    assert first.count == len(values)
+    assert_within_bound(first, values)
+
+    with pytest.raises(ValueError):
+        first.merge(LogHistogram(0.05))
+
+
+def test_empty():
+    assert math.isnan(LogHistogram().quantile(0.5))
+
+
+def test_stats_percentiles():
+    stats = PingStats(1, 60)
+    for i in range(500):
+        is_up = random.randint(0, 4) > 0
+        stats.update(is_up, random.uniform(10, 300) if is_up else None, 0 if is_up else 1)
+        if not stats.response_times:
+            assert math.isnan(stats.percentile(50))
+            continue
+        for percent in (50, 95, 99):
+            exact = exact_quantile(stats.response_times, percent / 100)
+            assert abs(stats.percentile(percent) - exact) <= RELATIVE_ACCURACY * exact * (1 + 1e-9)
@@ -0,0 +1,116 @@
+import random
+
+import pytest
+
+from stella.config import hour
+from stella.rules import Rule
+from stella import snapshot
+from stella.website import Website
+
+TIMEFRAMES = [5, 30, 2 * hour]
+
+
+def monitored_website(url, start, nb_checks):
+    website = Website(url, 1, timeframes=TIMEFRAMES)
+    for timestamp in range(start, start + nb_checks):
+        is_up = random.random() < 0.9
+        website.update_stats(False, is_up, random.uniform(10, 100) if is_up else None, 0 if is_up else 1, timestamp)
+    return website
+
+
+def summary(stats):
+    return (stats.nb_data_points(), stats.availability, stats.min_response_time, stats.max_response_time,
+            stats.average_response_time, stats.percentile(95), dict(stats.response_codes_dict),
+            stats.covered_duration())
+
+
+def test_snapshot_round_trip(tmp_path):
+    file_path = str(tmp_path / 'stella.snapshot')
+    websites = [monitored_website(f'http://site{i}.com', 1000, 3 * hour) for i in range(3)]
+    websites[1].availability_issue = True
+    snapshot.save(websites, file_path)
+
+    restored = [Website(f'http://site{i}.com', 1, timeframes=TIMEFRAMES) for i in (2, 1, 0, 3)]
+    assert snapshot.restore(restored, file_path) == 3
+    # Stats are decoded when first used
+    assert restored[0].ping_stats_list.pending_restore is not None
+
+    # Websites restored but not used yet are saved as well
+    snapshot.save(restored, file_path)
+    restored = [Website(f'http://site{i}.com', 1, timeframes=TIMEFRAMES) for i in (2, 1, 0, 3)]
+    assert snapshot.restore(restored, file_path) == 4
+
+    for website, restored_website in zip(websites, reversed(restored[:3])):
+        assert restored_website.availability_issue == website.availability_issue
+        for timeframe in TIMEFRAMES:
+            assert summary(restored_website.ping_stats_list[timeframe]) == summary(website.ping_stats_list[timeframe])
+    # Unknown websites are left untouched
+    assert restored[3].ping_stats_list[30].nb_data_points() == 0
+
+
+def test_firing_rules_are_restored_by_name(tmp_path):
+    file_path = str(tmp_path / 'stella.snapshot')
+    slow, errors = Rule('slow', 'p95', 30, '>', 50), Rule('errors', '5xx_ratio', 30, '>', 0.5)
+    website = Website('http://site0.com', 1, timeframes=TIMEFRAMES, alert_rules=[slow, errors])
+    website.alert_evaluator.firing[1:] = [False, True]
+    snapshot.save([website], file_path)
+
+    # The rules file was edited: the rules moved, and one was removed
+    new = Rule('new', 'p50', 5, '>', 1)
+    restored = Website('http://site0.com', 1, timeframes=TIMEFRAMES, alert_rules=[errors, new])
+    restored.alert_evaluator.firing[:] = [True, False, True]
+    assert snapshot.restore([restored], file_path) == 1
+    assert restored.alert_evaluator.firing == [False, True, False]
+
+
+def test_snapshot_accounts_for_elapsed_time(tmp_path, monkeypatch):
+    file_path = str(tmp_path / 'stella.snapshot')
+    website = Website('http://site.com', 1, timeframes=[30])
+    for timestamp in range(4990, 5000):
+        website.update_stats(False, True, 10, 0, timestamp)
+
+    monkeypatch.setattr(snapshot.time, 'time', lambda: 1000)
+    monkeypatch.setattr(snapshot.time, 'monotonic', lambda: 5000)
+    snapshot.save([website], file_path)
+
+    # Restart 20 seconds later, the monotonic clock starting over
+    restored = Website('http://site.com', 1, timeframes=[30])
+    monkeypatch.setattr(snapshot.time, 'time', lambda: 1020)
+    monkeypatch.setattr(snapshot.time, 'monotonic', lambda: 10)
+    snapshot.restore([restored], file_path)
+
+    restored.update_stats(False, True, 10, 0, timestamp=10)
+    # The new check happens at 5020 in the time of the snapshot: the check at 4990 is now 30 seconds old
+    assert restored.ping_stats_list[30].nb_data_points() == 10
+    assert restored.ping_stats_list[30].covered_duration() == 5020 - 4991 + 1
+
+
+def test_snapshot_skips_corrupted_and_mismatching_records(tmp_path):
+    file_path = str(tmp_path / 'stella.snapshot')
+    websites = [monitored_website(f'http://site{i}.com', 0, 60) for i in range(2)]
+    snapshot.save(websites, file_path)
+
+    with open(file_path, 'r+b') as snapshot_file:
+        # Flip the last byte, which belongs to the record of the last website
+        snapshot_file.seek(-1, 2)
+        last_byte = snapshot_file.read(1)
+        snapshot_file.seek(-1, 2)
+        snapshot_file.write(bytes([last_byte[0] ^ 0xFF]))
+
+    restored = [Website('http://site0.com', 1, timeframes=TIMEFRAMES),
+                Website('http://site1.com', 1, timeframes=TIMEFRAMES)]
+    assert snapshot.restore(restored, file_path) == 1
+    assert restored[0].ping_stats_list[30].nb_data_points() == 30
+    assert restored[1].ping_stats_list[30].nb_data_points() == 0
+
+    # Stats saved with other timeframes are not restored
+    other_timeframes = Website('http://site0.com', 1, timeframes=[5, 60])
+    assert snapshot.restore([other_timeframes], file_path) == 1
+    assert other_timeframes.ping_stats_list[5].nb_data_points() == 0
+
+
+def test_restore_rejects_unknown_files(tmp_path):
+    file_path = tmp_path / 'stella.snapshot'
+    file_path.write_bytes(b'not a snapshot' * 10)
+    with pytest.raises(snapshot.SnapshotError):
+        snapshot.restore([], str(file_path))
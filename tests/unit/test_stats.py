@@ -1,6 +1,6 @@
 import random
 
-from stella.stats import Stats, HttpStats, PingStats
+from stella.stats import Stats, HttpStats, PingStats, StatsWindows
 
 
 def test_stats_length():
@@ -41,3 +41,69 @@ def test_http_stats_length():
         stats.update(is_up, response_time, response_code)
 
         assert len(stats.response_codes) == stats.successes_in_timeframe
+
+
+def test_min_max_response_times():
+    stats = Stats(1, 10)
+    for i in range(200):
+        is_up = random.randint(0, 3) > 0
+        response_time = random.randint(0, 5) if is_up else None
+        stats.update(is_up, response_time, 200 if is_up else None, False)
+        if stats.response_times:
+            assert stats.max_response_time == max(stats.response_times)
+            assert stats.min_response_time == min(stats.response_times)
+        else:
+            assert stats.max_response_time == -float('inf')
+            assert stats.min_response_time == float('inf')
+
+
+def test_stats_windows_share_buffer():
+    timeframes = [5, 10, 30]
+    windows = StatsWindows(1, timeframes, PingStats)
+    separate_stats = {timeframe: PingStats(1, timeframe) for timeframe in timeframes}
+    for i in range(100):
+        is_up = random.randint(0, 3) > 0
+        response_time = random.randint(0, 100) if is_up else None
+        response_code = 0 if is_up else 1
+        windows.update(is_up, response_time, response_code)
+        for timeframe in timeframes:
+            separate_stats[timeframe].update(is_up, response_time, response_code)
+
+            stats, expected = windows[timeframe], separate_stats[timeframe]
+            assert stats.buffer is windows.buffer
+            assert stats.ups == expected.ups
+            assert stats.availability == expected.availability
+            assert stats.max_response_time == expected.max_response_time
+            assert stats.min_response_time == expected.min_response_time
+            assert stats.average_response_time == expected.average_response_time
+            assert stats.response_codes_dict == expected.response_codes_dict
+    assert windows.buffer.capacity == 30
+
+
+def test_late_checks_are_removed_by_time():
+    stats = PingStats(1, 10)
+    # Checks are done every 3 seconds rather than every second
+    for i in range(20):
+        stats.update(True, 10, 0, timestamp=3 * i)
+        assert stats.covered_duration() <= 10 + 1
+    assert stats.nb_data_points() == 4
+    assert stats.covered_duration() == 3 * 3 + 1
+    assert stats.timeframe_reached()
+
+
+def test_frequent_checks_are_capped():
+    stats = PingStats(1, 10)
+    for i in range(40):
+        stats.update(True, 10, 0, timestamp=i / 4)
+    assert stats.nb_data_points() == stats.max_nb_data_points
+    assert stats.timeframe_reached()
+
+
+def test_timeframe_not_reached_after_gap():
+    windows = StatsWindows(1, [5, 10], HttpStats)
+    windows.update(False, timestamp=0)
+    windows.update(True, 10, 200, timestamp=100)
+    for timeframe in (5, 10):
+        assert windows[timeframe].nb_data_points() == 1
+        assert windows[timeframe].availability == 1
+        assert not windows[timeframe].timeframe_reached()
@@ -2,6 +2,7 @@ import mock
 import pytest
 
 from stella import config
+from stella.website import parse_ping_output
 from stella.website import Website
 
 TIMEFRAME_FOR_ALERTS = config.ALERTING_TIMEFRAME
@@ -47,6 +48,11 @@ class HttpMock(object):
 
 @pytest.mark.parametrize("use_http", [True, False])
 class TestAlerting(object):
+    @pytest.fixture(autouse=True)
+    def no_cold_checks(self, monkeypatch):
+        # Cold checks are kept out of the http stats (see Website.is_cold_check), and would shift the counts below
+        monkeypatch.setattr(config, 'HTTP_COLD_CHECK_INTERVAL', 0)
+
     @mock.patch('stella.website.Website.http_ping')
     @mock.patch('stella.website.Website.ping')
     def test_alerting_wait_for_enough_data(self, mock_ping, mock_http, use_http):
@@ -84,6 +90,7 @@ class TestAlerting(object):
             website.check_for_alert(use_http=use_http)
 
         assert (len(website.alert_history) == 1), website.alert_history
+        assert website.alert_history[0].url == "fakehost.url"
 
     @mock.patch('stella.website.Website.http_ping')
     @mock.patch('stella.website.Website.ping')
@@ -165,3 +172,66 @@ class TestAlerting(object):
         website.ping_and_update_stats(use_http=use_http)
         website.check_for_alert(use_http=use_http)
         assert (len(website.alert_history) == 2), website.alert_history
+
+
+def test_snapshot_is_published_on_update():
+    website = Website("fakehost.url", 1, timeframes=[TIMEFRAME_FOR_ALERTS, 3600])
+    for i in range(TIMEFRAME_FOR_ALERTS):
+        website.update_stats(False, True, 10.0 + i, 0, timestamp=1000 + i)
+    snapshot = website.get_snapshot()
+    stats = website.ping_stats_list[TIMEFRAME_FOR_ALERTS]
+    assert snapshot.ping_stats[TIMEFRAME_FOR_ALERTS].availability == 1
+    assert snapshot.ping_stats[TIMEFRAME_FOR_ALERTS].percentile(50) == stats.percentile(50)
+    assert snapshot.ping_stats[3600].nb_data_points() == TIMEFRAME_FOR_ALERTS
+
+    # Updates publish a new snapshot, and never modify the published ones
+    for i in range(TIMEFRAME_FOR_ALERTS):
+        website.update_stats(False, False, None, 1, timestamp=1000 + TIMEFRAME_FOR_ALERTS + i)
+        website.check_for_alert(False)
+    assert snapshot.ping_stats[TIMEFRAME_FOR_ALERTS].availability == 1
+    assert snapshot.ping_stats[TIMEFRAME_FOR_ALERTS].response_codes_dict == {0: TIMEFRAME_FOR_ALERTS}
+    assert not snapshot.availability_issue
+
+    new_snapshot = website.get_snapshot()
+    assert new_snapshot.ping_stats[TIMEFRAME_FOR_ALERTS].availability == 0
+    assert new_snapshot.availability_issue
+    assert new_snapshot.http_stats is snapshot.http_stats
+
+
+def test_parse_ping_output():
+    stdout = b"64 bytes from 127.0.0.1: icmp_seq=1 ttl=64 time=0.045 ms\n"
+    assert parse_ping_output(0, stdout) == (True, 0.045, 0)
+    assert parse_ping_output(1, b"") == (False, None, 1)
+    # Killed by a signal
+    assert parse_ping_output(-9, b"") == (False, None, 2)
+    with pytest.raises(RuntimeError):
+        parse_ping_output(0, b"unexpected output")
+
+
+def test_ipv6_addresses_are_pinged_with_the_ping_command(monkeypatch):
+    monkeypatch.setattr(config, 'ICMP_NATIVE', True)
+    stdout = b"64 bytes from 2001:db8::1: icmp_seq=1 ttl=64 time=0.5 ms\n"
+    with mock.patch('stella.icmp.native_icmp_available', return_value=True), \
+            mock.patch('stella.icmp.ping', return_value=(True, 0.1, 0)) as native_ping, \
+            mock.patch('subprocess.run', return_value=mock.Mock(returncode=0, stdout=stdout)) as run:
+        assert Website.ping('2001:db8::1') == (True, 0.5, 0)
+        assert Website.ping('10.0.0.1') == (True, 0.1, 0)
+    assert run.call_args[0][0][-1] == '2001:db8::1'
+    native_ping.assert_called_once_with('10.0.0.1')
+
+
+def test_cold_checks_are_only_recorded_in_the_cold_stats(monkeypatch):
+    monkeypatch.setattr(config, 'HTTP_KEEP_ALIVE', True)
+    monkeypatch.setattr(config, 'HTTP_COLD_CHECK_INTERVAL', 5)
+    website = Website('http://a.com', 1, timeframes=[10], alerting_timeframe=10)
+    response_times = iter(range(10, 110, 10))
+    with mock.patch.object(Website, 'http_ping', side_effect=lambda url, fresh_connection: (
+            True, next(response_times) * (10 if fresh_connection else 1), 200)) as http_ping:
+        for _ in range(10):
+            website.ping_and_update_stats(use_http=True)
+    fresh_connections = [call[1]['fresh_connection'] for call in http_ping.call_args_list]
+    assert fresh_connections == ([False] * 4 + [True]) * 2
+    assert website.http_stats_list[10].nb_data_points() == 8
+    assert website.http_stats_list[10].max_response_time == 90
+    assert website.http_cold_stats_list[10].nb_data_points() == 2
+    assert website.http_cold_stats_list[10].max_response_time == 1000